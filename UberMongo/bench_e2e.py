@@ -0,0 +1,281 @@
+"""
+Banc de test de bout en bout MongoDB : client, manager et coursiers sans interaction, dans un processus.
+
+- client    : commandes insérées à --rate commandes/s (arrivées de Poisson) pendant --duration s,
+              affectations et dernières positions suivies par change streams (stream_mux) ;
+- manager   : manager_mongo.run_batch (affectation globale, headless, --window-policy) dans un thread ;
+- coursiers : fleet_mongo.Fleet (--couriers, --policy), courses accélérées par --speedup.
+Tout se passe dans une base dédiée (--db, vidée au démarrage, restaurants recopiés depuis DB_NAME).
+
+Latences mesurées par étape (p50 / p95 / p99 / max, en ms) :
+  order_to_offer        insertion de la commande -> reçue par la flotte (change stream orders)
+  order_to_assignment   insertion -> affectation vue par le client
+  assignment_to_track   affectation -> première position vue par le client (tracking_latest)
+  track_lag             point TRACK généré (ts) -> vu par le client
+  order_to_delivered    insertion -> vers_client_arrived (durée de course comprise)
+Résultats JSON (--out), comparaison des p95 à une référence (--baseline, code 1 si régression).
+
+Les change streams exigent un replica set (mongod --replSet rs0 puis rs.initiate()) ;
+mongomock ne les implémente pas, ce banc a donc besoin d'un vrai mongod.
+
+    python bench_e2e.py --rate 5 --duration 30 --couriers 500 --out results/e2e_mongo.json
+"""
+import asyncio, argparse, json, os, random, sys, threading, time, uuid
+from datetime import datetime, timezone
+from pymongo import MongoClient
+from pymongo.errors import PyMongoError
+from dotenv import load_dotenv
+
+import fleet_mongo as fleet_mod
+from client_mongo import CLIENT_LAT, CLIENT_LON
+from coursier_mongo import jitter
+from catalog_cache import open_catalog
+from manager_mongo import run_batch
+from stream_mux import ChangeStreamMux
+from tracking_store import TRACKING_LATEST, TRACKING_TS
+from window import POLICIES, WindowStats
+
+load_dotenv()
+URI = os.getenv("MONGODB_URI")
+DBNAME = os.getenv("DB_NAME", "ubeer")
+
+HOPS = ("order_to_offer", "order_to_assignment", "assignment_to_track", "track_lag", "order_to_delivered")
+BATCH_WINDOW_S = 0.5   # regroupement des commandes côté manager pendant le banc
+CANDIDATES_S = 1.0     # attente des candidatures côté manager
+SPEEDUP = 30.0         # une course de 10 min dure 20 s
+CUSTOMER_SPREAD_KM = 1.5
+RESET_COLLECTIONS = ("orders", "candidatures", "assignments", TRACKING_TS, TRACKING_LATEST)
+
+def percentiles(values):
+    if not values:
+        return {"n": 0}
+    s = sorted(values)
+    pick = lambda p: s[min(len(s) - 1, int(round(p / 100.0 * (len(s) - 1))))]
+    return {"n": len(s), "p50": pick(50) * 1000, "p95": pick(95) * 1000,
+            "p99": pick(99) * 1000, "max": s[-1] * 1000}
+
+def prepare_db(client, bench_db):
+    """Base de banc propre ; les restaurants sont recopiés depuis la base principale si besoin."""
+    db = client[bench_db]
+    for name in RESET_COLLECTIONS:
+        db[name].drop()
+    if db.restaurants.estimated_document_count() == 0:
+        docs = list(client[DBNAME].restaurants.find({}, {"_id": 0}))
+        if docs:
+            db.restaurants.insert_many(docs)
+    return db
+
+class BenchFleet(fleet_mod.Fleet):
+    """Fleet qui note l'heure de réception de chaque commande."""
+
+    def __init__(self, *args, seen=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.seen = seen
+
+    def on_order(self, order):
+        self.seen.setdefault(order["_id"], time.monotonic())
+        super().on_order(order)
+
+class Bench:
+    def __init__(self, db, args):
+        self.db = db
+        self.args = args
+        self.sent = {}          # order_id -> t (monotonic) d'insertion
+        self.first_offer = {}
+        self.assigned = {}
+        self.first_track = {}
+        self.delivered = {}
+        self.track_lag = []
+        self.window_stats = WindowStats()   # rempli par le thread du manager
+
+    # appelés depuis les threads des multiplexeurs
+    def on_assignment(self, sel):
+        if sel.get("order_id") in self.sent:
+            self.assigned.setdefault(sel["order_id"], time.monotonic())
+
+    def on_track(self, doc):
+        order_id = doc.get("order_id")
+        if order_id not in self.sent:
+            return
+        now = time.monotonic()
+        self.first_track.setdefault(order_id, now)
+        ts = doc.get("ts")
+        if isinstance(ts, datetime):
+            ts = ts if ts.tzinfo else ts.replace(tzinfo=timezone.utc)
+            self.track_lag.append(max(0.0, (datetime.now(timezone.utc) - ts).total_seconds()))
+        if doc.get("status") == "vers_client_arrived":
+            self.delivered.setdefault(order_id, now)
+
+    def run_manager(self, restos):
+        cand_mux = ChangeStreamMux(self.db.candidatures).start()
+        try:
+            with self.db.orders.watch(
+                [{"$match": {"operationType": "insert", "fullDocument.type": "ORDER"}}],
+                full_document="updateLookup"
+            ) as stream:
+                run_batch(self.db, restos, stream, cand_mux, self.args.window,
+                          timeout_s=self.args.candidates, verbose=False,
+                          window_policy=self.args.window_policy, stats=self.window_stats)
+        except PyMongoError:
+            pass  # client fermé en fin de banc
+        finally:
+            cand_mux.close()
+
+    async def produce(self, names):
+        end = time.monotonic() + self.args.duration
+        while time.monotonic() < end:
+            lat, lon = jitter(CLIENT_LAT, CLIENT_LON, CUSTOMER_SPREAD_KM)
+            order_id = str(uuid.uuid4())
+            doc = {
+                "_id": order_id, "type": "ORDER",
+                "restaurant": {"name": random.choice(names)},
+                "items": [],
+                "customer": {"name": "Bench", "lat": lat, "lon": lon},
+                "created_at": int(time.time()), "sent_ts": time.time(), "status": "created",
+            }
+            self.sent[order_id] = time.monotonic()
+            await asyncio.to_thread(self.db.orders.insert_one, doc)
+            await asyncio.sleep(random.expovariate(self.args.rate))
+
+    def hop_values(self):
+        deltas = lambda start, end: [end[o] - start[o] for o in end if o in start]
+        return {
+            "order_to_offer": deltas(self.sent, self.first_offer),
+            "order_to_assignment": deltas(self.sent, self.assigned),
+            "assignment_to_track": deltas(self.assigned, self.first_track),
+            "track_lag": self.track_lag,
+            "order_to_delivered": deltas(self.sent, self.delivered),
+        }
+
+    async def run(self):
+        a = self.args
+        restos = open_catalog(self.db, warm=False)
+        if not len(restos):
+            raise SystemExit("[BENCH] ⚠️ Aucun restaurant : lancer d'abord import_csv_to_mongo.py")
+        fleet = BenchFleet(self.db, a.couriers, fleet_mod.make_policy(a.policy, restos, a.accept_prob, a.max_km),
+                           speedup=a.speedup, seen=self.first_offer)
+        assign_mux = ChangeStreamMux(self.db.assignments, key_field="type").start()
+        assign_mux.subscribe("SELECTION", self.on_assignment)
+        track_mux = ChangeStreamMux(self.db[TRACKING_LATEST], key_field="type",
+                                    operation_types=("insert", "update", "replace")).start()
+        track_mux.subscribe("TRACK", self.on_track)
+        threading.Thread(target=self.run_manager, args=(restos,), daemon=True, name="bench-manager").start()
+        fleet_task = asyncio.create_task(fleet.run())
+        try:
+            await asyncio.sleep(1.0)   # change streams ouverts partout
+            print(f"[BENCH] ▶️ {a.rate} cmd/s pendant {a.duration} s, {a.couriers} coursiers ({a.policy})")
+            t0 = time.monotonic()
+            await self.produce(restos.names())
+            sent_s = time.monotonic() - t0
+            print(f"[BENCH] {len(self.sent)} commandes envoyées, attente des livraisons ({a.drain} s max)…")
+            await asyncio.sleep(a.window + a.candidates + 0.5)   # dernières commandes affectées
+            deadline = time.monotonic() + a.drain
+            while time.monotonic() < deadline and len(self.delivered) < len(self.assigned):
+                await asyncio.sleep(0.5)
+        finally:
+            fleet_task.cancel()
+            await asyncio.gather(fleet_task, return_exceptions=True)
+            await fleet.shutdown()
+            assign_mux.close()
+            track_mux.close()
+        return self.report(sent_s, fleet)
+
+    def report(self, sent_s, fleet):
+        a = self.args
+        st = fleet.tracking.stats()
+        return {
+            "backend": "mongo",
+            "started_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "config": {"rate": a.rate, "duration_s": a.duration, "couriers": a.couriers, "policy": a.policy,
+                       "window_s": a.window, "candidates_s": a.candidates,
+                       "window_policy": a.window_policy, "speedup": a.speedup},
+            "orders": {"sent": len(self.sent), "assigned": len(self.assigned),
+                       "unassigned": len(self.sent) - len(self.assigned), "delivered": len(self.delivered)},
+            "throughput": {"orders_per_s": len(self.sent) / max(1e-6, sent_s),
+                           "assigned_per_s": len(self.assigned) / max(1e-6, sent_s)},
+            "fleet": {"ticks": fleet.ticks, "track_written": st["written"], "track_dropped": st["dropped"],
+                      "mem_per_courier_kb": fleet.mem_per_courier / 1024},
+            "hops_ms": {hop: percentiles(v) for hop, v in self.hop_values().items()},
+            "windows": self.window_stats.summary(),
+        }
+
+def print_report(res):
+    o = res["orders"]
+    print(f"\n[BENCH] commandes : {o['sent']} envoyées, {o['assigned']} affectées, {o['delivered']} livrées | "
+          f"{res['throughput']['assigned_per_s']:.1f} affectations/s")
+    print(f"{'étape':<22}{'n':>7}{'p50':>10}{'p95':>10}{'p99':>10}{'max':>10}  (ms)")
+    for hop in HOPS:
+        h = res["hops_ms"][hop]
+        if not h["n"]:
+            print(f"{hop:<22}{0:>7}")
+            continue
+        print(f"{hop:<22}{h['n']:>7}{h['p50']:>10.1f}{h['p95']:>10.1f}{h['p99']:>10.1f}{h['max']:>10.1f}")
+    w = res.get("windows")
+    if w and w["windows"]:
+        reasons = ", ".join(f"{k}={v}" for k, v in sorted(w["reasons"].items()))
+        print(f"[BENCH] ⏱️ fenêtres ({res['config']['window_policy']}) : {reasons} | "
+              f"gagné moy={w['saved_s']['mean'] * 1000:.0f} ms p50={w['saved_s']['p50'] * 1000:.0f} ms | "
+              f"moins bon choix {w['worse_pct']:.1f} % (perte moy={w['lost_min']['mean']:.2f} min)")
+
+def compare(res, baseline_path, tolerance):
+    """Étapes dont le p95 dépasse celui de la référence de plus de tolerance (0.2 = +20 %)."""
+    with open(baseline_path, encoding="utf-8") as f:
+        base = json.load(f)
+    worse = []
+    for hop in HOPS:
+        new, old = res["hops_ms"].get(hop, {}), base.get("hops_ms", {}).get(hop, {})
+        if new.get("n") and old.get("n") and new["p95"] > old["p95"] * (1 + tolerance):
+            worse.append((hop, old["p95"], new["p95"]))
+    return worse
+
+def parse_args(argv=None):
+    p = argparse.ArgumentParser(description="Banc de bout en bout MongoDB : commandes -> affectation -> tracking.")
+    p.add_argument("--db", default=f"{DBNAME}_bench", help="base dédiée au banc (vidée au démarrage)")
+    p.add_argument("--rate", type=float, default=5.0, help="commandes par seconde")
+    p.add_argument("--duration", type=float, default=30.0, help="durée d'envoi des commandes (s)")
+    p.add_argument("--drain", type=float, default=60.0, help="attente max des livraisons après l'envoi (s)")
+    p.add_argument("--couriers", type=int, default=500)
+    p.add_argument("--policy", choices=fleet_mod.POLICIES, default="prob")
+    p.add_argument("--accept-prob", type=float, default=0.05)
+    p.add_argument("--max-km", type=float, default=3.0)
+    p.add_argument("--window", type=float, default=BATCH_WINDOW_S, help="regroupement des commandes (s)")
+    p.add_argument("--candidates", type=float, default=CANDIDATES_S, help="attente des candidatures (s, au plus)")
+    p.add_argument("--window-policy", choices=POLICIES, default="adaptive",
+                   help="fixed : toujours --candidates ; adaptive : fermeture anticipée (window.py)")
+    p.add_argument("--speedup", type=float, default=SPEEDUP, help="courses N fois plus courtes que l'ETA")
+    p.add_argument("--seed", type=int, default=None)
+    p.add_argument("--out", help="fichier JSON des résultats")
+    p.add_argument("--baseline", help="JSON d'un run de référence à comparer")
+    p.add_argument("--tolerance", type=float, default=0.2, help="dégradation de p95 tolérée (0.2 = +20 %%)")
+    return p.parse_args(argv)
+
+def main():
+    args = parse_args()
+    if args.seed is not None:
+        random.seed(args.seed)
+    fleet_mod.STATS_EVERY_S = max(fleet_mod.STATS_EVERY_S, args.duration)  # moins de bruit pendant le banc
+    client = MongoClient(URI, maxPoolSize=50)
+    try:
+        res = asyncio.run(Bench(prepare_db(client, args.db), args).run())
+    finally:
+        client.close()
+    print_report(res)
+    if args.out:
+        os.makedirs(os.path.dirname(args.out) or ".", exist_ok=True)
+        with open(args.out, "w", encoding="utf-8") as f:
+            json.dump(res, f, indent=2)
+        print(f"[BENCH] 💾 Résultats : {args.out}")
+    if args.baseline:
+        worse = compare(res, args.baseline, args.tolerance)
+        for hop, old, new in worse:
+            print(f"[BENCH] ❌ régression {hop} : p95 {old:.1f} ms -> {new:.1f} ms")
+        if worse:
+            sys.exit(1)
+        print("[BENCH] ✅ aucune régression de p95 par rapport à la référence")
+
+if __name__ == "__main__":
+    try:
+        main()
+    except KeyboardInterrupt:
+        print("\n[BENCH] Arrêt.")
+        sys.exit(0)
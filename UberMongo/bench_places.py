@@ -0,0 +1,93 @@
+"""
+Restaurants à proximité côté MongoDB : $geoNear sur restaurant_places (index 2dsphere, places.py)
+vs balayage linéaire (toutes les positions relues puis haversine NumPy côté client).
+
+Remplit une base dédiée <DB_NAME>_bench_places avec --restaurants points dans Paris (supprimée
+à la fin sauf --keep) ; les deux méthodes doivent rendre les mêmes restaurants. Utilise MONGODB_URI (.env).
+
+    python bench_places.py --restaurants 100000 --radius 1 --k 10
+"""
+import argparse, os, random, statistics, time
+import numpy as np
+from pymongo import MongoClient, InsertOne
+from dotenv import load_dotenv
+
+from geo import haversine_pairs
+from places import PLACES, ensure_places_index, near, point
+
+load_dotenv()
+URI = os.getenv("MONGODB_URI")
+DBNAME = os.getenv("DB_NAME", "ubeer")
+
+def fill(db, n, chunk=10_000):
+    db[PLACES].drop()
+    ensure_places_index(db)
+    ops = []
+    for i in range(n):
+        ops.append(InsertOne({"_id": f"Resto {i:06d}",
+                              "location": point(48.80 + random.random() * 0.12, 2.25 + random.random() * 0.17)}))
+        if len(ops) >= chunk:
+            db[PLACES].bulk_write(ops, ordered=False)
+            ops = []
+    if ops:
+        db[PLACES].bulk_write(ops, ordered=False)
+
+def linear(db, lat, lon, radius_km, k):
+    """Ce qu'on ferait sans index : tout relire et trier côté client."""
+    docs = list(db[PLACES].find({}, {"location.coordinates": 1}))
+    lons = np.array([d["location"]["coordinates"][0] for d in docs])
+    lats = np.array([d["location"]["coordinates"][1] for d in docs])
+    d = haversine_pairs(lat, lon, lats, lons)
+    idx = np.nonzero(d <= radius_km)[0] if radius_km is not None else np.arange(len(d))
+    idx = idx[np.argsort(d[idx], kind="stable")][:k]
+    return [docs[i]["_id"] for i in idx]
+
+def timed(fn, queries):
+    out, lat = [], []
+    for q in queries:
+        t0 = time.perf_counter()
+        out.append(fn(*q))
+        lat.append((time.perf_counter() - t0) * 1e6)
+    lat.sort()
+    return out, statistics.median(lat), lat[max(0, int(len(lat) * 0.99) - 1)]
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--restaurants", type=int, default=100_000)
+    ap.add_argument("--queries", type=int, default=1000)
+    ap.add_argument("--linear-queries", type=int, default=20, help="le balayage linéaire est lent : moins de requêtes")
+    ap.add_argument("--radius", type=float, default=1.0)
+    ap.add_argument("--k", type=int, default=10)
+    ap.add_argument("--keep", action="store_true", help="garder la base de test")
+    args = ap.parse_args()
+    random.seed(7)
+
+    client = MongoClient(URI)
+    db = client[f"{DBNAME}_bench_places"]
+    try:
+        t0 = time.perf_counter()
+        fill(db, args.restaurants)
+        print(f"[BENCH] {args.restaurants} restaurants insérés et indexés en {time.perf_counter() - t0:.1f} s")
+        queries = [(48.80 + random.random() * 0.12, 2.25 + random.random() * 0.17) for _ in range(args.queries)]
+        few = queries[:args.linear_queries]
+
+        rows, mismatch = [], 0
+        for label, radius, k in ((f"within {args.radius:g} km", args.radius, None),
+                                 (f"{args.k} plus proches", None, args.k)):
+            geo, p50, p99 = timed(lambda a, b: [n for n, _ in near(db, a, b, radius, k)], queries)
+            rows.append((f"{label} $geoNear", p50, p99))
+            lin, p50, p99 = timed(lambda a, b: linear(db, a, b, radius, k), few)
+            rows.append((f"{label} linéaire", p50, p99))
+            mismatch += sum(set(x) != set(y) for x, y in zip(geo, lin))
+
+        print(f"{'':<32}{'p50':>11}{'p99':>11}")
+        for name, a, b in rows:
+            print(f"{name:<32}{a:>9.0f}µs{b:>9.0f}µs")
+        print(f"[BENCH] {mismatch} requête(s) en désaccord avec le balayage linéaire")
+    finally:
+        if not args.keep:
+            client.drop_database(db.name)
+        client.close()
+
+if __name__ == "__main__":
+    main()
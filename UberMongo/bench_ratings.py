@@ -0,0 +1,82 @@
+"""
+Stress test de la notation : chemin d'origine (find_one puis update_one avec la moyenne
+recalculée en Python) vs mise à jour atomique en pipeline (ratings.rate).
+
+N threads notent le MÊME coursier en parallèle ; on compare les latences et on vérifie
+à la fin que ratings_count et avg_rating reflètent bien toutes les notes. Utilise MONGODB_URI (.env).
+
+    python bench_ratings.py --threads 32 --ratings 100
+"""
+import argparse, os, random, statistics, threading, time
+from pymongo import MongoClient
+from dotenv import load_dotenv
+
+from ratings import ensure_ratings_index, rate
+
+load_dotenv()
+URI = os.getenv("MONGODB_URI")
+DBNAME = os.getenv("DB_NAME", "ubeer")
+
+def legacy_rate(db, courier_id, score, order_id):
+    # copie de la mise à jour d'origine de client_mongo.rate_courier
+    c = db.couriers.find_one({"courier_id": courier_id}) or {"avg_rating": 0, "ratings_count": 0}
+    new_count = c["ratings_count"] + 1
+    new_avg = (c["avg_rating"] * c["ratings_count"] + score) / new_count
+    db.couriers.update_one(
+        {"courier_id": courier_id},
+        {"$set": {"avg_rating": new_avg, "ratings_count": new_count}},
+        upsert=True
+    )
+    return new_avg, new_count
+
+def run(db, fn, courier_id, threads, per_thread):
+    db.couriers.delete_many({"courier_id": courier_id})
+    lat, lock, expected = [], threading.Lock(), [0]
+
+    def worker(t):
+        rng = random.Random(t)
+        mine, total = [], 0
+        for i in range(per_thread):
+            score = rng.randint(1, 5)
+            t0 = time.perf_counter()
+            fn(db, courier_id, score, f"o{t}-{i}")
+            mine.append(time.perf_counter() - t0)
+            total += score
+        with lock:
+            lat.extend(mine)
+            expected[0] += total
+
+    ths = [threading.Thread(target=worker, args=(t,)) for t in range(threads)]
+    t0 = time.perf_counter()
+    for th in ths:
+        th.start()
+    for th in ths:
+        th.join()
+    return time.perf_counter() - t0, lat, expected[0]
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--threads", type=int, default=32)
+    ap.add_argument("--ratings", type=int, default=100, help="notes par thread")
+    args = ap.parse_args()
+
+    client = MongoClient(URI)
+    db = client[DBNAME]
+    ensure_ratings_index(db)
+    n = args.threads * args.ratings
+    print(f"{args.threads} threads × {args.ratings} notes = {n} notes sur un même coursier")
+    for label, fn in (("origine (find+update)", legacy_rate), ("pipeline atomique", rate)):
+        courier_id = f"bench-{label.split()[0]}"
+        elapsed, lat, expected_sum = run(db, fn, courier_id, args.threads, args.ratings)
+        lat.sort()
+        doc = db.couriers.find_one({"courier_id": courier_id})
+        lost = n - doc["ratings_count"]
+        avg_err = abs(doc["avg_rating"] - expected_sum / n)
+        print(f"{label:<22} {n / elapsed:7.0f} notes/s | p50={statistics.median(lat) * 1e3:.2f} ms "
+              f"p95={lat[int(0.95 * (len(lat) - 1))] * 1e3:.2f} ms | "
+              f"notes perdues={lost} écart moyenne={avg_err:.4f}")
+        db.couriers.delete_many({"courier_id": courier_id})
+    client.close()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,80 @@
+"""
+Benchmark du tracking : insert_one par point (chemin d'origine) vs TrackingWriter groupé.
+
+N coursiers simulés (threads) publient chacun T points le plus vite possible dans une
+collection temporaire, puis on compare les insertions/s. Utilise MONGODB_URI (.env).
+
+    python bench_tracking_writer.py --couriers 50 --ticks 200
+    python bench_tracking_writer.py --w 0          # sans accusé d'écriture
+"""
+import argparse, os, threading, time
+from pymongo import MongoClient
+from pymongo.write_concern import WriteConcern
+from dotenv import load_dotenv
+
+from tracking_writer import TrackingWriter
+
+load_dotenv()
+URI = os.getenv("MONGODB_URI")
+DBNAME = os.getenv("DB_NAME", "ubeer")
+BENCH_COLL = "bench_tracking"
+
+def track_doc(courier, i):
+    return {"type": "TRACK", "order_id": f"bench-{courier}", "courier_id": f"c{courier}",
+            "status": "vers_client", "lat": 48.86 + i * 1e-5, "lon": 2.34, "progress": i % 101,
+            "eta_s": 100, "global_eta_s": 200, "sent_at": int(time.time())}
+
+def run_threads(n, target):
+    threads = [threading.Thread(target=target, args=(c,)) for c in range(n)]
+    t0 = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return time.perf_counter() - t0
+
+def bench_insert_one(coll, couriers, ticks):
+    def courier(c):
+        for i in range(ticks):
+            coll.insert_one(track_doc(c, i))
+    return run_threads(couriers, courier)
+
+def bench_writer(coll, couriers, ticks, w, batch):
+    writer = TrackingWriter(coll, max_batch=batch, w=w).start()
+    def courier(c):
+        for i in range(ticks):
+            writer.write(track_doc(c, i))
+    t0 = time.perf_counter()
+    run_threads(couriers, courier)
+    enqueue_s = time.perf_counter() - t0
+    writer.close()
+    return enqueue_s, time.perf_counter() - t0, writer.stats()
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--couriers", type=int, default=50)
+    ap.add_argument("--ticks", type=int, default=200)
+    ap.add_argument("--w", type=int, default=1, help="write concern (0 ou 1)")
+    ap.add_argument("--batch", type=int, default=500)
+    args = ap.parse_args()
+
+    client = MongoClient(URI)
+    db = client[DBNAME]
+    coll = db[BENCH_COLL]
+    coll.drop()
+    total = args.couriers * args.ticks
+    print(f"{args.couriers} coursiers × {args.ticks} points = {total} TRACK (w={args.w})")
+
+    t = bench_insert_one(coll.with_options(write_concern=WriteConcern(w=args.w)), args.couriers, args.ticks)
+    print(f"insert_one par point : {total / t:10.0f} inserts/s  ({t:.2f} s)")
+    coll.drop()
+
+    enq, t, st = bench_writer(coll, args.couriers, args.ticks, args.w, args.batch)
+    print(f"TrackingWriter       : {total / t:10.0f} inserts/s  ({t:.2f} s, {st['batches']} lots, "
+          f"{st['errors']} erreurs) | côté coursier : {total / enq:.0f} points/s")
+    assert coll.count_documents({}) == st["written"]
+    coll.drop()
+    client.close()
+
+if __name__ == "__main__":
+    main()
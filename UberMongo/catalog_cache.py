@@ -0,0 +1,279 @@
+"""
+Cache du catalogue des restaurants, partagé dans le processus et tenu à jour par change stream.
+
+- chargement : UNE agrégation ($group par restaurant, plats poussés dans un tableau) au lieu de
+  distinct + un find par restaurant ; le change stream est ouvert AVANT, rien n'est manqué ;
+- mise à jour : insert / update sur `restaurants` -> le restaurant concerné est relu (les
+  événements d'une rafale sont regroupés en une requête $in) ; un delete, un replace (l'import
+  peut déplacer un sku vers un autre restaurant, l'ancien nom n'est pas dans l'événement) ou un
+  renommage ne dit pas quel restaurant change -> rechargement complet, lui aussi regroupé, et
+  au plus un toutes les RELOAD_MIN_S (un import qui remplace des documents en continu ne relance
+  pas le $group complet toutes les FLUSH_S ; en attendant, les insert / update restent appliqués) ;
+- taille bornée (max_restaurants, LRU) ; un restaurant absent du cache (éjecté, ou ajouté à
+  l'instant) est lu dans Mongo à la demande au lieu d'être déclaré inconnu ;
+- démarrage à chaud : le cache et le jeton de reprise du change stream sont enregistrés dans
+  catalog_cache_<db>.json (à l'arrêt, et SAVE_EVERY_S après une modification) ; au lancement
+  suivant on repart du fichier et le change stream rejoue les modifications faites entre-temps
+  (rechargement complet si l'oplog ne les a plus). Le jeton enregistré est celui du dernier
+  événement appliqué au cache : des modifications encore en attente (regroupement) au moment
+  de l'enregistrement seront rejouées, pas sautées.
+
+    cat = open_catalog(db)      # le même objet pour tout le processus
+    cat.pickup("Sushi Mori")    # {"lat": ..., "lon": ...} ou None
+    cat.menu("Sushi Mori")      # [{"item", "sku", "price_eur", "prep_min"}]
+"""
+import os, threading, time
+from collections import OrderedDict
+from bson import json_util
+from pymongo import ASCENDING
+from pymongo.errors import PyMongoError, OperationFailure
+
+CACHE_MAX = 50_000       # restaurants gardés en mémoire
+MAX_AWAIT_MS = 500
+BATCH_MAX = 1000         # restaurants relus au plus par requête de rafraîchissement
+FLUSH_S = 0.2            # regroupement des événements d'une rafale
+RELOAD_MIN_S = 5.0       # intervalle minimal entre deux rechargements complets
+SAVE_EVERY_S = 60        # enregistrement du cache à chaud après des modifications
+WARM_DIR = "."
+
+GROUP_PIPELINE = [
+    {"$match": {"restaurant": {"$type": "string"}}},
+    {"$group": {
+        "_id": "$restaurant",
+        "lat": {"$first": "$latitude"},
+        "lon": {"$first": "$longitude"},
+        "items": {"$push": {"item": "$item", "sku": "$sku", "price_eur": "$price_eur", "prep_min": "$prep_min"}},
+    }},
+    {"$sort": {"_id": 1}},
+]
+
+def _entry(doc):
+    """Document $group -> entrée du cache, ou None si les coordonnées sont invalides."""
+    try:
+        pickup = {"lat": float(doc["lat"]), "lon": float(doc["lon"])}
+    except (KeyError, TypeError, ValueError):
+        return None
+    items = sorted((it for it in doc.get("items") or [] if it.get("item")), key=lambda it: str(it["item"]))
+    return {"pickup": pickup, "items": items}
+
+class CatalogCache:
+    def __init__(self, db, max_restaurants=CACHE_MAX, warm_path=None):
+        self.coll = db.restaurants
+        self.max = max_restaurants
+        self.warm_path = warm_path
+        self.entries = OrderedDict()   # nom -> {"pickup", "items"} (ordre LRU)
+        self.complete = False          # True : tout le catalogue tient dans le cache
+        self.lock = threading.Lock()
+        self.resume_token = None       # dernier événement lu (reprise du change stream)
+        self.applied_token = None      # dernier événement appliqué au cache (celui qu'on enregistre)
+        self.need_load = True
+        self.pending = set()           # restaurants à relire
+        self.pending_reload = False
+        self.pending_since = None
+        self.reloaded_at = float("-inf")
+        self.dirty = False
+        self.saved_at = time.monotonic()
+        self.hits = self.misses = self.fetches = self.reloads = 0
+        self.ready = threading.Event()
+        self.stopping = threading.Event()
+        self.thread = threading.Thread(target=self._run, daemon=True, name="catalog-cache")
+
+    def start(self, timeout=30):
+        """Démarrage à chaud si possible, puis change stream (et chargement complet sinon)."""
+        self.coll.create_index([("restaurant", ASCENDING)])
+        self._load_warm()
+        self.thread.start()
+        if not self.ready.wait(timeout):
+            print(f"[CATALOG] ⚠️ catalogue pas encore chargé après {timeout} s")
+        return self
+
+    def close(self):
+        self.stopping.set()
+        if self.thread.is_alive():
+            self.thread.join(timeout=2 * MAX_AWAIT_MS / 1000)
+        self.save()
+
+    # ----- lecture
+
+    def __len__(self):
+        return len(self.entries)
+
+    def _get(self, name):
+        with self.lock:
+            e = self.entries.get(name)
+            if e is not None:
+                self.entries.move_to_end(name)
+                self.hits += 1
+                return e
+            self.misses += 1
+        self._refresh([name])   # hors cache ou ajouté à l'instant : lecture directe dans Mongo
+        with self.lock:
+            return self.entries.get(name)
+
+    def pickup(self, name):
+        e = self._get(name)
+        return e["pickup"] if e else None
+
+    def menu(self, name):
+        e = self._get(name)
+        return list(e["items"]) if e else []
+
+    def names(self):
+        if self.complete:
+            with self.lock:
+                return sorted(self.entries)
+        return sorted(n for n in self.coll.distinct("restaurant") if isinstance(n, str))
+
+    def stats(self):
+        return {"restaurants": len(self.entries), "complete": self.complete, "hits": self.hits,
+                "misses": self.misses, "fetches": self.fetches, "reloads": self.reloads}
+
+    # ----- remplissage
+
+    def _put(self, name, entry):
+        """Sous self.lock."""
+        self.entries[name] = entry
+        self.entries.move_to_end(name)
+        while len(self.entries) > self.max:
+            self.entries.popitem(last=False)
+            self.complete = False
+
+    def _full_load(self):
+        t0 = time.perf_counter()
+        entries, total = OrderedDict(), 0
+        for doc in self.coll.aggregate(GROUP_PIPELINE, allowDiskUse=True):
+            total += 1
+            e = _entry(doc)
+            if e is not None and len(entries) < self.max:
+                entries[doc["_id"]] = e
+        with self.lock:
+            self.entries = entries
+            self.complete = total <= self.max
+            self.reloads += 1
+        self.reloaded_at = time.monotonic()
+        print(f"[CATALOG] 📚 {len(entries)} restaurants chargés en {(time.perf_counter() - t0) * 1000:.0f} ms"
+              + ("" if self.complete else f" (sur {total}, cache borné à {self.max})"))
+
+    def _refresh(self, names):
+        """Relit quelques restaurants ; ceux qui n'ont plus de document disparaissent."""
+        names = list(names)
+        for i in range(0, len(names), BATCH_MAX):
+            chunk = names[i:i + BATCH_MAX]
+            pipeline = [{"$match": {"restaurant": {"$in": chunk}}}] + GROUP_PIPELINE[1:]
+            found = {doc["_id"]: _entry(doc) for doc in self.coll.aggregate(pipeline)}
+            with self.lock:
+                self.fetches += 1
+                for name in chunk:
+                    e = found.get(name)
+                    if e is not None:
+                        self._put(name, e)
+                    else:
+                        self.entries.pop(name, None)
+
+    # ----- change stream
+
+    def _on_event(self, ev):
+        op = ev.get("operationType")
+        doc = ev.get("fullDocument") or {}
+        renamed = "restaurant" in ((ev.get("updateDescription") or {}).get("updatedFields") or {})
+        if op in ("insert", "update") and doc.get("restaurant") and not renamed:
+            self.pending.add(doc["restaurant"])
+        else:  # delete, replace, renommage, drop… : on ne sait pas (tous) les restaurants qui changent
+            self.pending_reload = True
+        if self.pending_since is None:
+            self.pending_since = time.monotonic()
+
+    def _apply_pending(self):
+        if self.pending_reload and time.monotonic() - self.reloaded_at < RELOAD_MIN_S:
+            # rechargement reporté (les événements suivants s'y ajoutent) : il reste en attente,
+            # le jeton appliqué n'avance pas ; les restaurants déjà connus sont relus tout de suite
+            if self.pending:
+                self._refresh(self.pending)
+                self.pending, self.dirty = set(), True
+            return
+        if self.pending_reload:
+            self._full_load()
+        elif self.pending:
+            self._refresh(self.pending)
+            print(f"[CATALOG] 🔄 {len(self.pending)} restaurant(s) mis à jour")
+        self.pending, self.pending_reload, self.pending_since = set(), False, None
+        self.dirty = True
+
+    def _run(self):
+        while not self.stopping.is_set():
+            try:
+                with self.coll.watch(full_document="updateLookup", resume_after=self.resume_token,
+                                     max_await_time_ms=MAX_AWAIT_MS) as stream:
+                    self.resume_token = stream.resume_token
+                    if self.pending_since is None:
+                        self.applied_token = self.resume_token
+                    if self.need_load:   # curseur déjà ouvert : aucune modification perdue
+                        self._full_load()
+                        self.need_load = False
+                        self.save()
+                    self.ready.set()
+                    while not self.stopping.is_set() and stream.alive:
+                        ev = stream.try_next()
+                        self.resume_token = stream.resume_token
+                        if ev is not None:
+                            self._on_event(ev)
+                        if self.pending_since is not None and (
+                                ev is None or len(self.pending) >= BATCH_MAX
+                                or time.monotonic() - self.pending_since >= FLUSH_S):
+                            self._apply_pending()
+                        if self.pending_since is None:   # rien en attente : le cache est à jour
+                            self.applied_token = self.resume_token
+                        if self.dirty and time.monotonic() - self.saved_at >= SAVE_EVERY_S:
+                            self.save()
+            except PyMongoError as e:
+                if isinstance(e, OperationFailure) and e.code == 286:  # ChangeStreamHistoryLost
+                    self.resume_token, self.applied_token, self.need_load = None, None, True
+                print(f"[CATALOG] ⚠️ change stream 'restaurants' interrompu ({e}) → reprise…")
+                time.sleep(1.0)
+
+    # ----- démarrage à chaud
+
+    def _load_warm(self):
+        if not self.warm_path or not os.path.exists(self.warm_path):
+            return
+        try:
+            with open(self.warm_path, encoding="utf-8") as f:
+                data = json_util.loads(f.read())
+            entries = OrderedDict((name, e) for name, e in data["entries"])
+        except (OSError, ValueError, KeyError, TypeError) as e:
+            print(f"[CATALOG] ⚠️ cache {self.warm_path} illisible ({e!r}), chargement complet")
+            return
+        with self.lock:
+            self.entries = entries
+            self.complete = data.get("complete", False) and len(entries) <= self.max
+        self.resume_token = self.applied_token = data.get("resume_token")
+        self.need_load = self.resume_token is None
+        print(f"[CATALOG] ♨️ démarrage à chaud : {len(entries)} restaurants ({self.warm_path})")
+
+    def save(self):
+        """Cache + jeton de reprise, écrits atomiquement pour le prochain démarrage."""
+        if not self.warm_path or self.need_load:
+            return
+        with self.lock:
+            data = {"resume_token": self.applied_token, "complete": self.complete,
+                    "entries": list(self.entries.items()), "saved_at": int(time.time())}
+        self.dirty, self.saved_at = False, time.monotonic()
+        tmp = f"{self.warm_path}.{os.getpid()}.tmp"
+        try:
+            with open(tmp, "w", encoding="utf-8") as f:
+                f.write(json_util.dumps(data))
+            os.replace(tmp, self.warm_path)
+        except OSError as e:
+            print(f"[CATALOG] ⚠️ cache non enregistré ({e})")
+
+_caches = {}
+_caches_lock = threading.Lock()
+
+def open_catalog(db, max_restaurants=CACHE_MAX, warm=True):
+    """Cache du processus pour cette base (démarré au premier appel)."""
+    with _caches_lock:
+        cat = _caches.get(db.name)
+        if cat is None:
+            warm_path = os.path.join(WARM_DIR, f"catalog_cache_{db.name}.json") if warm else None
+            cat = _caches[db.name] = CatalogCache(db, max_restaurants, warm_path).start()
+        return cat
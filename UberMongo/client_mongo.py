@@ -1,23 +1,28 @@
-import os, time, uuid
+import argparse, os, queue, time, uuid
+from datetime import datetime, timezone
 from pymongo import MongoClient
+from pymongo.errors import OperationFailure
 from dotenv import load_dotenv
 
+from catalog_cache import open_catalog
+from places import NEAR_MAX, PLACES, near
+from ratings import ensure_ratings_index, rate
+from reckoning import Follower
+from stream_mux import ChangeStreamMux
+from tracking_store import TRACKING_LATEST, get_latest_position
+
 load_dotenv()
 URI = os.getenv("MONGODB_URI")
 DBNAME = os.getenv("DB_NAME", "ubeer")
 
 CLIENT_LAT = 48.8610
 CLIENT_LON = 2.3450
+RENDER_S = 1.0      # suivi reckoning : position estimée affichée chaque seconde entre deux TRACK
 
-def fetch_restaurants(db):
-    coll = db.restaurants
-    names = coll.distinct("restaurant")
-    return sorted([n for n in names if isinstance(n, str)])
-
-def fetch_menu_for_restaurant(db, resto_name):
-    coll = db.restaurants
-    cur = coll.find({"restaurant": resto_name}, {"_id": 0}).sort("item", 1)
-    return list(cur)
+def show_estimate(follower, now):
+    lat, lon = follower.position(now)
+    print(f"[SUIVI] {follower.msg.get('status', '')} | prog~{follower.progress(now):.0f}% | "
+          f"pos~({lat:.5f},{lon:.5f}) | eta~{int(follower.eta_s(now) // 60)} min")
 
 def rate_courier(db, courier_id, order_id):
     while True:
@@ -36,36 +41,42 @@ def rate_courier(db, courier_id, order_id):
         "order_id": order_id,
         "score": score,
         "comment": comment,
-        "ts": int(time.time())
+        "ts": int(time.time()),
+        "at": datetime.now(timezone.utc),   # index TTL (ratings.RATINGS_RETENTION_DAYS)
     })
 
-    c = db.couriers.find_one({"courier_id": courier_id}) or {"avg_rating": 0, "ratings_count": 0}
-    new_count = c["ratings_count"] + 1
-    new_avg = (c["avg_rating"] * c["ratings_count"] + score) / new_count
+    # moyenne + historique récent en une mise à jour atomique (voir ratings.py)
+    new_avg, _, recent = rate(db, courier_id, score, order_id)
 
-    db.couriers.update_one(
-        {"courier_id": courier_id},
-        {"$set": {"avg_rating": new_avg, "ratings_count": new_count}},
-        upsert=True
-    )
+    print(f"⭐ Merci ! Vous avez noté {score}/5 (moyenne actuelle du livreur ≈ {round(new_avg,2)}, "
+          f"note récente ≈ {round(recent,2)})")
 
-    print(f"⭐ Merci ! Vous avez noté {score}/5 (moyenne actuelle du livreur ≈ {round(new_avg,2)})")
-
-def main():
+def main(radius_km=None, limit=NEAR_MAX):
     client = MongoClient(URI)
     db = client[DBNAME]
     orders = db.orders
     assignments = db.assignments
-    tracking = db.tracking
+    ensure_ratings_index(db)
+    # une mise à jour de la « dernière position » par point de tracking
+    tracking_latest = db[TRACKING_LATEST]
 
-    names = fetch_restaurants(db)
+    catalog = open_catalog(db)   # un seul $group (ou démarrage à chaud) au lieu de distinct + find par resto
+    # du plus proche au plus loin ($geoNear, places.py) ; liste alphabétique sans index géographique
+    try:
+        near_list = near(db, CLIENT_LAT, CLIENT_LON, radius_km, limit)
+    except OperationFailure:
+        near_list = []   # restaurant_places pas encore construit : python places.py --rebuild
+    if not near_list and radius_km is not None and db[PLACES].estimated_document_count():
+        print(f"⚠️ Aucun restaurant à moins de {radius_km} km.")
+        return
+    names = [name for name, _ in near_list] or catalog.names()
     if not names:
         print("⚠️ Aucun restaurant trouvé dans MongoDB ('restaurants').")
         return
 
-    print("Restaurants disponibles :")
+    print("Restaurants à proximité :" if near_list else "Restaurants disponibles :")
     for i, name in enumerate(names, 1):
-        print(f"{i}) {name}")
+        print(f"{i}) {name} ({near_list[i - 1][1]:.1f} km)" if near_list else f"{i}) {name}")
     while True:
         try:
             idx = int(input("Choisir un restaurant : ")) - 1
@@ -75,7 +86,7 @@ def main():
         print("Saisie invalide.")
 
     resto = names[idx]
-    menu = fetch_menu_for_restaurant(db, resto)
+    menu = catalog.menu(resto)
     if not menu:
         print(f"⚠️ Aucun plat trouvé pour '{resto}'.")
         return
@@ -93,6 +104,15 @@ def main():
 
     chosen = menu[k]
     order_id = str(uuid.uuid4())
+
+    # change streams ouverts (et abonnés) AVANT l'insertion : aucun événement manqué
+    # filter_keys : le serveur ne renvoie que cette commande, pas les affectations de toute la ville
+    assign_mux = ChangeStreamMux(assignments, filter_keys=True).start()
+    track_mux = ChangeStreamMux(tracking_latest, operation_types=("insert", "update", "replace"),
+                                filter_keys=True).start()
+    sel_q = assign_mux.subscribe(order_id)
+    track_q = track_mux.subscribe(order_id)
+
     orders.insert_one({
         "_id": order_id,
         "type": "ORDER",
@@ -100,42 +120,57 @@ def main():
         "items": [{"sku": chosen["sku"], "qty": 1, "name": chosen["item"]}],
         "customer": {"name": "Client POC", "lat": CLIENT_LAT, "lon": CLIENT_LON},
         "created_at": int(time.time()),
+        "sent_ts": time.time(),      # retard client -> manager (métriques du manager)
         "status": "created"
     })
     print(f"[CLIENT] 🧾 Commande envoyée : {order_id}")
 
-    with assignments.watch(
-        [{"$match": {"operationType": "insert", "fullDocument.order_id": order_id}}],
-        full_document="updateLookup"
-    ) as s1:
-        for ev in s1:
-            sel = ev["fullDocument"]
-            courier_id = sel["courier_id"]
-            courier_name = sel.get("courier_name", courier_id)
-            eta_min = sel.get("eta_min")
-            print(f"[CLIENT] ✅ Livreur attribué : {courier_name} (ETA ≈ {eta_min} min)")
-            break
-
-    print("[CLIENT] 🚴 Suivi en temps réel…")
     try:
-        with tracking.watch(
-            [{"$match": {"operationType": "insert", "fullDocument.order_id": order_id}}],
-            full_document="updateLookup"
-        ) as s2:
-            for ev in s2:
-                t = ev["fullDocument"]
-                status = t.get("status", "")
-                progress = t.get("progress", 0)
-                if status in ("vers_client_arrived", "livre"):
-                    print(f"[CLIENT] 🎉 Livraison terminée ({progress}%)")
-                    rate_courier(db, courier_id, order_id)
-                    break
-                else:
-                    print(f"[SUIVI] {status} | prog={progress}%")
+        sel = sel_q.get()
+        assign_mux.close()
+        courier_id = sel["courier_id"]
+        courier_name = sel.get("courier_name", courier_id)
+        eta_min = sel.get("eta_min")
+        print(f"[CLIENT] ✅ Livreur attribué : {courier_name} (ETA ≈ {eta_min} min)")
+
+        print("[CLIENT] 🚴 Suivi en temps réel…")
+        last = get_latest_position(db, order_id)
+        if last:
+            print(f"[SUIVI] dernière position connue : {last.get('status')} | prog={last.get('progress')}%")
+        seen = (last or {}).get("status"), (last or {}).get("progress")
+        follower = Follower()
+        while True:
+            try:
+                t = track_q.get(timeout=RENDER_S)
+            except queue.Empty:
+                # coursier en mode reckoning : position extrapolée entre deux TRACK
+                if follower.msg is not None and "vn" in follower.msg:
+                    show_estimate(follower, time.monotonic())
+                continue
+            status = t.get("status", "")
+            progress = t.get("progress", 0)
+            if (status, progress) == seen:
+                continue  # updateLookup peut renvoyer deux fois le même état
+            seen = status, progress
+            if status in ("vers_client_arrived", "livre"):
+                print(f"[CLIENT] 🎉 Livraison terminée ({progress}%)")
+                track_mux.close()
+                rate_courier(db, courier_id, order_id)
+                break
+            follower.update(t, time.monotonic())
+            if "vn" in t:
+                show_estimate(follower, time.monotonic())
+            else:
+                print(f"[SUIVI] {status} | prog={progress}%")
     except KeyboardInterrupt:
         print("\n[CLIENT] Arrêt du suivi.")
     finally:
+        catalog.close()
         client.close()
 
 if __name__ == "__main__":
-    main()
+    ap = argparse.ArgumentParser(description="Client MongoDB : commande, suivi, notation.")
+    ap.add_argument("--radius", type=float, help="restaurants à moins de N km seulement")
+    ap.add_argument("--limit", type=int, default=NEAR_MAX, help="nombre de restaurants proposés")
+    args = ap.parse_args()
+    main(radius_km=args.radius, limit=args.limit)
@@ -1,7 +1,14 @@
-import os, time, math, random
+import os, time, math, random, queue, argparse
 from pymongo import MongoClient
 from dotenv import load_dotenv
 
+from geo import haversine_km
+from metrics import Counter, serve
+from reckoning import TRACKING_MODES, Reckoner, velocity
+from routing import open_router, polyline_at
+from stream_mux import ChangeStreamMux
+from tracking_store import make_tracking_writer, track_doc
+
 load_dotenv()
 URI = os.getenv("MONGODB_URI")
 DBNAME = os.getenv("DB_NAME", "ubeer")
@@ -11,6 +18,11 @@ CENTER_LAT, CENTER_LON = 48.8660, 2.3350
 JITTER_KM = 0.3
 TICK_SEC = 1.0
 PAUSE_S = 2
+SELECTION_TIMEOUT_S = 120
+TRACKING = "quarters"     # "reckoning" : position + vitesse, TRACK seulement sur écart (reckoning.py)
+
+# Métriques (metrics.py, --metrics-port) ; les TRACK sont comptés par tracking_writer.py
+M_CANDIDATURES = Counter("ubeer_courier_candidatures_total", "Candidatures envoyées")
 
 NAMES = [
     "Alex","Sam","Robin","Camille","Noa","Lina","Mael","Eli","Nora","Rayan",
@@ -25,61 +37,105 @@ def jitter(lat0, lon0, spread_km=JITTER_KM):
     dlon = random.gauss(0, spread_km) / (111.0 * max(0.1, math.cos(math.radians(lat0))))
     return lat0 + dlat, lon0 + dlon
 
-def hav(a_lat,a_lon,b_lat,b_lon):
-    R=6371.0
-    dlat=math.radians(b_lat-a_lat); dlon=math.radians(b_lon-a_lon)
-    lat1=math.radians(a_lat); lat2=math.radians(b_lat)
-    h=math.sin(dlat/2)**2+math.cos(lat1)*math.cos(lat2)*math.sin(dlon/2)**2
-    return 2*R*math.asin(math.sqrt(h))
-
 def lerp(a,b,t): return a+(b-a)*t
 
-def move_and_track(db, order_id, courier, start, target, status_label, planned_s, global_remaining_s):
-    tracking = db.tracking
+def track_ticks(order_id, courier, start, target, status_label, planned_s, global_remaining_s, clock=time.time,
+                path=None, tracking=TRACKING):
+    """
+    Tronçon découpé en ticks, sans dormir : produit (lat, lon, doc, wait_s) où doc est le
+    document TRACK à écrire (ou None si rien à écrire) et wait_s l'attente avant le tick suivant.
+    Utilisé par move_and_track (un coursier) et par fleet_mongo.py (roue de temporisation).
+    path : polyligne par les rues (routing.py) suivie au lieu de la ligne droite.
+    tracking : "quarters" (un point par quart) ou "reckoning" (position + vitesse vn/ve, puis un
+    point seulement quand l'extrapolation s'écarte de la position réelle, reckoning.py).
+    """
     steps = max(5, int(planned_s // TICK_SEC))
-    t0 = time.time()
+    t0 = clock()
     last_shown = -25
+    rk = Reckoner() if tracking == "reckoning" else None
+
+    def at(t):
+        if path:
+            return polyline_at(path, t)
+        return lerp(start[0], target[0], t), lerp(start[1], target[1], t)
+
     for step in range(steps+1):
         t = step/steps
-        lat = lerp(start[0], target[0], t)
-        lon = lerp(start[1], target[1], t)
+        lat, lon = at(t)
         progress = int(round(t*100))
-        if progress - last_shown < 25 and progress != 100:
-            time.sleep(TICK_SEC)
+        now = clock()
+        extra = {}
+        if rk is not None:
+            if not rk.due(now, lat, lon, status_label):
+                yield lat, lon, None, TICK_SEC
+                continue
+            vn, ve = velocity((lat, lon), at(min(1.0, (step + 1) / steps)), TICK_SEC)
+            rk.sent(now, lat, lon, vn, ve, status_label)
+            extra = {"vn": round(vn, 2), "ve": round(ve, 2)}
+        elif progress - last_shown < 25 and progress != 100:
+            yield lat, lon, None, TICK_SEC
             continue
         last_shown = progress
-        elapsed = time.time() - t0
+        elapsed = now - t0
         local_eta  = max(0, int(planned_s - elapsed))
         global_eta = max(0, int(global_remaining_s - elapsed))
-        tracking.insert_one({
-            "type":"TRACK",
-            "order_id":order_id,
-            "courier_id":courier["id"],
-            "name":courier["name"],
-            "status":status_label,
-            "lat":lat,"lon":lon,
-            "progress":progress,
-            "eta_s":local_eta,
-            "global_eta_s":global_eta,
-            "sent_at":int(time.time())
-        })
-        time.sleep(TICK_SEC)
-    tracking.insert_one({
-        "type":"TRACK",
-        "order_id":order_id,
-        "courier_id":courier["id"],
-        "name":courier["name"],
-        "status":f"{status_label}_arrived",
-        "lat":target[0],"lon":target[1],
-        "progress":100,"eta_s":0,
-        "global_eta_s":max(0, int(global_remaining_s - planned_s)),
-        "sent_at":int(time.time())
-    })
-
-def main():
+        yield lat, lon, track_doc(
+            order_id, courier,
+            status=status_label,
+            lat=lat, lon=lon,
+            progress=progress,
+            eta_s=local_eta,
+            global_eta_s=global_eta,
+            sent_at=int(time.time()),
+            **extra
+        ), TICK_SEC
+    yield target[0], target[1], track_doc(
+        order_id, courier,
+        status=f"{status_label}_arrived",
+        lat=target[0], lon=target[1],
+        progress=100, eta_s=0,
+        global_eta_s=max(0, int(global_remaining_s - planned_s)),
+        sent_at=int(time.time())
+    ), 0
+
+def move_and_track(tracking, order_id, courier, start, target, status_label, planned_s, global_remaining_s,
+                   path=None, mode=TRACKING):
+    """tracking : TrackingWriter (écriture groupée en arrière-plan, la boucle n'attend pas Mongo) ; mode : voir track_ticks."""
+    for _, _, doc, wait_s in track_ticks(order_id, courier, start, target, status_label,
+                                         planned_s, global_remaining_s, path=path, tracking=mode):
+        if doc:
+            tracking.write(doc)
+        if wait_s:
+            time.sleep(wait_s)
+
+def plan_delivery(pos, sel):
+    """
+    Trajectoire recalée sur l'ETA de l'assignation.
+    -> (pickup, drop, dur_pick, dur_drop, global_remaining)
+    """
+    pickup = (float(sel["pickup"]["lat"]), float(sel["pickup"]["lon"]))
+    drop = (float(sel["dropoff"]["lat"]), float(sel["dropoff"]["lon"]))
+    target_total_s = max(5, int(sel.get("eta_min", 10)*60))
+
+    d_pick = haversine_km(pos[0], pos[1], pickup[0], pickup[1])
+    d_drop = haversine_km(pickup[0], pickup[1], drop[0], drop[1])
+    dur_pick = (d_pick / max(1e-6, VITESSE_KMH)) * 3600
+    dur_drop = (d_drop / max(1e-6, VITESSE_KMH)) * 3600
+    total_raw = max(1.0, dur_pick + PAUSE_S + dur_drop)
+    scale = target_total_s / total_raw
+    dur_pick *= scale
+    dur_drop *= scale
+    return pickup, drop, dur_pick, dur_drop, dur_pick + PAUSE_S + dur_drop
+
+def main(graph=None, tracking_mode=TRACKING):
     client = MongoClient(URI)
+    router = open_router(graph, VITESSE_KMH) if graph else None   # trajets par les rues
     db = client[DBNAME]
-    orders, cands, assignments = db.orders, db.candidatures, db.assignments
+    orders, cands = db.orders, db.candidatures
+    # un seul change stream d'affectations pour toute la session du coursier, filtré côté serveur
+    # sur les commandes auxquelles il a candidaté (filter_keys)
+    assign_mux = ChangeStreamMux(db.assignments, filter_keys=True).start()
+    tracking = make_tracking_writer(db).start()
 
     firstname = choose_firstname()
     courier = {"id": firstname, "name": firstname}
@@ -101,6 +157,9 @@ def main():
                     print(f"[{courier['id']}] ❌ refuse la commande {order_id}")
                     continue
 
+                # abonné AVANT la candidature : la sélection ne peut pas arriver avant
+                sel_q = assign_mux.subscribe(order_id)
+
                 # Candidature
                 cands.insert_one({
                     "type":"CANDIDATURE",
@@ -108,21 +167,24 @@ def main():
                     "courier_id": courier["id"],
                     "name": courier["name"],
                     "position": {"lat": lat, "lon": lon},
-                    "sent_at": int(time.time())
+                    "sent_at": int(time.time()),
+                    "sent_ts": time.time(),
                 })
+                M_CANDIDATURES.inc()
                 print(f"[{courier['id']}] 📨 Candidature envoyée pour {order_id}")
 
                 # Attente sélection
-                with assignments.watch(
-                    [{"$match": {
-                        "operationType":"insert",
-                        "fullDocument.order_id": order_id,
-                        "fullDocument.courier_id": courier["id"]
-                    }}],
-                    full_document='updateLookup'
-                ) as s2:
-                    for ev in s2:
-                        sel = ev["fullDocument"]
+                deadline = time.monotonic() + SELECTION_TIMEOUT_S
+                try:
+                    while True:
+                        try:
+                            sel = sel_q.get(timeout=max(0.0, deadline - time.monotonic()))
+                        except queue.Empty:
+                            print(f"[{courier['id']}] ⏳ Pas sélectionné, on passe.")
+                            break
+                        if sel.get("courier_id") != courier["id"]:
+                            print(f"[{courier['id']}] Commande {order_id} attribuée à {sel.get('courier_id')}.")
+                            break
                         print(f"[{courier['id']}] ✅ Sélectionné pour {order_id}")
 
                         # ✅ Vérification sécurisée (évite KeyError)
@@ -133,41 +195,39 @@ def main():
                             print("→ Vérifie que manager_mongo.py insère bien ces champs.")
                             continue
 
-                        target_total_s = max(5, int(sel.get("eta_min", 10)*60))
-
-                        def dist(a_lat,a_lon,b_lat,b_lon):
-                            return hav(a_lat,a_lon,b_lat,b_lon)
-
-                        d_pick = dist(lat,lon,float(pickup["lat"]),float(pickup["lon"]))
-                        d_drop = dist(float(pickup["lat"]),float(pickup["lon"]),
-                                      float(dropoff["lat"]),float(dropoff["lon"]))
-                        dur_pick = (d_pick / max(1e-6, VITESSE_KMH)) * 3600
-                        dur_drop = (d_drop / max(1e-6, VITESSE_KMH)) * 3600
-                        total_raw = max(1.0, dur_pick + PAUSE_S + dur_drop)
-                        scale = target_total_s / total_raw
-                        dur_pick *= scale
-                        dur_drop *= scale
-                        global_remaining = dur_pick + PAUSE_S + dur_drop
+                        pickup, drop, dur_pick, dur_drop, global_remaining = plan_delivery((lat, lon), sel)
 
                         # 1️⃣ Vers le restaurant
-                        move_and_track(db, order_id, courier, (lat,lon),
-                                       (float(pickup["lat"]),float(pickup["lon"])),
-                                       "vers_resto", dur_pick, global_remaining)
+                        move_and_track(tracking, order_id, courier, (lat,lon), pickup,
+                                       "vers_resto", dur_pick, global_remaining,
+                                       router.path((lat, lon), pickup) if router else None, tracking_mode)
                         time.sleep(PAUSE_S)
 
                         # 2️⃣ Vers le client
-                        lat, lon = float(pickup["lat"]), float(pickup["lon"])
+                        lat, lon = pickup
                         global_remaining -= dur_pick + PAUSE_S
-                        move_and_track(db, order_id, courier, (lat,lon),
-                                       (float(dropoff["lat"]),float(dropoff["lon"])),
-                                       "vers_client", dur_drop, global_remaining)
+                        move_and_track(tracking, order_id, courier, (lat,lon), drop,
+                                       "vers_client", dur_drop, global_remaining,
+                                       router.path((lat, lon), drop) if router else None, tracking_mode)
                         print(f"[{courier['id']}] 🎯 Livraison terminée pour {order_id}")
                         break
+                finally:
+                    assign_mux.unsubscribe(order_id, sel_q)
 
     except KeyboardInterrupt:
         print("\n[COURSIER] Arrêt manuel.")
     finally:
+        tracking.close()
+        assign_mux.close()
         client.close()
 
 if __name__ == "__main__":
-    main()
+    ap = argparse.ArgumentParser(description="Coursier MongoDB : candidatures et livraison simulée.")
+    ap.add_argument("--graph", help="graphe de rues compilé (routing.py) : trajets par les rues")
+    ap.add_argument("--tracking", choices=TRACKING_MODES, default=TRACKING,
+                    help="reckoning : position + vitesse, un TRACK seulement quand l'estimation dérive")
+    ap.add_argument("--metrics-port", type=int, help="expose /metrics (Prometheus) sur ce port local")
+    args = ap.parse_args()
+    if args.metrics_port is not None:
+        serve(args.metrics_port)
+    main(graph=args.graph, tracking_mode=args.tracking)
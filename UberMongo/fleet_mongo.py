@@ -0,0 +1,333 @@
+"""
+Hôte de flotte MongoDB : N coursiers simulés dans UN processus, sur une seule boucle asyncio.
+
+- un seul MongoClient (pool partagé, --pool) pour toute la flotte ;
+- un change stream orders (mux, clé "type") et un change stream assignments (mux, clé
+  order_id) pour tous les coursiers ; l'acceptation suit une politique automatique (--policy) ;
+- les candidatures d'un même cran partent en un insert_many, les TRACK passent par le
+  TrackingWriter (écriture groupée, sans jamais bloquer la boucle) ;
+- déplacements (coursier_mongo.track_ticks) et pauses avancent sur une roue de temporisation.
+
+    python fleet_mongo.py --couriers 2000 --policy prob --accept-prob 0.02
+"""
+import asyncio, argparse, os, random, sys, time
+from pymongo import MongoClient
+from pymongo.errors import PyMongoError
+from dotenv import load_dotenv
+
+from catalog_cache import open_catalog
+from coursier_mongo import (
+    NAMES, CENTER_LAT, CENTER_LON, TICK_SEC, PAUSE_S, TRACKING,
+    jitter, track_ticks, plan_delivery, M_CANDIDATURES,
+)
+from geo import haversine_km
+from metrics import serve
+from reckoning import TRACKING_MODES
+from stream_mux import ChangeStreamMux
+from timer_wheel import TimerWheel
+from tracking_store import make_tracking_writer
+
+load_dotenv()
+URI = os.getenv("MONGODB_URI")
+DBNAME = os.getenv("DB_NAME", "ubeer")
+
+POOL_SIZE = 20             # connexions Mongo partagées par toute la flotte
+FLEET_JITTER_KM = 2.0      # dispersion des positions de départ
+SELECTION_TIMEOUT_S = 120
+STATS_EVERY_S = 5.0
+
+POLICIES = ("always", "prob", "near")
+
+def make_policy(name, restos, accept_prob=0.5, max_km=3.0):
+    """Politique d'acceptation automatique : callable(coursier, commande) -> bool."""
+    if name == "always":
+        return lambda c, order: True
+    if name == "prob":
+        return lambda c, order: random.random() < accept_prob
+    if name == "near":
+        def near(c, order):
+            pos = restos.pickup((order.get("restaurant") or {}).get("name"))
+            return pos is not None and haversine_km(c.lat, c.lon, pos["lat"], pos["lon"]) <= max_km
+        return near
+    raise ValueError(f"politique inconnue : {name}")
+
+def rss_bytes():
+    """
+    Mémoire résidente du processus : /proc sous Linux, sinon pic via getrusage (macOS),
+    sinon psutil s'il est installé (Windows), sinon 0.
+    """
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, AttributeError):
+        pass
+    try:
+        import resource  # absent sous Windows
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak if sys.platform == "darwin" else peak * 1024
+    except ImportError:
+        pass
+    try:
+        import psutil
+        return psutil.Process().memory_info().rss
+    except ImportError:
+        return 0
+
+class SimCourier:
+    __slots__ = ("ident", "lat", "lon", "state", "inbox", "deliveries")
+
+    def __init__(self, name, lat, lon):
+        self.ident = {"id": name, "name": name}   # forme attendue par track_doc
+        self.lat, self.lon = lat, lon
+        self.state = "idle"      # idle | candidate | delivering
+        self.inbox = asyncio.Queue(maxsize=1)
+        self.deliveries = 0
+
+class Fleet:
+    def __init__(self, db, n, policy, selection_timeout_s=SELECTION_TIMEOUT_S, speedup=1.0, verbose=False,
+                 tracking_mode=TRACKING):
+        """speedup : les courses durent ETA / speedup (tests de charge plus courts)."""
+        self.db = db
+        self.policy = policy
+        self.speedup = speedup
+        self.tracking_mode = tracking_mode
+        self.selection_timeout_s = selection_timeout_s
+        self.verbose = verbose
+        self.base_rss = rss_bytes()
+        self.couriers = {}
+        for i in range(n):
+            name = f"{NAMES[i % len(NAMES)]}-{i:05d}"
+            lat, lon = jitter(CENTER_LAT, CENTER_LON, FLEET_JITTER_KM)
+            self.couriers[name] = SimCourier(name, lat, lon)
+        self.loop = None
+        self.orders_mux = ChangeStreamMux(db.orders, key_field="type")
+        self.assign_mux = ChangeStreamMux(db.assignments)
+        self.tracking = make_tracking_writer(db, block=False)
+        self.waiting = {}        # order_id -> {nom: future de la sélection}
+        self.assign_cbs = {}     # order_id -> callback abonné au mux des affectations
+        self.cand_outbox = []    # candidatures insérées en un insert_many (au plus tard au cran suivant)
+        self.flush_pending = False
+        self.wheel = TimerWheel(tick_s=TICK_SEC, on_tick=self.flush)
+        self.tasks = []
+        self.ticks = 0
+        self.orders = 0
+        self.candidatures = 0
+        self.deliveries = 0
+        self.mem_per_courier = 0.0
+
+    def log(self, msg):
+        if self.verbose:
+            print(msg)
+
+    # ----- boucle principale
+
+    async def run(self):
+        self.loop = asyncio.get_running_loop()
+        self.tracking.start()
+        self.assign_mux.start()
+        self.orders_mux.start()
+        self.orders_mux.subscribe("ORDER", lambda doc: self.loop.call_soon_threadsafe(self.on_order, doc))
+
+        self.tasks = [asyncio.create_task(self.courier_loop(c)) for c in self.couriers.values()]
+        self.tasks += [asyncio.create_task(self.wheel.run()),
+                       asyncio.create_task(self.stats_loop())]
+        await asyncio.sleep(0)  # laisse chaque coroutine démarrer avant la mesure
+        self.mem_per_courier = (rss_bytes() - self.base_rss) / max(1, len(self.couriers))
+        print(f"[FLEET] 🚲 {len(self.couriers)} coursiers en ligne "
+              f"(≈ {self.mem_per_courier / 1024:.1f} Ko/coursier, RSS {rss_bytes() / 2**20:.0f} Mo)")
+        await asyncio.gather(*self.tasks)
+
+    async def shutdown(self):
+        for t in self.tasks:
+            t.cancel()
+        await asyncio.gather(*self.tasks, return_exceptions=True)
+        await self.flush()
+        self.orders_mux.close()
+        self.assign_mux.close()
+        self.tracking.close()
+
+    # ----- routage des événements (appelé dans la boucle via call_soon_threadsafe)
+
+    def on_order(self, order):
+        self.orders += 1
+        for c in self.couriers.values():
+            if c.state == "idle" and self.policy(c, order):
+                try:
+                    c.inbox.put_nowait(order)
+                except asyncio.QueueFull:
+                    pass  # une commande est déjà en cours d'examen
+
+    def on_assignment(self, sel):
+        order_id = sel.get("order_id")
+        for fut in self.waiting.pop(order_id, {}).values():
+            if not fut.done():
+                fut.set_result(sel)
+        self._unwatch(order_id)
+
+    def _watch(self, order_id, name, fut):
+        if order_id not in self.assign_cbs:
+            cb = lambda doc: self.loop.call_soon_threadsafe(self.on_assignment, doc)
+            self.assign_cbs[order_id] = cb
+            self.assign_mux.subscribe(order_id, cb)
+        self.waiting.setdefault(order_id, {})[name] = fut
+
+    def _unwatch(self, order_id):
+        cb = self.assign_cbs.pop(order_id, None)
+        if cb is not None:
+            self.assign_mux.unsubscribe(order_id, cb)
+
+    # ----- un coursier
+
+    async def courier_loop(self, c):
+        name = c.ident["id"]
+        while True:
+            order = await c.inbox.get()
+            if c.state != "idle":
+                continue
+            order_id = order["_id"]
+            c.state = "candidate"
+            fut = self.loop.create_future()
+            self._watch(order_id, name, fut)   # avant la candidature
+            self.cand_outbox.append({
+                "type": "CANDIDATURE", "order_id": order_id,
+                "courier_id": name, "name": name,
+                "position": {"lat": c.lat, "lon": c.lon}, "sent_at": int(time.time()), "sent_ts": time.time(),
+            })
+            self.flush_soon()
+            try:
+                sel = await asyncio.wait_for(fut, self.selection_timeout_s)
+            except asyncio.TimeoutError:
+                sel = None
+            finally:
+                waiters = self.waiting.get(order_id)
+                if waiters is not None:
+                    waiters.pop(name, None)
+                    if not waiters:
+                        self.waiting.pop(order_id, None)
+                        self._unwatch(order_id)
+            if not sel or sel.get("courier_id") != name or not sel.get("pickup") or not sel.get("dropoff"):
+                c.state = "idle"
+                continue
+            await self.deliver(c, order_id, sel)
+            c.state = "idle"
+
+    async def deliver(self, c, order_id, sel):
+        c.state = "delivering"
+        self.log(f"[{c.ident['id']}] ✅ Sélectionné pour {order_id}")
+        pickup, drop, dur_pick, dur_drop, global_remaining = plan_delivery((c.lat, c.lon), sel)
+        if self.speedup != 1.0:
+            dur_pick /= self.speedup
+            dur_drop /= self.speedup
+            global_remaining = dur_pick + PAUSE_S + dur_drop
+        await self.drive(c, track_ticks(order_id, c.ident, (c.lat, c.lon), pickup,
+                                        "vers_resto", dur_pick, global_remaining, tracking=self.tracking_mode))
+        await self.sleep(PAUSE_S)
+        global_remaining -= dur_pick + PAUSE_S
+        await self.drive(c, track_ticks(order_id, c.ident, pickup, drop,
+                                        "vers_client", dur_drop, global_remaining, tracking=self.tracking_mode))
+        c.lat, c.lon = drop
+        c.deliveries += 1
+        self.deliveries += 1
+        self.log(f"[{c.ident['id']}] 🎯 Livraison terminée pour {order_id}")
+
+    # ----- roue de temporisation
+
+    def sleep(self, delay_s):
+        fut = self.loop.create_future()
+        self.wheel.schedule(delay_s, lambda: fut.done() or fut.set_result(None))
+        return fut
+
+    def drive(self, c, ticks):
+        """Fait avancer un tronçon sur la roue ; le future se termine à l'arrivée."""
+        fut = self.loop.create_future()
+
+        def step():
+            try:
+                while True:
+                    lat, lon, doc, wait_s = next(ticks)
+                    c.lat, c.lon = lat, lon
+                    self.ticks += 1
+                    if doc:
+                        self.tracking.write(doc)   # block=False : jamais d'attente dans la boucle
+                    if wait_s:
+                        self.wheel.schedule(wait_s, step)
+                        return
+            except StopIteration:
+                fut.done() or fut.set_result(None)
+            except Exception as e:
+                fut.done() or fut.set_exception(e)
+
+        step()
+        return fut
+
+    def flush_soon(self):
+        # les coursiers qui candidatent sur la même commande sont réveillés dans le même
+        # passage de la boucle : un seul insert_many pour tous
+        if not self.flush_pending:
+            self.flush_pending = True
+            self.loop.create_task(self.flush())
+
+    async def flush(self):
+        """Insère les candidatures accumulées en un seul insert_many (hors de la boucle)."""
+        self.flush_pending = False
+        if not self.cand_outbox:
+            return
+        batch, self.cand_outbox = self.cand_outbox, []
+        try:
+            await asyncio.to_thread(self.db.candidatures.insert_many, batch, ordered=False)
+            self.candidatures += len(batch)
+            M_CANDIDATURES.inc(len(batch))
+        except PyMongoError as e:
+            print(f"[FLEET] ⚠️ {len(batch)} candidatures non envoyées ({e})")
+
+    async def stats_loop(self):
+        last_t, last_ticks = time.monotonic(), self.ticks
+        while True:
+            await asyncio.sleep(STATS_EVERY_S)
+            now = time.monotonic()
+            rate = (self.ticks - last_ticks) / max(1e-6, now - last_t)
+            last_t, last_ticks = now, self.ticks
+            busy = sum(1 for c in self.couriers.values() if c.state == "delivering")
+            st = self.tracking.stats()
+            print(f"[FLEET] 📈 {rate:.0f} ticks/s | {busy}/{len(self.couriers)} en course | "
+                  f"{self.orders} commandes, {self.candidatures} candidatures, {self.deliveries} livraisons | "
+                  f"TRACK écrits={st['written']} en attente={st['pending']} abandonnés={st['dropped']} | "
+                  f"RSS {rss_bytes() / 2**20:.0f} Mo "
+                  f"(+{(rss_bytes() - self.base_rss) / max(1, len(self.couriers)) / 1024:.1f} Ko/coursier) | "
+                  f"retard roue max {self.wheel.max_late_s * 1000:.0f} ms")
+
+async def amain(args):
+    if args.metrics_port is not None:
+        serve(args.metrics_port)
+    client = MongoClient(URI, maxPoolSize=args.pool)
+    db = client[DBNAME]
+    restos = open_catalog(db) if args.policy == "near" else None
+    fleet = Fleet(db, args.couriers, make_policy(args.policy, restos, args.accept_prob, args.max_km),
+                  speedup=args.speedup, verbose=args.verbose, tracking_mode=args.tracking)
+    try:
+        await fleet.run()
+    finally:
+        await fleet.shutdown()
+        client.close()
+
+def parse_args(argv=None):
+    p = argparse.ArgumentParser(description="Flotte de coursiers simulés MongoDB (asyncio, un seul processus).")
+    p.add_argument("--couriers", type=int, default=1000)
+    p.add_argument("--policy", choices=POLICIES, default="always",
+                   help="always : tout accepter ; prob : avec une probabilité ; near : restaurant proche")
+    p.add_argument("--accept-prob", type=float, default=0.5)
+    p.add_argument("--max-km", type=float, default=3.0)
+    p.add_argument("--pool", type=int, default=POOL_SIZE, help="connexions Mongo partagées")
+    p.add_argument("--speedup", type=float, default=1.0, help="courses N fois plus courtes que l'ETA")
+    p.add_argument("--verbose", action="store_true", help="une ligne par sélection / livraison")
+    p.add_argument("--tracking", choices=TRACKING_MODES, default=TRACKING,
+                   help="reckoning : position + vitesse, un TRACK seulement quand l'estimation dérive")
+    p.add_argument("--metrics-port", type=int, help="expose /metrics (Prometheus) sur ce port local")
+    return p.parse_args(argv)
+
+if __name__ == "__main__":
+    try:
+        asyncio.run(amain(parse_args()))
+    except KeyboardInterrupt:
+        print("\n[FLEET] Arrêt.")
+        sys.exit(0)
@@ -0,0 +1,98 @@
+"""
+Distances et ETA partagés par les scripts (manager, coursier, ...).
+
+- versions scalaires (math) pour un appel isolé ;
+- versions vectorisées (NumPy) pour scorer N coursiers × M commandes en un appel.
+La vitesse et le délai fixe restent propres à chaque script (20 km/h Redis, 28 km/h Mongo).
+"""
+import math
+import numpy as np
+
+R_TERRE_KM = 6371.0
+
+# ----- Scalaire -----
+
+def haversine_km(a_lat, a_lon, b_lat, b_lon):
+    dlat = math.radians(b_lat - a_lat)
+    dlon = math.radians(b_lon - a_lon)
+    lat1 = math.radians(a_lat); lat2 = math.radians(b_lat)
+    h = math.sin(dlat/2)**2 + math.cos(lat1)*math.cos(lat2)*math.sin(dlon/2)**2
+    return 2 * R_TERRE_KM * math.asin(math.sqrt(h))
+
+def eta_minutes(c_pos, pickup, drop, vitesse_kmh, delai_fixe_min):
+    """ETA (min, entier ≥ 1) coursier -> restaurant -> client."""
+    d1 = haversine_km(c_pos[0], c_pos[1], pickup[0], pickup[1])
+    d2 = haversine_km(pickup[0], pickup[1], drop[0], drop[1])
+    minutes = ((d1 + d2) / max(1e-6, vitesse_kmh)) * 60.0 + delai_fixe_min
+    return max(1, int(round(minutes)))
+
+# ----- Vectorisé -----
+
+def _rad(x):
+    return np.radians(np.asarray(x, dtype=np.float64))
+
+def haversine_pairs(a_lat, a_lon, b_lat, b_lon):
+    """Distances (km) élément par élément entre deux tableaux de même forme."""
+    a_lat, a_lon, b_lat, b_lon = _rad(a_lat), _rad(a_lon), _rad(b_lat), _rad(b_lon)
+    h = np.sin((b_lat - a_lat) / 2) ** 2 + np.cos(a_lat) * np.cos(b_lat) * np.sin((b_lon - a_lon) / 2) ** 2
+    return 2 * R_TERRE_KM * np.arcsin(np.sqrt(h))
+
+def haversine_matrix(a_lat, a_lon, b_lat, b_lon):
+    """Distances (km) entre N points a et M points b -> matrice N×M."""
+    a_lat, a_lon = _rad(a_lat)[:, None], _rad(a_lon)[:, None]
+    b_lat, b_lon = _rad(b_lat)[None, :], _rad(b_lon)[None, :]
+    h = np.sin((b_lat - a_lat) * 0.5)
+    h *= h
+    s = np.sin((b_lon - a_lon) * 0.5)
+    s *= s
+    s *= np.cos(a_lat) * np.cos(b_lat)
+    h += s
+    np.sqrt(h, out=h)
+    np.arcsin(h, out=h)
+    h *= 2 * R_TERRE_KM
+    return h
+
+def equirect_matrix(a_lat, a_lon, b_lat, b_lon):
+    """
+    Approximation plane (équirectangulaire) N×M, ~2x plus rapide que haversine.
+    Erreur < 0.1 % en dessous de ~20 km : suffisant pour des trajets urbains.
+    """
+    a_lat, a_lon = _rad(a_lat)[:, None], _rad(a_lon)[:, None]
+    b_lat, b_lon = _rad(b_lat)[None, :], _rad(b_lon)[None, :]
+    x = b_lon - a_lon
+    x *= np.cos(a_lat)
+    x *= x
+    y = b_lat - a_lat
+    y *= y
+    x += y
+    np.sqrt(x, out=x)
+    x *= R_TERRE_KM
+    return x
+
+def eta_matrix(c_lat, c_lon, p_lat, p_lon, d_lat, d_lon, vitesse_kmh, delai_fixe_min, fast=False):
+    """
+    ETA (min, entiers ≥ 1) de N coursiers (c_*) pour M commandes (pickup p_*, drop d_*)
+    -> matrice N×M, mêmes arrondis que eta_minutes().
+    fast=True utilise l'approximation équirectangulaire.
+    """
+    dist = equirect_matrix if fast else haversine_matrix
+    km = dist(c_lat, c_lon, p_lat, p_lon)
+    km += haversine_pairs(p_lat, p_lon, d_lat, d_lon)[None, :]
+    km *= 60.0 / max(1e-6, vitesse_kmh)
+    km += delai_fixe_min
+    np.rint(km, out=km)
+    return np.maximum(km, 1).astype(np.int32)
+
+def rank_keys(eta, ratings):
+    """
+    Clé de tri « ETA ↑ puis note ↓ » sous forme d'un seul float (ETA entières, notes 0..5).
+    eta: N×M (ou N) ; ratings: N.
+    """
+    r = np.asarray(ratings, dtype=np.float64)
+    if np.ndim(eta) == 2:
+        r = r[:, None]
+    return np.asarray(eta, dtype=np.float64) - r / 6.0
+
+def best_couriers(eta, ratings):
+    """Indice du meilleur coursier pour chacune des M commandes (matrice N×M)."""
+    return np.argmin(rank_keys(eta, ratings), axis=0)
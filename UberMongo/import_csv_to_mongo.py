@@ -1,41 +1,165 @@
-import csv
-from pymongo import MongoClient
+"""
+Import incrémental de menus.csv dans la collection restaurants (une ligne du CSV = un document).
+
+- lecture en flux, par paquets de --chunk lignes : mémoire bornée quelle que soit la taille du CSV ;
+- clé = sku (index unique) ; chaque document garde un content_hash de sa ligne : les lignes
+  inchangées ne sont pas réécrites, les autres partent en bulk_write non ordonné (ReplaceOne upsert) ;
+- les sku absents du CSV sont supprimés à la fin, et seulement si tout le fichier a été lu ;
+- la collection n'est jamais vidée : le catalogue reste lisible pendant l'import.
+Les sku vus sont notés dans une collection temporaire (pas en mémoire) pour trouver les absents.
+La position de chaque restaurant est recopiée dans restaurant_places (index 2dsphere, places.py).
+
+    python import_csv_to_mongo.py                      # menus.csv
+    python import_csv_to_mongo.py gros_menus.csv --chunk 10000 --keep-missing
+"""
+import argparse, csv, hashlib, json, os, time
+from pymongo import MongoClient, ReplaceOne, ASCENDING
+from pymongo.errors import BulkWriteError, OperationFailure
 from dotenv import load_dotenv
-import os
+
+from places import ensure_places_index, prune_places, sync_places
 
 # Chargement des variables d'environnement
 load_dotenv()
 URI = os.getenv("MONGODB_URI")
 DBNAME = os.getenv("DB_NAME", "ubeer")
 
-client = MongoClient(URI)
-db = client[DBNAME]
+CSV_PATH = "menus.csv"   # ton fichier CSV local
+CHUNK = 5000             # lignes par aller-retour
+SEEN_COLL = "restaurants_import_seen"
+DUPLICATE_KEY = 11000
+
+def to_doc(row):
+    """Ligne CSV -> document (conversion des nombres comme l'import d'origine), ou None."""
+    doc = {k: (v.strip() if isinstance(v, str) else v) for k, v in row.items() if k}
+    if not doc.get("sku"):
+        return None
+    try:
+        for field in ("latitude", "longitude", "price_eur"):
+            if field in doc:
+                doc[field] = float(doc[field])
+    except ValueError:
+        return None
+    return doc
+
+def content_hash(doc):
+    return hashlib.blake2b(json.dumps(doc, sort_keys=True, ensure_ascii=False).encode("utf-8"),
+                           digest_size=16).hexdigest()
+
+def read_chunks(path, size):
+    """Paquets de lignes lus au fil de l'eau : (lignes valides, lignes ignorées)."""
+    chunk, skipped = [], 0
+    with open(path, newline="", encoding="utf-8") as f:
+        for row in csv.DictReader(f):
+            doc = to_doc(row)
+            if doc is None:
+                skipped += 1
+                continue
+            chunk.append(doc)
+            if len(chunk) >= size:
+                yield chunk, skipped
+                chunk, skipped = [], 0
+    if chunk or skipped:
+        yield chunk, skipped
+
+def ensure_indexes(db):
+    try:
+        db.restaurants.create_index([("sku", ASCENDING)], unique=True,
+                                    partialFilterExpression={"sku": {"$type": "string"}})
+    except OperationFailure as e:
+        # anciens imports avec des sku en double : on continue, l'upsert reste correct
+        print(f"⚠️ Index unique sur sku impossible ({e.code}) : nettoie les doublons puis relance")
+    db.restaurants.create_index([("restaurant", ASCENDING)])
+    ensure_places_index(db)
 
-# Nom de ta collection MongoDB
-collection = db.restaurants
+def mark_seen(seen, skus):
+    try:
+        seen.insert_many([{"_id": s} for s in skus], ordered=False)
+    except BulkWriteError as e:
+        if any(err.get("code") != DUPLICATE_KEY for err in e.details.get("writeErrors", [])):
+            raise
 
-csv_file = "menus.csv"  # ton fichier CSV local
+def upsert_chunk(coll, docs):
+    """Réécrit seulement les lignes nouvelles ou modifiées -> (nouvelles, modifiées, inchangées)."""
+    by_sku = {}
+    for doc in docs:   # sku en double dans le CSV : la dernière ligne l'emporte
+        doc["content_hash"] = content_hash(doc)
+        by_sku[doc["sku"]] = doc
+    known = {d["sku"]: d.get("content_hash")
+             for d in coll.find({"sku": {"$in": list(by_sku)}}, {"sku": 1, "content_hash": 1})}
+    ops = [ReplaceOne({"sku": sku}, doc, upsert=True)
+           for sku, doc in by_sku.items() if known.get(sku) != doc["content_hash"]]
+    if ops:
+        coll.bulk_write(ops, ordered=False)
+    created = sum(1 for sku in by_sku if sku not in known)
+    return created, len(ops) - created, len(by_sku) - len(ops)
 
-# Vider la collection avant de réimporter (optionnel)
-collection.delete_many({})
+def delete_missing(db, batch=CHUNK):
+    """Supprime les documents dont le sku n'a pas été vu pendant cet import."""
+    cur = db.restaurants.aggregate([
+        {"$match": {"sku": {"$type": "string"}}},
+        {"$lookup": {"from": SEEN_COLL, "localField": "sku", "foreignField": "_id", "as": "seen"}},
+        {"$match": {"seen": {"$size": 0}}},
+        {"$project": {"_id": 1}},
+    ], allowDiskUse=True)
+    deleted, ids = 0, []
+    for d in cur:
+        ids.append(d["_id"])
+        if len(ids) >= batch:
+            deleted += db.restaurants.delete_many({"_id": {"$in": ids}}).deleted_count
+            ids = []
+    if ids:
+        deleted += db.restaurants.delete_many({"_id": {"$in": ids}}).deleted_count
+    return deleted
 
-with open(csv_file, newline='', encoding='utf-8') as f:
-    reader = csv.DictReader(f)
-    data = list(reader)
+def import_csv(db, path=CSV_PATH, chunk=CHUNK, keep_missing=False):
+    ensure_indexes(db)
+    seen = db[SEEN_COLL]
+    seen.drop()
+    stats = {"rows": 0, "skipped": 0, "created": 0, "updated": 0, "unchanged": 0, "deleted": 0}
+    t0 = time.perf_counter()
+    try:
+        for docs, skipped in read_chunks(path, chunk):
+            stats["skipped"] += skipped
+            if not docs:
+                continue
+            created, updated, unchanged = upsert_chunk(db.restaurants, docs)
+            sync_places(db, docs)   # position par restaurant pour $geoNear (places.py)
+            if not keep_missing:
+                mark_seen(seen, [d["sku"] for d in docs])
+            stats["rows"] += len(docs)
+            stats["created"] += created
+            stats["updated"] += updated
+            stats["unchanged"] += unchanged
+            elapsed = time.perf_counter() - t0
+            print(f"[IMPORT] {stats['rows']} lignes ({stats['rows'] / max(1e-6, elapsed):.0f} lignes/s) | "
+                  f"{stats['created']} nouvelles, {stats['updated']} modifiées, {stats['unchanged']} inchangées")
+        if not keep_missing and stats["rows"]:   # CSV lu en entier : on peut retirer les absents
+            stats["deleted"] = delete_missing(db)
+            prune_places(db)
+    finally:
+        seen.drop()
+    stats["seconds"] = time.perf_counter() - t0
+    return stats
 
-# Conversion automatique des nombres
-for d in data:
-    if "latitude" in d:
-        d["latitude"] = float(d["latitude"])
-    if "longitude" in d:
-        d["longitude"] = float(d["longitude"])
-    if "price_eur" in d:
-        d["price_eur"] = float(d["price_eur"])
+def main():
+    ap = argparse.ArgumentParser(description="Import incrémental du CSV des menus dans MongoDB.")
+    ap.add_argument("csv", nargs="?", default=CSV_PATH)
+    ap.add_argument("--chunk", type=int, default=CHUNK, help="lignes par paquet")
+    ap.add_argument("--keep-missing", action="store_true", help="ne pas supprimer les sku absents du CSV")
+    args = ap.parse_args()
 
-if data:
-    collection.insert_many(data)
-    print(f"✅ {len(data)} documents insérés dans 'restaurants'")
-else:
-    print("⚠️ Aucun enregistrement trouvé dans le CSV.")
+    client = MongoClient(URI)
+    try:
+        st = import_csv(client[DBNAME], args.csv, args.chunk, args.keep_missing)
+    finally:
+        client.close()
+    if not st["rows"]:
+        print("⚠️ Aucun enregistrement trouvé dans le CSV.")
+        return
+    print(f"✅ {st['rows']} lignes en {st['seconds']:.1f} s ({st['rows'] / max(1e-6, st['seconds']):.0f} lignes/s) : "
+          f"{st['created']} nouvelles, {st['updated']} modifiées, {st['unchanged']} inchangées, "
+          f"{st['deleted']} supprimées, {st['skipped']} ignorées (sans sku ou coordonnées invalides)")
 
-client.close()
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,142 @@
+"""
+Plusieurs managers en parallèle : zones (zones.py) + réservation de chaque commande.
+
+- appartenance : chaque manager met à jour son document dans `managers` ({_id: nom,
+  expires_at}) toutes les MEMBER_HEARTBEAT_S, depuis un thread ; les membres dont expires_at
+  est passé sortent de la répartition (index TTL pour le ménage) ;
+- zones : tous les managers voient toutes les commandes (change stream orders), chacun ne
+  traite que celles dont la zone lui revient (HRW sur les membres vivants) ;
+- réservation : avant de lancer la collecte, insert_one({_id: order_id}) dans `order_claims`.
+  L'index unique sur _id garantit un seul gagnant, même pendant un rééquilibrage. Une
+  réservation non terminée dont lease_until est passé peut être reprise (manager tombé) ;
+  après l'affectation elle est marquée done et n'est plus jamais reprise ;
+- reprise : une commande d'une autre zone est gardée TAKEOVER_S ; si personne ne l'a réservée
+  entre-temps (propriétaire tombé et pas encore expiré, ou en retard), ce manager la prend.
+"""
+import threading, time
+from collections import Counter, deque
+from datetime import datetime, timedelta, timezone
+from pymongo import ASCENDING
+from pymongo.errors import DuplicateKeyError, PyMongoError
+
+from zones import ZoneMap
+
+MEMBERS = "managers"
+CLAIMS = "order_claims"
+MEMBER_HEARTBEAT_S = 1.0
+MEMBER_TTL_S = 5           # sans heartbeat pendant ce délai, le manager sort de la répartition
+LEASE_S = 60               # réservation d'une commande en cours d'affectation
+CLAIM_TTL_S = 24 * 3600    # ménage des réservations (index TTL)
+TAKEOVER_S = 3.0           # délai avant de reprendre une commande d'une autre zone
+
+def _now():
+    return datetime.now(timezone.utc)
+
+def ensure_claim_indexes(db):
+    db[MEMBERS].create_index([("expires_at", ASCENDING)], expireAfterSeconds=0)
+    db[CLAIMS].create_index([("claimed_at", ASCENDING)], expireAfterSeconds=CLAIM_TTL_S)
+
+class ZoneGate:
+    """Décide si ce manager traite une commande : zone possédée, puis réservation obtenue."""
+
+    def __init__(self, db, name, zones=True):
+        self.db = db
+        self.name = name
+        self.zones = ZoneMap(name) if zones else None
+        self.deferred = deque()      # (échéance, commande, pickup) d'autres zones, repris si orphelins
+        self.counts = Counter()      # owned, foreign, lost, takeover, rebalance
+        self.stopping = threading.Event()
+        self.thread = threading.Thread(target=self._beat_loop, daemon=True, name="zones-heartbeat")
+
+    def start(self):
+        ensure_claim_indexes(self.db)
+        self.beat()
+        self.thread.start()
+        return self
+
+    def close(self):
+        self.stopping.set()
+        try:
+            self.db[MEMBERS].delete_one({"_id": self.name})   # départ immédiat
+        except PyMongoError:
+            pass
+
+    # ----- appartenance
+
+    def beat(self):
+        now = _now()
+        self.db[MEMBERS].update_one({"_id": self.name},
+                                    {"$set": {"expires_at": now + timedelta(seconds=MEMBER_TTL_S)}},
+                                    upsert=True)
+        members = [m["_id"] for m in self.db[MEMBERS].find({"expires_at": {"$gt": now}}, {"_id": 1})]
+        if self.zones is not None and self.zones.update(members):
+            self.counts["rebalance"] += 1
+            print(f"[MANAGER] 🗺️ {len(self.zones.members)} manager(s) actif(s), zones réparties à nouveau")
+
+    def _beat_loop(self):
+        while not self.stopping.wait(MEMBER_HEARTBEAT_S):
+            try:
+                self.beat()
+            except PyMongoError as e:
+                print(f"[MANAGER] ⚠️ heartbeat manager impossible ({e})")
+
+    # ----- commandes
+
+    def _reserve(self, order_id):
+        now = _now()
+        lease = now + timedelta(seconds=LEASE_S)
+        try:
+            self.db[CLAIMS].insert_one({"_id": order_id, "manager": self.name, "claimed_at": now,
+                                        "lease_until": lease, "done": False})
+            return True
+        except DuplicateKeyError:
+            # déjà réservée : reprise seulement si le bail a expiré sans affectation
+            return self.db[CLAIMS].find_one_and_update(
+                {"_id": order_id, "done": False, "lease_until": {"$lt": now}},
+                {"$set": {"manager": self.name, "lease_until": lease}},
+            ) is not None
+
+    def claim(self, order_id):
+        ok = self._reserve(order_id)
+        if not ok:
+            self.counts["lost"] += 1
+        return ok
+
+    def admit(self, order, pickup):
+        """True si ce manager doit affecter la commande (réservation obtenue)."""
+        if self.zones is not None:
+            mine, _ = self.zones.owns(pickup["lat"], pickup["lon"])
+            if not mine:
+                self.counts["foreign"] += 1
+                self.deferred.append((time.monotonic() + TAKEOVER_S, order, pickup))
+                return False
+        if self.claim(order["_id"]):
+            self.counts["owned"] += 1
+            return True
+        return False
+
+    def has_due(self):
+        return bool(self.deferred) and self.deferred[0][0] <= time.monotonic()
+
+    def takeovers(self):
+        """[(commande, pickup)] d'autres zones restées sans réservation après TAKEOVER_S."""
+        now, out = time.monotonic(), []
+        while self.deferred and self.deferred[0][0] <= now:
+            _, order, pickup = self.deferred.popleft()
+            if self._reserve(order["_id"]):   # échec = le propriétaire l'a prise : cas normal
+                self.counts["takeover"] += 1
+                out.append((order, pickup))
+        if out:
+            print(f"[MANAGER] 🛟 {len(out)} commande(s) d'une autre zone reprise(s) (propriétaire absent ou en retard)")
+        return out
+
+    def done(self, order_ids):
+        """Affectations enregistrées : réservations closes, plus jamais reprises."""
+        self.db[CLAIMS].update_many({"_id": {"$in": list(order_ids)}, "manager": self.name},
+                                    {"$set": {"done": True}})
+
+    def describe(self):
+        c = self.counts
+        zones = f"{len(self.zones.members)} managers" if self.zones is not None else "sans zones"
+        return (f"{zones} | {c['owned']} prises, {c['takeover']} reprises, "
+                f"{c['foreign']} d'autres zones, {c['lost']} réservations déjà prises")
@@ -1,52 +1,261 @@
-import os, time, math
-from pymongo import MongoClient, ASCENDING
+import os, socket, time, argparse, queue
+from pymongo import MongoClient
 from dotenv import load_dotenv
 
+import geo
+from assignment import match_window, greedy_total_eta
+from catalog_cache import open_catalog
+from leases import ZoneGate
+from metrics import Counter, Histogram, lag_since, serve, timer
+from ratings import LEADERBOARD_REFRESH_S, current_rating, refresh_every
+from routing import open_router
+from stream_mux import ChangeStreamMux
+from window import POLICIES, Window, WindowStats, make_policy
+
 load_dotenv()
 URI = os.getenv("MONGODB_URI")
 DBNAME = os.getenv("DB_NAME", "ubeer")
 
 REWARD_EUR = 8.5
-TIMEOUT_S = 15
+TIMEOUT_S = 15          # fenêtre de candidatures (au plus)
+WINDOW_POLICY = "adaptive"  # fermeture anticipée de la fenêtre (window.py) ; "fixed" = toujours TIMEOUT_S
 VITESSE_KMH = 28.0
 DELAI_FIXE_MIN = 0.5
+BATCH_WINDOW_S = 2.0   # mode batch : durée de regroupement des commandes
+ROUTER = None          # routing.Router (--graph) : ETA par les rues ; None = vol d'oiseau
+
+# ----- Métriques (metrics.py, --metrics-port) -----
+M_ORDERS = Counter("ubeer_manager_orders_total", "Commandes reçues")
+M_ASSIGNED = Counter("ubeer_manager_assignments_total", "Commandes affectées")
+M_UNASSIGNED = Counter("ubeer_manager_unassigned_total", "Commandes sans candidature")
+M_CANDS = Histogram("ubeer_manager_candidates_per_order", "Candidatures reçues par fenêtre", unit=1, highest=1024)
+M_WINDOW = Histogram("ubeer_manager_window_seconds", "Durée de la fenêtre de candidatures", unit=1e-3)
+M_ORDER_LAG = Histogram("ubeer_manager_order_lag_seconds", "Retard insertion client -> change stream du manager")
+M_CAND_LAG = Histogram("ubeer_manager_candidate_lag_seconds", "Retard insertion coursier -> lecture par le manager")
+M_RATING = Histogram("ubeer_manager_rating_lookup_seconds", "Lecture des notes (get_rating[s])")
 
-def haversine_km(a_lat, a_lon, b_lat, b_lon):
-    R = 6371.0
-    dlat = math.radians(b_lat - a_lat)
-    dlon = math.radians(b_lon - a_lon)
-    lat1 = math.radians(a_lat)
-    lat2 = math.radians(b_lat)
-    h = math.sin(dlat/2)**2 + math.cos(lat1)*math.cos(lat2)*math.sin(dlon/2)**2
-    return 2 * R * math.asin(math.sqrt(h))
+def manager_name():
+    return f"manager-{socket.gethostname()}-{os.getpid()}"
 
 def eta_minutes_from(c_pos, pickup, drop):
-    d1 = haversine_km(float(c_pos["lat"]), float(c_pos["lon"]),
-                      float(pickup["lat"]), float(pickup["lon"]))
-    d2 = haversine_km(float(pickup["lat"]), float(pickup["lon"]),
-                      float(drop["lat"]), float(drop["lon"]))
-    minutes = ((d1 + d2) / max(1e-6, VITESSE_KMH)) * 60.0 + DELAI_FIXE_MIN
-    return max(1, int(round(minutes)))
-
-def load_restaurants_from_mongo(db):
-    mapping = {}
-    coll = db.restaurants
-    coll.create_index([("restaurant", ASCENDING)])
-    for doc in coll.find({}, {"restaurant": 1, "latitude": 1, "longitude": 1}):
-        name = doc.get("restaurant")
-        if not name:
+    if ROUTER is not None:
+        return ROUTER.eta_minutes((float(c_pos["lat"]), float(c_pos["lon"])),
+                                  (float(pickup["lat"]), float(pickup["lon"])),
+                                  (float(drop["lat"]), float(drop["lon"])), DELAI_FIXE_MIN)
+    return geo.eta_minutes(
+        (float(c_pos["lat"]), float(c_pos["lon"])),
+        (float(pickup["lat"]), float(pickup["lon"])),
+        (float(drop["lat"]), float(drop["lon"])),
+        VITESSE_KMH, DELAI_FIXE_MIN,
+    )
+
+def get_rating(db, courier_id):
+    with timer(M_RATING):
+        c = db.couriers.find_one({"courier_id": courier_id})
+    return rating_value(c) if c else 3.0
+
+def rating_value(c):
+    """Note récente à cet instant, sinon moyenne (document d'avant la note récente), sinon 3.0."""
+    recent = current_rating(c)
+    return recent if recent is not None else c.get("avg_rating", 3.0)
+
+def get_ratings(db, courier_ids):
+    """Notes récentes (sinon moyennes) de plusieurs coursiers en une seule requête."""
+    out = {cid: 3.0 for cid in courier_ids}
+    with timer(M_RATING):
+        docs = list(db.couriers.find({"courier_id": {"$in": list(courier_ids)}},
+                                     {"courier_id": 1, "avg_rating": 1, "rating_dsum": 1,
+                                      "rating_dweight": 1, "rating_dts": 1}))
+    for c in docs:
+        out[c["courier_id"]] = rating_value(c)
+    return out
+
+def build_selection(order_id, courier_id, courier_name, eta_min, pickup, dropoff):
+    return {
+        "type": "SELECTION",
+        "order_id": order_id,
+        "courier_id": courier_id,
+        "courier_name": courier_name,
+        "eta_min": int(eta_min),
+        "reward_eur": REWARD_EUR,
+        "pickup":  {"lat": float(pickup["lat"]),  "lon": float(pickup["lon"])},
+        "dropoff": {"lat": float(dropoff["lat"]), "lon": float(dropoff["lon"])},
+        "assigned_at": int(time.time())
+    }
+
+def observe_order(order):
+    M_ORDERS.inc()
+    lag_since(M_ORDER_LAG, order.get("sent_ts"))
+
+def observe_window(w):
+    """Fenêtre fermée -> métriques (durée, candidatures reçues)."""
+    M_WINDOW.observe(w.closed_at - w.opened)
+    M_CANDS.observe(w.n)
+
+def collect_orders(stream, window_s, idle=None):
+    """
+    Attend une première commande puis regroupe celles insérées pendant window_s.
+    idle() est appelé entre deux ; s'il retourne True avant la première commande, on rend
+    la main tout de suite (travail en attente ailleurs, ex. reprises de zones).
+    """
+    batch = []
+    deadline = None
+    while deadline is None or time.monotonic() < deadline:
+        ch = stream.try_next()
+        if ch is None:
+            if idle is not None and idle() and deadline is None:
+                return batch
+            time.sleep(0.05)
             continue
-        try:
-            lat = float(doc["latitude"])
-            lon = float(doc["longitude"])
-            mapping[name] = {"lat": lat, "lon": lon}
-        except Exception:
+        batch.append(ch["fullDocument"])
+        observe_order(ch["fullDocument"])
+        if deadline is None:
+            deadline = time.monotonic() + window_s
+    return batch
+
+class WindowShadows:
+    """
+    Fenêtres fermées avant l'échéance fixe : leur file reste abonnée jusque-là pour savoir
+    quelles candidatures la fenêtre fixe aurait encore vues (qualité perdue, window.py).
+    """
+
+    def __init__(self, db, cand_mux, stats=None, verbose=True):
+        self.db = db
+        self.cand_mux = cand_mux
+        self.stats = stats if stats is not None else WindowStats()
+        self.verbose = verbose
+        self.open = []   # (échéance, file, {order_id: (fenêtre, pickup, drop)})
+
+    def keep(self, q, windows):
+        if all(w.reason == "timeout" for w, _, _ in windows.values()):
+            for order_id in windows:
+                self.cand_mux.unsubscribe(order_id, q)
+            return
+        self.open.append((max(w.deadline for w, _, _ in windows.values()), q, windows))
+
+    def settle(self, force=False):
+        now = time.monotonic()
+        due = [s for s in self.open if force or s[0] <= now]
+        if not due:
+            return
+        self.open = [s for s in self.open if not (force or s[0] <= now)]
+        for _, q, windows in due:
+            for order_id in windows:
+                self.cand_mux.unsubscribe(order_id, q)
+            late = []
+            while True:
+                try:
+                    cand = q.get_nowait()
+                except queue.Empty:
+                    break
+                if cand.get("order_id") in windows:
+                    late.append(cand)
+            ratings = get_ratings(self.db, {c["courier_id"] for c in late}) if late else {}
+            for cand in late:
+                w, pickup, drop = windows[cand["order_id"]]
+                pos = cand.get("position") or {}
+                w.add(eta_minutes_from(pos, pickup, drop), ratings[cand["courier_id"]])
+        self.stats.settle(now, force)
+        if self.verbose:
+            print(f"[MANAGER] ⏱️ fenêtres : {self.stats.line()}")
+
+def run_batch(db, restos, stream, cand_mux, window_s, timeout_s=TIMEOUT_S, verbose=True,
+              window_policy=WINDOW_POLICY, stats=None, gate=None):
+    """
+    Mode batch : commandes regroupées sur window_s, candidatures de toute la fenêtre
+    reçues sur une même file jusqu'à la fermeture de la fenêtre de chaque commande
+    (au plus timeout_s, window.py), puis affectation globale (Hongrois).
+    verbose=False : sans une ligne par commande (banc de test) ; stats : WindowStats à remplir ;
+    gate (leases.ZoneGate) : seules les commandes de nos zones que l'on réussit à réserver.
+    """
+    assignments = db.assignments
+    log = print if verbose else (lambda *a, **k: None)
+    policy = make_policy(window_policy, timeout_s)
+    shadows = WindowShadows(db, cand_mux, stats, verbose)
+    print(f"[MANAGER] Mode batch : fenêtre de regroupement {window_s:.1f} s, "
+          f"candidatures {timeout_s} s max ({policy.name})")
+
+    def idle():
+        shadows.settle()
+        return gate is not None and gate.has_due()
+
+    while True:
+        orders = {}
+        for order in collect_orders(stream, window_s, idle=idle):
+            resto_name = order["restaurant"]["name"]
+            pickup = restos.pickup(resto_name)
+            if not pickup:
+                log(f"[MANAGER] ⚠️ Restaurant inconnu : {resto_name}")
+                continue
+            if gate is not None and not gate.admit(order, pickup):
+                continue
+            customer = order["customer"]
+            orders[order["_id"]] = ((pickup["lat"], pickup["lon"]), (float(customer["lat"]), float(customer["lon"])))
+        for order, pickup in gate.takeovers() if gate is not None else []:
+            customer = order["customer"]
+            orders[order["_id"]] = ((pickup["lat"], pickup["lon"]), (float(customer["lat"]), float(customer["lon"])))
+        if not orders:
             continue
-    return mapping
+        log(f"\n[MANAGER] 📣 {len(orders)} commande(s) en attente de candidatures…")
 
-def get_rating(db, courier_id):
-    c = db.couriers.find_one({"courier_id": courier_id})
-    return c.get("avg_rating", 3.0) if c else 3.0
+        cands, names, ratings = [], {}, {}
+        q = queue.Queue()
+        windows = {}
+        for order_id, (pickup, drop) in orders.items():
+            windows[order_id] = (Window(policy), {"lat": pickup[0], "lon": pickup[1]}, {"lat": drop[0], "lon": drop[1]})
+            cand_mux.subscribe(order_id, q)
+        while not all([w.check() for w, _, _ in windows.values()]):
+            wait = min(w.wait_s() for w, _, _ in windows.values() if w.reason is None)
+            try:
+                cand = q.get(timeout=max(0.001, wait))
+            except queue.Empty:
+                continue
+            if cand.get("order_id") not in windows:
+                continue
+            lag_since(M_CAND_LAG, cand.get("sent_ts"))
+            w, pickup, drop = windows[cand["order_id"]]
+            pos = cand.get("position") or {}
+            cid = cand["courier_id"]
+            if cid not in ratings:
+                ratings[cid] = get_rating(db, cid)
+            if w.reason is None:   # fenêtre de cette commande encore ouverte
+                cands.append((cand["order_id"], cid, (float(pos["lat"]), float(pos["lon"]))))
+                names[cid] = cand.get("name", cid)
+            w.add(eta_minutes_from(pos, pickup, drop), ratings[cid])
+        for w, _, _ in windows.values():
+            observe_window(w)
+            shadows.stats.record(w)
+        shadows.keep(q, windows)
+
+        t0 = time.perf_counter()
+        chosen = match_window(orders, cands, ratings, VITESSE_KMH, DELAI_FIXE_MIN, ROUTER)
+        solve_ms = (time.perf_counter() - t0) * 1000
+        greedy = greedy_total_eta(orders, cands, ratings, VITESSE_KMH, DELAI_FIXE_MIN, ROUTER)
+        total = sum(c["eta_min"] for c in chosen.values())
+        log(f"[MANAGER] 🧮 {len(cands)} candidature(s), {len(chosen)}/{len(orders)} affectée(s) en {solve_ms:.1f} ms "
+              f"| ETA totale {total} min (glouton : {greedy} min)")
+
+        docs = []
+        for order_id, (pickup, drop) in orders.items():
+            c = chosen.get(order_id)
+            if c is None:
+                M_UNASSIGNED.inc()
+                log(f"[MANAGER] 😕 {order_id} : aucune candidature disponible.")
+                continue
+            docs.append(build_selection(
+                order_id, c["courier"], names.get(c["courier"], c["courier"]), c["eta_min"],
+                {"lat": pickup[0], "lon": pickup[1]}, {"lat": drop[0], "lon": drop[1]},
+            ))
+            log(f"[MANAGER] ✅ {order_id} → {c['courier']} (ETA={c['eta_min']} min, Note={c['rating']:.2f})")
+        if docs:
+            assignments.insert_many(docs)
+            M_ASSIGNED.inc(len(docs))
+            if gate is not None:
+                gate.done([d["order_id"] for d in docs])
+        if gate is not None:
+            log(f"[MANAGER] 🗺️ {gate.describe()}")
+        if ROUTER is not None:
+            log(f"[MANAGER] 🛣️ {ROUTER.describe()}")
 
 def prompt_select_or_auto(cands_sorted):
     print("\n[MANAGER] 📊 Candidatures :")
@@ -67,72 +276,105 @@ def prompt_select_or_auto(cands_sorted):
     print("[MANAGER] Choix invalide → sélection auto.")
     return cands_sorted[0]
 
-def main():
-    client = MongoClient(URI)
-    db = client[DBNAME]
-    orders, candidatures, assignments = db.orders, db.candidatures, db.assignments
-    restos = load_restaurants_from_mongo(db)
-
-    print("[MANAGER] En attente de commandes...")
-
-    with orders.watch(
-        [{"$match": {"operationType": "insert", "fullDocument.type": "ORDER"}}],
-        full_document="updateLookup"
-    ) as stream:
-        for ch in stream:
-            order = ch["fullDocument"]
-            order_id = order["_id"]
-            resto_name = order["restaurant"]["name"]
-            customer = order["customer"]
-            dropoff = {"lat": float(customer["lat"]), "lon": float(customer["lon"])}
+def dispatch_one(db, cand_mux, order, pickup, policy, shadows):
+    """Collecte des candidatures (fenêtre window.py), sélection et affectation d'une commande ; True si affectée."""
+    order_id = order["_id"]
+    customer = order["customer"]
+    dropoff = {"lat": float(customer["lat"]), "lon": float(customer["lon"])}
 
-            pickup = restos.get(resto_name)
-            if not pickup:
-                print(f"[MANAGER] ⚠️ Restaurant inconnu : {resto_name}")
-                continue
+    print(f"[MANAGER] 📣 Commande {order_id} ({order['restaurant']['name']})")
+    cands = []
 
-            print(f"[MANAGER] 📣 Commande {order_id} ({resto_name})")
-            start = time.monotonic()
-            cands = []
-
-            with candidatures.watch(
-                [{"$match": {"operationType": "insert", "fullDocument.order_id": order_id}}],
-                full_document="updateLookup"
-            ) as cs:
-                while time.monotonic() - start < TIMEOUT_S:
-                    ev = cs.try_next()
-                    if not ev:
-                        time.sleep(0.2)
-                        continue
-                    cand = ev["fullDocument"]
-                    pos = cand.get("position") or {}
-                    cand["eta_min"] = eta_minutes_from(
-                        {"lat": float(pos["lat"]), "lon": float(pos["lon"])}, pickup, dropoff
-                    )
-                    cand["rating"] = get_rating(db, cand["courier_id"])
-                    cands.append(cand)
-                    print(f"[MANAGER] 📥 Candidature {cand['courier_id']} (ETA={cand['eta_min']} min, Note={cand['rating']})")
-
-            if not cands:
-                print("[MANAGER] 😕 Aucune candidature reçue.")
-                continue
+    q = cand_mux.subscribe(order_id)
+    w = Window(policy)
+    while w.check() is None:
+        try:
+            cand = q.get(timeout=w.wait_s())
+        except queue.Empty:
+            continue
+        lag_since(M_CAND_LAG, cand.get("sent_ts"))
+        pos = cand.get("position") or {}
+        cand["eta_min"] = eta_minutes_from(
+            {"lat": float(pos["lat"]), "lon": float(pos["lon"])}, pickup, dropoff
+        )
+        cand["rating"] = get_rating(db, cand["courier_id"])
+        cands.append(cand)
+        w.add(cand["eta_min"], cand["rating"])
+        print(f"[MANAGER] 📥 Candidature {cand['courier_id']} (ETA={cand['eta_min']} min, Note={cand['rating']})")
+    print(f"[MANAGER] ⏱️ Fenêtre fermée après {w.closed_at - w.opened:.1f} s ({w.reason}, {w.n} candidature(s))")
+    observe_window(w)
+    shadows.stats.record(w)
+    shadows.keep(q, {order_id: (w, pickup, dropoff)})
+
+    if not cands:
+        M_UNASSIGNED.inc()
+        print("[MANAGER] 😕 Aucune candidature reçue.")
+        return False
+
+    cands.sort(key=lambda c: (c["eta_min"], -c.get("rating", 3.0)))
+    chosen = prompt_select_or_auto(cands)
 
-            cands.sort(key=lambda c: (c["eta_min"], -c.get("rating", 3.0)))
-            chosen = prompt_select_or_auto(cands)
-
-            # ✅ Correction : ajout de pickup/dropoff pour éviter KeyError côté coursier
-            assignments.insert_one({
-                "type": "SELECTION",
-                "order_id": order_id,
-                "courier_id": chosen["courier_id"],
-                "courier_name": chosen.get("name", chosen["courier_id"]),
-                "eta_min": int(chosen.get("eta_min", 10)),
-                "reward_eur": REWARD_EUR,
-                "pickup":  {"lat": float(pickup["lat"]),  "lon": float(pickup["lon"])},
-                "dropoff": {"lat": float(dropoff["lat"]), "lon": float(dropoff["lon"])},
-                "assigned_at": int(time.time())
-            })
-            print(f"[MANAGER] ✅ Affecté : {chosen['courier_id']} (Note={chosen.get('rating', '?')})")
+    # ✅ Correction : ajout de pickup/dropoff pour éviter KeyError côté coursier
+    db.assignments.insert_one(build_selection(
+        order_id, chosen["courier_id"], chosen.get("name", chosen["courier_id"]),
+        chosen.get("eta_min", 10), pickup, dropoff,
+    ))
+    M_ASSIGNED.inc()
+    print(f"[MANAGER] ✅ Affecté : {chosen['courier_id']} (Note={chosen.get('rating', '?')})")
+    return True
+
+def main(batch=False, window_s=BATCH_WINDOW_S, window_policy=WINDOW_POLICY):
+    client = MongoClient(URI)
+    db = client[DBNAME]
+    restos = open_catalog(db)   # tenu à jour par change stream : pas de redémarrage pour un nouveau resto
+    # un seul change stream de candidatures pour toute la durée de vie du manager
+    cand_mux = ChangeStreamMux(db.candidatures).start()
+    policy = make_policy(window_policy, TIMEOUT_S)
+    # tous les managers voient toutes les commandes : zones + réservation, une seule affectation
+    name = manager_name()
+    gate = ZoneGate(db, name).start()
+    refresh_every(db, LEADERBOARD_REFRESH_S, name)   # recent_rating rafraîchi en fond (un manager à la fois)
+
+    print(f"[MANAGER] En attente de commandes... (fenêtre {policy.name} ≤ {TIMEOUT_S} s, {name})")
+    try:
+        with db.orders.watch(
+            [{"$match": {"operationType": "insert", "fullDocument.type": "ORDER"}}],
+            full_document="updateLookup", max_await_time_ms=500
+        ) as stream:
+            if batch:
+                return run_batch(db, restos, stream, cand_mux, window_s, window_policy=window_policy, gate=gate)
+            shadows = WindowShadows(db, cand_mux)
+            while True:
+                ch = stream.try_next()
+                shadows.settle()
+                for order, pickup in gate.takeovers():
+                    if dispatch_one(db, cand_mux, order, pickup, policy, shadows):
+                        gate.done([order["_id"]])
+                if ch is None:
+                    continue   # try_next attend déjà côté serveur (max_await_time_ms)
+                order = ch["fullDocument"]
+                observe_order(order)
+                resto_name = order["restaurant"]["name"]
+                pickup = restos.pickup(resto_name)
+                if not pickup:
+                    print(f"[MANAGER] ⚠️ Restaurant inconnu : {resto_name}")
+                    continue
+                if gate.admit(order, pickup) and dispatch_one(db, cand_mux, order, pickup, policy, shadows):
+                    gate.done([order["_id"]])
+    finally:
+        gate.close()
 
 if __name__ == "__main__":
-    main()
+    ap = argparse.ArgumentParser(description="Manager MongoDB : candidatures et attribution.")
+    ap.add_argument("--batch", action="store_true", help="affectation globale par fenêtre (Hongrois) au lieu du tri par commande")
+    ap.add_argument("--batch-window", type=float, default=BATCH_WINDOW_S, help="durée de regroupement des commandes (s)")
+    ap.add_argument("--window-policy", choices=POLICIES, default=WINDOW_POLICY,
+                    help="adaptive : fermeture de la fenêtre de candidatures dès que possible (window.py)")
+    ap.add_argument("--graph", help="graphe de rues compilé (routing.py) : ETA par les rues")
+    ap.add_argument("--metrics-port", type=int, help="expose /metrics (Prometheus) sur ce port local")
+    args = ap.parse_args()
+    if args.metrics_port is not None:
+        serve(args.metrics_port)
+    if args.graph:
+        ROUTER = open_router(args.graph, VITESSE_KMH)
+    main(batch=args.batch, window_s=args.batch_window, window_policy=args.window_policy)
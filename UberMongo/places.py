@@ -0,0 +1,106 @@
+"""
+Restaurants à proximité : collection restaurant_places (un document par restaurant, index 2dsphere).
+
+`restaurants` garde une ligne par plat ; $geoNear dessus rendrait chaque restaurant autant de fois
+qu'il a de plats, et « les k plus proches » demanderait de tout regrouper. restaurant_places
+porte {_id: nom, location: Point GeoJSON [lon, lat]} : $geoNear + $limit lit seulement les k
+premiers restaurants dans l'ordre de l'index, distances calculées par le serveur.
+
+- tenue à jour par import_csv_to_mongo.py (sync_places par paquet, prune_places en fin d'import) ;
+- python places.py --rebuild : (re)construit la collection depuis restaurants ($group + $merge) ;
+- near(db, lat, lon, radius_km, k) -> [(nom, distance km)] du plus proche au plus loin.
+
+    python places.py --rebuild
+    python places.py --lat 48.8610 --lon 2.3450 --radius 1
+"""
+import argparse, os, time
+from pymongo import MongoClient, UpdateOne, GEOSPHERE
+from dotenv import load_dotenv
+
+load_dotenv()
+URI = os.getenv("MONGODB_URI")
+DBNAME = os.getenv("DB_NAME", "ubeer")
+
+PLACES = "restaurant_places"
+NEAR_MAX = 20
+
+def point(lat, lon):
+    return {"type": "Point", "coordinates": [float(lon), float(lat)]}
+
+def ensure_places_index(db):
+    db[PLACES].create_index([("location", GEOSPHERE)])
+
+def sync_places(db, docs):
+    """Lignes d'un paquet d'import -> position de chaque restaurant (premières coordonnées du paquet)."""
+    pos = {}
+    for d in docs:
+        name = d.get("restaurant")
+        if isinstance(name, str) and name and name not in pos \
+                and isinstance(d.get("latitude"), float) and isinstance(d.get("longitude"), float):
+            pos[name] = point(d["latitude"], d["longitude"])
+    if pos:
+        db[PLACES].bulk_write([UpdateOne({"_id": name}, {"$set": {"location": loc}}, upsert=True)
+                               for name, loc in pos.items()], ordered=False)
+    return len(pos)
+
+def prune_places(db):
+    """Retire les restaurants qui n'ont plus aucune ligne dans restaurants."""
+    gone = [d["_id"] for d in db[PLACES].aggregate([
+        {"$lookup": {"from": "restaurants", "localField": "_id", "foreignField": "restaurant", "as": "rows"}},
+        {"$match": {"rows": {"$size": 0}}},
+        {"$project": {"_id": 1}},
+    ])]
+    if gone:
+        db[PLACES].delete_many({"_id": {"$in": gone}})
+    return len(gone)
+
+def rebuild_places(db):
+    """Reconstruit restaurant_places depuis restaurants, côté serveur."""
+    ensure_places_index(db)
+    db.restaurants.aggregate([
+        {"$match": {"restaurant": {"$type": "string"},
+                    "latitude": {"$type": "number"}, "longitude": {"$type": "number"}}},
+        {"$group": {"_id": "$restaurant", "lat": {"$first": "$latitude"}, "lon": {"$first": "$longitude"}}},
+        {"$project": {"location": {"type": "Point", "coordinates": ["$lon", "$lat"]}}},
+        {"$merge": {"into": PLACES, "on": "_id", "whenMatched": "replace", "whenNotMatched": "insert"}},
+    ])
+    prune_places(db)
+    return db[PLACES].estimated_document_count()
+
+def near(db, lat, lon, radius_km=None, k=NEAR_MAX):
+    """[(nom, distance km)] du plus proche au plus loin : dans radius_km (si donné), k au plus."""
+    geo = {"near": point(lat, lon), "distanceField": "dist_m", "key": "location", "spherical": True}
+    if radius_km is not None:
+        geo["maxDistance"] = radius_km * 1000
+    pipeline = [{"$geoNear": geo}]
+    if k is not None:
+        pipeline.append({"$limit": k})
+    pipeline.append({"$project": {"dist_m": 1}})
+    return [(d["_id"], d["dist_m"] / 1000) for d in db[PLACES].aggregate(pipeline)]
+
+def main():
+    ap = argparse.ArgumentParser(description="Restaurants à proximité ($geoNear sur restaurant_places).")
+    ap.add_argument("--rebuild", action="store_true", help="reconstruire restaurant_places depuis restaurants")
+    ap.add_argument("--lat", type=float, default=48.8610)
+    ap.add_argument("--lon", type=float, default=2.3450)
+    ap.add_argument("--radius", type=float, help="rayon (km)")
+    ap.add_argument("-k", type=int, default=NEAR_MAX)
+    args = ap.parse_args()
+
+    client = MongoClient(URI)
+    db = client[DBNAME]
+    try:
+        if args.rebuild:
+            t0 = time.perf_counter()
+            n = rebuild_places(db)
+            print(f"[PLACES] {n} restaurants indexés en {time.perf_counter() - t0:.1f} s")
+        t0 = time.perf_counter()
+        res = near(db, args.lat, args.lon, args.radius, args.k)
+        print(f"[PLACES] {len(res)} restaurant(s) en {(time.perf_counter() - t0) * 1000:.1f} ms")
+        for name, dist in res:
+            print(f"  {dist:6.2f} km  {name}")
+    finally:
+        client.close()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,182 @@
+"""
+Notation des coursiers en UNE mise à jour atomique du document `couriers`.
+
+Un update en pipeline incrémente ratings_sum / ratings_count, recalcule avg_rating à partir
+des nouvelles valeurs et ajoute la note à ratings_history (les HISTORY_MAX dernières),
+le tout dans le même find_one_and_update : pas de lecture préalable côté Python,
+donc plus de note perdue quand deux clients notent le même coursier en même temps.
+
+Note récente (celle qu'utilise le manager) : somme et poids des notes amortis de moitié tous les
+HALF_LIFE_DAYS, mis à jour en O(1) dans le même pipeline (rating_dsum, rating_dweight à la date
+rating_dts, multipliés par 2^(-Δt / demi-vie) avant d'ajouter la note), tirés vers PRIOR comme
+si le coursier avait PRIOR_WEIGHT notes neutres de plus :
+    recent_rating = (rating_dsum + PRIOR × PRIOR_WEIGHT) / (rating_dweight + PRIOR_WEIGHT)
+recent_rating est indexé (décroissant) : top K = find trié + limit, rang = count_documents sur
+l'intervalle, sans parcourir la collection. Sans nouvelle note, la note récente continue de
+glisser vers PRIOR : le manager la recalcule à l'instant de la lecture (current_rating), et
+refresh() (un update_many en pipeline, côté serveur) rejoue l'amortissement dans recent_rating
+pour tous les coursiers. Chaque manager lance refresh_every, mais un seul passe toutes les
+LEADERBOARD_REFRESH_S : celui qui obtient le bail {_id: "ratings_refresh"} de la collection
+`leases` (comme les réservations de order_claims, DuplicateKeyError pour les perdants).
+
+Historique borné : ratings_history garde les HISTORY_MAX dernières notes de moins de
+HISTORY_MAX_AGE_DAYS ; db.ratings (détail avec commentaire) expire après RATINGS_RETENTION_DAYS
+(index TTL sur le champ `at`).
+
+    avg, count, recent = rate(db, "Léa", 5, order_id)
+    top(db, 10) ; rank(db, "Léa")
+    refresh(db)
+"""
+import os, socket, threading, time
+from collections import namedtuple
+from datetime import datetime, timedelta, timezone
+from pymongo import ASCENDING, DESCENDING, ReturnDocument
+from pymongo.errors import DuplicateKeyError, OperationFailure, PyMongoError
+
+HISTORY_MAX = 100             # notes gardées dans couriers.ratings_history
+HISTORY_MAX_AGE_DAYS = 180    # ... et pas plus vieilles que ça (0 = pas de limite)
+RATINGS_RETENTION_DAYS = 365  # db.ratings : détail complet, expiré par index TTL (0 = gardé)
+HALF_LIFE_DAYS = 30.0         # une note perd la moitié de son poids en 30 jours
+PRIOR = 3.0                   # note neutre (celle du manager pour un coursier jamais noté)
+PRIOR_WEIGHT = 2.0            # ... comptée comme 2 notes
+LEADERBOARD_REFRESH_S = 900   # amortissement rejoué dans recent_rating (refresh_every)
+LEASES = "leases"
+REFRESH_LEASE = "ratings_refresh"   # bail : un seul refresh() par période, tous managers confondus
+REFRESH_CHECK_S = 30          # chaque refresh_every tente de prendre le bail toutes les 30 s
+
+Rating = namedtuple("Rating", "avg count recent")
+
+def ensure_ratings_index(db):
+    # unique : deux premières notes simultanées ne créent pas deux documents (upsert réessayé par le serveur)
+    try:
+        db.couriers.create_index([("courier_id", ASCENDING)], unique=True)
+    except OperationFailure as e:
+        print(f"[RATINGS] ⚠️ index unique couriers.courier_id non créé (doublons existants ?) : {e}")
+    db.couriers.create_index([("recent_rating", DESCENDING)])
+    if RATINGS_RETENTION_DAYS > 0:
+        try:
+            db.ratings.create_index("at", expireAfterSeconds=int(RATINGS_RETENTION_DAYS * 86400))
+        except OperationFailure as e:
+            print(f"[RATINGS] ⚠️ index TTL ratings.at non créé (déjà là avec une autre durée ?) : {e}")
+
+_COUNT = {"$ifNull": ["$ratings_count", 0]}
+# documents créés avant ratings_sum : on repart de avg × count
+_PREV_SUM = {"$ifNull": ["$ratings_sum", {"$multiply": [{"$ifNull": ["$avg_rating", 0]}, _COUNT]}]}
+_RECENT = {"$divide": [{"$add": ["$rating_dsum", PRIOR * PRIOR_WEIGHT]},
+                       {"$add": ["$rating_dweight", PRIOR_WEIGHT]}]}
+
+def _decay(prev_ts, now, half_life_days):
+    """2^(-(now - prev_ts) / demi-vie), 1 si now est antérieur (horloges décalées)."""
+    return {"$pow": [2, {"$divide": [{"$min": [{"$subtract": [prev_ts, now]}, 0]}, half_life_days * 86400]}]}
+
+def _rate_pipeline(entry, history_max, max_age_days=HISTORY_MAX_AGE_DAYS, half_life_days=HALF_LIFE_DAYS):
+    score, now = entry["score"], entry["ts"]
+    # documents sans note récente : les anciennes notes comptent comme d'aujourd'hui
+    prev_ts = {"$ifNull": ["$rating_dts", now]}
+    decay = _decay(prev_ts, now, half_life_days)
+    history = {"$concatArrays": [{"$ifNull": ["$ratings_history", []]}, [entry]]}
+    if max_age_days > 0:
+        history = {"$filter": {"input": history, "cond": {"$gte": ["$$this.ts", now - int(max_age_days * 86400)]}}}
+    return [
+        {"$set": {
+            "ratings_sum": {"$add": [_PREV_SUM, score]},
+            "ratings_count": {"$add": [_COUNT, 1]},
+            "rating_dsum": {"$add": [{"$multiply": [{"$ifNull": ["$rating_dsum", _PREV_SUM]}, decay]}, score]},
+            "rating_dweight": {"$add": [{"$multiply": [{"$ifNull": ["$rating_dweight", _COUNT]}, decay]}, 1]},
+            "rating_dts": {"$max": [prev_ts, now]},
+            "ratings_history": {"$slice": [history, -history_max]},
+        }},
+        {"$set": {
+            "avg_rating": {"$divide": ["$ratings_sum", "$ratings_count"]},
+            "recent_rating": _RECENT,
+        }},
+    ]
+
+def rate(db, courier_id, score, order_id, history_max=HISTORY_MAX, ts=None):
+    """Enregistre la note -> Rating(moyenne, nombre d'avis, note récente)."""
+    entry = {"order_id": order_id, "score": int(score), "ts": int(ts or time.time())}
+    doc = db.couriers.find_one_and_update(
+        {"courier_id": courier_id},
+        _rate_pipeline(entry, history_max),
+        projection={"avg_rating": 1, "ratings_count": 1, "recent_rating": 1},
+        upsert=True,
+        return_document=ReturnDocument.AFTER,
+    )
+    return Rating(doc["avg_rating"], doc["ratings_count"], doc["recent_rating"])
+
+def top(db, k=10):
+    """Les k coursiers les mieux notés (note récente) -> [(courier_id, note)], index recent_rating."""
+    cur = (db.couriers.find({"recent_rating": {"$exists": True}}, {"courier_id": 1, "recent_rating": 1})
+           .sort("recent_rating", DESCENDING).limit(k))
+    return [(c["courier_id"], c["recent_rating"]) for c in cur]
+
+def rank(db, courier_id):
+    """Rang (1 = meilleur) d'un coursier, ou None s'il n'a jamais été noté."""
+    c = db.couriers.find_one({"courier_id": courier_id}, {"recent_rating": 1})
+    if not c or "recent_rating" not in c:
+        return None
+    return db.couriers.count_documents({"recent_rating": {"$gt": c["recent_rating"]}}) + 1
+
+def current_rating(doc, now=None, half_life_days=HALF_LIFE_DAYS):
+    """Note récente à l'instant now d'un document couriers, ou None s'il n'en a pas encore."""
+    if doc.get("rating_dts") is None:
+        return None
+    f = 2 ** (-max(0.0, (now or time.time()) - doc["rating_dts"]) / (half_life_days * 86400))
+    return (doc["rating_dsum"] * f + PRIOR * PRIOR_WEIGHT) / (doc["rating_dweight"] * f + PRIOR_WEIGHT)
+
+def refresh(db, now=None, half_life_days=HALF_LIFE_DAYS):
+    """
+    recent_rating de chaque coursier noté recalculé à l'instant now, en un update_many côté
+    serveur (chaque document mis à jour atomiquement : une notation concurrente reste exacte).
+    Sert aussi de migration : documents notés avant la note récente. -> nombre de coursiers.
+    """
+    now = int(now or time.time())
+    res = db.couriers.update_many({"ratings_count": {"$gt": 0}}, [
+        {"$set": {
+            "rating_dsum": {"$ifNull": ["$rating_dsum", _PREV_SUM]},
+            "rating_dweight": {"$ifNull": ["$rating_dweight", _COUNT]},
+            "rating_dts": {"$ifNull": ["$rating_dts", now]},
+        }},
+        {"$set": {"recent_rating": {"$divide": [
+            {"$add": [{"$multiply": ["$rating_dsum", _decay("$rating_dts", now, half_life_days)]},
+                      PRIOR * PRIOR_WEIGHT]},
+            {"$add": [{"$multiply": ["$rating_dweight", _decay("$rating_dts", now, half_life_days)]},
+                      PRIOR_WEIGHT]},
+        ]}}},
+    ])
+    return res.matched_count
+
+def _take_lease(db, owner, every_s):
+    """Bail ratings_refresh pris pour every_s s'il est libre ou expiré ; sinon False."""
+    now = datetime.now(timezone.utc)
+    try:
+        # bail encore valide : le filtre ne trouve rien, l'upsert heurte _id -> DuplicateKeyError
+        db[LEASES].find_one_and_update(
+            {"_id": REFRESH_LEASE, "until": {"$lt": now}},
+            {"$set": {"owner": owner, "until": now + timedelta(seconds=every_s)}},
+            upsert=True,
+        )
+        return True
+    except DuplicateKeyError:
+        return False
+
+def refresh_every(db, every_s=LEADERBOARD_REFRESH_S, owner=None):
+    """
+    refresh() au plus une fois toutes les every_s pour tous les managers : chacun tente toutes
+    les REFRESH_CHECK_S de prendre le bail, seul le gagnant rafraîchit. Thread de fond.
+    """
+    owner = owner or f"ratings-{socket.gethostname()}-{os.getpid()}"
+
+    def loop():
+        while True:
+            try:
+                if _take_lease(db, owner, every_s):
+                    t0 = time.perf_counter()
+                    n = refresh(db)
+                    print(f"[RATINGS] 🏆 notes récentes rafraîchies : {n} coursiers en {(time.perf_counter() - t0) * 1000:.0f} ms")
+            except PyMongoError as e:
+                print(f"[RATINGS] ⚠️ rafraîchissement des notes récentes échoué : {e}")
+            time.sleep(min(every_s, REFRESH_CHECK_S))
+    th = threading.Thread(target=loop, daemon=True, name="ratings-refresh")
+    th.start()
+    return th
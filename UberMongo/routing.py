@@ -0,0 +1,430 @@
+"""
+Temps de trajet par les rues (partagé par les managers Redis et MongoDB).
+
+Les ETA de geo.py sont à vol d'oiseau, à vitesse constante. Ici on suit un graphe de rues local
+compilé une fois (streets.graph, colonnes CSR ouvertes en mmap comme catalog.py) :
+  - nœuds : lat, lon ; arcs orientés : destination, longueur (m), vitesse de la voie (km/h) ;
+  - CSR des arcs sortants et des arcs entrants (parcours inverse) ;
+  - python routing.py --osm paris.osm.pbf   (extrait OpenStreetMap, pyosmium optionnel)
+    python routing.py --synthetic           (ville de test : quadrillage, boulevards, sens uniques, fleuve)
+Router répond pour UNE vitesse de coursier (sur une voie : min(vitesse de la voie, coursier)) :
+  - retrait -> dépôt : A* (heuristique vol d'oiseau / vitesse max), mémo LRU par paire de
+    cellules geohash (ROUTE_PRECISION, ~150 m) ;
+  - coursier -> retrait : un Dijkstra inverse depuis le retrait (borné à HORIZON_S) donne le temps
+    de TOUS les nœuds vers ce retrait, gardé en LRU par cellule de retrait. Une candidature ne
+    coûte ensuite qu'un rattachement au nœud le plus proche et une lecture de tableau ;
+  - entre un point et son nœud : vol d'oiseau à la vitesse du coursier. Point à plus de
+    SNAP_MAX_KM du réseau, pas de chemin ou au-delà de l'horizon : ETA de geo.py.
+SciPy (optionnel) fait le Dijkstra inverse en C ; sans lui, Dijkstra en Python pur.
+
+    router = Router(Graph("streets.graph"), vitesse_kmh=20.0)
+    router.eta_minutes((48.85, 2.33), (48.86, 2.35), (48.87, 2.34), 0.5)
+"""
+import argparse, heapq, math, mmap, os, random, struct, time
+from collections import Counter, OrderedDict
+import numpy as np
+
+import geo
+from spatial import GridIndex
+from zones import geohash
+
+try:
+    from scipy.sparse import csr_matrix as _csr
+    from scipy.sparse.csgraph import dijkstra as _sp_dijkstra
+except ImportError:  # SciPy optionnel
+    _csr = _sp_dijkstra = None
+
+GRAPH_PATH = "streets.graph"
+MAGIC = b"UBGRAPH\0"
+FORMAT_VERSION = 1
+HEADER = struct.Struct("<8sIQQ")   # magic, version, nœuds, arcs
+ALIGN = 8
+ROUTE_PRECISION = 7      # cellules du mémo (~150 m × 150 m)
+ROUTE_CACHE = 100_000    # paires (cellule retrait, cellule dépôt) gardées
+TREE_CACHE = 64          # arbres « tous les nœuds -> retrait » gardés
+SNAP_CACHE = 50_000      # rattachements point -> nœud gardés (positions exactes)
+HORIZON_S = 1800         # coursier à plus de 30 min du retrait par les rues : ETA de geo.py
+SNAP_MAX_KM = 1.0
+
+# voies praticables par un coursier (vélo / scooter) et vitesse par défaut sans maxspeed
+HIGHWAY_KMH = {
+    "trunk": 50, "trunk_link": 40, "primary": 50, "primary_link": 40, "secondary": 40,
+    "secondary_link": 30, "tertiary": 30, "tertiary_link": 30, "unclassified": 30,
+    "residential": 25, "living_street": 10, "service": 15, "cycleway": 20,
+}
+
+def _layout(n, m):
+    """Sections (nom, dtype, longueur) -> offsets, identiques à l'écriture et à la lecture."""
+    sections = [
+        ("lat", np.float64, n), ("lon", np.float64, n),
+        ("off", np.uint32, n + 1), ("dst", np.uint32, m),
+        ("length_m", np.float32, m), ("kmh", np.uint8, m),
+        ("roff", np.uint32, n + 1), ("rsrc", np.uint32, m), ("redge", np.uint32, m),
+    ]
+    out, pos = {}, HEADER.size
+    for name, dtype, count in sections:
+        pos = (pos + ALIGN - 1) // ALIGN * ALIGN
+        out[name] = (dtype, count, pos)
+        pos += np.dtype(dtype).itemsize * count
+    return out, pos
+
+# ---------------------------------------------------------------- compilation
+
+def build(lat, lon, u, v, kmh, oneway, out_path=GRAPH_PATH):
+    """
+    Tronçons (u, v, vitesse, sens unique) -> graphe compilé ; un tronçon à double sens donne
+    deux arcs, les arcs en double gardent le plus court. Retourne le chemin du fichier.
+    """
+    lat = np.asarray(lat, np.float64); lon = np.asarray(lon, np.float64)
+    u = np.asarray(u, np.int64); v = np.asarray(v, np.int64)
+    kmh = np.asarray(kmh, np.float64); oneway = np.asarray(oneway, bool)
+    two = ~oneway
+    src = np.concatenate([u, v[two]]); dst = np.concatenate([v, u[two]])
+    speed = np.concatenate([kmh, kmh[two]])
+    keep = src != dst
+    src, dst, speed = src[keep], dst[keep], speed[keep]
+    length = geo.haversine_pairs(lat[src], lon[src], lat[dst], lon[dst]) * 1000
+    o = np.lexsort((length / np.maximum(speed, 1), dst, src))
+    src, dst, speed, length = src[o], dst[o], speed[o], length[o]
+    first = np.ones(len(src), bool)
+    first[1:] = (src[1:] != src[:-1]) | (dst[1:] != dst[:-1])
+    src, dst, speed, length = src[first], dst[first], speed[first], length[first]
+
+    n, m = len(lat), len(src)
+    r = np.argsort(dst, kind="stable")
+    cols = {
+        "lat": lat, "lon": lon,
+        "off": np.searchsorted(src, np.arange(n + 1)), "dst": dst,
+        "length_m": np.maximum(length, 0.1), "kmh": np.clip(np.round(speed), 1, 255),
+        "roff": np.searchsorted(dst[r], np.arange(n + 1)), "rsrc": src[r], "redge": r,
+    }
+    layout, total = _layout(n, m)
+    buf = bytearray(total)
+    HEADER.pack_into(buf, 0, MAGIC, FORMAT_VERSION, n, m)
+    for name, (dtype, count, off) in layout.items():
+        data = np.ascontiguousarray(cols[name], dtype=dtype).tobytes()
+        buf[off:off + len(data)] = data
+    tmp = f"{out_path}.{os.getpid()}.tmp"
+    with open(tmp, "wb") as f:
+        f.write(buf)
+    os.replace(tmp, out_path)
+    return out_path
+
+def _maxspeed(tag, default):
+    try:
+        return float(str(tag).split()[0])
+    except (TypeError, ValueError, IndexError):
+        return default
+
+def from_osm(osm_path, out_path=GRAPH_PATH):
+    """Extrait OpenStreetMap (.osm.pbf / .osm) -> graphe compilé. Nécessite pyosmium."""
+    try:
+        import osmium
+    except ImportError:
+        raise SystemExit("pyosmium requis pour lire un extrait OSM : pip install osmium")
+
+    ids, lat, lon = {}, [], []
+    u, v, kmh, oneway = [], [], [], []
+
+    def node(ref, loc):
+        i = ids.get(ref)
+        if i is None:
+            i = ids[ref] = len(lat)
+            lat.append(loc.lat); lon.append(loc.lon)
+        return i
+
+    class Ways(osmium.SimpleHandler):
+        def way(self, w):
+            hw = w.tags.get("highway")
+            if hw not in HIGHWAY_KMH:
+                return
+            speed = _maxspeed(w.tags.get("maxspeed"), HIGHWAY_KMH[hw])
+            ow = w.tags.get("oneway")
+            nodes = [(n.ref, n.location) for n in w.nodes if n.location.valid()]
+            if ow == "-1":
+                nodes.reverse()
+            for (a, la), (b, lb) in zip(nodes, nodes[1:]):
+                u.append(node(a, la)); v.append(node(b, lb))
+                kmh.append(speed); oneway.append(ow in ("yes", "1", "-1") or hw == "trunk")
+
+    Ways().apply_file(osm_path, locations=True)
+    if not u:
+        raise RuntimeError(f"Aucune voie praticable dans {osm_path}.")
+    return build(lat, lon, u, v, kmh, oneway, out_path)
+
+def synthetic(out_path=GRAPH_PATH, lat0=48.80, lon0=2.25, size_km=12.0, step_m=120.0, seed=7):
+    """
+    Ville de test : quadrillage de rues à 25 km/h (30 % en sens unique, 8 % de rues coupées),
+    boulevards à 40 km/h toutes les 6 rues, fleuve est-ouest franchi par un pont toutes les 8 rues.
+    """
+    rnd = random.Random(seed)
+    k = int(size_km * 1000 / step_m) + 1
+    dlat = step_m / 1000 / geo.R_TERRE_KM * 180 / math.pi
+    dlon = dlat / math.cos(math.radians(lat0))
+    ii, jj = np.meshgrid(np.arange(k), np.arange(k), indexing="ij")
+    lat = lat0 + ii.ravel() * dlat
+    lon = lon0 + jj.ravel() * dlon
+    river = k // 2
+    u, v, kmh, oneway = [], [], [], []
+    for i in range(k):
+        for j in range(k):
+            a = i * k + j
+            for di, dj, line in ((0, 1, i), (1, 0, j)):   # vers l'est (rue i), vers le nord (rue j)
+                if i + di >= k or j + dj >= k:
+                    continue
+                if di and i == river and j % 8:
+                    continue                               # pas de pont
+                big = line % 6 == 0
+                if not big and rnd.random() < 0.08:
+                    continue
+                one = not big and rnd.random() < 0.3
+                b = (i + di) * k + j + dj
+                if one and line % 2:
+                    a_, b_ = b, a
+                else:
+                    a_, b_ = a, b
+                u.append(a_); v.append(b_); kmh.append(40 if big else 25); oneway.append(one)
+    return build(lat, lon, u, v, kmh, oneway, out_path)
+
+# ---------------------------------------------------------------- lecture
+
+class Graph:
+    """Graphe compilé ouvert en mmap ; toutes les colonnes sont des vues numpy sans copie."""
+
+    def __init__(self, path=GRAPH_PATH):
+        self.path = path
+        with open(path, "rb") as f:
+            self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, self.n, self.m = HEADER.unpack_from(self._mm, 0)
+        if magic != MAGIC or version != FORMAT_VERSION:
+            raise ValueError(f"{path} : format de graphe inconnu")
+        layout, _ = _layout(self.n, self.m)
+        for name, (dtype, count, off) in layout.items():
+            setattr(self, name, np.frombuffer(self._mm, dtype, count, off))
+        self._grid = None
+
+    def snap(self, lat, lon):
+        """(nœud le plus proche, distance km)."""
+        if self._grid is None:
+            self._grid = GridIndex(self.lat, self.lon)
+        idx, d = self._grid.nearest(lat, lon, 1)
+        return int(idx[0]), float(d[0])
+
+class Router:
+    """Temps de trajet par les rues pour une vitesse de coursier, avec mémo et arbres en LRU."""
+
+    def __init__(self, graph, vitesse_kmh, precision=ROUTE_PRECISION, cache_size=ROUTE_CACHE,
+                 tree_cache=TREE_CACHE, horizon_s=HORIZON_S):
+        self.g = graph
+        self.vitesse_kmh = vitesse_kmh
+        self.precision = precision
+        self.cache_size = cache_size
+        self.tree_cache = tree_cache
+        self.horizon_s = horizon_s
+        w = graph.length_m / (np.minimum(graph.kmh.astype(np.float64), vitesse_kmh) / 3.6)
+        rw = w[graph.redge]
+        # listes Python pour A* / Dijkstra : l'accès élément par élément y est bien plus rapide
+        self._off, self._dst, self._w = graph.off.tolist(), graph.dst.tolist(), w.tolist()
+        self._roff, self._rsrc, self._rw = graph.roff.tolist(), graph.rsrc.tolist(), rw.tolist()
+        self._lat, self._lon = graph.lat.tolist(), graph.lon.tolist()
+        self._inv_vmax = 3.6 / min(float(graph.kmh.max()), vitesse_kmh)
+        self._rev = (_csr((rw, graph.rsrc, graph.roff), shape=(graph.n, graph.n))
+                     if _csr is not None else None)
+        self.pairs = OrderedDict()   # (cellule, cellule) -> s
+        self.trees = OrderedDict()   # cellule -> (temps de chaque nœud vers le point, s hors réseau)
+        self.snaps = OrderedDict()   # (lat, lon) -> (nœud, s) ou None
+        self.counts = Counter()
+
+    # ----- briques
+
+    def _snap(self, lat, lon):
+        """(nœud, secondes entre le point et le nœud) ou None si trop loin du réseau ; mémo LRU."""
+        key = (lat, lon)
+        if key in self.snaps:
+            return self.snaps[key]
+        node, km = self.g.snap(lat, lon)
+        snapped = None if km > SNAP_MAX_KM else (node, km * 3600 / self.vitesse_kmh)
+        self._lru_put(self.snaps, key, snapped, SNAP_CACHE)
+        return snapped
+
+    def _astar(self, s, t, parents=None):
+        """Temps (s) du nœud s au nœud t (inf sans chemin) ; parents : dict rempli pour path()."""
+        if s == t:
+            return 0.0
+        lat, lon, off, dst, w = self._lat, self._lon, self._off, self._dst, self._w
+        t_lat, t_lon, inv = lat[t], lon[t], self._inv_vmax * 1000
+        best = {s: 0.0}
+        heap = [(geo.haversine_km(lat[s], lon[s], t_lat, t_lon) * inv, 0.0, s)]
+        done = set()
+        while heap:
+            _, gx, x = heapq.heappop(heap)
+            if x == t:
+                return gx
+            if x in done:
+                continue
+            done.add(x)
+            for e in range(off[x], off[x + 1]):
+                y = dst[e]
+                gy = gx + w[e]
+                if gy < best.get(y, math.inf):
+                    best[y] = gy
+                    if parents is not None:
+                        parents[y] = x
+                    heapq.heappush(heap, (gy + geo.haversine_km(lat[y], lon[y], t_lat, t_lon) * inv, gy, y))
+        return math.inf
+
+    def _reverse_tree(self, t):
+        """Temps (s) de chaque nœud vers t, inf au-delà de l'horizon (float32, n valeurs)."""
+        if self._rev is not None:
+            return _sp_dijkstra(self._rev, directed=True, indices=t, limit=self.horizon_s).astype(np.float32)
+        roff, rsrc, rw = self._roff, self._rsrc, self._rw
+        dist = {t: 0.0}
+        heap = [(0.0, t)]
+        while heap:
+            dx, x = heapq.heappop(heap)
+            if dx > dist.get(x, math.inf):
+                continue
+            for e in range(roff[x], roff[x + 1]):
+                y, dy = rsrc[e], dx + rw[e]
+                if dy <= self.horizon_s and dy < dist.get(y, math.inf):
+                    dist[y] = dy
+                    heapq.heappush(heap, (dy, y))
+        out = np.full(self.g.n, np.inf, np.float32)
+        out[list(dist)] = list(dist.values())
+        return out
+
+    @staticmethod
+    def _lru_put(cache, key, value, size):
+        cache[key] = value
+        if len(cache) > size:
+            cache.popitem(last=False)
+
+    # ----- temps de trajet
+
+    def pair_s(self, a, b):
+        """Temps (s) de a à b par les rues, mémo par paire de cellules ; None sans chemin."""
+        key = (geohash(a[0], a[1], self.precision), geohash(b[0], b[1], self.precision))
+        t = self.pairs.get(key)
+        if t is not None:
+            self.pairs.move_to_end(key)
+            self.counts["pair_hit"] += 1
+        else:
+            self.counts["pair_miss"] += 1
+            sa, sb = self._snap(*a), self._snap(*b)
+            t = math.inf if sa is None or sb is None else sa[1] + self._astar(sa[0], sb[0]) + sb[1]
+            self._lru_put(self.pairs, key, t, self.cache_size)
+        return None if math.isinf(t) else t
+
+    def tree(self, b):
+        """(temps de chaque nœud vers b, s entre b et son nœud) ou None hors réseau ; LRU par cellule."""
+        key = geohash(b[0], b[1], self.precision)
+        if key in self.trees:
+            self.trees.move_to_end(key)
+            self.counts["tree_hit"] += 1
+            return self.trees[key]
+        self.counts["tree_miss"] += 1
+        sb = self._snap(*b)
+        tr = None if sb is None else (self._reverse_tree(sb[0]), sb[1])
+        self._lru_put(self.trees, key, tr, self.tree_cache)
+        return tr
+
+    def to_s(self, c, b, tr=None):
+        """Temps (s) du point c au point b (arbre de b) ; None si inaccessible."""
+        tr = tr if tr is not None else self.tree(b)
+        sc = self._snap(*c)
+        if tr is None or sc is None:
+            return None
+        t = float(tr[0][sc[0]])
+        return None if math.isinf(t) else sc[1] + t + tr[1]
+
+    def eta_minutes(self, c_pos, pickup, drop, delai_fixe_min):
+        """Comme geo.eta_minutes (min, entier ≥ 1), par les rues ; geo.py si un tronçon échoue."""
+        t1 = self.to_s(c_pos, pickup)
+        t2 = self.pair_s(pickup, drop) if t1 is not None else None
+        if t2 is None:
+            self.counts["fallback"] += 1
+            return geo.eta_minutes(c_pos, pickup, drop, self.vitesse_kmh, delai_fixe_min)
+        return max(1, int(round((t1 + t2) / 60 + delai_fixe_min)))
+
+    def eta_matrix(self, c_lat, c_lon, p_lat, p_lon, d_lat, d_lon, delai_fixe_min):
+        """Comme geo.eta_matrix : N coursiers × M commandes ; un arbre par retrait."""
+        out = np.empty((len(c_lat), len(p_lat)), dtype=np.int64)
+        snaps = [self._snap(a, b) for a, b in zip(c_lat, c_lon)]
+        for j, (p, d) in enumerate(zip(zip(p_lat, p_lon), zip(d_lat, d_lon))):
+            tr = self.tree(p)
+            t2 = self.pair_s(p, d)
+            for i, sc in enumerate(snaps):
+                t1 = None if tr is None or sc is None or t2 is None else float(tr[0][sc[0]])
+                if t1 is None or math.isinf(t1):
+                    self.counts["fallback"] += 1
+                    out[i, j] = geo.eta_minutes((c_lat[i], c_lon[i]), p, d, self.vitesse_kmh, delai_fixe_min)
+                else:
+                    out[i, j] = max(1, int(round((sc[1] + t1 + tr[1] + t2) / 60 + delai_fixe_min)))
+        return out
+
+    def path(self, a, b):
+        """Polyligne [(lat, lon)] de a à b par les rues ([a, b] sans chemin)."""
+        sa, sb = self._snap(*a), self._snap(*b)
+        parents = {}
+        if sa is None or sb is None or math.isinf(self._astar(sa[0], sb[0], parents)):
+            return [tuple(a), tuple(b)]
+        nodes, x = [sb[0]], sb[0]
+        while x != sa[0]:
+            x = parents[x]
+            nodes.append(x)
+        return [tuple(a)] + [(self._lat[x], self._lon[x]) for x in reversed(nodes)] + [tuple(b)]
+
+    def describe(self):
+        c = self.counts
+        pairs = c["pair_hit"] + c["pair_miss"]
+        trees = c["tree_hit"] + c["tree_miss"]
+        return (f"mémo trajets {c['pair_hit'] / max(1, pairs):.0%} ({len(self.pairs)}), "
+                f"arbres {c['tree_hit'] / max(1, trees):.0%} ({len(self.trees)}), "
+                f"{c['fallback']} ETA à vol d'oiseau")
+
+def open_router(path, vitesse_kmh):
+    """Router sur le graphe compilé path (option --graph des scripts)."""
+    g = Graph(path)
+    print(f"[ROUTING] {path} : {g.n} nœuds, {g.m} arcs, ETA par les rues à {vitesse_kmh:g} km/h max")
+    return Router(g, vitesse_kmh)
+
+def polyline_at(points, t):
+    """Point à la fraction t (0..1) de la longueur d'une polyligne."""
+    if len(points) < 2 or t <= 0:
+        return points[0]
+    legs = [geo.haversine_km(a[0], a[1], b[0], b[1]) for a, b in zip(points, points[1:])]
+    left = t * sum(legs)
+    for (a, b), d in zip(zip(points, points[1:]), legs):
+        if left <= d and d > 0:
+            f = left / d
+            return a[0] + (b[0] - a[0]) * f, a[1] + (b[1] - a[1]) * f
+        left -= d
+    return points[-1]
+
+def main():
+    ap = argparse.ArgumentParser(description="Compile un graphe de rues pour les ETA (routing.py).")
+    ap.add_argument("--osm", help="extrait OpenStreetMap (.osm.pbf), nécessite pyosmium")
+    ap.add_argument("--synthetic", action="store_true", help="ville de test (quadrillage ~12 km autour de Paris)")
+    ap.add_argument("-o", "--out", default=GRAPH_PATH)
+    ap.add_argument("--route", nargs=4, type=float, metavar=("LAT_A", "LON_A", "LAT_B", "LON_B"),
+                    help="temps de trajet d'essai sur le graphe")
+    ap.add_argument("--kmh", type=float, default=20.0, help="vitesse du coursier pour --route")
+    args = ap.parse_args()
+    if args.osm or args.synthetic:
+        t0 = time.perf_counter()
+        path = from_osm(args.osm, args.out) if args.osm else synthetic(args.out)
+        g = Graph(path)
+        print(f"[ROUTING] {path} : {g.n} nœuds, {g.m} arcs, {os.path.getsize(path) / 2**20:.1f} Mo "
+              f"en {time.perf_counter() - t0:.1f} s")
+    if args.route:
+        router = Router(Graph(args.out), args.kmh)
+        a, b = tuple(args.route[:2]), tuple(args.route[2:])
+        t0 = time.perf_counter()
+        s = router.pair_s(a, b)
+        ms = (time.perf_counter() - t0) * 1000
+        crow = geo.haversine_km(a[0], a[1], b[0], b[1]) / args.kmh * 60
+        print(f"[ROUTING] {'pas de chemin' if s is None else f'{s / 60:.1f} min'} par les rues "
+              f"(vol d'oiseau : {crow:.1f} min) en {ms:.1f} ms")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,113 @@
+"""
+Index spatial du catalogue : grille régulière en degrés, triée par cellule (NumPy, sans dépendance).
+
+Chaque restaurant tombe dans une cellule (ligne de latitude, colonne de longitude) ; les
+indices sont triés par numéro de cellule = ligne × colonnes + colonne. Les cellules d'une même
+ligne sont contiguës : une requête lit une tranche par ligne de la boîte englobante du cercle
+(deux searchsorted vectorisés), puis ne calcule haversine que sur ces candidats.
+  - within(lat, lon, rayon_km)  : restaurants du cercle, triés par distance ;
+  - nearest(lat, lon, k)        : k plus proches (rayon élargi jusqu'à en trouver k).
+La taille de cellule vient de la densité (~CELL_TARGET restaurants par cellule). Les distances
+restent exactes (haversine) ; prévu pour un catalogue urbain ou régional (ni pôles ni antiméridien).
+
+    grid = GridIndex(cat.lat, cat.lon)
+    idx, dist_km = grid.nearest(48.8610, 2.3450, 10)
+"""
+import math
+import numpy as np
+
+from geo import R_TERRE_KM, haversine_pairs
+
+KM_PAR_DEG = math.pi * R_TERRE_KM / 180
+CELL_TARGET = 16        # restaurants par cellule visés (taille automatique)
+CELL_MIN_KM = 0.05
+
+class GridIndex:
+    def __init__(self, lat, lon, cell_km=None):
+        self.lat = np.asarray(lat, dtype=np.float64)
+        self.lon = np.asarray(lon, dtype=np.float64)
+        n = len(self.lat)
+        if n:
+            self.lat0, self.lon0 = float(self.lat.min()), float(self.lon.min())
+            lat1, lon1 = float(self.lat.max()), float(self.lon.max())
+        else:
+            self.lat0 = self.lon0 = lat1 = lon1 = 0.0
+        coslat = max(0.01, math.cos(math.radians((self.lat0 + lat1) / 2)))
+        if cell_km is None:
+            area = max(1e-6, (lat1 - self.lat0) * KM_PAR_DEG) * max(1e-6, (lon1 - self.lon0) * KM_PAR_DEG * coslat)
+            cell_km = max(CELL_MIN_KM, math.sqrt(area * CELL_TARGET / max(1, n)))
+        self.cell_km = cell_km
+        self.dlat = cell_km / KM_PAR_DEG
+        self.dlon = cell_km / (KM_PAR_DEG * coslat)
+        self.rows = int((lat1 - self.lat0) / self.dlat) + 1
+        self.cols = int((lon1 - self.lon0) / self.dlon) + 1
+        self.extent_km = math.hypot(self.rows * cell_km, self.cols * cell_km)
+        keys = self._row(self.lat) * self.cols + self._col(self.lon)
+        self.order = np.argsort(keys, kind="stable").astype(np.int64)
+        self.keys = keys[self.order]
+
+    def __len__(self):
+        return len(self.order)
+
+    def _row(self, lat):
+        return np.clip(((lat - self.lat0) / self.dlat).astype(np.int64), 0, self.rows - 1)
+
+    def _col(self, lon):
+        return np.clip(((lon - self.lon0) / self.dlon).astype(np.int64), 0, self.cols - 1)
+
+    def _candidates(self, lat, lon, radius_km):
+        """Indices des restaurants des cellules de la boîte englobante du cercle."""
+        dlat = radius_km / KM_PAR_DEG
+        edge = min(89.9, abs(lat) + dlat)            # latitude la plus polaire du cercle
+        dlon = radius_km / (KM_PAR_DEG * math.cos(math.radians(edge)))
+        r0 = int(math.floor((lat - dlat - self.lat0) / self.dlat))
+        r1 = int(math.floor((lat + dlat - self.lat0) / self.dlat))
+        c0 = int(math.floor((lon - dlon - self.lon0) / self.dlon))
+        c1 = int(math.floor((lon + dlon - self.lon0) / self.dlon))
+        r0, r1 = max(r0, 0), min(r1, self.rows - 1)
+        c0, c1 = max(c0, 0), min(c1, self.cols - 1)
+        if r0 > r1 or c0 > c1:
+            return np.empty(0, np.int64)
+        base = np.arange(r0, r1 + 1, dtype=np.int64) * self.cols
+        lo = np.searchsorted(self.keys, base + c0, "left")
+        hi = np.searchsorted(self.keys, base + c1, "right")
+        sizes = hi - lo
+        total = int(sizes.sum())
+        if not total:
+            return np.empty(0, np.int64)
+        # concaténation des tranches [lo, hi) sans boucle Python
+        pos = np.arange(total, dtype=np.int64) - np.repeat(np.cumsum(sizes) - sizes - lo, sizes)
+        return self.order[pos]
+
+    def within(self, lat, lon, radius_km, limit=None):
+        """(indices, distances km) des restaurants à moins de radius_km, du plus proche au plus loin."""
+        idx = self._candidates(lat, lon, radius_km)
+        d = haversine_pairs(lat, lon, self.lat[idx], self.lon[idx])
+        keep = d <= radius_km
+        idx, d = idx[keep], d[keep]
+        if limit is not None and limit < len(idx):
+            part = np.argpartition(d, limit - 1)[:limit]
+            idx, d = idx[part], d[part]
+        o = np.argsort(d, kind="stable")
+        return idx[o], d[o]
+
+    def nearest(self, lat, lon, k, max_km=None):
+        """(indices, distances km) des k restaurants les plus proches (au plus max_km)."""
+        k = min(k, len(self))
+        if k <= 0:
+            return np.empty(0, np.int64), np.empty(0)
+        # rayon de départ : celui qui contient ~k restaurants à densité moyenne
+        radius = self.cell_km * max(1.0, math.sqrt(k / CELL_TARGET))
+        while True:
+            if max_km is not None and radius >= max_km:
+                return self.within(lat, lon, max_km, k)
+            idx, d = self.within(lat, lon, radius, k)
+            if len(idx) >= k or radius > self.extent_km + self._gap_km(lat, lon):
+                return idx, d
+            radius *= 2
+
+    def _gap_km(self, lat, lon):
+        """Distance (majorée) du point à la grille : au-delà, tout est couvert."""
+        lat1, lon1 = self.lat0 + self.rows * self.dlat, self.lon0 + self.cols * self.dlon
+        cl, cn = min(max(lat, self.lat0), lat1), min(max(lon, self.lon0), lon1)
+        return float(haversine_pairs(lat, lon, cl, cn)) + self.cell_km
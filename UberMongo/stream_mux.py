@@ -0,0 +1,164 @@
+"""
+Multiplexeur de change streams : UN curseur serveur par collection, quel que soit
+le nombre de commandes suivies. Les événements sont routés en mémoire, selon un champ
+du document (order_id par défaut), vers des files, des callbacks ou des asyncio.Queue.
+
+    cands = ChangeStreamMux(db.candidatures).start()
+    q = cands.subscribe(order_id)        # s'abonner AVANT de provoquer l'événement
+    doc = q.get(timeout=5)
+    cands.unsubscribe(order_id, q)
+
+filter_keys=True (rôles qui ne suivent qu'une ou quelques commandes : client, coursier) : le
+serveur ne renvoie que les documents des clés abonnées ($in sur key_field), au lieu de toute
+la ville. Un nouvel abonnement rouvre le curseur depuis le jeton courant au moment du subscribe
+(rien de manqué, doublons des clés déjà suivies écartés) ; pas de backlog : s'abonner avant de
+provoquer l'événement.
+"""
+import queue, threading, time
+from collections import OrderedDict
+from pymongo.errors import PyMongoError, OperationFailure
+
+MAX_AWAIT_MS = 500   # attente côté serveur (getMore) : pas de sleep côté client
+BACKLOG_TTL_S = 30   # événements sans abonné gardés 30 s (rejoués au subscribe)
+BACKLOG_MAX = 10000  # nombre max de clés en attente (mémoire bornée)
+
+class ChangeStreamMux:
+    def __init__(self, collection, key_field="order_id", operation_types=("insert",), filter_keys=False):
+        self.coll = collection
+        self.key_field = key_field
+        self.operation_types = list(operation_types)
+        self.filter_keys = filter_keys
+        self.watched = set()      # filter_keys : clés du $match du curseur ouvert
+        self.reopen = False       # filter_keys : une clé a été ajoutée, curseur à rouvrir...
+        self.restart_from = None  # ... depuis ce jeton (celui du moment du subscribe)
+        self.skip = None          # (clés déjà suivies, jeton) : doublons après réouverture
+        self.routes = {}          # clé -> [cible, ...]
+        self.backlog = OrderedDict()  # clé -> [(t, doc)] arrivés avant l'abonnement
+        self.lock = threading.Lock()
+        self.resume_token = None
+        self.ready = threading.Event()
+        self.stopping = threading.Event()
+        self.thread = threading.Thread(target=self._run, daemon=True,
+                                       name=f"mux-{collection.name}")
+
+    def start(self, timeout=10):
+        """Démarre le thread et attend l'ouverture du curseur (aucun événement manqué ensuite)."""
+        self.thread.start()
+        if not self.ready.wait(timeout):
+            print(f"[MUX] ⚠️ change stream '{self.coll.name}' pas encore ouvert après {timeout} s")
+        return self
+
+    def close(self):
+        self.stopping.set()
+        self.thread.join(timeout=2 * MAX_AWAIT_MS / 1000)
+
+    # ----- abonnements
+
+    def subscribe(self, key, target=None):
+        """
+        target : None (une queue.Queue est créée), une queue.Queue partagée,
+        ou un callable(doc) appelé depuis le thread du multiplexeur.
+        Retourne la cible, à repasser à unsubscribe().
+        """
+        if target is None:
+            target = queue.Queue()
+        with self.lock:
+            if self.filter_keys and key not in self.watched and not self.reopen:
+                self.reopen, self.restart_from = True, self.resume_token
+            self.routes.setdefault(key, []).append(target)
+            early = self.backlog.pop(key, [])
+        limit = time.monotonic() - BACKLOG_TTL_S
+        for t, doc in early:
+            if t >= limit:
+                self._deliver(target, doc)
+        return target
+
+    def subscribe_async(self, key, loop):
+        """asyncio.Queue alimentée depuis le thread du multiplexeur."""
+        import asyncio
+        aq = asyncio.Queue()
+        self.subscribe(key, lambda doc: loop.call_soon_threadsafe(aq.put_nowait, doc))
+        return aq
+
+    def unsubscribe(self, key, target):
+        with self.lock:
+            targets = self.routes.get(key, [])
+            if target in targets:
+                targets.remove(target)
+            if not targets:
+                self.routes.pop(key, None)
+
+    # ----- boucle du change stream
+
+    def _deliver(self, target, doc):
+        if callable(target):
+            try:
+                target(doc)
+            except Exception as e:
+                print(f"[MUX] ⚠️ callback en erreur ({e!r})")
+        else:
+            target.put(doc)
+
+    def _pipeline(self):
+        match = {"operationType": {"$in": self.operation_types}}
+        if self.filter_keys:
+            match[f"fullDocument.{self.key_field}"] = {"$in": sorted(self.watched, key=str)}
+        return [{"$match": match}]
+
+    def _dispatch(self, doc):
+        key = doc.get(self.key_field)
+        now = time.monotonic()
+        with self.lock:
+            targets = list(self.routes.get(key, ()))
+            if not targets and self.filter_keys:
+                return   # désabonné entre-temps
+            if not targets:
+                # personne n'écoute encore : on garde l'événement un court instant
+                self.backlog.setdefault(key, []).append((now, doc))
+                self.backlog.move_to_end(key)
+                while self.backlog:
+                    oldest = next(iter(self.backlog.values()))
+                    if len(self.backlog) <= BACKLOG_MAX and oldest[-1][0] >= now - BACKLOG_TTL_S:
+                        break
+                    self.backlog.popitem(last=False)
+        for t in targets:
+            self._deliver(t, doc)
+
+    def _duplicate(self, ev):
+        """Événement déjà livré par le curseur précédent (clé suivie avant la réouverture)."""
+        if self.skip is None:
+            return False
+        keys, token = self.skip
+        data = (ev.get("_id") or {}).get("_data")
+        if token is None or data is None or data > token:
+            self.skip = None   # les jetons _data sont croissants : au-delà, plus de doublon possible
+            return False
+        return ev["fullDocument"].get(self.key_field) in keys
+
+    def _run(self):
+        while not self.stopping.is_set():
+            try:
+                with self.lock:
+                    if self.filter_keys:
+                        if self.reopen:
+                            self.skip = (set(self.watched), (self.resume_token or {}).get("_data"))
+                            self.resume_token, self.reopen = self.restart_from, False
+                        self.watched = set(self.routes)
+                    pipeline = self._pipeline()
+                with self.coll.watch(pipeline, full_document="updateLookup",
+                                     resume_after=self.resume_token,
+                                     max_await_time_ms=MAX_AWAIT_MS) as stream:
+                    self.resume_token = stream.resume_token or self.resume_token
+                    self.ready.set()
+                    while not self.stopping.is_set() and stream.alive:
+                        ev = stream.try_next()
+                        self.resume_token = stream.resume_token
+                        if ev is not None and ev.get("fullDocument") and not self._duplicate(ev):
+                            self._dispatch(ev["fullDocument"])
+                        if self.reopen:
+                            break   # nouvelle clé abonnée : curseur rouvert avec le nouveau $match
+            except PyMongoError as e:
+                if isinstance(e, OperationFailure) and e.code == 286:  # ChangeStreamHistoryLost
+                    self.resume_token = None
+                print(f"[MUX] ⚠️ change stream '{self.coll.name}' interrompu ({e}) → reprise…")
+                time.sleep(1.0)
@@ -0,0 +1,48 @@
+"""
+Stockage du tracking :
+- tracking_ts     : collection time-series (timeField ts, metaField {order_id, courier_id}),
+                    expirée après TRACKING_TTL_S ;
+- tracking_latest : un document par commande (_id = order_id), dernière position connue,
+                    mise à jour (upsert) à chaque lot du TrackingWriter.
+« Où est ma commande ? » devient une lecture ponctuelle sur _id.
+"""
+from datetime import datetime, timezone
+from pymongo import ASCENDING
+from pymongo.errors import CollectionInvalid
+
+from tracking_writer import TrackingWriter
+
+TRACKING_TS = "tracking_ts"
+TRACKING_LATEST = "tracking_latest"
+TRACKING_TTL_S = 7 * 24 * 3600
+
+def ensure_tracking_collections(db):
+    if TRACKING_TS not in db.list_collection_names():
+        try:
+            db.create_collection(
+                TRACKING_TS,
+                timeseries={"timeField": "ts", "metaField": "meta", "granularity": "seconds"},
+                expireAfterSeconds=TRACKING_TTL_S,
+            )
+        except CollectionInvalid:
+            pass  # créée entre-temps par un autre coursier
+    latest = db[TRACKING_LATEST]
+    latest.create_index([("updated_at", ASCENDING)], expireAfterSeconds=TRACKING_TTL_S)
+    latest.create_index([("courier_id", ASCENDING)])
+    return db[TRACKING_TS], latest
+
+def make_tracking_writer(db, **kwargs):
+    ts, latest = ensure_tracking_collections(db)
+    return TrackingWriter(ts, latest=latest, **kwargs)
+
+def track_doc(order_id, courier, **fields):
+    """Document TRACK prêt pour la time-series (champs d'origine + ts + meta)."""
+    doc = {"type": "TRACK", "order_id": order_id, "courier_id": courier["id"], "name": courier["name"]}
+    doc.update(fields)
+    doc["ts"] = datetime.now(timezone.utc)
+    doc["meta"] = {"order_id": order_id, "courier_id": courier["id"]}
+    return doc
+
+def get_latest_position(db, order_id):
+    """Dernier point connu d'une commande (ou None)."""
+    return db[TRACKING_LATEST].find_one({"_id": order_id})
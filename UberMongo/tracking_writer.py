@@ -0,0 +1,153 @@
+"""
+Écriture différée (write-behind) des documents TRACK.
+
+Le coursier dépose ses points dans une file bornée et continue sa boucle ; un thread
+de fond les regroupe en insert_many(ordered=False), vidés dès que MAX_BATCH documents
+sont prêts ou toutes les FLUSH_INTERVAL_S secondes.
+
+    writer = TrackingWriter(db.tracking).start()
+    writer.write({...})
+    writer.close()          # vide la file avant de rendre la main
+"""
+import queue, threading, time
+from pymongo import UpdateOne
+from pymongo.errors import PyMongoError, BulkWriteError
+from pymongo.write_concern import WriteConcern
+
+from metrics import Counter, Gauge, Histogram, timer
+
+MAX_BATCH = 500          # documents max par insert_many
+FLUSH_INTERVAL_S = 0.2   # délai max avant écriture d'un point
+MAX_PENDING = 10_000     # borne mémoire : au-delà, backpressure (ou abandon)
+RETRIES = 3
+DUPLICATE_KEY = 11000
+
+# ----- Métriques (metrics.py) : tous les writers du process
+M_TRACKS = Counter("ubeer_courier_tracks_total", "Documents TRACK écrits")
+M_TRACK_DROPPED = Counter("ubeer_courier_tracks_dropped_total", "Points TRACK abandonnés (file pleine) ou perdus")
+M_TRACK_PENDING = Gauge("ubeer_courier_tracks_pending", "Points TRACK en attente d'écriture")
+M_TRACK_PUBLISH = Histogram("ubeer_courier_track_publish_seconds", "Écriture d'un lot TRACK (insert_many)")
+
+class TrackingWriter:
+    def __init__(self, coll, latest=None, max_batch=MAX_BATCH, flush_interval_s=FLUSH_INTERVAL_S,
+                 max_pending=MAX_PENDING, w=1, j=False, block=True):
+        """
+        latest : collection optionnelle « dernière position » (_id = order_id), mise à jour
+                 une fois par commande et par lot avec son point le plus récent.
+        w / j : write concern des lots (w=0 : sans accusé, le plus rapide ; "majority" : le plus sûr).
+        block : file pleine -> True bloque le producteur (backpressure), False abandonne le point.
+        """
+        wc = WriteConcern(w=w, j=j if w != 0 else None)
+        self.coll = coll.with_options(write_concern=wc)
+        self.latest = latest.with_options(write_concern=wc) if latest is not None else None
+        self.max_batch = max_batch
+        self.flush_interval_s = flush_interval_s
+        self.block = block
+        self.q = queue.Queue(maxsize=max_pending)
+        self.stopping = threading.Event()
+        self.thread = threading.Thread(target=self._run, daemon=True, name="tracking-writer")
+        self.written = 0
+        self.batches = 0
+        self.dropped = 0
+        self.errors = 0
+
+    def start(self):
+        self.thread.start()
+        return self
+
+    def write(self, doc):
+        if self.block:
+            self.q.put(doc)
+            return True
+        try:
+            self.q.put_nowait(doc)
+            return True
+        except queue.Full:
+            self.dropped += 1
+            M_TRACK_DROPPED.inc()
+            return False
+
+    def flush(self):
+        """Attend que tous les documents déjà déposés soient écrits."""
+        self.q.join()
+
+    def close(self):
+        self.stopping.set()   # le thread vide la file sans attendre FLUSH_INTERVAL_S
+        self.flush()
+        self.thread.join(timeout=2 * self.flush_interval_s + 1)
+
+    def stats(self):
+        return {"written": self.written, "batches": self.batches, "dropped": self.dropped,
+                "errors": self.errors, "pending": self.q.qsize()}
+
+    # ----- thread de fond
+
+    def _next_batch(self):
+        try:
+            first = self.q.get(timeout=self.flush_interval_s)
+        except queue.Empty:
+            return []
+        batch = [first]
+        deadline = time.monotonic() + (0 if self.stopping.is_set() else self.flush_interval_s)
+        while len(batch) < self.max_batch:
+            remaining = deadline - time.monotonic()
+            try:
+                batch.append(self.q.get(timeout=remaining) if remaining > 0 else self.q.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _insert(self, batch):
+        for attempt in range(1, RETRIES + 1):
+            try:
+                with timer(M_TRACK_PUBLISH):
+                    self.coll.insert_many(batch, ordered=False)
+                return len(batch)
+            except BulkWriteError as e:
+                # doublons (réessai après coupure : déjà écrits) ignorés ; les autres erreurs
+                # sont des points perdus
+                failed = [err for err in e.details.get("writeErrors", []) if err.get("code") != DUPLICATE_KEY]
+                if failed:
+                    self.errors += len(failed)
+                    M_TRACK_DROPPED.inc(len(failed))
+                    print(f"[TRACKING] ⚠️ {len(failed)} point(s) non écrit(s) ({failed[0].get('errmsg')})")
+                return e.details.get("nInserted", 0)
+            except PyMongoError as e:
+                if attempt == RETRIES:
+                    self.errors += len(batch)
+                    M_TRACK_DROPPED.inc(len(batch))
+                    print(f"[TRACKING] ⚠️ lot de {len(batch)} points perdu ({e})")
+                    return 0
+                time.sleep(0.2 * attempt)
+
+    def _upsert_latest(self, batch):
+        last = {}
+        for doc in batch:
+            last[doc["order_id"]] = doc  # le lot est dans l'ordre d'arrivée
+        ops = []
+        for order_id, doc in last.items():
+            fields = {k: v for k, v in doc.items() if k not in ("_id", "meta")}
+            fields["updated_at"] = doc.get("ts")
+            ops.append(UpdateOne({"_id": order_id}, {"$set": fields}, upsert=True))
+        try:
+            self.latest.bulk_write(ops, ordered=False)
+        except PyMongoError as e:
+            self.errors += 1
+            print(f"[TRACKING] ⚠️ dernière position non mise à jour ({e})")
+
+    def _run(self):
+        while not (self.stopping.is_set() and self.q.empty()):
+            batch = self._next_batch()
+            if not batch:
+                continue
+            M_TRACK_PENDING.set(self.q.qsize())
+            try:
+                n = self._insert(batch)
+                self.written += n
+                M_TRACKS.inc(n)
+                self.batches += 1
+                if self.latest is not None:
+                    self._upsert_latest(batch)
+            finally:
+                for _ in batch:
+                    self.q.task_done()
@@ -0,0 +1,202 @@
+"""
+Fenêtre de candidatures : quand arrêter d'attendre et affecter (partagé par les managers).
+
+Politique « fixed » : on attend toujours timeout_s, comme avant.
+Politique « adaptive » : fermeture dès que possible, après au moins MIN_WAIT_S, si
+  - all_replied  : tous les coursiers sollicités ont répondu (expected connu : annonce ciblée) ;
+  - good_enough  : le meilleur candidat passe la barre de qualité (ETA <= ETA_BAR_MIN et
+                   note >= RATING_BAR) ;
+  - stable       : attendre a peu de chances d'améliorer le meilleur score (p_better < IMPROVE_P) ;
+et au plus tard à timeout_s (timeout).
+
+Mesure de ce que la fermeture anticipée coûte : les candidatures qui arrivent encore jusqu'à
+l'échéance fixe sont versées dans la fenêtre (w.add après fermeture) ; WindowStats compare alors
+le meilleur score au moment de la fermeture au meilleur score qu'aurait vu la fenêtre fixe.
+
+    w = Window(policy, expected=len(targets))
+    while w.check() is None:
+        cand = get(w.wait_s())
+        if cand: w.add(eta_min, rating)
+    stats.record(w)
+"""
+import math, time
+from collections import Counter
+
+TIMEOUT_S = 15.0      # fenêtre fixe / borne de la fenêtre adaptative
+MIN_WAIT_S = 0.3      # jamais avant : laisse arriver les réponses quasi simultanées
+ETA_BAR_MIN = 5       # candidat « assez bon » : ETA <= 5 min…
+RATING_BAR = 4.5      # … et note >= 4.5
+IMPROVE_P = 0.1       # fermeture si P(un meilleur candidat arrive encore) < 10 %
+CHECK_S = 0.05        # réévaluation pendant l'attente (le silence fait baisser p_better)
+POLICIES = ("fixed", "adaptive")
+
+def score(eta_min, rating):
+    """Même ordre que geo.rank_keys (ETA ↑ puis note ↓) ; plus petit = meilleur, en minutes."""
+    return eta_min - rating / 6.0
+
+class FixedWindow:
+    name = "fixed"
+
+    def __init__(self, timeout_s=TIMEOUT_S):
+        self.timeout_s = timeout_s
+        self.check_s = timeout_s
+
+    def close_reason(self, w, now):
+        return "timeout" if now >= w.deadline else None
+
+class AdaptiveWindow(FixedWindow):
+    name = "adaptive"
+
+    def __init__(self, timeout_s=TIMEOUT_S, min_wait_s=MIN_WAIT_S, eta_bar_min=ETA_BAR_MIN,
+                 rating_bar=RATING_BAR, improve_p=IMPROVE_P):
+        super().__init__(timeout_s)
+        self.min_wait_s = min(min_wait_s, timeout_s)
+        self.eta_bar_min = eta_bar_min
+        self.rating_bar = rating_bar
+        self.improve_p = improve_p
+        self.check_s = CHECK_S
+
+    def p_better(self, w, now):
+        """
+        Probabilité qu'une candidature encore à venir batte la meilleure.
+        Taux d'arrivée observé λ = n / (dernière arrivée - ouverture), amorti par le silence
+        depuis la dernière candidature : m = λ · reste · exp(-λ · silence) arrivées attendues
+        (au plus expected - n). Candidats i.i.d. : le meilleur des n + m est parmi les m
+        derniers avec une probabilité m / (n + m).
+        """
+        lam = w.n / max(w.last_at - w.opened, self.min_wait_s)
+        m = lam * max(0.0, w.deadline - now) * math.exp(-lam * (now - w.last_at))
+        if w.expected:
+            m = min(m, max(0, w.expected - w.n))
+        return m / (w.n + m)
+
+    def close_reason(self, w, now):
+        if now >= w.deadline:
+            return "timeout"
+        if now - w.opened < self.min_wait_s:
+            return None
+        if w.expected and w.n >= w.expected:
+            return "all_replied"
+        if w.best is not None and w.best[1] <= self.eta_bar_min and w.best[2] >= self.rating_bar:
+            return "good_enough"
+        if w.n and self.p_better(w, now) < self.improve_p:
+            return "stable"
+        return None
+
+def make_policy(name, timeout_s=TIMEOUT_S):
+    if name == "fixed":
+        return FixedWindow(timeout_s)
+    if name == "adaptive":
+        return AdaptiveWindow(timeout_s)
+    raise ValueError(f"politique de fenêtre inconnue : {name}")
+
+class Window:
+    """Candidatures d'une commande : meilleur score, instants d'arrivée, raison de fermeture."""
+    __slots__ = ("policy", "opened", "deadline", "expected", "n", "last_at", "best",
+                 "closed_at", "reason", "late", "late_best")
+
+    def __init__(self, policy, expected=None, now=None):
+        self.policy = policy
+        self.opened = time.monotonic() if now is None else now
+        self.deadline = self.opened + policy.timeout_s
+        self.expected = expected or None
+        self.n = 0
+        self.last_at = self.opened
+        self.best = None          # (score, eta_min, note)
+        self.closed_at = None
+        self.reason = None
+        self.late = 0             # candidatures reçues après la fermeture, avant l'échéance fixe
+        self.late_best = None
+
+    def add(self, eta_min, rating, now=None):
+        s = score(eta_min, rating)
+        if self.closed_at is not None:
+            self.late += 1
+            if self.late_best is None or s < self.late_best:
+                self.late_best = s
+            return
+        self.n += 1
+        self.last_at = time.monotonic() if now is None else now
+        if self.best is None or s < self.best[0]:
+            self.best = (s, eta_min, rating)
+
+    def check(self, now=None):
+        """Raison de fermeture (la fenêtre est alors fermée) ou None."""
+        if self.closed_at is None:
+            now = time.monotonic() if now is None else now
+            reason = self.policy.close_reason(self, now)
+            if reason is not None:
+                self.closed_at, self.reason = now, reason
+        return self.reason
+
+    def wait_s(self, now=None):
+        """Attente maximale avant de rappeler check() (0 si fermée)."""
+        if self.closed_at is not None:
+            return 0.0
+        now = time.monotonic() if now is None else now
+        return max(0.0, min(self.deadline - now, self.policy.check_s))
+
+    @property
+    def saved_s(self):
+        return max(0.0, self.deadline - self.closed_at) if self.closed_at is not None else 0.0
+
+    @property
+    def lost(self):
+        """Score perdu par rapport à la fenêtre fixe (minutes, >= 0), connu après l'échéance."""
+        if self.best is None or self.late_best is None:
+            return 0.0
+        return max(0.0, self.best[0] - self.late_best)
+
+def _pct(values, p):
+    if not values:
+        return 0.0
+    s = sorted(values)
+    return s[min(len(s) - 1, int(round(p / 100.0 * (len(s) - 1))))]
+
+class WindowStats:
+    """Latence gagnée et qualité perdue par rapport à la fenêtre fixe."""
+
+    def __init__(self):
+        self.reasons = Counter()
+        self.saved = []           # secondes gagnées par fenêtre
+        self.pending = []         # fermées avant l'échéance fixe, en attente des retardataires
+        self.lost = []            # score perdu par fenêtre comparée (minutes)
+        self.late = 0
+
+    def record(self, w):
+        self.reasons[w.reason] += 1
+        self.saved.append(w.saved_s)
+        if w.reason != "timeout":
+            self.pending.append(w)
+
+    def settle(self, now=None, force=False):
+        """Solde les fenêtres dont l'échéance fixe est passée ; retourne la liste soldée."""
+        now = time.monotonic() if now is None else now
+        done = [w for w in self.pending if force or w.deadline <= now]
+        if done:
+            self.pending = [w for w in self.pending if not (force or w.deadline <= now)]
+            for w in done:
+                self.lost.append(w.lost)
+                self.late += w.late
+        return done
+
+    def summary(self):
+        n, cmp = len(self.saved), len(self.lost) + self.reasons["timeout"]
+        worse = sum(1 for x in self.lost if x > 0)
+        return {
+            "windows": n,
+            "reasons": dict(self.reasons),
+            "saved_s": {"mean": sum(self.saved) / n if n else 0.0,
+                        "p50": _pct(self.saved, 50), "p95": _pct(self.saved, 95)},
+            "compared": cmp,
+            "late_candidates": self.late,
+            "worse_pct": 100.0 * worse / cmp if cmp else 0.0,
+            "lost_min": {"mean": sum(self.lost) / cmp if cmp else 0.0, "max": max(self.lost, default=0.0)},
+        }
+
+    def line(self):
+        s = self.summary()
+        reasons = ", ".join(f"{k}={v}" for k, v in sorted(s["reasons"].items()))
+        return (f"{s['windows']} fenêtres ({reasons}) | gagné p50={s['saved_s']['p50']:.2f}s "
+                f"moy={s['saved_s']['mean']:.2f}s | moins bon choix {s['worse_pct']:.1f} % "
+                f"(perte moy={s['lost_min']['mean']:.2f} min, max={s['lost_min']['max']:.2f})")
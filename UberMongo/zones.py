@@ -0,0 +1,80 @@
+"""
+Zones de dispatch (partagé par les managers Redis et MongoDB).
+
+Une commande appartient à la zone du geohash de son point de retrait (ZONE_PRECISION caractères,
+~1,2 km × 0,6 km à 6). Les zones sont réparties entre les managers vivants par rendezvous
+hashing (HRW) : chaque zone va au manager de plus fort poids hash(zone, manager). Quand un
+manager arrive ou part, seules ~1/N des zones changent de main, sans coordination : tous les
+managers qui voient la même liste de membres calculent le même propriétaire.
+
+    zm = ZoneMap("manager-a")
+    zm.update(["manager-a", "manager-b"])
+    mine, zone = zm.owns(48.8566, 2.3522)
+"""
+import hashlib
+
+ZONE_PRECISION = 6
+_BASE32 = "0123456789bcdefghjkmnpqrstuvwxyz"
+
+def geohash(lat, lon, precision=ZONE_PRECISION):
+    """Geohash standard (base 32, bits entrelacés longitude / latitude)."""
+    lat_lo, lat_hi, lon_lo, lon_hi = -90.0, 90.0, -180.0, 180.0
+    out, bits, ch, even = [], 0, 0, True
+    while len(out) < precision:
+        if even:
+            mid = (lon_lo + lon_hi) / 2
+            if lon >= mid:
+                ch, lon_lo = (ch << 1) | 1, mid
+            else:
+                ch, lon_hi = ch << 1, mid
+        else:
+            mid = (lat_lo + lat_hi) / 2
+            if lat >= mid:
+                ch, lat_lo = (ch << 1) | 1, mid
+            else:
+                ch, lat_hi = ch << 1, mid
+        even = not even
+        bits += 1
+        if bits == 5:
+            out.append(_BASE32[ch])
+            bits, ch = 0, 0
+    return "".join(out)
+
+def _weight(zone, member):
+    return int.from_bytes(hashlib.blake2b(f"{zone}|{member}".encode("utf-8"), digest_size=8).digest(), "big")
+
+def owner(zone, members):
+    """Manager propriétaire de la zone (None si aucun membre)."""
+    return max(members, key=lambda m: _weight(zone, m), default=None)
+
+class ZoneMap:
+    """Vue locale de la répartition : membres connus, cache zone -> propriétaire."""
+
+    def __init__(self, me, precision=ZONE_PRECISION):
+        self.me = me
+        self.precision = precision
+        self.members = (me,)
+        self._owners = {}
+
+    def update(self, members):
+        """Nouvelle liste de membres ; True si la répartition a changé."""
+        members = tuple(sorted(set(members) | {self.me}))
+        if members == self.members:
+            return False
+        self.members = members
+        self._owners.clear()
+        return True
+
+    def zone(self, lat, lon):
+        return geohash(lat, lon, self.precision)
+
+    def owner_of(self, zone):
+        o = self._owners.get(zone)
+        if o is None:
+            o = self._owners[zone] = owner(zone, self.members)
+        return o
+
+    def owns(self, lat, lon):
+        """(ce manager possède la zone ?, zone)."""
+        zone = self.zone(lat, lon)
+        return self.owner_of(zone) == self.me, zone
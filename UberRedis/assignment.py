@@ -0,0 +1,139 @@
+"""
+Affectation globale d'une fenêtre de commandes (mode batch des managers).
+
+Au lieu de donner à chaque commande, dans l'ordre d'arrivée, son meilleur candidat,
+on résout un problème d'affectation rectangulaire (Hongrois) sur la matrice
+coût = ETA - note/6 (même ordre que le tri « ETA ↑ puis note ↓ »).
+SciPy est utilisé s'il est installé, sinon une implémentation NumPy équivalente.
+"""
+import numpy as np
+
+import geo
+
+try:
+    from scipy.optimize import linear_sum_assignment as _scipy_lsa
+except ImportError:  # SciPy optionnel
+    _scipy_lsa = None
+
+INFEASIBLE = 1e9   # coût d'une paire (coursier, commande) sans candidature
+
+def _hungarian(cost):
+    """Hongrois O(n²m) (potentiels + plus courts chemins), boucle interne vectorisée."""
+    transposed = cost.shape[0] > cost.shape[1]
+    if transposed:
+        cost = cost.T
+    n, m = cost.shape
+    u = np.zeros(n + 1)
+    v = np.zeros(m + 1)
+    p = np.zeros(m + 1, dtype=np.int64)     # p[j] = ligne (1..n) affectée à la colonne j
+    way = np.zeros(m + 1, dtype=np.int64)
+    for i in range(1, n + 1):
+        p[0] = i
+        j0 = 0
+        minv = np.full(m + 1, np.inf)
+        used = np.zeros(m + 1, dtype=bool)
+        while True:
+            used[j0] = True
+            i0 = p[j0]
+            free = ~used[1:]
+            cur = cost[i0 - 1] - u[i0] - v[1:]
+            better = free & (cur < minv[1:])
+            minv[1:][better] = cur[better]
+            way[1:][better] = j0
+            masked = np.where(free, minv[1:], np.inf)
+            j1 = int(np.argmin(masked)) + 1
+            delta = masked[j1 - 1]
+            cols = np.nonzero(used)[0]
+            u[p[cols]] += delta
+            v[cols] -= delta
+            minv[1:][free] -= delta
+            j0 = j1
+            if p[j0] == 0:
+                break
+        while j0:
+            j1 = way[j0]
+            p[j0] = p[j1]
+            j0 = j1
+    cols = np.nonzero(p[1:])[0]
+    rows = p[1:][cols] - 1
+    if transposed:
+        rows, cols = cols, rows
+    order = np.argsort(rows)
+    return rows[order], cols[order]
+
+def solve(cost):
+    """Affectation de coût minimal -> (lignes, colonnes), paires impossibles exclues."""
+    cost = np.asarray(cost, dtype=np.float64)
+    if cost.size == 0:
+        return np.array([], dtype=np.int64), np.array([], dtype=np.int64)
+    if _scipy_lsa is not None:
+        rows, cols = _scipy_lsa(cost)
+    else:
+        rows, cols = _hungarian(cost)
+    ok = cost[rows, cols] < INFEASIBLE
+    return rows[ok], cols[ok]
+
+def match_window(orders, candidatures, ratings, vitesse_kmh, delai_fixe_min, router=None):
+    """
+    orders: dict order_id -> (pickup, drop)        (ordre d'arrivée conservé)
+    candidatures: liste de (order_id, courier_id, (lat, lon))
+    ratings: dict courier_id -> note moyenne
+    router: routing.Router pour des ETA par les rues (None : vol d'oiseau, geo.py)
+    Retourne dict order_id -> {"courier", "eta_min", "rating"} ; un coursier au plus une commande.
+    """
+    applied = {c[0] for c in candidatures}
+    order_ids = [oid for oid in orders if oid in applied]
+    if not order_ids:
+        return {}
+    col = {oid: j for j, oid in enumerate(order_ids)}
+    couriers, pos = [], {}
+    for oid, cid, p in candidatures:
+        if cid not in pos:
+            couriers.append(cid)
+        pos[cid] = p  # dernière position connue
+    row = {cid: i for i, cid in enumerate(couriers)}
+
+    pickups = [orders[oid][0] for oid in order_ids]
+    drops = [orders[oid][1] for oid in order_ids]
+    args = ([pos[c][0] for c in couriers], [pos[c][1] for c in couriers],
+            [p[0] for p in pickups], [p[1] for p in pickups],
+            [d[0] for d in drops], [d[1] for d in drops])
+    if router is not None:   # ETA par les rues (routing.py)
+        eta = router.eta_matrix(*args, delai_fixe_min)
+    else:
+        eta = geo.eta_matrix(*args, vitesse_kmh, delai_fixe_min)
+    rating_vec = [ratings.get(c, 3.0) for c in couriers]
+    feasible = np.zeros(eta.shape, dtype=bool)
+    for oid, cid, _ in candidatures:
+        if oid in col:
+            feasible[row[cid], col[oid]] = True
+
+    cost = np.where(feasible, geo.rank_keys(eta, rating_vec), INFEASIBLE)
+    rows, cols = solve(cost)
+    return {
+        order_ids[j]: {"courier": couriers[i], "eta_min": int(eta[i, j]), "rating": float(rating_vec[i])}
+        for i, j in zip(rows, cols)
+    }
+
+def greedy_total_eta(orders, candidatures, ratings, vitesse_kmh, delai_fixe_min, router=None):
+    """ETA totale de l'attribution gloutonne (commande par commande) — pour comparaison."""
+    by_order = {}
+    for oid, cid, p in candidatures:
+        by_order.setdefault(oid, []).append((cid, p))
+    taken, total = set(), 0
+    for oid, (pickup, drop) in orders.items():
+        best = None
+        for cid, p in by_order.get(oid, ()):
+            if cid in taken:
+                continue
+            if router is not None:
+                eta = router.eta_minutes(p, pickup, drop, delai_fixe_min)
+            else:
+                eta = geo.eta_minutes(p, pickup, drop, vitesse_kmh, delai_fixe_min)
+            key = (eta, -ratings.get(cid, 3.0))
+            if best is None or key < best[0]:
+                best = (key, cid)
+        if best:
+            taken.add(best[1])
+            total += best[0][0]
+    return total
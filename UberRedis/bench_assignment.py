@@ -0,0 +1,51 @@
+"""
+Benchmark du mode batch : temps de résolution de l'affectation globale
+(SciPy si installé, sinon Hongrois NumPy) et gain d'ETA totale vs glouton.
+
+    python bench_assignment.py
+"""
+import time
+import numpy as np
+
+import assignment
+from manager import VITESSE_KMH, DELAI_FIXE_MIN
+
+CENTER_LAT, CENTER_LON = 48.8660, 2.3350
+
+def scenario(n_orders, n_couriers, apply_rate, rng):
+    orders = {}
+    for j in range(n_orders):
+        p = (CENTER_LAT + rng.normal(0, 0.02), CENTER_LON + rng.normal(0, 0.03))
+        d = (CENTER_LAT + rng.normal(0, 0.02), CENTER_LON + rng.normal(0, 0.03))
+        orders[f"o{j}"] = (p, d)
+    pos = [(CENTER_LAT + rng.normal(0, 0.02), CENTER_LON + rng.normal(0, 0.03)) for _ in range(n_couriers)]
+    cands = [(oid, f"c{i}", pos[i]) for oid in orders for i in range(n_couriers) if rng.random() < apply_rate]
+    ratings = {f"c{i}": float(rng.uniform(2.5, 5.0)) for i in range(n_couriers)}
+    return orders, cands, ratings
+
+def timed(fn, repeat=5):
+    best = float("inf")
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        out = fn()
+        best = min(best, time.perf_counter() - t0)
+    return best * 1000, out
+
+def main():
+    rng = np.random.default_rng(0)
+    backend = "scipy" if assignment._scipy_lsa is not None else "numpy"
+    print(f"solveur : {backend}")
+    print(f"{'commandes':>9} {'coursiers':>9} {'paires':>7} | {'solve':>8} {'numpy':>8} {'match':>8} | ETA glouton -> global")
+    for n_orders, n_couriers in [(20, 30), (50, 60), (80, 80), (100, 150), (200, 250)]:
+        cost = rng.random((n_couriers, n_orders)) * 30
+        t_solve, _ = timed(lambda: assignment.solve(cost))
+        t_np, _ = timed(lambda: assignment._hungarian(cost))
+        orders, cands, ratings = scenario(n_orders, n_couriers, 0.5, rng)
+        t_match, chosen = timed(lambda: assignment.match_window(orders, cands, ratings, VITESSE_KMH, DELAI_FIXE_MIN))
+        greedy = assignment.greedy_total_eta(orders, cands, ratings, VITESSE_KMH, DELAI_FIXE_MIN)
+        total = sum(c["eta_min"] for c in chosen.values())
+        print(f"{n_orders:>9} {n_couriers:>9} {n_orders*n_couriers:>7} | {t_solve:6.2f}ms {t_np:6.2f}ms {t_match:6.2f}ms | "
+              f"{greedy} -> {total} min")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,81 @@
+"""
+Démarrage : relecture de menus.csv (csv.DictReader, comme avant catalog.py) vs ouverture
+de l'instantané mmap. Génère un CSV synthétique de --restaurants × --items lignes.
+
+    python bench_catalog.py --restaurants 100000 --items 10
+"""
+import argparse, csv, os, random, tempfile, time
+
+from catalog import Catalog, build, normalize_name
+from fleet import rss_bytes
+
+def make_csv(path, n_resto, n_items):
+    with open(path, "w", newline="", encoding="utf-8") as f:
+        w = csv.writer(f)
+        w.writerow(["restaurant", "latitude", "longitude", "item", "sku", "price_eur", "prep_min"])
+        for i in range(n_resto):
+            name = f"Resto {i:06d}"
+            lat, lon = 48.80 + random.random() * 0.12, 2.25 + random.random() * 0.17
+            for j in range(n_items):
+                w.writerow([name, f"{lat:.5f}", f"{lon:.5f}", f"Plat {j}", f"r{i}.p{j}",
+                            f"{random.uniform(3, 25):.2f}", random.randint(2, 30)])
+
+def legacy_load(path):
+    """Ce que faisaient client.load_from_csv + manager.load_restos_from_csv au démarrage."""
+    restos, menus, by_key = [], {}, {}
+    with open(path, newline="", encoding="utf-8") as f:
+        for row in csv.DictReader(f):
+            name = row["restaurant"].strip()
+            lat, lon = float(row["latitude"]), float(row["longitude"])
+            if name not in menus:
+                restos.append((name, lat, lon))
+            menus.setdefault(name, []).append(row["item"].strip())
+            by_key.setdefault(normalize_name(name), (lat, lon))
+    return restos, menus, by_key
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--restaurants", type=int, default=100_000)
+    ap.add_argument("--items", type=int, default=10)
+    ap.add_argument("--lookups", type=int, default=100_000)
+    args = ap.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        csv_path = os.path.join(tmp, "menus.csv")
+        make_csv(csv_path, args.restaurants, args.items)
+        print(f"[BENCH] CSV : {args.restaurants} restaurants × {args.items} plats "
+              f"({os.path.getsize(csv_path) / 2**20:.0f} Mo)")
+        names = [f"resto {random.randrange(args.restaurants):06d}" for _ in range(args.lookups)]
+
+        rss0 = rss_bytes()
+        t0 = time.perf_counter()
+        _, _, by_key = legacy_load(csv_path)
+        t_csv = time.perf_counter() - t0
+        rss_csv = rss_bytes() - rss0
+        t0 = time.perf_counter()
+        for n in names:
+            by_key[normalize_name(n)]
+        t_dict = (time.perf_counter() - t0) / len(names) * 1e6
+        del by_key
+
+        t0 = time.perf_counter()
+        snap = build(csv_path)
+        t_build = time.perf_counter() - t0
+        rss1 = rss_bytes()
+        t0 = time.perf_counter()
+        cat = Catalog(snap)
+        t_open = time.perf_counter() - t0
+        t0 = time.perf_counter()
+        for n in names:
+            cat.coords(cat.find(n))
+        t_find = (time.perf_counter() - t0) / len(names) * 1e6
+        rss_cat = rss_bytes() - rss1
+
+        print(f"{'':<22}{'démarrage':>12}{'mémoire':>12}{'recherche':>12}")
+        print(f"{'CSV (DictReader)':<22}{t_csv * 1000:>10.0f}ms{rss_csv / 2**20:>10.0f}Mo{t_dict:>10.2f}µs")
+        print(f"{'instantané mmap':<22}{t_open * 1000:>10.2f}ms{rss_cat / 2**20:>10.0f}Mo{t_find:>10.2f}µs")
+        print(f"[BENCH] compilation unique : {t_build:.1f} s, {os.path.getsize(snap) / 2**20:.1f} Mo "
+              f"(mémoire comptée après {args.lookups} recherches, pages partagées entre processus)")
+
+if __name__ == "__main__":
+    main()
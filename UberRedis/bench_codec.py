@@ -0,0 +1,74 @@
+"""
+Benchmark des codecs de messages (codec.py) : octets par message et coût encode / decode.
+
+Messages représentatifs de chaque type (ORDER, OFFER, CANDIDATURE, SELECTION, TRACK)
+construits avec les fonctions des scripts ; pas besoin de Redis. Le décodage part d'une
+chaîne reçue comme sur une connexion decode_responses=True (surrogateescape).
+--tick-rate donne en plus le débit sortant d'une flotte pour ce nombre de TRACK/s.
+
+    python bench_codec.py --n 20000 --tick-rate 5000
+"""
+import argparse, time, uuid
+
+import codec
+from coursier import tracking_message
+from manager import build_offer, build_selection
+
+def sample_messages():
+    oid = str(uuid.uuid4())
+    pickup, drop = (48.8661234, 2.3351234), (48.8610, 2.3450)
+    order = {
+        "type": "ORDER", "order_id": oid,
+        "restaurant": {"name": "Le Petit Bistrot", "lat": pickup[0], "lon": pickup[1]},
+        "items": [{"name": "Croque-monsieur", "qty": 1}],
+        "customer": {"name": "Client POC", "lat": drop[0], "lon": drop[1]},
+        "created_at": int(time.time()), "sent_ts": time.time(),
+    }
+    cand = {"type": "CANDIDATURE", "order_id": oid, "courier": "Camille",
+            "position": {"lat": 48.8702, "lon": 2.3301}, "sent_at": int(time.time()), "sent_ts": time.time()}
+    chosen = {"courier": "Camille", "eta_min": 12, "rating": 4.2}
+    return {
+        "ORDER": order,
+        "OFFER": build_offer(oid, "Le Petit Bistrot", pickup, drop),
+        "CANDIDATURE": cand,
+        "SELECTION": build_selection(oid, chosen, pickup, drop),
+        "TRACK": tracking_message(oid, "Camille", "vers_client", 48.8634567, 2.3398765, 50, 210, 420, 75),
+    }
+
+def timed(fn, arg, n):
+    t0 = time.perf_counter()
+    for _ in range(n):
+        fn(arg)
+    return (time.perf_counter() - t0) / n * 1e6
+
+def main():
+    ap = argparse.ArgumentParser(description="Taille et coût des codecs de messages.")
+    ap.add_argument("--n", type=int, default=20000, help="répétitions par mesure")
+    ap.add_argument("--tick-rate", type=int, default=0, help="TRACK/s d'une flotte (débit estimé)")
+    args = ap.parse_args()
+
+    codecs = [c for c in codec.CODECS if c == "json" or codec.msgpack is not None]
+    if len(codecs) < len(codec.CODECS):
+        print("[BENCH] msgpack absent : seul le codec json est mesuré (pip install msgpack)")
+    print(f"{'message':<12}{'codec':<9}{'octets':>8}{'encode µs':>11}{'decode µs':>11}")
+    track_bytes = {}
+    for kind, msg in sample_messages().items():
+        for name in codecs:
+            data = codec.encode(msg, name)
+            raw = data.decode("utf-8", "surrogateescape")   # tel que reçu de redis-py
+            assert codec.decode(raw).keys() == msg.keys()
+            enc = timed(lambda m: codec.encode(m, name), msg, args.n)
+            dec = timed(codec.decode, raw, args.n)
+            print(f"{kind:<12}{name:<9}{len(data):>8}{enc:>11.2f}{dec:>11.2f}")
+            if kind == "TRACK":
+                track_bytes[name] = (len(data), enc)
+        print()
+
+    if args.tick_rate:
+        print(f"[BENCH] {args.tick_rate} TRACK/s :")
+        for name, (size, enc) in track_bytes.items():
+            print(f"  {name:<9} {size * args.tick_rate / 1024:8.0f} Ko/s sortants, "
+                  f"{enc * args.tick_rate / 1e4:5.1f} % d'un cœur pour l'encodage")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,263 @@
+"""
+Banc de test de bout en bout : client, manager et coursiers sans interaction, dans un processus.
+
+- client  : commandes générées à --rate commandes/s (arrivées de Poisson) pendant --duration s,
+            sélections et TRACK suivis sur une seule connexion pub/sub (PSUBSCRIBE) ;
+- manager : manager_async.Dispatcher en mode auto (--window-policy fixed | adaptive) ;
+- coursiers : fleet.Fleet (--couriers, --policy), courses accélérées par --speedup.
+
+Latences mesurées par étape (p50 / p95 / p99 / max, en ms) :
+  order_to_offer        commande publiée -> première annonce reçue par un coursier
+  order_to_assignment   commande publiée -> SELECTION reçue par le client
+  assignment_to_track   SELECTION -> premier TRACK reçu par le client
+  track_lag             TRACK généré par le coursier -> reçu par le client
+  order_to_delivered    commande publiée -> vers_client_arrived (durée de course comprise)
+Les résultats sont écrits en JSON (--out) ; --baseline compare les p95 à un run précédent et
+sort avec le code 1 si une étape se dégrade de plus de --tolerance.
+
+    python bench_e2e.py --fake --rate 10 --duration 20 --couriers 300     # sans redis-server (fakeredis)
+    python bench_e2e.py --rate 50 --couriers 2000 --out results/e2e.json --baseline results/ref.json
+"""
+import asyncio, argparse, json, os, random, sys, time, uuid
+import redis.asyncio as aioredis
+
+import fleet as fleet_mod
+from codec import CODECS, DEFAULT_CODEC, encode, get_codec, set_codec, try_decode
+from catalog import open_catalog
+from client import CSV_PATH, CLIENT_LAT, CLIENT_LON, CHAN_ORDERS
+from coursier import jitter
+from manager import load_restos
+from manager_async import Dispatcher
+from registry import HEARTBEAT_S
+from window import POLICIES
+
+HOPS = ("order_to_offer", "order_to_assignment", "assignment_to_track", "track_lag", "order_to_delivered")
+WINDOW_S = 1.0         # fenêtre de candidatures du manager pendant le banc
+SPEEDUP = 30.0         # une course de 10 min dure 20 s
+CUSTOMER_SPREAD_KM = 1.5
+
+def percentiles(values):
+    if not values:
+        return {"n": 0}
+    s = sorted(values)
+    pick = lambda p: s[min(len(s) - 1, int(round(p / 100.0 * (len(s) - 1))))]
+    return {"n": len(s), "p50": pick(50) * 1000, "p95": pick(95) * 1000,
+            "p99": pick(99) * 1000, "max": s[-1] * 1000}
+
+class BenchFleet(fleet_mod.Fleet):
+    """Fleet qui note l'heure de la première annonce reçue pour chaque commande."""
+
+    def __init__(self, *args, first_offer=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.first_offer = first_offer
+
+    def on_offer(self, channel, raw):
+        offer = try_decode(raw)
+        order_id = offer.get("order_id") if offer else None
+        if order_id is not None:
+            self.first_offer.setdefault(order_id, time.monotonic())
+        super().on_offer(channel, raw)
+
+class Bench:
+    def __init__(self, make_redis, args):
+        self.make_redis = make_redis
+        self.args = args
+        self.sent = {}          # order_id -> t (monotonic) de publication
+        self.first_offer = {}
+        self.assigned = {}
+        self.first_track = {}
+        self.delivered = {}
+        self.track_lag = []
+
+    async def listen(self, r, ready):
+        ps = r.pubsub()
+        await ps.psubscribe("assignments:*", "tracking:*")
+        ready.set()
+        async for msg in ps.listen():
+            if msg.get("type") != "pmessage":
+                continue
+            now = time.monotonic()
+            data = try_decode(msg["data"])
+            if data is None:
+                continue
+            order_id = data.get("order_id")
+            if order_id not in self.sent:
+                continue
+            if data.get("type") == "SELECTION":
+                self.assigned.setdefault(order_id, now)
+            elif data.get("type") == "TRACK":
+                self.first_track.setdefault(order_id, now)
+                if "sent_ts" in data:
+                    self.track_lag.append(max(0.0, time.time() - data["sent_ts"]))
+                if data.get("status") == "vers_client_arrived":
+                    self.delivered.setdefault(order_id, now)
+
+    async def produce(self, r):
+        cat = open_catalog(CSV_PATH)
+        end = time.monotonic() + self.args.duration
+        while time.monotonic() < end:
+            i = random.randrange(len(cat))
+            (rlat, rlon), items = cat.coords(i), cat.items(i)
+            lat, lon = jitter(CLIENT_LAT, CLIENT_LON, CUSTOMER_SPREAD_KM)
+            order_id = str(uuid.uuid4())
+            order = {
+                "type": "ORDER", "order_id": order_id,
+                "restaurant": {"name": cat.name(i), "lat": rlat, "lon": rlon},
+                "items": [{"name": it["name"], "sku": it["sku"], "qty": 1} for it in random.sample(items, min(1, len(items)))],
+                "customer": {"name": "Bench", "lat": lat, "lon": lon},
+                "created_at": int(time.time()), "sent_ts": time.time(),
+            }
+            self.sent[order_id] = time.monotonic()
+            await r.publish(CHAN_ORDERS, encode(order))
+            await asyncio.sleep(random.expovariate(self.args.rate))
+
+    def hop_values(self):
+        deltas = lambda start, end: [end[o] - start[o] for o in end if o in start]
+        return {
+            "order_to_offer": deltas(self.sent, self.first_offer),
+            "order_to_assignment": deltas(self.sent, self.assigned),
+            "assignment_to_track": deltas(self.assigned, self.first_track),
+            "track_lag": self.track_lag,
+            "order_to_delivered": deltas(self.sent, self.delivered),
+        }
+
+    async def run(self):
+        a = self.args
+        r_fleet, r_manager, r_client = self.make_redis(), self.make_redis(), self.make_redis()
+        fleet = BenchFleet(r_fleet, a.couriers, fleet_mod.make_policy(a.policy, a.accept_prob, a.max_km),
+                           speedup=a.speedup, first_offer=self.first_offer)
+        dispatcher = Dispatcher(r_manager, load_restos(CSV_PATH), auto=True,
+                                timeout_s=a.window, max_windows=max(500, int(a.rate * a.window * 4)),
+                                verbose=False, window_policy=a.window_policy)
+        ready = asyncio.Event()
+        tasks = [asyncio.create_task(fleet.run()), asyncio.create_task(dispatcher.run()),
+                 asyncio.create_task(self.listen(r_client, ready))]
+        try:
+            await ready.wait()
+            await asyncio.sleep(HEARTBEAT_S + 0.5)   # index GEO rempli par les heartbeats
+            print(f"[BENCH] ▶️ {a.rate} cmd/s pendant {a.duration} s, {a.couriers} coursiers ({a.policy})")
+            t0 = time.monotonic()
+            await self.produce(r_client)
+            sent_s = time.monotonic() - t0
+            print(f"[BENCH] {len(self.sent)} commandes envoyées, attente des livraisons ({a.drain} s max)…")
+            deadline = time.monotonic() + a.drain
+            while time.monotonic() < deadline and len(self.delivered) < len(self.assigned):
+                await asyncio.sleep(0.5)
+        finally:
+            for t in tasks:
+                t.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            await fleet.shutdown()
+            dispatcher.window_stats.settle(force=True)
+            for r in (r_fleet, r_manager, r_client):
+                await r.aclose()
+        return self.report(sent_s, fleet, dispatcher)
+
+    def report(self, sent_s, fleet, dispatcher):
+        a = self.args
+        return {
+            "backend": "redis",
+            "fake": a.fake,
+            "started_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "config": {"rate": a.rate, "duration_s": a.duration, "couriers": a.couriers, "policy": a.policy,
+                       "window_s": a.window, "window_policy": a.window_policy, "speedup": a.speedup,
+                       "codec": get_codec()},
+            "orders": {"sent": len(self.sent), "assigned": len(self.assigned),
+                       "unassigned": dispatcher.unassigned, "delivered": len(self.delivered)},
+            "throughput": {"orders_per_s": len(self.sent) / max(1e-6, sent_s),
+                           "assigned_per_s": len(self.assigned) / max(1e-6, sent_s)},
+            "fleet": {"ticks": fleet.ticks, "track_published": fleet.published,
+                      "mem_per_courier_kb": fleet.mem_per_courier / 1024},
+            "hops_ms": {hop: percentiles(v) for hop, v in self.hop_values().items()},
+            "windows": dispatcher.window_stats.summary(),
+        }
+
+def print_report(res):
+    o = res["orders"]
+    print(f"\n[BENCH] commandes : {o['sent']} envoyées, {o['assigned']} affectées, "
+          f"{o['unassigned']} sans candidat, {o['delivered']} livrées | "
+          f"{res['throughput']['assigned_per_s']:.1f} affectations/s")
+    print(f"{'étape':<22}{'n':>7}{'p50':>10}{'p95':>10}{'p99':>10}{'max':>10}  (ms)")
+    for hop in HOPS:
+        h = res["hops_ms"][hop]
+        if not h["n"]:
+            print(f"{hop:<22}{0:>7}")
+            continue
+        print(f"{hop:<22}{h['n']:>7}{h['p50']:>10.1f}{h['p95']:>10.1f}{h['p99']:>10.1f}{h['max']:>10.1f}")
+    w = res.get("windows")
+    if w and w["windows"]:
+        reasons = ", ".join(f"{k}={v}" for k, v in sorted(w["reasons"].items()))
+        print(f"[BENCH] ⏱️ fenêtres ({res['config']['window_policy']}) : {reasons} | "
+              f"gagné moy={w['saved_s']['mean'] * 1000:.0f} ms p50={w['saved_s']['p50'] * 1000:.0f} ms | "
+              f"moins bon choix {w['worse_pct']:.1f} % (perte moy={w['lost_min']['mean']:.2f} min)")
+
+def compare(res, baseline_path, tolerance):
+    """Étapes dont le p95 dépasse celui de la référence de plus de tolerance (0.2 = +20 %)."""
+    with open(baseline_path, encoding="utf-8") as f:
+        base = json.load(f)
+    worse = []
+    for hop in HOPS:
+        new, old = res["hops_ms"].get(hop, {}), base.get("hops_ms", {}).get(hop, {})
+        if new.get("n") and old.get("n") and new["p95"] > old["p95"] * (1 + tolerance):
+            worse.append((hop, old["p95"], new["p95"]))
+    return worse
+
+def parse_args(argv=None):
+    p = argparse.ArgumentParser(description="Banc de bout en bout : commandes -> affectation -> tracking.")
+    p.add_argument("--fake", action="store_true", help="fakeredis en mémoire au lieu de redis-server")
+    p.add_argument("--rate", type=float, default=10.0, help="commandes par seconde")
+    p.add_argument("--duration", type=float, default=30.0, help="durée d'envoi des commandes (s)")
+    p.add_argument("--drain", type=float, default=60.0, help="attente max des livraisons après l'envoi (s)")
+    p.add_argument("--couriers", type=int, default=500)
+    p.add_argument("--policy", choices=fleet_mod.POLICIES, default="always")
+    p.add_argument("--accept-prob", type=float, default=0.5)
+    p.add_argument("--max-km", type=float, default=3.0)
+    p.add_argument("--window", type=float, default=WINDOW_S, help="fenêtre de candidatures du manager (s, au plus)")
+    p.add_argument("--window-policy", choices=POLICIES, default="adaptive",
+                   help="fixed : toujours --window ; adaptive : fermeture anticipée (window.py)")
+    p.add_argument("--speedup", type=float, default=SPEEDUP, help="courses N fois plus courtes que l'ETA")
+    p.add_argument("--codec", choices=CODECS, default=DEFAULT_CODEC, help="encodage des messages")
+    p.add_argument("--seed", type=int, default=None)
+    p.add_argument("--out", help="fichier JSON des résultats")
+    p.add_argument("--baseline", help="JSON d'un run de référence à comparer")
+    p.add_argument("--tolerance", type=float, default=0.2, help="dégradation de p95 tolérée (0.2 = +20 %%)")
+    return p.parse_args(argv)
+
+def main():
+    args = parse_args()
+    if args.seed is not None:
+        random.seed(args.seed)
+    set_codec(args.codec)
+    if args.fake:
+        import fakeredis
+        server = fakeredis.FakeServer()
+        make_redis = lambda: fakeredis.FakeAsyncRedis(server=server, decode_responses=True,
+                                                         encoding_errors="surrogateescape")
+    else:
+        pool = aioredis.BlockingConnectionPool(host="localhost", port=6379, db=0,
+                                               decode_responses=True, encoding_errors="surrogateescape",
+                                               max_connections=50)
+        make_redis = lambda: aioredis.Redis(connection_pool=pool)
+    fleet_mod.STATS_EVERY_S = max(fleet_mod.STATS_EVERY_S, args.duration)  # moins de bruit pendant le banc
+
+    res = asyncio.run(Bench(make_redis, args).run())
+    print_report(res)
+    if args.out:
+        os.makedirs(os.path.dirname(args.out) or ".", exist_ok=True)
+        with open(args.out, "w", encoding="utf-8") as f:
+            json.dump(res, f, indent=2)
+        print(f"[BENCH] 💾 Résultats : {args.out}")
+    if args.baseline:
+        worse = compare(res, args.baseline, args.tolerance)
+        for hop, old, new in worse:
+            print(f"[BENCH] ❌ régression {hop} : p95 {old:.1f} ms -> {new:.1f} ms")
+        if worse:
+            sys.exit(1)
+        print("[BENCH] ✅ aucune régression de p95 par rapport à la référence")
+
+if __name__ == "__main__":
+    try:
+        main()
+    except KeyboardInterrupt:
+        print("\n[BENCH] Arrêt.")
+        sys.exit(0)
@@ -0,0 +1,71 @@
+"""
+Benchmark ETA : boucle scalaire actuelle vs noyau NumPy (geo.eta_matrix).
+
+    python bench_geo.py                      # 10 000 coursiers × 1 000 commandes
+    python bench_geo.py --couriers 2000 --orders 500
+"""
+import argparse, random, time
+import numpy as np
+
+import geo
+from manager import VITESSE_KMH, DELAI_FIXE_MIN, eta_minutes
+
+CENTER_LAT, CENTER_LON = 48.8660, 2.3350
+
+def random_points(n, spread_deg=0.05, seed=0):
+    rng = np.random.default_rng(seed)
+    return (CENTER_LAT + rng.normal(0, spread_deg, n), CENTER_LON + rng.normal(0, spread_deg, n))
+
+def bench_scalar(c_lat, c_lon, p_lat, p_lon, d_lat, d_lon, sample):
+    """Boucle Python d'origine sur un échantillon de paires, extrapolée au total."""
+    n, m = len(c_lat), len(p_lat)
+    rnd = random.Random(1)
+    pairs = [(rnd.randrange(n), rnd.randrange(m)) for _ in range(sample)]
+    c = [(float(c_lat[i]), float(c_lon[i])) for i in range(n)]
+    p = [(float(p_lat[j]), float(p_lon[j])) for j in range(m)]
+    d = [(float(d_lat[j]), float(d_lon[j])) for j in range(m)]
+    t0 = time.perf_counter()
+    for i, j in pairs:
+        eta_minutes(c[i], p[j], d[j])
+    return time.perf_counter() - t0
+
+def bench_vector(c_lat, c_lon, p_lat, p_lon, d_lat, d_lon, fast, repeat=3):
+    best = float("inf")
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        eta = geo.eta_matrix(c_lat, c_lon, p_lat, p_lon, d_lat, d_lon, VITESSE_KMH, DELAI_FIXE_MIN, fast=fast)
+        best = min(best, time.perf_counter() - t0)
+    return best, eta
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--couriers", type=int, default=10_000)
+    ap.add_argument("--orders", type=int, default=1_000)
+    ap.add_argument("--scalar-sample", type=int, default=200_000, help="paires mesurées en scalaire")
+    args = ap.parse_args()
+
+    c_lat, c_lon = random_points(args.couriers, seed=1)
+    p_lat, p_lon = random_points(args.orders, seed=2)
+    d_lat, d_lon = random_points(args.orders, seed=3)
+    total = args.couriers * args.orders
+    print(f"{args.couriers} coursiers × {args.orders} commandes = {total:,} paires")
+
+    sample = min(total, args.scalar_sample)
+    t = bench_scalar(c_lat, c_lon, p_lat, p_lon, d_lat, d_lon, sample)
+    scalar_rate = sample / t
+    print(f"scalaire (math)     : {scalar_rate/1e6:8.2f} M paires/s  -> {total/scalar_rate:8.3f} s (extrapolé)")
+
+    t_h, eta_h = bench_vector(c_lat, c_lon, p_lat, p_lon, d_lat, d_lon, fast=False)
+    print(f"numpy haversine     : {total/t_h/1e6:8.2f} M paires/s  -> {t_h:8.3f} s  (x{total/t_h/scalar_rate:.0f})")
+    t_e, eta_e = bench_vector(c_lat, c_lon, p_lat, p_lon, d_lat, d_lon, fast=True)
+    print(f"numpy équirect.     : {total/t_e/1e6:8.2f} M paires/s  -> {t_e:8.3f} s  (x{total/t_e/scalar_rate:.0f})")
+
+    # contrôle : mêmes ETA que la version scalaire, écart de l'approximation plane
+    for i, j in [(0, 0), (args.couriers - 1, args.orders - 1), (args.couriers // 2, args.orders // 3)]:
+        ref = eta_minutes((c_lat[i], c_lon[i]), (p_lat[j], p_lon[j]), (d_lat[j], d_lon[j]))
+        assert ref == eta_h[i, j], (ref, eta_h[i, j])
+    diff = np.abs(eta_h.astype(np.int64) - eta_e)
+    print(f"équirect. vs haversine : {np.mean(diff > 0)*100:.3f} % d'ETA différentes, écart max {diff.max()} min")
+
+if __name__ == "__main__":
+    main()
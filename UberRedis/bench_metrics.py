@@ -0,0 +1,93 @@
+"""
+Coût de l'instrumentation (metrics.py) : ce qu'ajoute chaque appel sur les chemins chauds.
+
+  - Counter.inc, Histogram.observe, `with timer(h)`, lag_since : ns par appel (boucle vide déduite) ;
+  - les mêmes depuis --threads threads à la fois (verrou disputé) ;
+  - render() d'un registre de la taille de celui du manager (temps d'un scrape) ;
+  - précision des quantiles HDR sur une loi log-normale (écart à la valeur exacte).
+
+    python bench_metrics.py --n 1000000 --threads 4
+"""
+import argparse, math, random, threading, time
+
+from metrics import Counter, Histogram, Registry, lag_since, timer
+
+def per_call_ns(fn, n):
+    t0 = time.perf_counter()
+    for _ in range(n):
+        fn()
+    return (time.perf_counter() - t0) / n * 1e9
+
+def threaded_ns(fn, n, threads):
+    """ns par appel vu de l'ensemble : n appels par thread, threads en parallèle."""
+    start = threading.Barrier(threads + 1)
+    def work():
+        start.wait()
+        for _ in range(n):
+            fn()
+    ts = [threading.Thread(target=work) for _ in range(threads)]
+    for t in ts:
+        t.start()
+    start.wait()
+    t0 = time.perf_counter()
+    for t in ts:
+        t.join()
+    return (time.perf_counter() - t0) / (n * threads) * 1e9
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--n", type=int, default=1_000_000, help="appels par mesure")
+    ap.add_argument("--threads", type=int, default=4)
+    args = ap.parse_args()
+    random.seed(7)
+
+    reg = Registry()
+    c = Counter("bench_total", "bench", registry=reg)
+    h = Histogram("bench_seconds", "bench", registry=reg)
+    sent = time.time()
+
+    def noop():
+        pass
+    def with_timer():
+        with timer(h):
+            pass
+
+    base = per_call_ns(noop, args.n)
+    calls = (("Counter.inc()", c.inc),
+             ("Histogram.observe(v)", lambda: h.observe(0.0042)),
+             ("with timer(h)", with_timer),
+             ("lag_since(h, sent_ts)", lambda: lag_since(h, sent)))
+    print(f"[BENCH] appel de fonction vide : {base:.0f} ns (déduit ci-dessous)")
+    print(f"{'':<26}{'1 thread':>12}{f'{args.threads} threads':>14}")
+    for name, fn in calls:
+        one = per_call_ns(fn, args.n) - base
+        many = threaded_ns(fn, args.n // args.threads, args.threads) - base
+        print(f"{name:<26}{one:>10.0f}ns{many:>12.0f}ns")
+
+    # registre du manager : 3 compteurs + 5 histogrammes remplis
+    full = Registry()
+    for i in range(3):
+        Counter(f"ubeer_c{i}_total", "c", registry=full).inc(i)
+    hs = [Histogram(f"ubeer_h{i}_seconds", "h", registry=full) for i in range(5)]
+    for hh in hs:
+        for _ in range(10_000):
+            hh.observe(random.lognormvariate(-6, 2))
+    t0 = time.perf_counter()
+    for _ in range(100):
+        text = full.render()
+    print(f"[BENCH] render() : {(time.perf_counter() - t0) / 100 * 1000:.2f} ms "
+          f"({len(text.encode())} octets, {text.count(chr(10))} lignes)")
+
+    # précision : quantiles HDR (borne haute du bucket) vs valeurs exactes
+    qh = Histogram("bench_q_seconds", "q", registry=Registry())
+    values = sorted(random.lognormvariate(-5, 1.5) for _ in range(100_000))
+    for v in values:
+        qh.observe(v)
+    errs = []
+    for q in (0.5, 0.9, 0.99, 0.999):
+        exact = values[max(0, math.ceil(q * len(values)) - 1)]
+        errs.append(f"p{q * 100:g} {(qh.quantile(q) / exact - 1) * 100:+.1f} %")
+    print(f"[BENCH] quantiles HDR vs exacts : {' | '.join(errs)}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,118 @@
+"""
+Stress test de la notation : chemin d'origine (HINCRBY ×2 + HGETALL + HSET + LPUSH)
+vs script Lua atomique (ratings.rate).
+
+N threads notent le MÊME coursier en parallèle ; on compare les latences et on vérifie
+à la fin que count, sum, avg et l'historique (borné à HISTORY_MAX pour le script) sont cohérents.
+Puis classement sur --couriers coursiers notés : top 10 et rang d'un coursier par SCAN de tous
+les ratings:* (seule option avant ratings_leaderboard) vs une commande sur le ZSET.
+Redis local (localhost:6379).
+
+    python bench_ratings.py --threads 32 --ratings 200 --couriers 5000
+"""
+import argparse, json, random, statistics, threading, time
+import redis
+
+from ratings import HISTORY_MAX, LEADERBOARD_KEY, rank, rate, top
+
+def legacy_rate(r, courier, score, order_id):
+    # copie du update_rating d'origine de client.py + LPUSH de l'historique
+    key = f"ratings:{courier}"
+    r.hincrby(key, "sum", score)
+    r.hincrby(key, "count", 1)
+    data = r.hgetall(key)
+    s = int(data.get("sum", 0))
+    c = int(data.get("count", 1))
+    avg = s / max(1, c)
+    r.hset(key, mapping={"avg": avg})
+    r.lpush(f"ratings_history:{courier}",
+            json.dumps({"order_id": order_id, "score": int(score), "ts": int(time.time())}))
+    return avg, c
+
+def run(r, fn, courier, threads, per_thread):
+    r.delete(f"ratings:{courier}", f"ratings_history:{courier}")
+    lat, lock, expected = [], threading.Lock(), [0]
+
+    def worker(t):
+        rng = random.Random(t)
+        mine, total = [], 0
+        for i in range(per_thread):
+            score = rng.randint(1, 5)
+            t0 = time.perf_counter()
+            fn(r, courier, score, f"o{t}-{i}")
+            mine.append(time.perf_counter() - t0)
+            total += score
+        with lock:
+            lat.extend(mine)
+            expected[0] += total
+
+    ths = [threading.Thread(target=worker, args=(t,)) for t in range(threads)]
+    t0 = time.perf_counter()
+    for th in ths:
+        th.start()
+    for th in ths:
+        th.join()
+    elapsed = time.perf_counter() - t0
+    return elapsed, lat, expected[0]
+
+def check(r, courier, n, expected_sum, history_max=0):
+    data = r.hgetall(f"ratings:{courier}")
+    s, c, avg = int(data["sum"]), int(data["count"]), float(data["avg"])
+    hist = r.llen(f"ratings_history:{courier}")
+    return {"count_ok": c == n, "sum_ok": s == expected_sum,
+            "avg_ok": abs(avg - s / c) < 1e-9, "history_ok": hist == (min(n, history_max) if history_max else n)}
+
+def scan_top(r, k):
+    """Avant le classement : lire la note de chaque coursier puis trier côté Python."""
+    keys = [key for key in r.scan_iter(match="ratings:bench-lb-*", count=1000)]
+    pipe = r.pipeline(transaction=False)
+    for key in keys:
+        pipe.hget(key, "avg")
+    rows = sorted(zip(keys, pipe.execute()), key=lambda x: -float(x[1]))
+    return rows[:k]
+
+def leaderboard(r, n_couriers):
+    names = [f"bench-lb-{i}" for i in range(n_couriers)]
+    rng = random.Random(0)
+    for name in names:
+        for i in range(3):
+            rate(r, name, rng.randint(1, 5), f"{name}-{i}", history_max=1)
+    for label, fn in ((f"SCAN {n_couriers} ratings:*", lambda: scan_top(r, 10)),
+                      ("ZREVRANGE (top 10)", lambda: top(r, 10)),
+                      ("ZREVRANK (rang)", lambda: rank(r, names[n_couriers // 2]))):
+        reps = 3 if label.startswith("SCAN") else 1000
+        t0 = time.perf_counter()
+        for _ in range(reps):
+            fn()
+        print(f"{label:<22} {(time.perf_counter() - t0) / reps * 1e3:9.3f} ms")
+    pipe = r.pipeline(transaction=False)
+    for name in names:
+        pipe.delete(f"ratings:{name}", f"ratings_history:{name}")
+    pipe.zrem(LEADERBOARD_KEY, *names)
+    pipe.execute()
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--threads", type=int, default=32)
+    ap.add_argument("--ratings", type=int, default=200, help="notes par thread")
+    ap.add_argument("--couriers", type=int, default=5000, help="coursiers notés pour le classement")
+    args = ap.parse_args()
+
+    r = redis.Redis(host="localhost", port=6379, db=0, decode_responses=True)
+    n = args.threads * args.ratings
+    print(f"{args.threads} threads × {args.ratings} notes = {n} notes sur un même coursier")
+    for label, fn in (("origine (5 appels)", legacy_rate), ("script Lua", rate)):
+        courier = f"bench-{label.split()[0]}"
+        elapsed, lat, expected_sum = run(r, fn, courier, args.threads, args.ratings)
+        lat.sort()
+        ok = check(r, courier, n, expected_sum, HISTORY_MAX if fn is rate else 0)
+        print(f"{label:<20} {n / elapsed:8.0f} notes/s | p50={statistics.median(lat) * 1e3:.2f} ms "
+              f"p95={lat[int(0.95 * (len(lat) - 1))] * 1e3:.2f} ms | "
+              + " ".join(f"{k}={'✅' if v else '❌'}" for k, v in ok.items()))
+        r.delete(f"ratings:{courier}", f"ratings_history:{courier}")
+        r.zrem(LEADERBOARD_KEY, courier)
+    print(f"[BENCH] classement : {args.couriers} coursiers notés")
+    leaderboard(r, args.couriers)
+
+if __name__ == "__main__":
+    main()
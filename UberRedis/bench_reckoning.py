@@ -0,0 +1,67 @@
+"""
+Suivi à l'estime (reckoning.py) : messages TRACK par livraison et écart entre la position vue
+par le client et la position réelle du coursier, selon le mode de publication.
+
+  - tick      : un TRACK par tick (TICK_SEC), ce qu'il faudrait pour un suivi fluide sans estime ;
+  - quarters  : un TRACK par quart de tronçon (mode historique), le client voit des sauts ;
+  - reckoning : position + vitesse, un TRACK quand l'extrapolation du client dérive de DRIFT_M.
+Livraisons simulées sans dormir (horloge virtuelle), en ligne droite puis par les rues
+(ville de test routing.synthetic) où chaque virage fait dériver l'estimation.
+
+    python bench_reckoning.py --deliveries 100
+"""
+import argparse, os, random, tempfile
+
+from coursier import TICK_SEC, VITESSE_KMH, segment_ticks, tracking_message
+from geo import haversine_km
+from reckoning import Follower, drift_m
+from routing import Graph, Router, synthetic
+
+def pct(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p / 100))]
+
+def city():
+    return 48.82 + random.random() * 0.07, 2.28 + random.random() * 0.11
+
+def replay(legs, mode):
+    """-> (messages par livraison, écarts client / réel en mètres à chaque tick)."""
+    now = [0.0]
+    msgs, errs = 0, []
+    for a, b, path in legs:
+        planned_s = haversine_km(a[0], a[1], b[0], b[1]) / VITESSE_KMH * 3600
+        f = Follower()
+        for lat, lon, track, wait_s in segment_ticks(a, b, "vers_client", planned_s, planned_s, 0.0, planned_s,
+                                                     clock=lambda: now[0], path=path,
+                                                     tracking="quarters" if mode == "tick" else mode):
+            if mode == "tick" or track:
+                msgs += 1
+                f.update(tracking_message("bench", "bench", *track) if track else
+                         {"lat": lat, "lon": lon}, now[0])
+            errs.append(drift_m(f.position(now[0]), (lat, lon)))
+            now[0] += wait_s
+    return msgs / (len(legs) / 2), errs   # 2 tronçons par livraison
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--deliveries", type=int, default=100)
+    ap.add_argument("--seed", type=int, default=7)
+    args = ap.parse_args()
+    random.seed(args.seed)
+
+    pts = [(city(), city(), city()) for _ in range(args.deliveries)]   # coursier, restaurant, client
+    straight = [leg for c, p, d in pts for leg in ((c, p, None), (p, d, None))]
+    with tempfile.TemporaryDirectory() as tmp:
+        router = Router(Graph(synthetic(os.path.join(tmp, "bench.graph"))), VITESSE_KMH)
+        streets = [leg for c, p, d in pts for leg in ((c, p, router.path(c, p)), (p, d, router.path(p, d)))]
+
+        print(f"[BENCH] {args.deliveries} livraisons, tick {TICK_SEC:g} s, écart mesuré à chaque tick")
+        print(f"{'':<24}{'TRACK/livr.':>12}{'écart moy':>12}{'p95':>9}{'max':>9}")
+        for name, legs in (("ligne droite", straight), ("par les rues", streets)):
+            for mode in ("tick", "quarters", "reckoning"):
+                n, errs = replay(legs, mode)
+                print(f"{name + ' / ' + mode:<24}{n:>12.1f}{sum(errs) / len(errs):>10.0f} m"
+                      f"{pct(errs, 95):>7.0f} m{max(errs):>7.0f} m")
+
+if __name__ == "__main__":
+    main()
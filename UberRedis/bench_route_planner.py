@@ -0,0 +1,119 @@
+"""
+Tournées multi-commandes (route_planner.py) : coût d'une insertion et commandes absorbées.
+
+  - insertions par seconde selon la taille de la tournée (0 à 6 arrêts) à vol d'oiseau, comparé
+    à l'énumération naïve (chaque placement replanifie toute la tournée) ;
+  - même chose par les rues (ville de test routing.synthetic) : une commande est essayée sur
+    OFFER_K tournées voisines, arbres inverses en cache (Router.tree), plus le coût des deux
+    arbres du retrait et du dépôt d'une nouvelle commande (un Dijkstra chacun, une fois) ;
+  - sur des commandes tirées au hasard autour d'un coursier qui en livre déjà une : part des
+    commandes insérables dans les limites (détour, heures promises) et détour moyen, comparé au
+    trajet d'un coursier dédié (retrait + dépôt depuis la même position).
+
+    python bench_route_planner.py --n 20000
+"""
+import argparse, os, random, tempfile, time
+
+from coursier import PAUSE_S, VITESSE_KMH
+from registry import OFFER_K
+from route_planner import MAX_DETOUR_S, Planner, Stop, router_s, straight_s
+from routing import TREE_CACHE, Graph, Router, synthetic
+
+def city():
+    return 48.82 + random.random() * 0.07, 2.28 + random.random() * 0.11
+
+def random_route(planner, pos, now, n_orders):
+    """n_orders commandes en cours (retrait puis dépôt), heures promises = arrivée prévue + 10 min."""
+    stops = []
+    for k in range(n_orders):
+        stops += [Stop(f"o{k}", "pickup", *city(), None), Stop(f"o{k}", "drop", *city(), None)]
+    at = planner.schedule(pos, now, stops)
+    return [s._replace(due=t + 600) if s.kind == "drop" else s for s, t in zip(stops, at)]
+
+def naive(planner, pos, now, stops, order_id, pickup, drop, locked=0):
+    """Référence : chaque placement (i, j) reconstruit la tournée et la replanifie en entier."""
+    base = planner.schedule(pos, now, stops)
+    old = {(s.order_id, s.kind): t for s, t in zip(stops, base)}
+    end = base[-1] + planner.service(stops[-1]) if stops else now
+    best = None
+    for i in range(locked, len(stops) + 1):
+        for j in range(i, len(stops) + 1):
+            new = (stops[:i] + [Stop(order_id, "pickup", *pickup, None)] + stops[i:j]
+                   + [Stop(order_id, "drop", *drop, None)] + stops[j:])
+            at = planner.schedule(pos, now, new)
+            added = at[-1] + planner.service(new[-1]) - end
+            if stops and added > planner.max_detour_s:
+                continue
+            if all(s.due is None or t <= s.due + planner.grace_s or t <= old[(s.order_id, s.kind)]
+                   for s, t in zip(new, at)):
+                if best is None or added < best:
+                    best = added
+    return best
+
+def per_insert_us(planner, cases, fn):
+    t0 = time.perf_counter()
+    for pos, stops, pickup, drop in cases:
+        fn(planner, pos, 0.0, stops, "new", pickup, drop, locked=1 if stops else 0)
+    return (time.perf_counter() - t0) / len(cases) * 1e6
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--n", type=int, default=20_000, help="insertions par mesure")
+    ap.add_argument("--seed", type=int, default=7)
+    args = ap.parse_args()
+    random.seed(args.seed)
+
+    print(f"[BENCH] {args.n} insertions par mesure, tournée verrouillée sur son premier arrêt")
+    print(f"{'':<26}{'µs/insertion':>14}{'insertions/s':>15}{'naïf µs':>10}")
+    planner = Planner(straight_s(VITESSE_KMH), pickup_s=PAUSE_S, max_orders=10)
+    for n_orders in (0, 1, 2, 3):
+        cases = []
+        for _ in range(args.n):
+            pos = city()
+            cases.append((pos, random_route(planner, pos, 0.0, n_orders), city(), city()))
+        us = per_insert_us(planner, cases, Planner.insert)
+        ref = per_insert_us(planner, cases[:max(1, args.n // 10)], naive)
+        label = f"vol d'oiseau / {2 * n_orders} arrêts"
+        print(f"{label:<26}{us:>12.1f}{1e6 / us:>15,.0f}{ref:>10.1f}")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        router = Router(Graph(synthetic(os.path.join(tmp, "bench.graph"))), VITESSE_KMH)
+        planner = Planner(router_s(router), pickup_s=PAUSE_S, max_orders=10)
+        for n_orders in (0, 1, 2, 3):
+            routes = []
+            for _ in range(OFFER_K):
+                pos = city()
+                routes.append((pos, random_route(planner, pos, 0.0, n_orders)))
+            pairs = [(city(), city()) for _ in range(max(1, TREE_CACHE // 2 - len(routes) * n_orders))]
+            cases = [routes[k % len(routes)] + pairs[k // len(routes) % len(pairs)] for k in range(args.n)]
+            per_insert_us(planner, cases[:len(routes) * len(pairs)], Planner.insert)   # arbres en cache
+            us = per_insert_us(planner, cases, Planner.insert)
+            label = f"par les rues / {2 * n_orders} arrêts"
+            print(f"{label:<26}{us:>12.1f}{1e6 / us:>15,.0f}")
+        fresh = [city() for _ in range(20)]
+        t0 = time.perf_counter()
+        for p in fresh:
+            router.tree(p)
+        print(f"[BENCH] par les rues, nouvelle commande : 2 arbres inverses "
+              f"{(time.perf_counter() - t0) / len(fresh) * 2 * 1000:.1f} ms, une fois pour toutes les tournées")
+
+    # commandes proches d'un coursier qui livre déjà une commande
+    planner = Planner(straight_s(VITESSE_KMH), pickup_s=PAUSE_S)
+    direct = straight_s(VITESSE_KMH)
+    taken, detours, dedicated = 0, [], []
+    for _ in range(args.n):
+        pos = city()
+        stops = random_route(planner, pos, 0.0, 1)
+        pickup = (pos[0] + random.gauss(0, 0.01), pos[1] + random.gauss(0, 0.015))
+        drop = (pickup[0] + random.gauss(0, 0.01), pickup[1] + random.gauss(0, 0.015))
+        ins = planner.insert(pos, 0.0, stops, "new", pickup, drop, locked=1)
+        if ins is not None:
+            taken += 1
+            detours.append(ins.added_s)
+            dedicated.append(direct(pos, pickup) + PAUSE_S + direct(pickup, drop))
+    print(f"[BENCH] commande à ~1 km d'un coursier en course : {taken / args.n:.0%} insérables "
+          f"(détour ≤ {MAX_DETOUR_S / 60:.0f} min), détour moyen {sum(detours) / max(1, taken) / 60:.1f} min "
+          f"contre {sum(dedicated) / max(1, taken) / 60:.1f} min pour un coursier dédié")
+
+if __name__ == "__main__":
+    main()
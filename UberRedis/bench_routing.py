@@ -0,0 +1,82 @@
+"""
+ETA par les rues (routing.py) : coût par candidature et écart avec le vol d'oiseau (geo.py).
+
+Compile la ville de test (routing.synthetic) puis rejoue --orders commandes de --cands
+candidatures chacune, coursiers à moins de --max-km du restaurant :
+  - A* seul (retrait -> dépôt, sans mémo) ;
+  - Dijkstra inverse depuis un retrait (SciPy si installé) ;
+  - ETA d'une candidature : premier retrait (arbre à construire) puis suivantes (arbre en cache).
+
+    python bench_routing.py --orders 200 --cands 20
+"""
+import argparse, os, random, statistics, tempfile, time
+
+import geo
+from manager import VITESSE_KMH, DELAI_FIXE_MIN
+from routing import Graph, Router, synthetic
+
+def pct(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p / 100))]
+
+def around(p, max_km):
+    return (p[0] + random.uniform(-1, 1) * max_km / 111.0, p[1] + random.uniform(-1, 1) * max_km / 73.0)
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--orders", type=int, default=200)
+    ap.add_argument("--cands", type=int, default=20, help="candidatures par commande")
+    ap.add_argument("--restaurants", type=int, default=50, help="retraits distincts (les arbres se réutilisent)")
+    ap.add_argument("--max-km", type=float, default=2.0, help="distance max coursier -> restaurant")
+    ap.add_argument("--seed", type=int, default=7)
+    args = ap.parse_args()
+    random.seed(args.seed)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        t0 = time.perf_counter()
+        g = Graph(synthetic(os.path.join(tmp, "bench.graph")))
+        t_build = time.perf_counter() - t0
+        t0 = time.perf_counter()
+        router = Router(g, VITESSE_KMH)
+        t_router = time.perf_counter() - t0
+        print(f"[BENCH] graphe {g.n} nœuds / {g.m} arcs compilé en {t_build:.2f} s, "
+              f"Router prêt en {t_router * 1000:.0f} ms")
+
+        city = lambda: (48.82 + random.random() * 0.07, 2.28 + random.random() * 0.11)
+        restos = [city() for _ in range(args.restaurants)]
+
+        astar = []
+        for _ in range(100):
+            a, b = g.snap(*city())[0], g.snap(*city())[0]
+            t0 = time.perf_counter()
+            router._astar(a, b)
+            astar.append((time.perf_counter() - t0) * 1000)
+        trees = []
+        for p in restos[:20]:
+            t0 = time.perf_counter()
+            router._reverse_tree(g.snap(*p)[0])
+            trees.append((time.perf_counter() - t0) * 1000)
+
+        first, warm, ratio = [], [], []
+        for _ in range(args.orders):
+            pickup = random.choice(restos)
+            drop = around(pickup, 3.0)
+            for k in range(args.cands):
+                c = around(pickup, args.max_km)
+                t0 = time.perf_counter()
+                eta = router.eta_minutes(c, pickup, drop, DELAI_FIXE_MIN)
+                dt = (time.perf_counter() - t0) * 1000
+                (first if k == 0 else warm).append(dt)
+                ratio.append(eta / geo.eta_minutes(c, pickup, drop, VITESSE_KMH, DELAI_FIXE_MIN))
+
+        print(f"{'':<36}{'p50':>10}{'p99':>10}")
+        for name, xs in (("A* retrait -> dépôt", astar),
+                         ("arbre inverse (1 retrait)", trees),
+                         ("ETA 1re candidature d'une commande", first),
+                         ("ETA candidatures suivantes", warm)):
+            print(f"{name:<36}{pct(xs, 50):>8.2f}ms{pct(xs, 99):>8.2f}ms")
+        print(f"[BENCH] ETA par les rues / vol d'oiseau : ×{statistics.mean(ratio):.2f} en moyenne "
+              f"(×{pct(ratio, 10):.2f} .. ×{pct(ratio, 90):.2f}) | {router.describe()}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,84 @@
+"""
+Restaurants à proximité : balayage linéaire (haversine NumPy sur tout le catalogue) vs
+grille spatial.py. --restaurants points tirés dans Paris (uniforme + quartiers denses),
+--queries positions client ; les deux méthodes doivent rendre les mêmes restaurants.
+
+    python bench_spatial.py --restaurants 100000 --radius 1 --k 10
+"""
+import argparse, random, statistics, time
+import numpy as np
+
+from geo import haversine_pairs
+from spatial import GridIndex
+
+def make_points(n):
+    lat = 48.80 + np.random.random(n) * 0.12
+    lon = 2.25 + np.random.random(n) * 0.17
+    dense = np.random.random(n) < 0.3          # 30 % autour de quelques quartiers
+    centers = np.random.randint(0, 8, n)
+    clat = 48.82 + (centers % 4) * 0.02
+    clon = 2.28 + (centers // 4) * 0.05
+    lat[dense] = clat[dense] + np.random.normal(0, 0.004, dense.sum())
+    lon[dense] = clon[dense] + np.random.normal(0, 0.006, dense.sum())
+    return lat, lon
+
+def linear_within(lat, lon, q_lat, q_lon, radius_km):
+    d = haversine_pairs(q_lat, q_lon, lat, lon)
+    idx = np.nonzero(d <= radius_km)[0]
+    return idx[np.argsort(d[idx], kind="stable")]
+
+def linear_nearest(lat, lon, q_lat, q_lon, k):
+    d = haversine_pairs(q_lat, q_lon, lat, lon)
+    idx = np.argpartition(d, k - 1)[:k]
+    return idx[np.argsort(d[idx], kind="stable")]
+
+def timed(fn, queries):
+    out, lat = [], []
+    for q in queries:
+        t0 = time.perf_counter()
+        out.append(fn(*q))
+        lat.append((time.perf_counter() - t0) * 1e6)
+    lat.sort()
+    return out, statistics.median(lat), lat[int(len(lat) * 0.99) - 1]
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--restaurants", type=int, default=100_000)
+    ap.add_argument("--queries", type=int, default=2000)
+    ap.add_argument("--radius", type=float, default=1.0, help="rayon des requêtes within (km)")
+    ap.add_argument("--k", type=int, default=10)
+    ap.add_argument("--seed", type=int, default=7)
+    args = ap.parse_args()
+    random.seed(args.seed)
+    np.random.seed(args.seed)
+
+    lat, lon = make_points(args.restaurants)
+    t0 = time.perf_counter()
+    grid = GridIndex(lat, lon)
+    t_build = (time.perf_counter() - t0) * 1000
+    print(f"[BENCH] {args.restaurants} restaurants, grille {grid.rows}×{grid.cols} "
+          f"(cellule {grid.cell_km * 1000:.0f} m) construite en {t_build:.1f} ms")
+    queries = [(48.80 + random.random() * 0.12, 2.25 + random.random() * 0.17) for _ in range(args.queries)]
+
+    rows = []
+    lin, p50, p99 = timed(lambda a, b: linear_within(lat, lon, a, b, args.radius), queries)
+    rows.append((f"within {args.radius:g} km linéaire", p50, p99))
+    got, p50, p99 = timed(lambda a, b: grid.within(a, b, args.radius)[0], queries)
+    rows.append((f"within {args.radius:g} km grille", p50, p99))
+    mismatch = sum(not np.array_equal(np.sort(x), np.sort(y)) for x, y in zip(lin, got))
+    found = statistics.mean(len(x) for x in got)
+
+    lin, p50, p99 = timed(lambda a, b: linear_nearest(lat, lon, a, b, args.k), queries)
+    rows.append((f"{args.k} plus proches linéaire", p50, p99))
+    got, p50, p99 = timed(lambda a, b: grid.nearest(a, b, args.k)[0], queries)
+    rows.append((f"{args.k} plus proches grille", p50, p99))
+    mismatch += sum(not np.array_equal(np.sort(x), np.sort(y)) for x, y in zip(lin, got))
+
+    print(f"{'':<28}{'p50':>10}{'p99':>10}")
+    for name, a, b in rows:
+        print(f"{name:<28}{a:>8.0f}µs{b:>8.0f}µs")
+    print(f"[BENCH] {found:.0f} restaurants par cercle en moyenne ; "
+          f"{mismatch} requête(s) en désaccord avec le balayage linéaire")
+
+if __name__ == "__main__":
+    main()
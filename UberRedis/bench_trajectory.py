@@ -0,0 +1,88 @@
+"""
+Trajet par commande (trajectory.py) : taille stockée et fidélité du rejeu.
+
+  - brut     : tous les ticks (t, lat, lon) en JSON, ce que coûterait un XADD par tick ;
+  - TRACK    : les messages TRACK JSON réellement publiés (mode quarters) ;
+  - trajet   : blob Douglas–Peucker (SED) + deltas varint, tel que stocké dans trajectory:<id>.
+Écart de rejeu : position rejouée (interpolée dans le temps) vs position réelle, à chaque tick.
+Livraisons simulées sans dormir (horloge virtuelle), en ligne droite puis par les rues
+(ville de test routing.synthetic).
+
+    python bench_trajectory.py --deliveries 100
+"""
+import argparse, json, os, random, tempfile, time
+
+from coursier import PAUSE_S, VITESSE_KMH, segment_ticks, tracking_message
+from geo import haversine_km
+from reckoning import drift_m
+from routing import Graph, Router, synthetic
+from trajectory import TOLERANCE_M, Recorder, decode, position_at
+
+def pct(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p / 100))]
+
+def city():
+    return 48.82 + random.random() * 0.07, 2.28 + random.random() * 0.11
+
+def deliver(legs, t0):
+    """-> (Recorder rempli, ticks réels [(t, lat, lon)], octets des TRACK JSON publiés)."""
+    now = [t0]
+    rec, ticks, track_bytes = Recorder("bench"), [], 0
+    for (a, b, path), status in zip(legs, ("vers_resto", "vers_client")):
+        planned_s = haversine_km(a[0], a[1], b[0], b[1]) / VITESSE_KMH * 3600
+        marked = None
+        for lat, lon, track, wait_s in segment_ticks(a, b, status, planned_s, planned_s, 0.0, planned_s,
+                                                     clock=lambda: now[0], path=path):
+            rec.add(now[0], lat, lon)
+            ticks.append((now[0], lat, lon))
+            if track:
+                track_bytes += len(json.dumps(tracking_message("bench", "bench", *track)))
+                if track[0] != marked:
+                    marked = track[0]
+                    rec.mark(marked)
+            now[0] += wait_s
+        now[0] += PAUSE_S
+    rec.eta_s = now[0] - t0
+    return rec, ticks, track_bytes
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--deliveries", type=int, default=100)
+    ap.add_argument("--seed", type=int, default=7)
+    args = ap.parse_args()
+    random.seed(args.seed)
+
+    pts = [(city(), city(), city()) for _ in range(args.deliveries)]   # coursier, restaurant, client
+    with tempfile.TemporaryDirectory() as tmp:
+        router = Router(Graph(synthetic(os.path.join(tmp, "bench.graph"))), VITESSE_KMH)
+        cases = (("ligne droite", [((c, p, None), (p, d, None)) for c, p, d in pts]),
+                 ("par les rues", [((c, p, router.path(c, p)), (p, d, router.path(p, d))) for c, p, d in pts]))
+
+        print(f"[BENCH] {args.deliveries} livraisons, tolérance {TOLERANCE_M:g} m, octets par livraison")
+        print(f"{'':<14}{'ticks':>7}{'brut':>9}{'TRACK':>8}{'trajet':>8}{'points':>8}"
+              f"{'écart moy':>11}{'max':>7}{'encode':>10}{'decode':>9}")
+        for name, deliveries in cases:
+            n_ticks = raw = tracks = blob_bytes = kept = 0
+            errs, t_enc, t_dec = [], 0.0, 0.0
+            for legs in deliveries:
+                rec, ticks, track_bytes = deliver(legs, time.time())
+                t = time.perf_counter()
+                blob = rec.blob()
+                t_enc += time.perf_counter() - t
+                t = time.perf_counter()
+                traj = decode(blob)
+                t_dec += time.perf_counter() - t
+                n_ticks += len(ticks)
+                raw += len(json.dumps([[round(t, 1), lat, lon] for t, lat, lon in ticks]))
+                tracks += track_bytes
+                blob_bytes += len(blob)
+                kept += len(traj["points"])
+                errs.extend(drift_m(position_at(traj["points"], t), (lat, lon)) for t, lat, lon in ticks)
+            k = len(deliveries)
+            print(f"{name:<14}{n_ticks / k:>7.0f}{raw / k:>9.0f}{tracks / k:>8.0f}{blob_bytes / k:>8.0f}"
+                  f"{kept / k:>8.0f}{sum(errs) / len(errs):>9.1f} m{max(errs):>5.1f} m"
+                  f"{t_enc / k * 1000:>8.2f}ms{t_dec / k * 1000:>7.2f}ms")
+
+if __name__ == "__main__":
+    main()
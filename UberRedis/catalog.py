@@ -0,0 +1,298 @@
+"""
+Catalogue des restaurants compilé : menus.csv -> menus.catalog, instantané binaire en colonnes.
+
+Un seul fichier, ouvert en mmap (lecture seule) : les pages sont partagées par tous les
+processus de la machine (client, manager, flotte…) et rien n'est lu tant qu'on n'y touche pas.
+  - restaurants : lat, lon (float64), nom, clé normalisée, plage de plats (CSR)
+  - plats       : nom, sku, prix en centimes, temps de préparation (min)
+  - index       : table de hachage à adressage ouvert sur normalize_name(nom) -> O(1)
+  - chaînes     : un seul blob UTF-8 adressé par offsets
+L'en-tête porte la version du format ainsi que taille et date du CSV source :
+open_catalog() recompile tout seul si le CSV a changé (écriture atomique, os.replace) ; si
+l'instantané ne peut pas être remplacé (Windows : fichier encore mappé par un autre processus),
+l'ancien reste servi et la recompilation est retentée toutes les REBUILD_RETRY_S.
+
+    python catalog.py                      # compile menus.csv -> menus.catalog
+    python catalog.py --lookup "sushi mori"
+"""
+import argparse, csv, hashlib, mmap, os, struct, sys, time
+import numpy as np
+
+from spatial import GridIndex
+
+CSV_PATH = "menus.csv"
+MAGIC = b"UBCATLG\0"
+FORMAT_VERSION = 1
+HEADER = struct.Struct("<8sIIIIQQQ")   # magic, version, restaurants, plats, slots, blob, taille CSV, mtime CSV
+ALIGN = 8
+REBUILD_RETRY_S = 30   # instantané non remplaçable : nouvel essai au plus tôt dans 30 s
+
+def normalize_name(name: str) -> str:
+    return " ".join((name or "").strip().split()).casefold()
+
+def _hash(key):
+    """Hachage stable entre processus (hash() de Python est randomisé)."""
+    return int.from_bytes(hashlib.blake2b(key.encode("utf-8"), digest_size=8).digest(), "little")
+
+def _layout(n_resto, n_items, n_slots, n_blob):
+    """Sections (nom, dtype, longueur) -> offsets, identiques à l'écriture et à la lecture."""
+    sections = [
+        ("lat", np.float64, n_resto), ("lon", np.float64, n_resto),
+        ("item_start", np.uint32, n_resto + 1),
+        ("name_off", np.uint32, n_resto + 1), ("key_off", np.uint32, n_resto + 1),
+        ("item_name_off", np.uint32, n_items + 1), ("sku_off", np.uint32, n_items + 1),
+        ("price_cents", np.uint32, n_items), ("prep_min", np.uint16, n_items),
+        ("slots", np.int32, n_slots), ("blob", np.uint8, n_blob),
+    ]
+    out, pos = {}, HEADER.size
+    for name, dtype, count in sections:
+        pos = (pos + ALIGN - 1) // ALIGN * ALIGN
+        out[name] = (dtype, count, pos)
+        pos += np.dtype(dtype).itemsize * count
+    return out, pos
+
+def _source_sig(csv_path):
+    st = os.stat(csv_path)
+    return st.st_size, st.st_mtime_ns
+
+# ---------------------------------------------------------------- compilation
+
+def build(csv_path=CSV_PATH, out_path=None):
+    """Compile le CSV ; retourne le chemin de l'instantané. Doublons de nom : premières coordonnées."""
+    out_path = out_path or snapshot_path(csv_path)
+    size, mtime = _source_sig(csv_path)
+    restos = {}   # clé normalisée -> [nom, lat, lon, [plats]]
+    with open(csv_path, newline="", encoding="utf-8") as f:
+        for row in csv.DictReader(f):
+            name = (row.get("restaurant") or "").strip()
+            item = (row.get("item") or "").strip()
+            try:
+                lat = float(row["latitude"]); lon = float(row["longitude"])
+            except (KeyError, TypeError, ValueError):
+                continue
+            if not name:
+                continue
+            entry = restos.setdefault(normalize_name(name), [name, lat, lon, []])
+            if item:
+                try:
+                    price = int(round(float(row.get("price_eur") or 0) * 100))
+                    prep = int(row.get("prep_min") or 0)
+                except ValueError:
+                    price, prep = 0, 0
+                entry[3].append((item, (row.get("sku") or "").strip(), price, prep))
+    if not restos:
+        raise RuntimeError(f"Aucun restaurant valide trouvé dans {csv_path}.")
+
+    n_resto = len(restos)
+    n_items = sum(len(e[3]) for e in restos.values())
+    n_slots = 1 << max(1, (2 * n_resto - 1).bit_length())    # taux de remplissage <= 50 %
+    blob = bytearray()
+
+    def put(s):
+        blob.extend(s.encode("utf-8"))
+        return len(blob)
+
+    cols = {
+        "lat": np.empty(n_resto), "lon": np.empty(n_resto),
+        "item_start": np.zeros(n_resto + 1, np.uint32),
+        "name_off": np.zeros(n_resto + 1, np.uint32), "key_off": np.zeros(n_resto + 1, np.uint32),
+        "item_name_off": np.zeros(n_items + 1, np.uint32), "sku_off": np.zeros(n_items + 1, np.uint32),
+        "price_cents": np.zeros(n_items, np.uint32), "prep_min": np.zeros(n_items, np.uint16),
+        "slots": np.full(n_slots, -1, np.int32),
+    }
+    # chaînes groupées par colonne : [noms][clés][plats][skus], offsets de fin dans le blob
+    keys = list(restos)
+    for i, key in enumerate(keys):
+        name, lat, lon, items = restos[key]
+        cols["lat"][i], cols["lon"][i] = lat, lon
+        cols["item_start"][i + 1] = cols["item_start"][i] + len(items)
+        cols["name_off"][i + 1] = put(name)
+    cols["key_off"][0] = len(blob)
+    for i, key in enumerate(keys):
+        cols["key_off"][i + 1] = put(key)
+        slot = _hash(key) & (n_slots - 1)
+        while cols["slots"][slot] >= 0:
+            slot = (slot + 1) & (n_slots - 1)
+        cols["slots"][slot] = i
+    all_items = [it for key in keys for it in restos[key][3]]
+    cols["item_name_off"][0] = len(blob)
+    for j, (item, _, price, prep) in enumerate(all_items):
+        cols["item_name_off"][j + 1] = put(item)
+        cols["price_cents"][j], cols["prep_min"][j] = price, min(prep, 0xFFFF)
+    cols["sku_off"][0] = len(blob)
+    for j, (_, sku, _, _) in enumerate(all_items):
+        cols["sku_off"][j + 1] = put(sku)
+    cols["blob"] = np.frombuffer(bytes(blob), np.uint8)
+
+    layout, total = _layout(n_resto, n_items, n_slots, len(blob))
+    buf = bytearray(total)
+    HEADER.pack_into(buf, 0, MAGIC, FORMAT_VERSION, n_resto, n_items, n_slots, len(blob), size, mtime)
+    for name, (dtype, count, off) in layout.items():
+        data = np.ascontiguousarray(cols[name], dtype=dtype).tobytes()
+        buf[off:off + len(data)] = data
+    tmp = f"{out_path}.{os.getpid()}.tmp"
+    with open(tmp, "wb") as f:
+        f.write(buf)
+    try:
+        os.replace(tmp, out_path)   # les lecteurs voient l'ancien ou le nouveau fichier, jamais un mélange
+    except OSError:
+        os.remove(tmp)              # Windows : out_path encore mappé ailleurs
+        raise
+    return out_path
+
+# ---------------------------------------------------------------- lecture
+
+class Catalog:
+    """Instantané ouvert en mmap ; toutes les colonnes sont des vues numpy sans copie."""
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, "rb") as f:
+            self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        (magic, self.version, self.n_resto, self.n_items, n_slots, n_blob,
+         self.src_size, self.src_mtime) = HEADER.unpack_from(self._mm, 0)
+        if magic != MAGIC or self.version != FORMAT_VERSION:
+            raise ValueError(f"{path} : format de catalogue inconnu")
+        layout, _ = _layout(self.n_resto, self.n_items, n_slots, n_blob)
+        for name, (dtype, count, off) in layout.items():
+            setattr(self, name, np.frombuffer(self._mm, dtype, count, off))
+        self._mask = n_slots - 1
+        self._grid = None
+        self._columns = list(layout)
+        self.retry_at = 0.0
+
+    def close(self):
+        """Libère le mmap (sous Windows, un fichier mappé ne peut pas être remplacé)."""
+        if self._mm is None:
+            return
+        self._grid = None
+        for name in self._columns:
+            delattr(self, name)
+        try:
+            self._mm.close()
+        except BufferError:
+            pass   # colonnes encore tenues ailleurs : le mmap sera libéré avec elles
+        self._mm = None
+
+    def __len__(self):
+        return self.n_resto
+
+    def _str(self, offs, i):
+        return self.blob[offs[i]:offs[i + 1]].tobytes().decode("utf-8")
+
+    def find(self, name):
+        """Indice du restaurant (nom normalisé comme côté manager) ou None."""
+        key = normalize_name(name)
+        slot = _hash(key) & self._mask
+        while True:
+            i = int(self.slots[slot])
+            if i < 0:
+                return None
+            if self._str(self.key_off, i) == key:
+                return i
+            slot = (slot + 1) & self._mask
+
+    def name(self, i):
+        return self._str(self.name_off, i)
+
+    def coords(self, i):
+        return float(self.lat[i]), float(self.lon[i])
+
+    def restaurants(self):
+        """(nom, lat, lon) dans l'ordre du CSV."""
+        for i in range(self.n_resto):
+            yield self.name(i), float(self.lat[i]), float(self.lon[i])
+
+    def items(self, i):
+        """Plats du restaurant i : [{name, sku, price_eur, prep_min}]."""
+        out = []
+        for j in range(int(self.item_start[i]), int(self.item_start[i + 1])):
+            out.append({"name": self._str(self.item_name_off, j), "sku": self._str(self.sku_off, j),
+                        "price_eur": int(self.price_cents[j]) / 100, "prep_min": int(self.prep_min[j])})
+        return out
+
+    def spatial(self):
+        """Index spatial (spatial.py) sur lat / lon, construit à la première requête de proximité."""
+        if self._grid is None:
+            self._grid = GridIndex(self.lat, self.lon)
+        return self._grid
+
+    def near(self, lat, lon, radius_km=None, k=None):
+        """[(indice, distance km)] du plus proche au plus loin : rayon, k plus proches, ou les deux."""
+        if radius_km is None:
+            idx, dist = self.spatial().nearest(lat, lon, len(self) if k is None else k)
+        else:
+            idx, dist = self.spatial().within(lat, lon, radius_km, k)
+        return list(zip(idx.tolist(), dist.tolist()))
+
+    def is_stale(self, csv_path):
+        try:
+            return _source_sig(csv_path) != (self.src_size, self.src_mtime)
+        except OSError:
+            return False   # CSV absent : l'instantané fait foi
+
+def snapshot_path(csv_path):
+    return os.path.splitext(csv_path)[0] + ".catalog"
+
+_open = {}
+
+def open_catalog(csv_path=CSV_PATH, path=None):
+    """
+    Catalogue partagé du processus (ouvert une fois, à la première utilisation) ;
+    compile ou recompile l'instantané si absent, d'un autre format ou plus ancien que le CSV.
+    """
+    path = path or snapshot_path(csv_path)
+    cat = _open.get(path)
+    if cat is not None and (not cat.is_stale(csv_path) or time.monotonic() < cat.retry_at):
+        return cat
+    if cat is not None:
+        cat.close()   # pas de mmap de ce processus sur le fichier à remplacer
+        del _open[path]
+    try:
+        cat = Catalog(path)
+        if cat.is_stale(csv_path):
+            cat.close()
+            cat = None
+    except (OSError, ValueError):
+        cat = None
+    if cat is None:
+        if not os.path.exists(csv_path):
+            raise FileNotFoundError(f"CSV introuvable: {csv_path}")
+        try:
+            cat = Catalog(build(csv_path, path))
+        except OSError as e:
+            try:
+                cat = Catalog(path)
+            except (OSError, ValueError):
+                raise e from None
+            cat.retry_at = time.monotonic() + REBUILD_RETRY_S
+            print(f"[CATALOG] ⚠️ {path} non remplacé ({e}) : ancien instantané servi, "
+                  f"nouvel essai dans {REBUILD_RETRY_S} s")
+    _open[path] = cat
+    return cat
+
+def main():
+    ap = argparse.ArgumentParser(description="Compile menus.csv en instantané binaire (mmap).")
+    ap.add_argument("csv", nargs="?", default=CSV_PATH)
+    ap.add_argument("-o", "--out", help="chemin de l'instantané (défaut : <csv>.catalog)")
+    ap.add_argument("--lookup", help="nom de restaurant à chercher après compilation")
+    args = ap.parse_args()
+    t0 = time.perf_counter()
+    path = build(args.csv, args.out)
+    t1 = time.perf_counter()
+    cat = Catalog(path)
+    t2 = time.perf_counter()
+    print(f"[CATALOG] {path} : {len(cat)} restaurants, {cat.n_items} plats, "
+          f"{os.path.getsize(path) / 1024:.0f} Ko | compilé en {(t1 - t0) * 1000:.0f} ms, "
+          f"ouvert en {(t2 - t1) * 1000:.2f} ms")
+    if args.lookup:
+        i = cat.find(args.lookup)
+        if i is None:
+            print(f"[CATALOG] « {args.lookup} » introuvable")
+            sys.exit(1)
+        print(f"[CATALOG] {cat.name(i)} {cat.coords(i)}")
+        for it in cat.items(i):
+            print(f"  - {it['name']} ({it['sku']}) {it['price_eur']:.2f} € · {it['prep_min']} min")
+
+if __name__ == "__main__":
+    main()
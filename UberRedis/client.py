@@ -1,71 +1,53 @@
 
 
-import json, time, uuid, sys, csv, os
+import json, time, uuid, sys, argparse, queue, threading
+from urllib.request import urlopen
 import redis
 
+from catalog import open_catalog
+from codec import CODECS, DEFAULT_CODEC, set_codec, try_decode
+from transport import TRANSPORTS, make_transport
+from ratings import rate
+from reckoning import Follower
+from trajectory import length_km, load as load_trajectory
+
 CLIENT_LAT = 48.8610
 CLIENT_LON = 2.3450
 CSV_PATH = "menus.csv"
+NEAR_KM = None          # rayon de la liste des restaurants (None = tous, du plus proche au plus loin)
+NEAR_MAX = 20           # restaurants proposés au plus
+RENDER_S = 1.0          # suivi reckoning : position estimée affichée chaque seconde entre deux TRACK
 
 CHAN_ORDERS = "orders"
 CHAN_ASSIGN = "assignments:{oid}"
 CHAN_TRACKING = "tracking:{oid}"
 
 def rconn():
-    return redis.Redis(host="localhost", port=6379, db=0, decode_responses=True)
-
-def load_from_csv(path):
-    """
-    Retourne:
-      - restos: liste ordonnée de (name, lat, lon)
-      - menus: dict name -> liste d'items
-    """
-    if not os.path.exists(path):
-        raise FileNotFoundError(f"CSV introuvable: {path}")
-
-    restos_order = []
-    seen = set()
-    menus = {}
-
-    with open(path, newline='', encoding="utf-8") as f:
-        reader = csv.DictReader(f)
-        for row in reader:
-            name = (row.get("restaurant") or "").strip()
-            item = (row.get("item") or "").strip()
-            try:
-                lat = float(row["latitude"]); lon = float(row["longitude"])
-            except Exception:
-                continue
-            if not name or not item:
-                continue
-
-            if name not in seen:
-                restos_order.append((name, lat, lon))
-                seen.add(name)
-            menus.setdefault(name, []).append(item)
-
-    if not restos_order:
-        raise RuntimeError("Aucun restaurant valide trouvé dans le CSV.")
-    return restos_order, menus
-
-def choose_restaurant_and_item(restos, menus):
-    print("Restaurants disponibles :")
-    for i,(name,_,_) in enumerate(restos,1):
-        print(f"{i}) {name}")
+    return redis.Redis(host="localhost", port=6379, db=0, decode_responses=True, encoding_errors="surrogateescape")
+
+def choose_restaurant_and_item(cat, radius_km=NEAR_KM, limit=NEAR_MAX):
+    """Choix dans le catalogue partagé (instantané mmap de menus.csv, voir catalog.py), du plus proche au plus loin."""
+    near = cat.near(CLIENT_LAT, CLIENT_LON, radius_km=radius_km, k=limit)
+    if not near:
+        raise RuntimeError(f"Aucun restaurant à moins de {radius_km} km.")
+    print("Restaurants à proximité :")
+    for n,(i,dist) in enumerate(near,1):
+        print(f"{n}) {cat.name(i)} ({dist:.1f} km)")
     idx = -1
-    while idx not in range(1, len(restos)+1):
+    while idx not in range(1, len(near)+1):
         try:
             idx = int(input("Choisir un restaurant : "))
         except Exception:
             idx = -1
-    resto, rlat, rlon = restos[idx-1]
+    i = near[idx-1][0]
+    resto, (rlat, rlon) = cat.name(i), cat.coords(i)
 
-    items = menus.get(resto, [])
+    items = cat.items(i)
     if not items:
-        raise RuntimeError(f"Aucun plat trouvé pour {resto} dans le CSV.")
+        raise RuntimeError(f"Aucun plat trouvé pour {resto} dans le catalogue.")
     print(f"Menu de {resto} :")
     for j,it in enumerate(items,1):
-        print(f"{j}) {it}")
+        print(f"{j}) {it['name']} ({it['price_eur']:.2f} €)")
     k = -1
     while k not in range(1, len(items)+1):
         try:
@@ -75,17 +57,6 @@ def choose_restaurant_and_item(restos, menus):
     item = items[k-1]
     return resto, rlat, rlon, item
 
-def update_rating(r, courier, score):
-    key = f"ratings:{courier}"
-    r.hincrby(key, "sum", score)
-    r.hincrby(key, "count", 1)
-    data = r.hgetall(key)
-    s = int(data.get("sum", 0))
-    c = int(data.get("count", 1))
-    avg = s / max(1, c)
-    r.hset(key, mapping={"avg": avg})
-    return avg, c
-
 def phase_from_status(status: str) -> str:
     if status.startswith("vers_resto"):
         return "vers_resto"
@@ -93,67 +64,122 @@ def phase_from_status(status: str) -> str:
         return "vers_client"
     return "autre"
 
-def main():
+def redis_tracks(r, order_id):
+    """TRACK de la commande via une souscription Redis dédiée (une connexion par client)."""
+    ps2 = r.pubsub()
+    ps2.subscribe(CHAN_TRACKING.format(oid=order_id))
+    try:
+        for _ in range(36000):
+            m = ps2.get_message(timeout=0.5)
+            if not m or m.get("type") != "message":
+                continue
+            t = try_decode(m["data"])
+            if t is not None and t.get("type") == "TRACK":
+                yield t
+    finally:
+        ps2.close()
+
+def gateway_tracks(url, order_id):
+    """TRACK de la commande via la passerelle SSE (gateway.py) : aucune connexion Redis de suivi."""
+    with urlopen(f"{url.rstrip('/')}/track/{order_id}", timeout=60) as resp:
+        for raw in resp:
+            line = raw.decode("utf-8").rstrip("\r\n")
+            if not line.startswith("data:"):
+                continue  # event:, commentaires (ping)
+            try:
+                t = json.loads(line[len("data:"):])
+            except ValueError:
+                continue
+            if t.get("type") == "TRACK":
+                yield t
+
+def paced(tracks, every_s):
+    """Lit tracks dans un thread ; produit None quand rien n'est arrivé depuis every_s secondes."""
+    q = queue.Queue()
+    def pump():
+        try:
+            for t in tracks:
+                q.put(t)
+        finally:
+            q.put(StopIteration)
+    threading.Thread(target=pump, daemon=True).start()
+    while True:
+        try:
+            t = q.get(timeout=every_s)
+        except queue.Empty:
+            yield None
+            continue
+        if t is StopIteration:
+            return
+        yield t
+
+def show_estimate(follower, now):
+    lat, lon = follower.position(now)
+    print(f"[SUIVI] {follower.msg.get('status', ''):<18} | prog~{follower.progress(now):>3.0f}% | "
+          f"pos~({lat:.5f},{lon:.5f}) | eta~{int(follower.eta_s(now) // 60)} min")
+
+def main(transport_name="pubsub", gateway=None, radius_km=NEAR_KM, limit=NEAR_MAX):
     r = rconn()
-    restos, menus = load_from_csv(CSV_PATH)
-    resto, rlat, rlon, item = choose_restaurant_and_item(restos, menus)
+    transport = make_transport(r, transport_name)
+    resto, rlat, rlon, item = choose_restaurant_and_item(open_catalog(CSV_PATH), radius_km, limit)
 
     order_id = str(uuid.uuid4())
     order = {
         "type":"ORDER",
         "order_id": order_id,
         "restaurant": {"name": resto, "lat": rlat, "lon": rlon},
-        "items": [{"name": item, "qty": 1}],
+        "items": [{"name": item["name"], "sku": item["sku"], "qty": 1}],
         "customer": {"name":"Client POC", "lat": CLIENT_LAT, "lon": CLIENT_LON},
-        "created_at": int(time.time())
+        "created_at": int(time.time()),
+        "sent_ts": time.time(),      # retard client -> manager (métriques du manager)
     }
-    r.publish(CHAN_ORDERS, json.dumps(order))
-    print(f"[CLIENT] 🧾 Commande envoyée : {order_id} ({resto} / {item})")
+    # Abonnement à l'affectation AVANT l'envoi de la commande
+    sel_in = transport.subscribe(CHAN_ASSIGN.format(oid=order_id))
+    transport.publish(CHAN_ORDERS, order)
+    print(f"[CLIENT] 🧾 Commande envoyée : {order_id} ({resto} / {item['name']})")
     print("[CLIENT] ⏳ En attente d'attribution…")
 
     # Attente affectation
-    ps = r.pubsub()
-    ps.subscribe(CHAN_ASSIGN.format(oid=order_id))
     courier = None
     eta_min = None
     for _ in range(6000):
-        m = ps.get_message(timeout=0.2)
-        if not m or m.get("type") != "message":
-            continue
-        try:
-            sel = json.loads(m["data"])
-        except Exception:
+        got = sel_in.get(0.2)
+        if not got:
             continue
+        sel = got[1]
         if sel.get("type") == "SELECTION" and sel.get("order_id") == order_id:
             courier = sel.get("courier_id")
             eta_min = sel.get("eta_min")
             print(f"[CLIENT] ✅ Livreur attribué : {courier} (ETA ≈ {eta_min} min)")
             break
+    sel_in.close()
 
     if not courier:
         print("[CLIENT] 😕 Pas d'attribution.")
         return
 
-    # Suivi en temps réel — 2 phases 0→100 chacune (0/25/50/75/100)
-    print("[CLIENT] 🚴 Suivi en temps réel… (0/25/50/75/100 par phase)")
-    ps2 = r.pubsub()
-    ps2.subscribe(CHAN_TRACKING.format(oid=order_id))
+    # Suivi en temps réel — 2 phases 0→100 chacune (0/25/50/75/100, ou continu si le coursier
+    # publie sa vitesse : position extrapolée entre deux TRACK, reckoning.py)
+    print("[CLIENT] 🚴 Suivi en temps réel…")
+    done = load_trajectory(r, order_id)    # arrivé en cours de route : trajet déjà parcouru
+    if done:
+        pts = done["points"]
+        print(f"[CLIENT] 🗺️ Trajet déjà parcouru : {len(pts)} points, {length_km(pts):.2f} km "
+              f"en {(pts[-1][0] - pts[0][0]) / 60:.1f} min")
+    tracks = gateway_tracks(gateway, order_id) if gateway else redis_tracks(r, order_id)
 
     last_phase = None
     last_local_pct = -1
+    follower, shown = Follower(), 0.0
 
     try:
-        for _ in range(36000):
-            m = ps2.get_message(timeout=0.5)
-            if not m or m.get("type") != "message":
-                continue
-            try:
-                t = json.loads(m["data"])
-            except Exception:
+        for t in paced(tracks, RENDER_S):
+            now = time.monotonic()
+            if t is None:
+                if follower.msg is not None and "vn" in follower.msg and now - shown >= RENDER_S:
+                    show_estimate(follower, now)
+                    shown = now
                 continue
-            if t.get("type") != "TRACK":
-                continue
-
             status = t.get("status","")
             phase = phase_from_status(status)
 
@@ -162,6 +188,7 @@ def main():
                 lat = t.get("lat"); lon = t.get("lon")
                 print(f"[SUIVI] {status:<18} | prog=100% | pos=({lat:.5f},{lon:.5f}) | eta~0 min")
                 print("[CLIENT] 🎉 Livraison terminée.")
+                print(f"[CLIENT] 🗺️ Trajet : python trajectory.py {order_id} --replay 20")
                 break
 
             # --- 2) Changement de phase : reset du % local ---
@@ -173,6 +200,13 @@ def main():
                 last_local_pct = -1
                 last_phase = phase
 
+            # --- Mode reckoning : nouveau vecteur, l'affichage continue à l'estime
+            follower.update(t, now)
+            if "vn" in t:
+                show_estimate(follower, now)
+                shown = now
+                continue
+
             # --- 3) Pourcentage local + anti-doublon ---
             local_pct = int(t.get("progress", 0))
             if local_pct == last_local_pct:
@@ -194,19 +228,24 @@ def main():
             pass
         print("Saisie invalide.")
 
-    avg, cnt = update_rating(r, courier, score)
-    # Historique détaillé
-    r.lpush(
-        f"ratings_history:{courier}",
-        json.dumps({"order_id": order_id, "score": int(score), "ts": int(time.time())})
-    )
-    # (optionnel) limiter à 100 dernières : r.ltrim(f"ratings_history:{courier}", 0, 99)
+    # Moyenne + historique détaillé en un seul script atomique (voir ratings.py)
+    avg, cnt, recent = rate(r, courier, score, order_id)
 
-    print(f"⭐ Merci ! Nouvelle moyenne de {courier} : {avg:.2f}/5 ({cnt} avis)")
+    print(f"⭐ Merci ! Nouvelle moyenne de {courier} : {avg:.2f}/5 ({cnt} avis), note récente {recent:.2f}/5")
 
 if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description="Client Redis : commande, suivi, notation.")
+    ap.add_argument("--transport", choices=sorted(TRANSPORTS), default="pubsub",
+                    help="doit être le même que celui du manager")
+    ap.add_argument("--codec", choices=CODECS, default=DEFAULT_CODEC,
+                    help="encodage des messages envoyés (la réception lit tous les codecs)")
+    ap.add_argument("--gateway", help="URL de gateway.py (ex. http://localhost:8080) : suivi en SSE")
+    ap.add_argument("--radius", type=float, default=NEAR_KM, help="restaurants à moins de N km seulement")
+    ap.add_argument("--limit", type=int, default=NEAR_MAX, help="nombre de restaurants proposés")
+    args = ap.parse_args()
+    set_codec(args.codec)
     try:
-        main()
+        main(transport_name=args.transport, gateway=args.gateway, radius_km=args.radius, limit=args.limit)
     except KeyboardInterrupt:
         print("\n[CLIENT] Arrêt.")
         sys.exit(0)
@@ -0,0 +1,193 @@
+"""
+Encodage des messages ORDER / OFFER / CANDIDATURE / SELECTION / TRACK (pub/sub et streams).
+
+Le premier octet du message indique le codec, ce qui permet de mélanger anciens et nouveaux
+processus : le décodeur lit les trois formats, seul l'émetteur choisit (--codec).
+  `{`  json     JSON compact, exactement ce qu'envoient (et lisent) les anciens processus
+  `M`  msgpack  liste positionnelle selon le schéma versionné du type : les clés ne sont
+                plus répétées dans chaque message (nécessite le paquet msgpack)
+  `T`  struct   TRACK en disposition fixe (UUID sur 16 octets, statut en code, lat/lon en
+                entiers 1e-7 degré ≈ 1 cm, vitesse vn/ve du mode reckoning en float32) ;
+                les autres types passent en msgpack
+Un message qui ne rentre pas dans la forme compacte (champ manquant ou en plus, statut
+inconnu…) est envoyé tel quel dans le codec de repli, sans perte.
+
+Les charges msgpack/struct sont binaires : les connexions Redis qui les transportent sont
+créées avec encoding_errors="surrogateescape", le texte reçu redonne alors les octets exacts.
+"""
+import json, re, struct
+
+try:
+    import msgpack
+except ImportError:  # codec json uniquement
+    msgpack = None
+
+CODECS = ("json", "msgpack", "struct")
+DEFAULT_CODEC = "json"     # lisible par les anciens processus ; --codec pour passer au compact
+
+H_JSON, H_MSGPACK, H_TRACK = b"{", b"M", b"T"
+
+# Schémas versionnés : ordre des champs dans la forme positionnelle msgpack.
+# Ajouter un champ = nouvelle version ; les décodeurs gardent les anciennes, l'encodeur prend
+# la plus récente dont le message a tous les champs.
+SCHEMAS = {
+    ("ORDER", 1): ("order_id", "restaurant", "items", "customer", "created_at"),
+    ("ORDER", 2): ("order_id", "restaurant", "items", "customer", "created_at", "sent_ts"),
+    ("OFFER", 1): ("order_id", "restaurant", "dropoff", "reward_eur"),
+    ("CANDIDATURE", 1): ("order_id", "courier", "position", "sent_at"),
+    ("CANDIDATURE", 2): ("order_id", "courier", "position", "sent_at", "sent_ts"),
+    ("SELECTION", 1): ("order_id", "courier_id", "courier_name", "eta_min", "reward_eur",
+                       "pickup", "dropoff", "assigned_at"),
+    ("TRACK", 1): ("order_id", "courier_id", "status", "lat", "lon", "progress", "global_progress",
+                   "eta_s", "global_eta_s", "sent_at", "sent_ts"),
+    ("TRACK", 2): ("order_id", "courier_id", "status", "lat", "lon", "progress", "global_progress",
+                   "eta_s", "global_eta_s", "sent_at", "sent_ts", "vn", "ve"),
+}
+VERSIONS = {t: sorted((v for (tt, v) in SCHEMAS if tt == t), reverse=True) for (t, _) in SCHEMAS}
+
+# TRACK v1 : version, order_id, statut, progress, global_progress, eta_s, global_eta_s,
+#            sent_at, sent_ts, lat, lon, longueur du nom ; puis le nom du coursier (UTF-8)
+# TRACK v2 : idem avec vn, ve (m/s, float32) avant la longueur du nom
+TRACK_STRUCTS = {1: struct.Struct("<B16sBBBIIIdiiB"), 2: struct.Struct("<B16sBBBIIIdiiffB")}
+TRACK_STATUSES = ("vers_resto", "vers_resto_arrived", "vers_client", "vers_client_arrived")
+_TRACK_LAYOUTS = {frozenset(("type",) + SCHEMAS[("TRACK", v)]): v for v in TRACK_STRUCTS}
+_STATUS_CODE = {s: i for i, s in enumerate(TRACK_STATUSES)}
+_UUID_RE = re.compile(r"[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}")
+COORD_SCALE = 10_000_000
+
+_codec = DEFAULT_CODEC
+
+def set_codec(name):
+    """Codec utilisé par encode() sans argument (option --codec des scripts)."""
+    global _codec
+    if name not in CODECS:
+        raise ValueError(f"codec inconnu : {name}")
+    if name != "json" and msgpack is None:
+        raise RuntimeError(f"codec {name} : pip install msgpack")
+    _codec = name
+
+def get_codec():
+    return _codec
+
+# ---------------------------------------------------------------- json
+
+def _json_encode(msg):
+    return json.dumps(msg, separators=(",", ":"), ensure_ascii=False).encode("utf-8")
+
+# ---------------------------------------------------------------- msgpack (positionnel)
+
+def _msgpack_encode(msg):
+    kind = msg.get("type")
+    version = next((v for v in VERSIONS.get(kind, ()) if all(f in msg for f in SCHEMAS[(kind, v)])), None)
+    fields = SCHEMAS.get((kind, version))
+    if fields:
+        extras = {k: v for k, v in msg.items() if k != "type" and k not in fields}
+        body = [kind, version, [msg[f] for f in fields]]
+        if extras:
+            body.append(extras)
+    else:
+        body = msg  # type sans schéma ou champ absent : dictionnaire complet
+    return H_MSGPACK + msgpack.packb(body, use_bin_type=True)
+
+def _msgpack_decode(data):
+    body = msgpack.unpackb(data, raw=False)
+    if isinstance(body, dict):
+        return body
+    kind, version, values = body[0], body[1], body[2]
+    fields = SCHEMAS.get((kind, version))
+    if fields is None or len(fields) != len(values):
+        raise ValueError(f"schéma inconnu : {kind} v{version}")
+    msg = {"type": kind}
+    msg.update(zip(fields, values))
+    if len(body) > 3:
+        msg.update(body[3])
+    return msg
+
+# ---------------------------------------------------------------- struct (TRACK)
+
+def _track_encode(msg):
+    """Forme fixe d'un TRACK, ou None s'il ne rentre pas exactement dans la disposition."""
+    version = _TRACK_LAYOUTS.get(frozenset(msg))
+    if version is None:
+        return None
+    oid, status = msg["order_id"], _STATUS_CODE.get(msg["status"])
+    if status is None or type(oid) is not str or not _UUID_RE.fullmatch(oid):
+        return None
+    ints = (msg["progress"], msg["global_progress"], msg["eta_s"], msg["global_eta_s"], msg["sent_at"])
+    if not all(type(v) is int for v in ints):
+        return None
+    try:
+        name = msg["courier_id"].encode("utf-8")
+        speed = (float(msg["vn"]), float(msg["ve"])) if version == 2 else ()
+        return H_TRACK + TRACK_STRUCTS[version].pack(
+            version, bytes.fromhex(oid.replace("-", "")), status, *ints,
+            float(msg["sent_ts"]),
+            round(float(msg["lat"]) * COORD_SCALE), round(float(msg["lon"]) * COORD_SCALE),
+            *speed, len(name)) + name
+    except (AttributeError, TypeError, ValueError, struct.error):
+        return None
+
+def _track_decode(data):
+    layout = TRACK_STRUCTS.get(data[0]) if data else None
+    if layout is None:
+        raise ValueError(f"TRACK v{data[:1].hex()} inconnu")
+    values = layout.unpack_from(data)
+    (version, oid, status, progress, global_progress, eta_s, global_eta_s,
+     sent_at, sent_ts, lat, lon), name_len = values[:11], values[-1]
+    name = data[layout.size:layout.size + name_len].decode("utf-8")
+    h = oid.hex()
+    msg = {
+        "type": "TRACK", "order_id": f"{h[:8]}-{h[8:12]}-{h[12:16]}-{h[16:20]}-{h[20:]}", "courier_id": name,
+        "status": TRACK_STATUSES[status], "lat": lat / COORD_SCALE, "lon": lon / COORD_SCALE,
+        "progress": progress, "global_progress": global_progress,
+        "eta_s": eta_s, "global_eta_s": global_eta_s, "sent_at": sent_at, "sent_ts": sent_ts,
+    }
+    if version == 2:
+        msg["vn"], msg["ve"] = round(values[11], 2), round(values[12], 2)
+    return msg
+
+# ---------------------------------------------------------------- API
+
+def encode(msg, codec=None):
+    """dict -> bytes préfixés par l'octet du codec."""
+    codec = codec or _codec
+    if codec == "struct" and msg.get("type") == "TRACK":
+        data = _track_encode(msg)
+        if data is not None:
+            return data
+    if codec in ("msgpack", "struct"):
+        return _msgpack_encode(msg)
+    return _json_encode(msg)
+
+def decode(raw):
+    """
+    bytes ou str (connexion decode_responses=True) -> dict, quel que soit le codec
+    de l'émetteur. Lève ValueError si le message est illisible.
+    """
+    if isinstance(raw, str):
+        raw = raw.encode("utf-8", "surrogateescape")
+    if not raw:
+        raise ValueError("message vide")
+    head, body = raw[:1], raw[1:]
+    try:
+        if head == H_TRACK:
+            return _track_decode(body)
+        if head == H_MSGPACK:
+            if msgpack is None:
+                raise ValueError("message msgpack reçu : pip install msgpack")
+            return _msgpack_decode(body)
+        msg = json.loads(raw)
+    except ValueError:
+        raise
+    except Exception as e:  # struct.error, IndexError, erreurs internes de msgpack…
+        raise ValueError(f"message illisible ({e})") from e
+    if not isinstance(msg, dict):
+        raise ValueError("message JSON non objet")
+    return msg
+
+def try_decode(raw):
+    """decode() qui renvoie None au lieu de lever (boucles de réception)."""
+    try:
+        return decode(raw)
+    except ValueError:
+        return None
@@ -1,11 +1,23 @@
-import json, time, math, random, sys
+import time, math, random, sys, threading, argparse
 import redis
 
+from codec import CODECS, DEFAULT_CODEC, encode, set_codec, try_decode
+from geo import haversine_km
+from metrics import Counter, Histogram, serve, timer
+from reckoning import TRACKING_MODES, Reckoner, velocity
+from trajectory import Recorder
+from registry import CHAN_OFFERS_COURIER, HEARTBEAT_S, heartbeat, go_offline
+from route_planner import MAX_ORDERS, Planner, Stop, pack, straight_s
+from routing import open_router, polyline_at
+from transport import TRANSPORTS, make_transport
+
 VITESSE_KMH = 20.0
 CENTER_LAT, CENTER_LON = 48.8660, 2.3350
 JITTER_KM = 0.3
 TICK_SEC = 1.0
 PAUSE_S = 2.0
+TRACKING = "quarters"     # "reckoning" : position + vitesse, TRACK seulement sur écart (reckoning.py)
+MAX_STACK = MAX_ORDERS    # commandes en cours à la fois (route_planner.py) ; 1 = une course à la fois
 
 NAMES = ["Alex","Sam","Robin","Camille","Noa","Lina","Mael","Eli","Nora","Rayan",
          "Milan","Yanis","Léa","Jules","Zoé","Léo","Inès","Sacha","Aya","Nils","Pierre"]
@@ -15,112 +27,333 @@ CHAN_CANDIDATES = "candidates:{oid}"
 CHAN_ASSIGN = "assignments:{oid}"
 CHAN_TRACKING = "tracking:{oid}"
 
+# ----- Métriques (metrics.py, --metrics-port) -----
+M_CANDIDATURES = Counter("ubeer_courier_candidatures_total", "Candidatures envoyées")
+M_TRACKS = Counter("ubeer_courier_tracks_total", "Messages TRACK publiés")
+M_TRACK_PUBLISH = Histogram("ubeer_courier_track_publish_seconds", "Publication TRACK (un message, ou un pipeline de la flotte)")
+
 def rconn():
-    return redis.Redis(host="localhost", port=6379, db=0, decode_responses=True)
+    return redis.Redis(host="localhost", port=6379, db=0, decode_responses=True, encoding_errors="surrogateescape")
 
 def jitter(lat0, lon0, spread_km=JITTER_KM):
     dlat = random.gauss(0, spread_km) / 111.0
     dlon = random.gauss(0, spread_km) / (111.0 * max(0.1, math.cos(math.radians(lat0))))
     return lat0 + dlat, lon0 + dlon
 
-def hav(a_lat,a_lon,b_lat,b_lon):
-    R=6371.0
-    dlat=math.radians(b_lat-a_lat); dlon=math.radians(b_lon-a_lon)
-    lat1=math.radians(a_lat); lat2=math.radians(b_lat)
-    h=math.sin(dlat/2)**2+math.cos(lat1)*math.cos(lat2)*math.sin(dlon/2)**2
-    return 2*R*math.asin(math.sqrt(h))
-
 def lerp(a,b,t): return a+(b-a)*t
 
-def publish_tracking(r, order_id, courier, status, lat, lon, local_progress, eta_s, global_eta_s, global_progress):
+def heartbeat_loop(r, courier, state, stop):
+    """Thread de fond : position + statut libre/occupé (+ tournée ouverte) toutes les HEARTBEAT_S secondes."""
+    while not stop.is_set():
+        try:
+            heartbeat(r, courier, state["lat"], state["lon"], state["busy"], state.get("route"))
+        except redis.RedisError as e:
+            print(f"[{courier}] ⚠️ heartbeat impossible : {e}")
+        stop.wait(HEARTBEAT_S)
+
+def tracking_message(order_id, courier, status, lat, lon, local_progress, eta_s, global_eta_s, global_progress,
+                     velocity=None):
     track = {
         "type":"TRACK","order_id":order_id,"courier_id":courier,"status":status,
         "lat":lat,"lon":lon,
-        "progress":local_progress,            # % du tronçon (0/25/50/75/100)
+        "progress":local_progress,            # % du tronçon (0/25/50/75/100, ou continu en mode reckoning)
         "global_progress": global_progress,   # % global si tu veux l'utiliser
         "eta_s":eta_s,"global_eta_s":global_eta_s,
-        "sent_at": int(time.time())
+        "sent_at": int(time.time()),
+        "sent_ts": time.time(),               # précision sub-seconde (mesure du retard de livraison)
     }
-    r.publish(CHAN_TRACKING.format(oid=order_id), json.dumps(track))
+    if velocity is not None:                  # mode reckoning : le client extrapole (reckoning.py)
+        track["vn"], track["ve"] = velocity
+    return track
 
-def move_segment(r, order_id, courier, start, target, status_label,
-                 planned_s, global_remain_s, base_elapsed_s, total_target_s):
+def publish_tracking(r, order_id, courier, status, lat, lon, local_progress, eta_s, global_eta_s, global_progress,
+                     velocity=None):
+    track = tracking_message(order_id, courier, status, lat, lon, local_progress, eta_s, global_eta_s,
+                             global_progress, velocity)
+    with timer(M_TRACK_PUBLISH):
+        r.publish(CHAN_TRACKING.format(oid=order_id), encode(track))
+    M_TRACKS.inc()
+
+def segment_ticks(start, target, status_label, planned_s, global_remain_s, base_elapsed_s, total_target_s,
+                  clock=time.time, path=None, tracking=TRACKING):
     """
-    - planned_s: durée visée pour CE tronçon
-    - global_remain_s: temps global restant au début du tronçon
-    - base_elapsed_s: temps global déjà passé AVANT le tronçon
-    - total_target_s: durée globale visée (dur_pick + PAUSE + dur_drop)
+    Tronçon découpé en ticks, sans dormir : produit (lat, lon, track, wait_s) où track est
+    None (rien à publier) ou le tuple des arguments de publish_tracking après (r, order_id, courier),
+    et wait_s l'attente avant le tick suivant. Utilisé par move_segment (un coursier, time.sleep)
+    et par fleet.py (des milliers de coursiers sur une roue de temporisation).
+    path : polyligne par les rues (routing.py) suivie au lieu de la ligne droite.
+    tracking : "quarters" (un TRACK par quart) ou "reckoning" (position + vitesse, puis un TRACK
+    seulement quand l'extrapolation s'écarte de la position réelle, reckoning.py).
     """
     steps = max(5, int(planned_s // TICK_SEC))
-    t0 = time.time()
+    t0 = clock()
     last_local_quarter = -25  # anti-doublon 0/25/50/75/100
+    rk = Reckoner() if tracking == "reckoning" else None
+
+    def at(t):
+        if path:
+            return polyline_at(path, t)
+        return lerp(start[0], target[0], t), lerp(start[1], target[1], t)
 
     for step in range(steps+1):
         t = step/steps
-        lat = lerp(start[0], target[0], t)
-        lon = lerp(start[1], target[1], t)
-
-        # ---- Progression locale strictement aux quarts
-        local_pct = int(round(t * 100))
-        local_quarter = (local_pct // 25) * 25
-        if local_quarter > 100:
-            local_quarter = 100
-        if local_quarter == last_local_quarter:
-            time.sleep(TICK_SEC)
-            continue
-        last_local_quarter = local_quarter
+        lat, lon = at(t)
+        now = clock()
+
+        if rk is not None:
+            if not rk.due(now, lat, lon, status_label):
+                yield lat, lon, None, TICK_SEC
+                continue
+            vn, ve = velocity((lat, lon), at(min(1.0, (step + 1) / steps)), TICK_SEC)
+            rk.sent(now, lat, lon, vn, ve, status_label)
+            local_pct = int(round(t * 100))
+        else:
+            # ---- Progression locale strictement aux quarts
+            local_pct = int(round(t * 100))
+            local_quarter = (local_pct // 25) * 25
+            if local_quarter > 100:
+                local_quarter = 100
+            if local_quarter == last_local_quarter:
+                yield lat, lon, None, TICK_SEC
+                continue
+            last_local_quarter = local_pct = local_quarter
 
         # ---- Progression globale (optionnelle)
-        elapsed_local = time.time() - t0
+        elapsed_local = now - t0
         elapsed_global = base_elapsed_s + min(planned_s, elapsed_local)
-        global_pct = int(round((elapsed_global / max(1e-6, total_target_s)) * 100))
-        global_quarter = (global_pct // 25) * 25
-        if global_quarter > 100:
-            global_quarter = 100
+        global_pct = min(100, int(round((elapsed_global / max(1e-6, total_target_s)) * 100)))
+        if rk is None:
+            global_pct = (global_pct // 25) * 25
 
         # ---- ETAs
         local_eta  = max(0, int(planned_s - elapsed_local))
         global_eta = max(0, int(global_remain_s - elapsed_local))
 
-        publish_tracking(
-            r, order_id, courier, status_label, lat, lon,
-            local_quarter, local_eta, global_eta, global_quarter
-        )
-        time.sleep(TICK_SEC)
+        track = (status_label, lat, lon, local_pct, local_eta, global_eta, global_pct)
+        if rk is not None:
+            track += ((round(vn, 2), round(ve, 2)),)
+        yield lat, lon, track, TICK_SEC
 
     # fin de tronçon = 100%
-    publish_tracking(
-        r, order_id, courier, f"{status_label}_arrived",
+    yield target[0], target[1], (
+        f"{status_label}_arrived",
         target[0], target[1],
         100, 0,
         max(0, int(global_remain_s - planned_s)),
         min(100, int(round((base_elapsed_s + planned_s)/max(1e-6,total_target_s)*100)))
-    )
+    ), 0
+
+def rider_track(track, status, started, drop_at, now):
+    """TRACK d'un tronçon recopié pour une autre commande de la tournée : son statut, son ETA."""
+    if track is None:
+        return None
+    _, lat, lon, local_pct, local_eta, _, _, *speed = track
+    global_pct = min(100, int(round((now - started) / max(1e-6, drop_at - started) * 100)))
+    if not speed:
+        global_pct = (global_pct // 25) * 25
+    return (status, lat, lon, local_pct, local_eta, max(0, int(drop_at - now)), global_pct, *speed)
+
+def move_segment(r, order_id, courier, start, target, status_label,
+                 planned_s, global_remain_s, base_elapsed_s, total_target_s, state=None, path=None,
+                 tracking=TRACKING, recorder=None, riders=None):
+    """
+    - planned_s: durée visée pour CE tronçon
+    - global_remain_s: temps global restant au début du tronçon
+    - base_elapsed_s: temps global déjà passé AVANT le tronçon
+    - total_target_s: durée globale visée (dur_pick + PAUSE + dur_drop)
+    - state: position partagée avec le thread de heartbeat (optionnel)
+    - path: polyligne par les rues (optionnel, routing.py)
+    - tracking: "quarters" ou "reckoning" (voir segment_ticks)
+    - recorder: trajectory.Recorder de la livraison, réécrit à chaque TRACK publié (optionnel)
+    - riders: autres commandes de la tournée, relues à chaque tick (fonction ->
+      [(order_id, statut, début, heure de dépôt prévue, recorder)]) : mêmes positions, avec
+      leur propre statut et leur ETA (tournées multi-commandes, Route)
+    """
+    marked = {}
+    for lat, lon, track, wait_s in segment_ticks(start, target, status_label, planned_s,
+                                                 global_remain_s, base_elapsed_s, total_target_s, path=path,
+                                                 tracking=tracking):
+        if state is not None:
+            state["lat"], state["lon"] = lat, lon
+        now = time.time()
+        legs = [(order_id, track, recorder)]
+        if riders is not None:
+            legs += [(oid, rider_track(track, status, started, drop_at, now), rec)
+                     for oid, status, started, drop_at, rec in riders()]
+        for oid, tr, rec in legs:
+            if rec is not None:
+                rec.add(now, lat, lon)
+                if tr and tr[0] != marked.get(oid):   # début de tronçon, arrivée
+                    marked[oid] = tr[0]
+                    rec.mark(tr[0])
+            if tr:
+                publish_tracking(r, oid, courier, *tr)
+                if rec is not None:
+                    rec.save(r)
+        if wait_s:
+            time.sleep(wait_s)
+
+def plan_delivery(pos, chosen):
+    """
+    Trajectoire recalée sur l'ETA annoncée par le manager.
+    -> (pickup, drop, dur_pick, dur_drop, total_target_s)
+    """
+    pickup = (float(chosen["pickup"]["lat"]), float(chosen["pickup"]["lon"]))
+    drop   = (float(chosen["dropoff"]["lat"]), float(chosen["dropoff"]["lon"]))
+    target_total_s = max(5, int(chosen["eta_min"] * 60))
+
+    def dist(a,b): return haversine_km(a[0],a[1],b[0],b[1])
+    d_pick = dist(pos, pickup)
+    d_drop = dist(pickup, drop)
+    dur_pick = (d_pick / max(1e-6, VITESSE_KMH)) * 3600
+    dur_drop = (d_drop / max(1e-6, VITESSE_KMH)) * 3600
+    total_raw = max(1.0, dur_pick + PAUSE_S + dur_drop)
+    scale = target_total_s / total_raw
+    dur_pick *= scale; dur_drop *= scale
+    return pickup, drop, dur_pick, dur_drop, dur_pick + PAUSE_S + dur_drop
+
+class Route:
+    """
+    Tournée du coursier : arrêts restants (route_planner.Stop) partagés entre le fil d'écoute
+    des annonces (add) et celui qui les suit (follow_route). Une commande ajoutée en course est
+    placée par insertion la moins chère, sans toucher au tronçon en cours.
+    """
+
+    def __init__(self, state, max_orders=MAX_STACK):
+        self.cond = threading.Condition()
+        self.state = state                 # position / busy / route partagés avec le heartbeat
+        self.stops = []
+        self.orders = {}                   # order_id -> (début, Recorder)
+        self.max_orders = max_orders
+        self.straight = straight_s(VITESSE_KMH)
+        self.pace = 1.0                    # temps de trajet × pace : recalage sur l'ETA annoncée
+        self.planner = Planner(lambda a, b: self.straight(a, b) * self.pace, pickup_s=PAUSE_S,
+                               max_orders=max_orders)
+        self._riders = None
+
+    def add(self, order_id, chosen):
+        """Commande sélectionnée -> arrêts de la tournée ; heure promise = maintenant + ETA."""
+        with self.cond:
+            pos, now = (self.state["lat"], self.state["lon"]), time.time()
+            pickup, drop, dur_pick, dur_drop, _ = plan_delivery(pos, chosen)
+            due = now + chosen["eta_min"] * 60
+            if not self.stops:
+                # première commande : même recalage que la course simple (plan_delivery)
+                raw = self.straight(pos, pickup) + self.straight(pickup, drop)
+                self.pace = (dur_pick + dur_drop) / raw if raw > 0 else 1.0
+                ins = None
+            else:
+                ins = self.planner.insert(pos, now, self.stops, order_id, pickup, drop, locked=1)
+            if ins is not None:
+                self.stops = [st._replace(due=due) if st.order_id == order_id and st.kind == "drop" else st
+                              for st in ins.stops]
+            else:   # route vide, ou tournée changée depuis le calcul du manager : en fin de tournée
+                self.stops += [Stop(order_id, "pickup", *pickup, None), Stop(order_id, "drop", *drop, due)]
+            drop_at = self.planner.schedule(pos, now, self.stops)[self._index(order_id, "drop")]
+            self.orders[order_id] = (now, Recorder(order_id, drop_at - now))
+            self._changed()
+            return ins
+
+    def _index(self, order_id, kind):
+        return next(k for k, st in enumerate(self.stops) if st.order_id == order_id and st.kind == kind)
 
-def main():
+    def _changed(self):
+        self._riders = None
+        self.state["busy"] = bool(self.stops)
+        self.state["route"] = pack(self.stops) if self.stops and len(self.orders) < self.max_orders else None
+        self.cond.notify_all()
+
+    def riders(self, target):
+        """Commandes de la tournée autres que target : (order_id, statut, début, dépôt prévu, recorder)."""
+        with self.cond:
+            if self._riders is None or self._riders[0] != target:
+                pos = (self.state["lat"], self.state["lon"])
+                at = dict(zip(self.stops, self.planner.schedule(pos, time.time(), self.stops)))
+                waiting = {st.order_id for st in self.stops if st.kind == "pickup"}
+                self._riders = (target, [
+                    (oid, "vers_resto" if oid in waiting else "vers_client", started,
+                     next(at[st] for st in self.stops if st.order_id == oid and st.kind == "drop"), rec)
+                    for oid, (started, rec) in self.orders.items() if oid != target])
+            return self._riders[1]
+
+def follow_route(r, courier, route, router=None, tracking=TRACKING):
+    """Thread : suit les arrêts de la tournée, un tronçon (move_segment) par arrêt."""
+    state = route.state
+    while True:
+        with route.cond:
+            while not route.stops:
+                route.cond.wait()
+            stop = route.stops[0]
+            start, now = (state["lat"], state["lon"]), time.time()
+            at = route.planner.schedule(start, now, route.stops)
+            started, recorder = route.orders[stop.order_id]
+            drop_at = at[route._index(stop.order_id, "drop")]
+            route._riders = None
+        target = (stop.lat, stop.lon)
+        status = "vers_resto" if stop.kind == "pickup" else "vers_client"
+        move_segment(r, stop.order_id, courier, start, target, status,
+                     at[0] - now, drop_at - now, now - started, drop_at - started, state,
+                     router.path(start, target) if router else None, tracking, recorder,
+                     lambda: route.riders(stop.order_id))
+        if stop.kind == "pickup":
+            time.sleep(PAUSE_S)
+        with route.cond:
+            route.stops.pop(0)
+            if stop.kind == "drop":
+                del route.orders[stop.order_id]
+            route._changed()
+            busy, packed = state["busy"], state["route"]
+        if stop.kind == "drop":
+            recorder.save(r, final=True)
+            print(f"[{courier}] 🎯 Livraison terminée pour {stop.order_id}")
+            # position à jour tout de suite (de nouveau libre, ou tournée ouverte à une commande)
+            heartbeat(r, courier, target[0], target[1], busy=busy, route=packed)
+
+def main(transport_name="pubsub", graph=None, tracking=TRACKING, max_orders=MAX_STACK):
     r = rconn()
+    router = open_router(graph, VITESSE_KMH) if graph else None   # trajets par les rues
+    transport = make_transport(r, transport_name)
     name = random.choice(NAMES)
     courier = name
     lat, lon = jitter(CENTER_LAT, CENTER_LON, JITTER_KM)
     print(f"[COURSIER {courier}] En ligne | pos=({lat:.5f},{lon:.5f})")
 
+    # Heartbeats : le manager ne sollicite que les coursiers libres proches (ou en course avec de la place)
+    state = {"lat": lat, "lon": lon, "busy": False, "route": None}
+    route = Route(state, max_orders)
+    stop = threading.Event()
+    threading.Thread(target=heartbeat_loop, args=(r, courier, state, stop), daemon=True).start()
+    threading.Thread(target=follow_route, args=(r, courier, route, router, tracking), daemon=True).start()
+
     ps = r.pubsub()
-    ps.subscribe(CHAN_OFFERS)
+    ps.subscribe(CHAN_OFFERS, CHAN_OFFERS_COURIER.format(name=courier))
     print("[COURSIER] En écoute des annonces…")
 
+    try:
+        serve_offers(r, transport, ps, courier, route)
+    finally:
+        stop.set()
+        go_offline(r, courier)
+
+def serve_offers(r, transport, ps, courier, route):
+    state = route.state
     for msg in ps.listen():
         if msg.get("type") != "message":
             continue
-        try:
-            offer = json.loads(msg["data"])
-        except Exception:
-            continue
-        if offer.get("type") != "OFFER":
+        offer = try_decode(msg["data"])
+        if offer is None or offer.get("type") != "OFFER":
             continue
 
         order_id = offer["order_id"]
         resto = offer["restaurant"]["name"]
-        print(f"[{courier}] Offre reçue: {order_id} → {resto}")
+        stack = offer.get("stack")   # annonce à un coursier en course (manager, route_planner.py)
+        if state["busy"] and not stack:
+            continue
+        if stack:
+            print(f"[{courier}] Offre en course : {order_id} → {resto} "
+                  f"(détour +{stack['detour_s'] / 60:.1f} min, ETA {stack['eta_min']} min)")
+        else:
+            print(f"[{courier}] Offre reçue: {order_id} → {resto}")
         try:
             ans = input(f"[{courier}] Accepter ? (o/N) ").strip().lower()
         except EOFError:
@@ -130,74 +363,68 @@ def main():
             continue
 
         # candidature
+        lat, lon = state["lat"], state["lon"]
         cand = {
             "type":"CANDIDATURE",
             "order_id": order_id,
             "courier": courier,
             "position": {"lat": lat, "lon": lon},
-            "sent_at": int(time.time())
+            "sent_at": int(time.time()),
+            "sent_ts": time.time(),
         }
-        r.publish(CHAN_CANDIDATES.format(oid=order_id), json.dumps(cand))
+        # attente sélection (abonnement avant l'envoi de la candidature)
+        sel_in = transport.subscribe(CHAN_ASSIGN.format(oid=order_id))
+        transport.publish(CHAN_CANDIDATES.format(oid=order_id), cand)
+        M_CANDIDATURES.inc()
         print(f"[{courier}] 📨 Candidature envoyée")
-
-        # attente sélection
-        ps2 = r.pubsub()
-        ps2.subscribe(CHAN_ASSIGN.format(oid=order_id))
         print(f"[{courier}] Attente sélection…")
 
         chosen = None
         t0 = time.time()
         while True:
-            m = ps2.get_message(timeout=0.2)
-            if m and m.get("type") == "message":
-                try:
-                    sel = json.loads(m["data"])
-                except Exception:
-                    sel = {}
-                if sel.get("type") == "SELECTION" and sel.get("order_id") == order_id and sel.get("courier_id") == courier:
+            got = sel_in.get(0.2)
+            sel = got[1] if got else {}
+            if sel.get("type") == "SELECTION" and sel.get("order_id") == order_id:
+                if sel.get("courier_id") == courier:
                     chosen = sel
-                    break
+                else:
+                    print(f"[{courier}] Commande attribuée à {sel.get('courier_id')}.")
+                break
             if time.time() - t0 > 120:
                 print(f"[{courier}] ⏳ Pas sélectionné, on passe.")
                 break
+        sel_in.close()
 
         if not chosen:
             continue
 
-        print(f"[{courier}] ✅ Sélectionné (ETA={chosen['eta_min']} min)")
-        pickup = (float(chosen["pickup"]["lat"]), float(chosen["pickup"]["lon"]))
-        drop   = (float(chosen["dropoff"]["lat"]), float(chosen["dropoff"]["lon"]))
-        target_total_s = max(5, int(chosen["eta_min"] * 60))
-
-        # trajectoire (recalée sur ETA)
-        def dist(a,b): return hav(a[0],a[1],b[0],b[1])
-        d_pick = dist((lat,lon), pickup)
-        d_drop = dist(pickup, drop)
-        dur_pick = (d_pick / max(1e-6, VITESSE_KMH)) * 3600
-        dur_drop = (d_drop / max(1e-6, VITESSE_KMH)) * 3600
-        total_raw = max(1.0, dur_pick + PAUSE_S + dur_drop)
-        scale = target_total_s / total_raw
-        dur_pick *= scale; dur_drop *= scale
-
-        total_target_s = dur_pick + PAUSE_S + dur_drop
-        base_elapsed = 0.0
-
-        # 1) Vers le resto
-        move_segment(r, order_id, courier, (lat,lon), pickup,
-                     "vers_resto", dur_pick, total_target_s, base_elapsed, total_target_s)
-        time.sleep(PAUSE_S)
-        base_elapsed += dur_pick + PAUSE_S
-
-        # 2) Vers le client
-        lat, lon = pickup
-        remaining_global = max(0.0, total_target_s - base_elapsed)
-        move_segment(r, order_id, courier, (lat,lon), drop,
-                     "vers_client", dur_drop, remaining_global, base_elapsed, total_target_s)
-        print(f"[{courier}] 🎯 Livraison terminée pour {order_id}")
+        # la tournée suit dans son thread (follow_route) ; on reste à l'écoute des annonces
+        ins = route.add(order_id, chosen)
+        heartbeat(r, courier, state["lat"], state["lon"], busy=True, route=state["route"])  # index à jour tout de suite
+        print(f"[{courier}] ✅ Sélectionné (ETA={chosen['eta_min']} min)"
+              + (f" | ajoutée à la tournée, détour +{ins.added_s / 60:.1f} min" if ins else ""))
+        print(f"[{courier}] 🗺️ Tournée : " + " → ".join(
+            f"{'🍽️' if st.kind == 'pickup' else '📦'}{st.order_id[:8]}" for st in route.stops))
 
 if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description="Coursier Redis : candidatures et livraison simulée.")
+    ap.add_argument("--transport", choices=sorted(TRANSPORTS), default="pubsub",
+                    help="doit être le même que celui du manager")
+    ap.add_argument("--codec", choices=CODECS, default=DEFAULT_CODEC,
+                    help="encodage des messages envoyés (la réception lit tous les codecs)")
+    ap.add_argument("--graph", help="graphe de rues compilé (routing.py) : trajets par les rues")
+    ap.add_argument("--tracking", choices=TRACKING_MODES, default=TRACKING,
+                    help="reckoning : position + vitesse, un TRACK seulement quand l'estimation dérive")
+    ap.add_argument("--max-orders", type=int, default=MAX_STACK,
+                    help="commandes en cours à la fois (tournée, route_planner.py) ; 1 = une course à la fois")
+    ap.add_argument("--metrics-port", type=int, help="expose /metrics (Prometheus) sur ce port local")
+    args = ap.parse_args()
+    set_codec(args.codec)
+    if args.metrics_port is not None:
+        serve(args.metrics_port)
     try:
-        main()
+        main(transport_name=args.transport, graph=args.graph, tracking=args.tracking,
+             max_orders=max(1, args.max_orders))
     except KeyboardInterrupt:
         print("\n[COURSIER] Arrêt.")
         sys.exit(0)
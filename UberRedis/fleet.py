@@ -0,0 +1,378 @@
+"""
+Hôte de flotte : N coursiers simulés dans UN processus, sur une seule boucle asyncio.
+
+- chaque coursier est une coroutine qui attend ses annonces ; l'acceptation suit une
+  politique automatique (--policy) au lieu de input() ;
+- une seule connexion pub/sub pour toutes les annonces (offers + offers:<nom> de chaque
+  coursier) et toutes les sélections (PSUBSCRIBE assignments:*) ;
+- les déplacements (coursier.segment_ticks) et les pauses avancent sur une roue de
+  temporisation partagée ; les TRACK d'un même cran partent dans un seul pipeline ;
+- heartbeats de toute la flotte en un pipeline, pool de connexions Redis borné (--pool) ;
+- trajet de chaque livraison (trajectory.py) réécrit à la fin de chaque tronçon.
+Transport pub/sub uniquement (comme manager_async.py).
+
+    python fleet.py --couriers 2000 --policy near --max-km 3
+"""
+import asyncio, argparse, os, random, sys, time
+import redis.asyncio as aioredis
+
+from coursier import (
+    NAMES, CENTER_LAT, CENTER_LON, TICK_SEC, PAUSE_S, TRACKING,
+    CHAN_OFFERS, CHAN_CANDIDATES, CHAN_TRACKING,
+    jitter, tracking_message, segment_ticks, plan_delivery,
+    M_CANDIDATURES, M_TRACKS, M_TRACK_PUBLISH,
+)
+from metrics import serve, timer
+from reckoning import TRACKING_MODES
+from codec import CODECS, DEFAULT_CODEC, encode, set_codec, try_decode
+from geo import haversine_km
+from registry import CHAN_OFFERS_COURIER, HEARTBEAT_S, heartbeat_many_async, go_offline_many_async
+from timer_wheel import TimerWheel
+from trajectory import Recorder
+
+POOL_SIZE = 20             # connexions Redis partagées par toute la flotte
+FLEET_JITTER_KM = 2.0      # dispersion des positions de départ
+SELECTION_TIMEOUT_S = 120
+STATS_EVERY_S = 5.0
+SUBSCRIBE_CHUNK = 500      # canaux offers:<nom> par commande SUBSCRIBE
+HEARTBEAT_CHUNK = 1000     # coursiers par pipeline de heartbeats
+PATTERN_ASSIGN = "assignments:*"
+
+POLICIES = ("always", "prob", "near")
+
+def make_policy(name, accept_prob=0.5, max_km=3.0):
+    """Politique d'acceptation automatique : callable(coursier, offre) -> bool."""
+    if name == "always":
+        return lambda c, offer: True
+    if name == "prob":
+        return lambda c, offer: random.random() < accept_prob
+    if name == "near":
+        def near(c, offer):
+            resto = offer["restaurant"]
+            return haversine_km(c.lat, c.lon, float(resto["lat"]), float(resto["lon"])) <= max_km
+        return near
+    raise ValueError(f"politique inconnue : {name}")
+
+def rss_bytes():
+    """
+    Mémoire résidente du processus : /proc sous Linux, sinon pic via getrusage (macOS),
+    sinon psutil s'il est installé (Windows), sinon 0.
+    """
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, AttributeError):
+        pass
+    try:
+        import resource  # absent sous Windows
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak if sys.platform == "darwin" else peak * 1024
+    except ImportError:
+        pass
+    try:
+        import psutil
+        return psutil.Process().memory_info().rss
+    except ImportError:
+        return 0
+
+class SimCourier:
+    __slots__ = ("name", "lat", "lon", "state", "inbox", "deliveries")
+
+    def __init__(self, name, lat, lon):
+        self.name = name
+        self.lat, self.lon = lat, lon
+        self.state = "idle"      # idle | candidate | delivering
+        self.inbox = asyncio.Queue(maxsize=1)
+        self.deliveries = 0
+
+class Fleet:
+    def __init__(self, r, n, policy, selection_timeout_s=SELECTION_TIMEOUT_S, speedup=1.0, verbose=False,
+                 tracking=TRACKING):
+        """speedup : les courses durent ETA / speedup (tests de charge plus courts)."""
+        self.r = r
+        self.policy = policy
+        self.speedup = speedup
+        self.tracking = tracking
+        self.selection_timeout_s = selection_timeout_s
+        self.verbose = verbose
+        self.base_rss = rss_bytes()
+        self.couriers = {}
+        for i in range(n):
+            name = f"{NAMES[i % len(NAMES)]}-{i:05d}"
+            lat, lon = jitter(CENTER_LAT, CENTER_LON, FLEET_JITTER_KM)
+            self.couriers[name] = SimCourier(name, lat, lon)
+        self.waiting = {}        # order_id -> {nom: future de la sélection}
+        self.outbox = []         # (canal, payload) publiés au prochain cran de la roue
+        self.flush_pending = False
+        self.wheel = TimerWheel(tick_s=TICK_SEC, on_tick=self.flush)
+        self.tasks = []
+        self.ticks = 0
+        self.published = 0
+        self.offers = 0
+        self.candidatures = 0
+        self.deliveries = 0
+        self.mem_per_courier = 0.0
+
+    def log(self, msg):
+        if self.verbose:
+            print(msg)
+
+    # ----- boucle principale
+
+    async def run(self):
+        ps = self.r.pubsub()
+        await ps.subscribe(CHAN_OFFERS)
+        names = list(self.couriers)
+        for i in range(0, len(names), SUBSCRIBE_CHUNK):
+            await ps.subscribe(*[CHAN_OFFERS_COURIER.format(name=n) for n in names[i:i + SUBSCRIBE_CHUNK]])
+        await ps.psubscribe(PATTERN_ASSIGN)
+
+        self.tasks = [asyncio.create_task(self.courier_loop(c)) for c in self.couriers.values()]
+        self.tasks += [asyncio.create_task(self.wheel.run()),
+                       asyncio.create_task(self.heartbeat_loop()),
+                       asyncio.create_task(self.stats_loop())]
+        await asyncio.sleep(0)  # laisse chaque coroutine démarrer avant la mesure
+        self.mem_per_courier = (rss_bytes() - self.base_rss) / max(1, len(self.couriers))
+        print(f"[FLEET] 🚲 {len(self.couriers)} coursiers en ligne "
+              f"(≈ {self.mem_per_courier / 1024:.1f} Ko/coursier, RSS {rss_bytes() / 2**20:.0f} Mo)")
+        try:
+            async for msg in ps.listen():
+                kind = msg.get("type")
+                if kind == "message":
+                    self.on_offer(msg["channel"], msg["data"])
+                elif kind == "pmessage":
+                    self.on_assignment(msg["data"])
+        finally:
+            await ps.aclose()
+
+    async def shutdown(self):
+        for t in self.tasks:
+            t.cancel()
+        await asyncio.gather(*self.tasks, return_exceptions=True)
+        try:
+            await self.flush()
+            names = list(self.couriers)
+            for i in range(0, len(names), HEARTBEAT_CHUNK):
+                await go_offline_many_async(self.r, names[i:i + HEARTBEAT_CHUNK])
+        except aioredis.RedisError as e:
+            print(f"[FLEET] ⚠️ arrêt incomplet : {e}")
+
+    # ----- routage des messages
+
+    def on_offer(self, channel, raw):
+        offer = try_decode(raw)
+        if offer is None or offer.get("type") != "OFFER":
+            return
+        self.offers += 1
+        if channel == CHAN_OFFERS:
+            targets = self.couriers.values()   # annonce globale : tous les coursiers libres
+        else:
+            c = self.couriers.get(channel.split(":", 1)[1])
+            targets = [c] if c else []
+        for c in targets:
+            if c.state == "idle" and self.policy(c, offer):
+                try:
+                    c.inbox.put_nowait(offer)
+                except asyncio.QueueFull:
+                    pass  # une annonce est déjà en cours d'examen
+
+    def on_assignment(self, raw):
+        sel = try_decode(raw)
+        if sel is None or sel.get("type") != "SELECTION":
+            return
+        for fut in self.waiting.pop(sel.get("order_id"), {}).values():
+            if not fut.done():
+                fut.set_result(sel)
+
+    # ----- un coursier
+
+    async def courier_loop(self, c):
+        loop = asyncio.get_running_loop()
+        while True:
+            offer = await c.inbox.get()
+            if c.state != "idle":
+                continue
+            order_id = offer["order_id"]
+            c.state = "candidate"
+            fut = loop.create_future()
+            self.waiting.setdefault(order_id, {})[c.name] = fut   # avant la candidature
+            cand = {"type": "CANDIDATURE", "order_id": order_id, "courier": c.name,
+                    "position": {"lat": c.lat, "lon": c.lon}, "sent_at": int(time.time()), "sent_ts": time.time()}
+            try:
+                await self.r.publish(CHAN_CANDIDATES.format(oid=order_id), encode(cand))
+                self.candidatures += 1
+                M_CANDIDATURES.inc()
+                sel = await asyncio.wait_for(fut, self.selection_timeout_s)
+            except (asyncio.TimeoutError, aioredis.RedisError):
+                sel = None
+            finally:
+                waiters = self.waiting.get(order_id)
+                if waiters is not None:
+                    waiters.pop(c.name, None)
+                    if not waiters:
+                        self.waiting.pop(order_id, None)
+            if not sel or sel.get("courier_id") != c.name:
+                c.state = "idle"
+                continue
+            try:
+                await self.deliver(c, order_id, sel)
+            except aioredis.RedisError as e:
+                print(f"[FLEET] ⚠️ {c.name} : livraison {order_id} interrompue ({e})")
+            c.state = "idle"
+
+    async def deliver(self, c, order_id, chosen):
+        c.state = "delivering"
+        await heartbeat_many_async(self.r, [(c.name, c.lat, c.lon, True)])
+        self.log(f"[{c.name}] ✅ Sélectionné pour {order_id} (ETA={chosen['eta_min']} min)")
+        pickup, drop, dur_pick, dur_drop, total_target_s = plan_delivery((c.lat, c.lon), chosen)
+        if self.speedup != 1.0:
+            dur_pick /= self.speedup
+            dur_drop /= self.speedup
+            total_target_s = dur_pick + PAUSE_S + dur_drop
+        recorder = Recorder(order_id, total_target_s)
+
+        await self.drive(c, order_id, segment_ticks((c.lat, c.lon), pickup, "vers_resto",
+                                                    dur_pick, total_target_s, 0.0, total_target_s,
+                                                    tracking=self.tracking), recorder)
+        await recorder.save(self.r)
+        await self.sleep(PAUSE_S)
+        base_elapsed = dur_pick + PAUSE_S
+        await self.drive(c, order_id, segment_ticks(pickup, drop, "vers_client", dur_drop,
+                                                    max(0.0, total_target_s - base_elapsed),
+                                                    base_elapsed, total_target_s, tracking=self.tracking),
+                         recorder)
+        await recorder.save(self.r, final=True)
+        c.lat, c.lon = drop
+        c.deliveries += 1
+        self.deliveries += 1
+        self.log(f"[{c.name}] 🎯 Livraison terminée pour {order_id}")
+        await heartbeat_many_async(self.r, [(c.name, c.lat, c.lon, False)])
+
+    # ----- roue de temporisation
+
+    def sleep(self, delay_s):
+        fut = asyncio.get_running_loop().create_future()
+        self.wheel.schedule(delay_s, lambda: fut.done() or fut.set_result(None))
+        return fut
+
+    def drive(self, c, order_id, ticks, recorder=None):
+        """Fait avancer un tronçon sur la roue ; le future se termine à l'arrivée."""
+        fut = asyncio.get_running_loop().create_future()
+        chan = CHAN_TRACKING.format(oid=order_id)
+        marked = [None]
+
+        def step():
+            try:
+                while True:
+                    lat, lon, track, wait_s = next(ticks)
+                    c.lat, c.lon = lat, lon
+                    self.ticks += 1
+                    if recorder is not None:
+                        recorder.add(time.time(), lat, lon)
+                        if track and track[0] != marked[0]:
+                            marked[0] = track[0]
+                            recorder.mark(track[0])
+                    if track:
+                        self.outbox.append((chan, encode(tracking_message(order_id, c.name, *track))))
+                    if wait_s:
+                        self.wheel.schedule(wait_s, step)
+                        return
+            except StopIteration:
+                fut.done() or fut.set_result(None)
+            except Exception as e:
+                fut.done() or fut.set_exception(e)
+
+        step()
+        self.flush_soon()  # premier point du tronçon : sans attendre le cran suivant
+        return fut
+
+    def flush_soon(self):
+        if self.outbox and not self.flush_pending:
+            self.flush_pending = True
+            asyncio.get_running_loop().create_task(self.flush())
+
+    async def flush(self):
+        """Publie les TRACK accumulés pendant le cran en un seul pipeline."""
+        self.flush_pending = False
+        if not self.outbox:
+            return
+        batch, self.outbox = self.outbox, []
+        pipe = self.r.pipeline(transaction=False)
+        for chan, payload in batch:
+            pipe.publish(chan, payload)
+        try:
+            with timer(M_TRACK_PUBLISH):
+                await pipe.execute()
+            self.published += len(batch)
+            M_TRACKS.inc(len(batch))
+        except aioredis.RedisError as e:
+            print(f"[FLEET] ⚠️ {len(batch)} TRACK non publiés ({e})")
+
+    # ----- tâches de fond
+
+    async def heartbeat_loop(self):
+        while True:
+            states = [(c.name, c.lat, c.lon, c.state == "delivering") for c in self.couriers.values()]
+            try:
+                for i in range(0, len(states), HEARTBEAT_CHUNK):
+                    await heartbeat_many_async(self.r, states[i:i + HEARTBEAT_CHUNK])
+            except aioredis.RedisError as e:
+                print(f"[FLEET] ⚠️ heartbeats impossibles : {e}")
+            await asyncio.sleep(HEARTBEAT_S)
+
+    async def stats_loop(self):
+        last_t, last_ticks = time.monotonic(), self.ticks
+        while True:
+            await asyncio.sleep(STATS_EVERY_S)
+            now = time.monotonic()
+            rate = (self.ticks - last_ticks) / max(1e-6, now - last_t)
+            last_t, last_ticks = now, self.ticks
+            busy = sum(1 for c in self.couriers.values() if c.state == "delivering")
+            print(f"[FLEET] 📈 {rate:.0f} ticks/s | {busy}/{len(self.couriers)} en course | "
+                  f"{self.offers} annonces, {self.candidatures} candidatures, {self.deliveries} livraisons | "
+                  f"{self.published} TRACK | RSS {rss_bytes() / 2**20:.0f} Mo "
+                  f"(+{(rss_bytes() - self.base_rss) / max(1, len(self.couriers)) / 1024:.1f} Ko/coursier) | "
+                  f"retard roue max {self.wheel.max_late_s * 1000:.0f} ms")
+
+async def amain(args):
+    set_codec(args.codec)
+    if args.metrics_port is not None:
+        serve(args.metrics_port)
+    pool = aioredis.BlockingConnectionPool(host=args.host, port=args.port, db=0,
+                                           decode_responses=True, encoding_errors="surrogateescape",
+                                           max_connections=args.pool)
+    r = aioredis.Redis(connection_pool=pool)
+    fleet = Fleet(r, args.couriers, make_policy(args.policy, args.accept_prob, args.max_km),
+                  speedup=args.speedup, verbose=args.verbose, tracking=args.tracking)
+    try:
+        await fleet.run()
+    finally:
+        await fleet.shutdown()
+        await r.aclose()
+        await pool.disconnect()
+
+def parse_args(argv=None):
+    p = argparse.ArgumentParser(description="Flotte de coursiers simulés (asyncio, un seul processus).")
+    p.add_argument("--couriers", type=int, default=1000)
+    p.add_argument("--policy", choices=POLICIES, default="always",
+                   help="always : tout accepter ; prob : avec une probabilité ; near : restaurant proche")
+    p.add_argument("--accept-prob", type=float, default=0.5)
+    p.add_argument("--max-km", type=float, default=3.0)
+    p.add_argument("--pool", type=int, default=POOL_SIZE, help="connexions Redis partagées")
+    p.add_argument("--speedup", type=float, default=1.0, help="courses N fois plus courtes que l'ETA")
+    p.add_argument("--host", default="localhost")
+    p.add_argument("--port", type=int, default=6379)
+    p.add_argument("--verbose", action="store_true", help="une ligne par sélection / livraison")
+    p.add_argument("--codec", choices=CODECS, default=DEFAULT_CODEC,
+                   help="encodage des messages envoyés (la réception lit tous les codecs)")
+    p.add_argument("--tracking", choices=TRACKING_MODES, default=TRACKING,
+                   help="reckoning : position + vitesse, un TRACK seulement quand l'estimation dérive")
+    p.add_argument("--metrics-port", type=int, help="expose /metrics (Prometheus) sur ce port local")
+    return p.parse_args(argv)
+
+if __name__ == "__main__":
+    try:
+        asyncio.run(amain(parse_args()))
+    except KeyboardInterrupt:
+        print("\n[FLEET] Arrêt.")
+        sys.exit(0)
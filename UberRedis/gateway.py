@@ -0,0 +1,216 @@
+"""
+Passerelle de suivi : une seule souscription Redis pour tous les clients qui suivent une commande.
+
+- PSUBSCRIBE tracking:* et assignments:* sur UNE connexion, quel que soit le nombre de clients ;
+- diffusion aux navigateurs / client.py en Server-Sent Events : GET /track/<order_id>
+  (event: SELECTION / TRACK, data: JSON) ; chaque message est mis en forme une seule fois,
+  puis copié dans la file de chaque abonné ;
+- dernière valeur par commande (sélection + dernier TRACK) envoyée dès l'abonnement,
+  gardée SNAPSHOT_TTL_S après la livraison ;
+- contre-pression par connexion : file bornée (les plus anciens TRACK sont écrasés, seule
+  la position la plus récente compte), et déconnexion d'un client qui n'absorbe plus rien
+  pendant SLOW_CLIENT_S.
+GET /stats renvoie les compteurs en JSON.
+
+    python gateway.py --http-port 8080
+    curl -N http://localhost:8080/track/<order_id>
+    python client.py --gateway http://localhost:8080
+"""
+import asyncio, argparse, json, sys, time
+from collections import OrderedDict
+import redis.asyncio as aioredis
+
+from codec import try_decode
+
+PATTERNS = ("tracking:*", "assignments:*")
+HTTP_PORT = 8080
+QUEUE_MAX = 16            # événements en attente par connexion
+SLOW_CLIENT_S = 10.0      # client bloqué plus longtemps -> déconnecté
+PING_S = 15.0             # commentaire SSE pour garder la connexion (et détecter les clients partis)
+SNAPSHOT_TTL_S = 300      # dernière valeur conservée après la livraison
+SNAPSHOT_MAX = 100_000    # commandes en mémoire au plus (les plus anciennes sortent)
+STATS_EVERY_S = 10.0
+RECONNECT_S = 1.0
+FINAL_STATUS = "vers_client_arrived"
+
+SSE_HEADERS = (b"HTTP/1.1 200 OK\r\n"
+               b"Content-Type: text/event-stream\r\n"
+               b"Cache-Control: no-cache\r\n"
+               b"Connection: keep-alive\r\n"
+               b"Access-Control-Allow-Origin: *\r\n\r\n")
+
+def sse_event(msg):
+    """dict -> octets d'un événement SSE (JSON sur une ligne)."""
+    data = json.dumps(msg, ensure_ascii=False, separators=(",", ":"))
+    return f"event: {msg.get('type', 'message')}\ndata: {data}\n\n".encode("utf-8")
+
+def http_response(status, body, content_type="application/json"):
+    return (f"HTTP/1.1 {status}\r\nContent-Type: {content_type}\r\n"
+            f"Content-Length: {len(body)}\r\nConnection: close\r\n\r\n").encode("latin-1") + body
+
+class Subscriber:
+    """Une connexion SSE : file bornée, les plus anciens événements cèdent la place."""
+    __slots__ = ("queue", "dropped")
+
+    def __init__(self, maxsize):
+        self.queue = asyncio.Queue(maxsize)
+        self.dropped = 0
+
+    def push(self, event):
+        if self.queue.full():
+            self.queue.get_nowait()
+            self.dropped += 1
+        self.queue.put_nowait(event)
+
+class Gateway:
+    def __init__(self, r, queue_max=QUEUE_MAX):
+        self.r = r
+        self.queue_max = queue_max
+        self.subs = {}                  # order_id -> {Subscriber}
+        self.last = OrderedDict()       # order_id -> {"SELECTION": octets, "TRACK": octets}
+        self.received = 0
+        self.sent = 0
+        self.dropped = 0
+        self.slow = 0
+        self.connections = 0
+
+    # ----- côté Redis
+
+    async def listen(self):
+        """Unique souscription ; reconnexion automatique si Redis tombe."""
+        while True:
+            ps = self.r.pubsub()
+            try:
+                await ps.psubscribe(*PATTERNS)
+                print(f"[GATEWAY] 🔌 PSUBSCRIBE {' '.join(PATTERNS)}")
+                async for msg in ps.listen():
+                    if msg.get("type") == "pmessage":
+                        self.on_message(msg["data"])
+            except aioredis.RedisError as e:
+                print(f"[GATEWAY] ⚠️ Redis indisponible ({e}), nouvelle tentative…")
+                await asyncio.sleep(RECONNECT_S)
+            finally:
+                await ps.aclose()
+
+    def on_message(self, raw):
+        msg = try_decode(raw)
+        if msg is None or msg.get("type") not in ("SELECTION", "TRACK") or "order_id" not in msg:
+            return
+        self.received += 1
+        order_id = msg["order_id"]
+        final = msg["type"] == "TRACK" and msg.get("status") == FINAL_STATUS
+        event = (sse_event(msg), final)   # mis en forme une fois pour tous les abonnés
+
+        snap = self.last.setdefault(order_id, {})
+        snap[msg["type"]] = event
+        self.last.move_to_end(order_id)
+        while len(self.last) > SNAPSHOT_MAX:
+            self.last.popitem(last=False)
+        if final:
+            asyncio.get_running_loop().call_later(SNAPSHOT_TTL_S, self.last.pop, order_id, None)
+
+        for sub in self.subs.get(order_id, ()):
+            before = sub.dropped
+            sub.push(event)
+            self.dropped += sub.dropped - before
+
+    # ----- côté HTTP
+
+    async def handle(self, reader, writer):
+        try:
+            line = await asyncio.wait_for(reader.readline(), 10)
+            while (await asyncio.wait_for(reader.readline(), 10)) not in (b"\r\n", b"\n", b""):
+                pass  # en-têtes ignorés
+            parts = line.decode("latin-1").split()
+            path = parts[1].split("?", 1)[0] if len(parts) >= 2 else ""
+            if not parts or parts[0] != "GET":
+                writer.write(http_response("405 Method Not Allowed", b""))
+            elif path == "/stats":
+                writer.write(http_response("200 OK", json.dumps(self.stats()).encode()))
+            elif path.startswith("/track/") and len(path) > len("/track/"):
+                return await self.stream(path[len("/track/"):], writer)
+            else:
+                writer.write(http_response("404 Not Found", b""))
+            await writer.drain()
+        except (asyncio.TimeoutError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+    async def stream(self, order_id, writer):
+        sub = Subscriber(self.queue_max)
+        self.subs.setdefault(order_id, set()).add(sub)
+        self.connections += 1
+        try:
+            writer.write(SSE_HEADERS)
+            snap = self.last.get(order_id, {})
+            for kind in ("SELECTION", "TRACK"):   # dernière valeur connue d'abord
+                if kind in snap:
+                    sub.push(snap[kind])
+            while True:
+                try:
+                    data, final = await asyncio.wait_for(sub.queue.get(), PING_S)
+                except asyncio.TimeoutError:
+                    data, final = b": ping\n\n", False
+                writer.write(data)
+                try:
+                    await asyncio.wait_for(writer.drain(), SLOW_CLIENT_S)
+                except asyncio.TimeoutError:
+                    self.slow += 1
+                    writer.transport.abort()   # tampon plein : on coupe sans attendre
+                    return
+                self.sent += 1
+                if final:
+                    return   # livraison terminée : fin du flux
+        finally:
+            self.connections -= 1
+            subs = self.subs.get(order_id)
+            if subs is not None:
+                subs.discard(sub)
+                if not subs:
+                    del self.subs[order_id]
+
+    def stats(self):
+        return {"connections": self.connections, "orders_watched": len(self.subs),
+                "snapshots": len(self.last), "received": self.received, "sent": self.sent,
+                "dropped": self.dropped, "slow_disconnects": self.slow}
+
+    async def stats_loop(self):
+        last_t, last_sent = time.monotonic(), self.sent
+        while True:
+            await asyncio.sleep(STATS_EVERY_S)
+            now = time.monotonic()
+            rate = (self.sent - last_sent) / max(1e-6, now - last_t)
+            last_t, last_sent = now, self.sent
+            st = self.stats()
+            print(f"[GATEWAY] 📈 {st['connections']} connexions ({st['orders_watched']} commandes) | "
+                  f"{st['received']} reçus, {rate:.0f} événements/s | "
+                  f"{st['dropped']} écrasés, {st['slow_disconnects']} clients lents coupés")
+
+async def amain(args):
+    r = aioredis.Redis(host=args.host, port=args.port, db=0,
+                       decode_responses=True, encoding_errors="surrogateescape")
+    gw = Gateway(r, queue_max=args.queue)
+    server = await asyncio.start_server(gw.handle, args.listen, args.http_port, limit=8192)
+    print(f"[GATEWAY] 🌐 SSE sur http://{args.listen}:{args.http_port}/track/<order_id>")
+    try:
+        async with server:
+            await asyncio.gather(gw.listen(), gw.stats_loop(), server.serve_forever())
+    finally:
+        await r.aclose()
+
+def parse_args(argv=None):
+    p = argparse.ArgumentParser(description="Passerelle SSE : une souscription Redis, N clients qui suivent leur commande.")
+    p.add_argument("--listen", default="0.0.0.0", help="adresse HTTP d'écoute")
+    p.add_argument("--http-port", type=int, default=HTTP_PORT)
+    p.add_argument("--queue", type=int, default=QUEUE_MAX, help="événements en attente par connexion")
+    p.add_argument("--host", default="localhost", help="Redis")
+    p.add_argument("--port", type=int, default=6379, help="Redis")
+    return p.parse_args(argv)
+
+if __name__ == "__main__":
+    try:
+        asyncio.run(amain(parse_args()))
+    except KeyboardInterrupt:
+        print("\n[GATEWAY] Arrêt.")
+        sys.exit(0)
@@ -0,0 +1,120 @@
+"""
+Plusieurs managers en parallèle : zones (zones.py) + bail par commande.
+
+- appartenance : chaque manager inscrit son nom dans le ZSET managers:alive (score = expiration
+  en ms) toutes les MEMBER_HEARTBEAT_S, depuis un thread ; les membres expirés sont retirés ;
+- zones : en Pub/Sub tous les managers reçoivent toutes les commandes, chacun ne traite que
+  celles dont la zone lui revient (HRW sur les membres vivants, rééquilibré à chaque arrivée
+  ou départ). En Streams, le groupe de consommateurs répartit déjà les commandes : pas de zones ;
+- bail : avant d'annoncer, SET lease:order:<id> <manager> NX PX LEASE_MS. Un seul manager
+  l'obtient, même pendant un rééquilibrage où deux se croient propriétaires de la zone.
+  Après la SELECTION le bail est prolongé (DONE_MS) : la commande n'est jamais réaffectée ;
+- reprise : une commande d'une autre zone est gardée TAKEOVER_S ; si personne n'a pris le bail
+  entre-temps (propriétaire tombé et pas encore expiré, ou en retard), ce manager la prend.
+"""
+import threading, time
+from collections import Counter, deque
+import redis
+
+from zones import ZoneMap
+
+MEMBERS_KEY = "managers:alive"
+LEASE_KEY = "lease:order:{oid}"
+MEMBER_HEARTBEAT_S = 1.0
+MEMBER_TTL_MS = 5_000      # sans heartbeat pendant ce délai, le manager sort de la répartition
+LEASE_MS = 60_000          # bail d'une commande en cours d'affectation
+DONE_MS = 3_600_000        # commande affectée : bail gardé 1 h (comme les flux par commande)
+TAKEOVER_S = 3.0           # délai avant de reprendre une commande d'une autre zone
+
+class ZoneGate:
+    """Décide si ce manager traite une commande : zone possédée, puis bail acquis."""
+
+    def __init__(self, r, name, zones=True):
+        self.r = r
+        self.name = name
+        self.zones = ZoneMap(name) if zones else None
+        self.deferred = deque()      # (échéance, commande) d'autres zones, repris si orphelins
+        self.counts = Counter()      # owned, foreign, lost, takeover, rebalance
+        self.stopping = threading.Event()
+        self.thread = threading.Thread(target=self._beat_loop, daemon=True, name="zones-heartbeat")
+
+    def start(self):
+        self.beat()
+        self.thread.start()
+        return self
+
+    def close(self):
+        self.stopping.set()
+        try:
+            self.r.zrem(MEMBERS_KEY, self.name)   # départ immédiat : les zones passent aux autres
+        except redis.RedisError:
+            pass
+
+    # ----- appartenance
+
+    def beat(self):
+        now_ms = int(time.time() * 1000)
+        pipe = self.r.pipeline(transaction=False)
+        pipe.zadd(MEMBERS_KEY, {self.name: now_ms + MEMBER_TTL_MS})
+        pipe.zremrangebyscore(MEMBERS_KEY, "-inf", now_ms)
+        pipe.zrange(MEMBERS_KEY, 0, -1)
+        members = pipe.execute()[-1]
+        if self.zones is not None and self.zones.update(members):
+            self.counts["rebalance"] += 1
+            print(f"[MANAGER] 🗺️ {len(self.zones.members)} manager(s) actif(s), zones réparties à nouveau")
+
+    def _beat_loop(self):
+        while not self.stopping.wait(MEMBER_HEARTBEAT_S):
+            try:
+                self.beat()
+            except redis.RedisError as e:
+                print(f"[MANAGER] ⚠️ heartbeat manager impossible ({e})")
+
+    # ----- commandes
+
+    def _lease(self, order_id):
+        return bool(self.r.set(LEASE_KEY.format(oid=order_id), self.name, nx=True, px=LEASE_MS))
+
+    def claim(self, order_id):
+        ok = self._lease(order_id)
+        if not ok:
+            self.counts["lost"] += 1
+        return ok
+
+    def admit(self, order, pickup):
+        """True si ce manager doit affecter la commande (bail acquis)."""
+        if self.zones is not None:
+            mine, _ = self.zones.owns(*pickup)
+            if not mine:
+                self.counts["foreign"] += 1
+                self.deferred.append((time.monotonic() + TAKEOVER_S, order))
+                return False
+        if self.claim(order["order_id"]):
+            self.counts["owned"] += 1
+            return True
+        return False
+
+    def has_due(self):
+        return bool(self.deferred) and self.deferred[0][0] <= time.monotonic()
+
+    def takeovers(self):
+        """Commandes d'autres zones restées sans bail après TAKEOVER_S, désormais à ce manager."""
+        now, out = time.monotonic(), []
+        while self.deferred and self.deferred[0][0] <= now:
+            _, order = self.deferred.popleft()
+            if self._lease(order["order_id"]):   # échec = le propriétaire l'a prise : cas normal
+                self.counts["takeover"] += 1
+                out.append(order)
+        if out:
+            print(f"[MANAGER] 🛟 {len(out)} commande(s) d'une autre zone reprise(s) (propriétaire absent ou en retard)")
+        return out
+
+    def done(self, order_id):
+        """SELECTION publiée : bail prolongé, la commande ne sera plus réaffectée."""
+        self.r.set(LEASE_KEY.format(oid=order_id), self.name, xx=True, px=DONE_MS)
+
+    def describe(self):
+        c = self.counts
+        zones = f"{len(self.zones.members)} managers" if self.zones is not None else "sans zones"
+        return (f"{zones} | {c['owned']} prises, {c['takeover']} reprises, "
+                f"{c['foreign']} d'autres zones, {c['lost']} baux déjà pris")
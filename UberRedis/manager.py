@@ -1,12 +1,45 @@
-import json, time, math, sys, csv, os
+import math, time, sys, argparse
 import redis
 
+import geo
+from assignment import match_window, greedy_total_eta
+from catalog import open_catalog
+from codec import CODECS, DEFAULT_CODEC, encode, set_codec
+from registry import CHAN_OFFERS_COURIER, nearest_idle, nearest_stackable
+from route_planner import Planner, router_s, straight_s, unpack
+from routing import open_router
+from leases import ZoneGate
+from ratings import LEADERBOARD_REFRESH_S, current_rating, refresh_every
+from metrics import Counter, Histogram, lag_since, serve, timer
+from transport import TRANSPORTS, make_transport, consumer_name
+from window import POLICIES, Window, WindowStats, make_policy
+
 # ----- Réglages ETA -----
 VITESSE_KMH = 20.0        # vitesse moyenne
 DELAI_FIXE_MIN = 0.5      # délai fixe additionnel
-TIMEOUT_S = 15            # fenêtre de candidatures
+TIMEOUT_S = 15            # fenêtre de candidatures (au plus)
+WINDOW_POLICY = "adaptive"  # fermeture anticipée de la fenêtre (window.py) ; "fixed" = toujours TIMEOUT_S
 REWARD_EUR = 8.5
 CSV_PATH = "menus.csv"
+GEO_DISPATCH = True       # annonces aux k coursiers libres proches (False = diffusion à tous)
+BATCH_WINDOW_S = 2.0      # mode batch : durée de regroupement des commandes
+ROUTER = None             # routing.Router (--graph) : ETA par les rues ; None = vol d'oiseau
+STACKING = True           # annonce aussi aux coursiers en course dont la tournée absorbe la commande
+# insertion dans les tournées (route_planner.py) ; le délai fixe compte comme arrêt au restaurant
+PLANNER = Planner(straight_s(VITESSE_KMH), pickup_s=DELAI_FIXE_MIN * 60)
+
+# ----- Métriques (metrics.py, --metrics-port) -----
+M_ORDERS = Counter("ubeer_manager_orders_total", "Commandes reçues")
+M_ASSIGNED = Counter("ubeer_manager_assignments_total", "Commandes affectées")
+M_UNASSIGNED = Counter("ubeer_manager_unassigned_total", "Commandes sans candidature")
+M_CANDS = Histogram("ubeer_manager_candidates_per_order", "Candidatures reçues par fenêtre", unit=1, highest=1024)
+M_WINDOW = Histogram("ubeer_manager_window_seconds", "Durée de la fenêtre de candidatures", unit=1e-3)
+M_ORDER_LAG = Histogram("ubeer_manager_order_lag_seconds", "Retard client -> manager des commandes")
+M_CAND_LAG = Histogram("ubeer_manager_candidate_lag_seconds", "Retard coursier -> manager des candidatures")
+M_RATING = Histogram("ubeer_manager_rating_lookup_seconds", "Lecture des notes (get_rating_average[s])")
+M_STACK_OFFERS = Counter("ubeer_manager_stack_offers_total", "Annonces à des coursiers en course (tournées)")
+M_STACKED = Counter("ubeer_manager_stacked_total", "Commandes affectées à un coursier en course")
+M_STACK_PLAN = Histogram("ubeer_manager_stack_plan_seconds", "Insertion dans les tournées proches, par commande")
 
 # ----- Canaux -----
 CHAN_ORDERS = "orders"                 # client -> manager
@@ -15,60 +48,143 @@ CHAN_CANDIDATES = "candidates:{oid}"   # coursiers -> manager
 CHAN_ASSIGN = "assignments:{oid}"      # manager -> client + coursier
 
 def rconn():
-    return redis.Redis(host="localhost", port=6379, db=0, decode_responses=True)
-
-def haversine_km(a_lat, a_lon, b_lat, b_lon):
-    R = 6371.0
-    dlat = math.radians(b_lat - a_lat)
-    dlon = math.radians(b_lon - a_lon)
-    lat1 = math.radians(a_lat); lat2 = math.radians(b_lat)
-    h = math.sin(dlat/2)**2 + math.cos(lat1)*math.cos(lat2)*math.sin(dlon/2)**2
-    return 2 * R * math.asin(math.sqrt(h))
+    return redis.Redis(host="localhost", port=6379, db=0, decode_responses=True, encoding_errors="surrogateescape")
 
 def eta_minutes(c_pos, pickup, drop):
-    d1 = haversine_km(c_pos[0], c_pos[1], pickup[0], pickup[1])
-    d2 = haversine_km(pickup[0], pickup[1], drop[0], drop[1])
-    minutes = ((d1 + d2) / max(1e-6, VITESSE_KMH)) * 60.0 + DELAI_FIXE_MIN
-    return max(1, int(round(minutes)))
+    if ROUTER is not None:
+        return ROUTER.eta_minutes(c_pos, pickup, drop, DELAI_FIXE_MIN)
+    return geo.eta_minutes(c_pos, pickup, drop, VITESSE_KMH, DELAI_FIXE_MIN)
+
+def eta_minutes_batch(positions, pickup, drop):
+    """ETA de N coursiers pour une commande, en un seul appel NumPy (un arbre de retrait par les rues)."""
+    lats = [p[0] for p in positions]; lons = [p[1] for p in positions]
+    if ROUTER is not None:
+        eta = ROUTER.eta_matrix(lats, lons, [pickup[0]], [pickup[1]], [drop[0]], [drop[1]], DELAI_FIXE_MIN)
+    else:
+        eta = geo.eta_matrix(lats, lons, [pickup[0]], [pickup[1]], [drop[0]], [drop[1]],
+                             VITESSE_KMH, DELAI_FIXE_MIN)
+    return [int(e) for e in eta[:, 0]]
 
 def get_rating_average(r, courier_name):
-    data = r.hgetall(f"ratings:{courier_name}")  # fields: sum, count, avg
+    with timer(M_RATING):
+        data = r.hgetall(f"ratings:{courier_name}")  # fields: sum, count, avg, dsum, dweight, dts (ratings.py)
     if not data:
         return 3.0  # neutre par défaut si pas encore noté
     try:
+        if "dsum" in data:
+            return current_rating(float(data["dsum"]), float(data["dweight"]), float(data["dts"]))
         return float(data.get("avg", 3.0))
     except Exception:
         return 3.0
 
-def normalize_name(name: str) -> str:
-    return " ".join((name or "").strip().split()).casefold()
+def get_rating_averages(r, couriers):
+    """Notes récentes (à cet instant) de plusieurs coursiers en un aller-retour (pipeline), sinon moyenne."""
+    pipe = r.pipeline(transaction=False)
+    for name in couriers:
+        pipe.hmget(f"ratings:{name}", "dsum", "dweight", "dts", "avg")
+    with timer(M_RATING):
+        raws = pipe.execute()
+    return rating_values(couriers, raws)
+
+def rating_values(couriers, raws):
+    """Réponses HMGET dsum dweight dts avg -> {coursier: note} (3.0 si jamais noté)."""
+    out, now = {}, time.time()
+    for name, (dsum, dweight, dts, avg) in zip(couriers, raws):
+        try:
+            if dsum is not None:
+                out[name] = current_rating(float(dsum), float(dweight), float(dts), now)
+            else:
+                out[name] = float(avg) if avg is not None else 3.0
+        except Exception:
+            out[name] = 3.0
+    return out
 
-def load_restos_from_csv(path):
-    """Retourne un dict clé=nom_normalisé -> (lat, lon)"""
-    mapping = {}
-    if not os.path.exists(path):
+def load_restos(path=CSV_PATH):
+    """Catalogue partagé (instantané mmap de menus.csv, voir catalog.py), None si pas de CSV."""
+    try:
+        cat = open_catalog(path)
+    except FileNotFoundError:
         print(f"[MANAGER] ⚠️ CSV introuvable: {path}.")
-        return mapping
-    with open(path, newline='', encoding="utf-8") as f:
-        reader = csv.DictReader(f)
-        for row in reader:
-            name_raw = (row.get("restaurant") or "").strip()
-            if not name_raw:
-                continue
-            key = normalize_name(name_raw)
-            try:
-                lat = float(row["latitude"]); lon = float(row["longitude"])
-            except Exception:
-                continue
-            if key not in mapping:
-                mapping[key] = (lat, lon)
-    print(f"[MANAGER] CSV chargé : {len(mapping)} restaurants uniques.")
-    return mapping
+        return None
+    print(f"[MANAGER] Catalogue chargé : {len(cat)} restaurants uniques.")
+    return cat
+
+def resolve_pickup(restos, order):
+    """Coordonnées du resto (catalogue) avec repli sur celles envoyées par le client."""
+    i = restos.find(order["restaurant"]["name"]) if restos is not None else None
+    if i is not None:
+        return restos.coords(i)
+    return (float(order["restaurant"]["lat"]), float(order["restaurant"]["lon"]))
+
+def build_offer(order_id, resto_name, pickup, drop):
+    return {
+        "type": "OFFER",
+        "order_id": order_id,
+        "restaurant": {"name": resto_name, "lat": pickup[0], "lon": pickup[1]},
+        "dropoff": {"lat": drop[0], "lon": drop[1]},
+        "reward_eur": REWARD_EUR
+    }
+
+def build_selection(order_id, chosen, pickup, drop):
+    return {
+        "type": "SELECTION",
+        "order_id": order_id,
+        "courier_id": chosen["courier"],
+        "courier_name": chosen["courier"],
+        "eta_min": int(chosen["eta_min"]),
+        "reward_eur": REWARD_EUR,
+        "pickup": {"lat": pickup[0], "lon": pickup[1]},
+        "dropoff": {"lat": drop[0], "lon": drop[1]},
+        "assigned_at": int(time.time())
+    }
+
+def publish_offer(r, offer, pickup):
+    """
+    Envoie l'annonce sur offers:<prenom> des coursiers libres les plus proches.
+    Repli sur le canal global si aucun coursier n'est indexé (anciens coursiers sans heartbeat).
+    Retourne la liste des coursiers ciblés ([] = diffusion globale).
+    """
+    targets = nearest_idle(r, pickup[0], pickup[1]) if GEO_DISPATCH else []
+    payload = encode(offer)  # encodé une fois pour tous les coursiers ciblés
+    if not targets:
+        r.publish(CHAN_OFFERS, payload)
+        return []
+    pipe = r.pipeline(transaction=False)
+    for name in targets:
+        pipe.publish(CHAN_OFFERS_COURIER.format(name=name), payload)
+    pipe.execute()
+    return targets
+
+def stack_candidates(r, order_id, pickup, drop):
+    """
+    Coursiers en course proches du retrait dont la tournée absorbe la commande dans les limites
+    de détour et d'heures promises (route_planner.py) -> {nom: {"eta_min", "detour_s"}}.
+    """
+    now = time.time()
+    out = {}
+    with timer(M_STACK_PLAN):
+        for name, pos, raw in nearest_stackable(r, pickup[0], pickup[1]):
+            ins = PLANNER.insert(pos, now, unpack(raw), order_id, pickup, drop, locked=1)
+            if ins is not None:
+                out[name] = {"eta_min": max(1, math.ceil((ins.drop_at - now) / 60)),
+                             "detour_s": int(ins.added_s)}
+    return out
+
+def publish_stack_offers(r, offer, stacked):
+    """Annonce sur offers:<prenom> de chaque coursier en course retenu, avec son détour et son ETA."""
+    if not stacked:
+        return
+    pipe = r.pipeline(transaction=False)
+    for name, terms in stacked.items():
+        pipe.publish(CHAN_OFFERS_COURIER.format(name=name), encode(dict(offer, stack=terms)))
+    pipe.execute()
+    M_STACK_OFFERS.inc(len(stacked))
 
 def prompt_select_or_auto(cands_sorted):
     print("\n[MANAGER] 📊 Candidatures (tri ETA ↑ puis Note ↓):")
     for i, c in enumerate(cands_sorted, 1):
-        print(f" {i}) {c['courier']} | ETA={c['eta_min']} min | Note={c['rating']:.2f}")
+        stacked = f" | en course, détour +{c['detour_s'] / 60:.1f} min" if c.get("detour_s") is not None else ""
+        print(f" {i}) {c['courier']} | ETA={c['eta_min']} min | Note={c['rating']:.2f}{stacked}")
     try:
         raw = input("[MANAGER] Choisir un livreur (1..N) ou Entrée pour auto : ").strip()
     except EOFError:
@@ -84,99 +200,325 @@ def prompt_select_or_auto(cands_sorted):
     print("[MANAGER] Choix invalide → sélection auto.")
     return cands_sorted[0]
 
-def main():
-    r = rconn()
-    restos = load_restos_from_csv(CSV_PATH)
+def parse_order(got):
+    """(id, message) lu sur le transport -> dict ORDER, ou None."""
+    if not got:
+        return None
+    order = got[1]
+    if order.get("type") != "ORDER":
+        return None
+    M_ORDERS.inc()
+    lag_since(M_ORDER_LAG, order.get("sent_ts"))
+    return order
+
+def parse_candidature(got):
+    """(id, message) lu sur le transport -> (order_id, courier, (lat, lon)), ou None."""
+    if not got:
+        return None
+    cand = got[1]
+    try:
+        if cand.get("type") != "CANDIDATURE":
+            return None
+        lag_since(M_CAND_LAG, cand.get("sent_ts"))
+        return cand["order_id"], cand["courier"], (float(cand["position"]["lat"]), float(cand["position"]["lon"]))
+    except Exception:
+        return None
 
-    ps = r.pubsub()
-    ps.subscribe(CHAN_ORDERS)
-    print("[MANAGER] En attente de commandes sur", CHAN_ORDERS)
+def observe_window(w):
+    """Fenêtre fermée -> métriques (durée, candidatures reçues)."""
+    M_WINDOW.observe(w.closed_at - w.opened)
+    M_CANDS.observe(w.n)
 
-    for msg in ps.listen():
-        if msg.get("type") != "message":
-            continue
-        try:
-            order = json.loads(msg["data"])
-        except Exception:
+def collect_orders(orders_in, window_s, idle=None):
+    """
+    Attend une première commande puis regroupe celles qui arrivent pendant window_s.
+    Retourne [(id, order)] ; les id servent à acquitter (transport streams).
+    idle() est appelé à chaque attente sans commande ; s'il retourne True avant la première
+    commande, on rend la main tout de suite (travail en attente ailleurs, ex. reprises de zones).
+    """
+    batch = []
+    deadline = None
+    while deadline is None or time.monotonic() < deadline:
+        timeout = 1.0 if deadline is None else max(0.001, deadline - time.monotonic())
+        got = orders_in.get(timeout)
+        order = parse_order(got)
+        if order is None:
+            if got:
+                orders_in.ack(got[0])
+            elif idle is not None and idle() and deadline is None:
+                return batch
             continue
-        if order.get("type") != "ORDER":
+        batch.append((got[0], order))
+        if deadline is None:
+            deadline = time.monotonic() + window_s
+    return batch
+
+def print_transport_stats(transport):
+    st = transport.stats()
+    if st:
+        print(f"[MANAGER] 📊 flux orders : longueur={st['length']} en cours={st['pending']} "
+              f"lag={st['lag']} managers={st['consumers']}")
+
+class WindowShadows:
+    """
+    Fenêtres fermées avant TIMEOUT_S : on garde leur abonnement jusqu'à l'échéance fixe pour
+    savoir quelles candidatures la fenêtre fixe aurait encore vues (qualité perdue, window.py).
+    """
+
+    def __init__(self, r):
+        self.r = r
+        self.stats = WindowStats()
+        self.open = []   # (échéance, abonnement, {order_id: (fenêtre, pickup, drop)})
+
+    def keep(self, cands_in, windows):
+        if all(w.reason == "timeout" for w, _, _ in windows.values()):
+            cands_in.close()
+            return
+        self.open.append((max(w.deadline for w, _, _ in windows.values()), cands_in, windows))
+
+    def settle(self, force=False):
+        now = time.monotonic()
+        due = [s for s in self.open if force or s[0] <= now]
+        if not due:
+            return
+        self.open = [s for s in self.open if not (force or s[0] <= now)]
+        for _, cands_in, windows in due:
+            late = []
+            while (got := cands_in.get(0)) is not None:
+                cand = parse_candidature(got)
+                if cand and cand[0] in windows:
+                    late.append(cand)
+            cands_in.close()
+            ratings = get_rating_averages(self.r, sorted({c[1] for c in late})) if late else {}
+            for order_id, courier, pos in late:
+                w, pickup, drop = windows[order_id]
+                w.add(eta_minutes(pos, pickup, drop), ratings[courier])
+        self.stats.settle(now, force)
+        print(f"[MANAGER] ⏱️ fenêtres : {self.stats.line()}")
+
+def run_batch(r, transport, restos, orders_in, window_s, policy=None, gate=None):
+    """
+    Mode batch : les commandes arrivées pendant window_s sont annoncées ensemble,
+    puis affectées globalement (un coursier au plus par commande, ETA totale minimale).
+    La collecte s'arrête quand la fenêtre de chaque commande est fermée (window.py).
+    gate (leases.ZoneGate) : seules les commandes de nos zones dont on obtient le bail.
+    """
+    policy = policy or make_policy(WINDOW_POLICY, TIMEOUT_S)
+    shadows = WindowShadows(r)
+    print(f"[MANAGER] Mode batch : fenêtre de regroupement {window_s:.1f} s, "
+          f"candidatures {policy.timeout_s} s max ({policy.name})")
+
+    def idle():
+        shadows.settle()
+        return gate is not None and gate.has_due()
+
+    while True:
+        batch = collect_orders(orders_in, window_s, idle=idle)
+        orders, mine = {}, []
+        for _, order in batch:
+            drop = (float(order["customer"]["lat"]), float(order["customer"]["lon"]))
+            pickup = resolve_pickup(restos, order)
+            if gate is None or gate.admit(order, pickup):
+                orders[order["order_id"]] = (pickup, drop)
+                mine.append(order)
+        for order in gate.takeovers() if gate is not None else []:
+            orders[order["order_id"]] = (resolve_pickup(restos, order),
+                                         (float(order["customer"]["lat"]), float(order["customer"]["lon"])))
+            mine.append(order)
+        if not orders:
+            for msg_id, _ in batch:
+                orders_in.ack(msg_id)
             continue
 
-        order_id = order["order_id"]
-        resto_name = order["restaurant"]["name"]
-        drop = (float(order["customer"]["lat"]), float(order["customer"]["lon"]))
-
-        key = normalize_name(resto_name)
-        if key in restos:
-            pickup = restos[key]
-        else:
-            # fallback coordonnées envoyées par le client
-            pickup = (float(order["restaurant"]["lat"]), float(order["restaurant"]["lon"]))
-
-        print(f"\n[MANAGER] 📣 Commande {order_id} ({resto_name}) → annonce envoyée aux coursiers…")
-
-        # 1) Annonce globale
-        offer = {
-            "type": "OFFER",
-            "order_id": order_id,
-            "restaurant": {"name": resto_name, "lat": pickup[0], "lon": pickup[1]},
-            "dropoff": {"lat": drop[0], "lon": drop[1]},
-            "reward_eur": REWARD_EUR
-        }
-        r.publish(CHAN_OFFERS, json.dumps(offer))
-
-        # 2) Collecte candidatures
-        cand_chan = CHAN_CANDIDATES.format(oid=order_id)
-        ps_cand = r.pubsub()
-        ps_cand.subscribe(cand_chan)
-
-        cands = []
+        cands_in = transport.subscribe(*[CHAN_CANDIDATES.format(oid=oid) for oid in orders])
+        windows = {}
+        for order in mine:
+            pickup, drop = orders[order["order_id"]]
+            targets = publish_offer(r, build_offer(order["order_id"], order["restaurant"]["name"], pickup, drop), pickup)
+            windows[order["order_id"]] = (Window(policy, expected=len(targets)), pickup, drop)
+        print(f"\n[MANAGER] 📣 {len(orders)} commande(s) annoncée(s), collecte des candidatures…")
+
+        cands, ratings = [], {}
         start = time.monotonic()
-        while time.monotonic() - start < TIMEOUT_S:
-            m = ps_cand.get_message(timeout=0.2)
-            if not m or m.get("type") != "message":
-                continue
-            try:
-                cand = json.loads(m["data"])
-            except Exception:
+        while not all([w.check() for w, _, _ in windows.values()]):
+            wait = min(w.wait_s() for w, _, _ in windows.values() if w.reason is None)
+            cand = parse_candidature(cands_in.get(max(0.001, min(0.2, wait))))
+            if cand is None or cand[0] not in windows:
                 continue
-            if cand.get("type") != "CANDIDATURE" or cand.get("order_id") != order_id:
+            order_id, courier, pos = cand
+            w, pickup, drop = windows[order_id]
+            if courier not in ratings:
+                ratings[courier] = get_rating_average(r, courier)
+            if w.reason is None:   # fenêtre de cette commande encore ouverte
+                cands.append(cand)
+            w.add(eta_minutes(pos, pickup, drop), ratings[courier])
+        for w, _, _ in windows.values():
+            observe_window(w)
+            shadows.stats.record(w)
+        shadows.keep(cands_in, windows)
+        print(f"[MANAGER] ⏱️ collecte terminée en {time.monotonic() - start:.1f} s")
+        t0 = time.perf_counter()
+        chosen = match_window(orders, cands, ratings, VITESSE_KMH, DELAI_FIXE_MIN, ROUTER)
+        solve_ms = (time.perf_counter() - t0) * 1000
+        greedy = greedy_total_eta(orders, cands, ratings, VITESSE_KMH, DELAI_FIXE_MIN, ROUTER)
+        total = sum(c["eta_min"] for c in chosen.values())
+        print(f"[MANAGER] 🧮 {len(cands)} candidature(s), {len(chosen)}/{len(orders)} affectée(s) en {solve_ms:.1f} ms "
+              f"| ETA totale {total} min (glouton : {greedy} min)")
+
+        for order_id, (pickup, drop) in orders.items():
+            c = chosen.get(order_id)
+            if c is None:
+                M_UNASSIGNED.inc()
+                print(f"[MANAGER] 😕 {order_id} : aucune candidature disponible.")
                 continue
+            assign = build_selection(order_id, c, pickup, drop)
+            transport.publish(CHAN_ASSIGN.format(oid=order_id), assign)
+            M_ASSIGNED.inc()
+            if gate is not None:
+                gate.done(order_id)
+            print(f"[MANAGER] ✅ {order_id} → {c['courier']} (ETA={c['eta_min']} min, Note={c['rating']:.2f})")
+        for msg_id, _ in batch:
+            orders_in.ack(msg_id)
+        print_transport_stats(transport)
+        if gate is not None:
+            print(f"[MANAGER] 🗺️ {gate.describe()}")
+        if ROUTER is not None:
+            print(f"[MANAGER] 🛣️ {ROUTER.describe()}")
+
+def dispatch_one(r, transport, restos, order, policy=None, shadows=None):
+    """Annonce, collecte des candidatures (fenêtre window.py), sélection et affectation d'une commande."""
+    policy = policy or make_policy(WINDOW_POLICY, TIMEOUT_S)
+    order_id = order["order_id"]
+    resto_name = order["restaurant"]["name"]
+    drop = (float(order["customer"]["lat"]), float(order["customer"]["lon"]))
+
+    pickup = resolve_pickup(restos, order)
 
-            courier = cand["courier"]
-            pos = (float(cand["position"]["lat"]), float(cand["position"]["lon"]))
-            eta_min = eta_minutes(pos, pickup, drop)
-            rating = get_rating_average(r, courier)
+    # 1) Souscription aux candidatures AVANT l'annonce (aucune réponse perdue)
+    cands_in = transport.subscribe(CHAN_CANDIDATES.format(oid=order_id))
 
-            cands.append({"courier": courier, "eta_min": eta_min, "rating": rating})
-            print(f"[MANAGER] 📥 {courier} (ETA={eta_min} min, Note={rating:.2f})")
+    # 2) Annonce ciblée (k coursiers libres proches) ou globale, + coursiers en course
+    #    dont la tournée peut absorber la commande (insertion la moins chère, route_planner.py)
+    offer = build_offer(order_id, resto_name, pickup, drop)
+    stacked = stack_candidates(r, order_id, pickup, drop) if STACKING else {}
+    targets = publish_offer(r, offer, pickup)
+    publish_stack_offers(r, offer, stacked)
+    en_route = f" + {len(stacked)} en course" if stacked else ""
+    if targets:
+        print(f"\n[MANAGER] 📣 Commande {order_id} ({resto_name}) → annonce envoyée à {len(targets)} coursier(s) proche(s){en_route}…")
+    else:
+        print(f"\n[MANAGER] 📣 Commande {order_id} ({resto_name}) → annonce envoyée à tous les coursiers{en_route}…")
 
-        if not cands:
-            print("[MANAGER] 😕 Aucune candidature reçue.")
+    cands = []
+    w = Window(policy, expected=len(targets) + len(stacked) if targets else 0)
+    while w.check() is None:
+        cand = parse_candidature(cands_in.get(max(0.001, min(0.2, w.wait_s()))))
+        if cand is None or cand[0] != order_id:
             continue
 
-        cands.sort(key=lambda c: (c["eta_min"], -c["rating"]))
-        chosen = prompt_select_or_auto(cands)
-
-        # 3) Affectation
-        assign = {
-            "type": "SELECTION",
-            "order_id": order_id,
-            "courier_id": chosen["courier"],
-            "courier_name": chosen["courier"],
-            "eta_min": int(chosen["eta_min"]),
-            "reward_eur": REWARD_EUR,
-            "pickup": {"lat": pickup[0], "lon": pickup[1]},
-            "dropoff": {"lat": drop[0], "lon": drop[1]},
-            "assigned_at": int(time.time())
-        }
-        assign_chan = CHAN_ASSIGN.format(oid=order_id)
-        r.publish(assign_chan, json.dumps(assign))
-        print(f"[MANAGER] ✅ Affecté : {chosen['courier']} (ETA={chosen['eta_min']} min, Note={chosen['rating']:.2f})")
+        _, courier, pos = cand
+        terms = stacked.get(courier)   # en course : ETA de sa tournée avec la commande insérée
+        eta_min = terms["eta_min"] if terms else eta_minutes(pos, pickup, drop)
+        rating = get_rating_average(r, courier)
+
+        cands.append({"courier": courier, "eta_min": eta_min, "rating": rating,
+                      "detour_s": terms["detour_s"] if terms else None})
+        w.add(eta_min, rating)
+        print(f"[MANAGER] 📥 {courier} (ETA={eta_min} min, Note={rating:.2f})"
+              + (f" | en course, détour +{terms['detour_s'] / 60:.1f} min" if terms else ""))
+
+    print(f"[MANAGER] ⏱️ Fenêtre fermée après {w.closed_at - w.opened:.1f} s ({w.reason}, {w.n} candidature(s))")
+    observe_window(w)
+    if shadows is not None:
+        shadows.stats.record(w)
+        shadows.keep(cands_in, {order_id: (w, pickup, drop)})
+    else:
+        cands_in.close()
+    if not cands:
+        M_UNASSIGNED.inc()
+        print("[MANAGER] 😕 Aucune candidature reçue.")
+        return
+
+    cands.sort(key=lambda c: (c["eta_min"], -c["rating"]))
+    chosen = prompt_select_or_auto(cands)
+
+    # 3) Affectation
+    assign = build_selection(order_id, chosen, pickup, drop)
+    transport.publish(CHAN_ASSIGN.format(oid=order_id), assign)
+    M_ASSIGNED.inc()
+    if chosen["detour_s"] is not None:
+        M_STACKED.inc()
+    print(f"[MANAGER] ✅ Affecté : {chosen['courier']} (ETA={chosen['eta_min']} min, Note={chosen['rating']:.2f})")
+    return chosen
+
+def dispatch_guarded(r, transport, restos, order, policy, shadows, gate):
+    """Zone + bail (gate), puis dispatch_one ; une commande mal formée est signalée et ignorée."""
+    try:
+        if gate.admit(order, resolve_pickup(restos, order)):
+            if dispatch_one(r, transport, restos, order, policy, shadows):
+                gate.done(order["order_id"])
+    except (KeyError, TypeError, ValueError) as e:
+        print(f"[MANAGER] ⚠️ Commande ignorée ({e!r})")
+
+def main(batch=False, window_s=BATCH_WINDOW_S, transport_name="pubsub", window_policy=WINDOW_POLICY):
+    r = rconn()
+    restos = load_restos(CSV_PATH)
+    transport = make_transport(r, transport_name)
+    policy = make_policy(window_policy, TIMEOUT_S)
+
+    name = consumer_name()
+    orders_in = transport.consume_orders(name)
+    # Pub/Sub : chaque manager reçoit tout, les zones partagent le travail ; Streams : le groupe s'en charge
+    gate = ZoneGate(r, name, zones=transport.name == "pubsub").start()
+    refresh_every(r, LEADERBOARD_REFRESH_S, name)   # classement des notes récentes (un manager à la fois)
+    print(f"[MANAGER] En attente de commandes sur {CHAN_ORDERS} (transport {transport.name}, fenêtre {policy.name}, {name})")
+    try:
+        if batch:
+            return run_batch(r, transport, restos, orders_in, window_s, policy, gate)
+
+        shadows = WindowShadows(r)
+        while True:
+            got = orders_in.get(1.0)
+            shadows.settle()
+            for order in gate.takeovers():
+                dispatch_guarded(r, transport, restos, order, policy, shadows, gate)
+            order = parse_order(got)
+            if order is None:
+                if got:
+                    orders_in.ack(got[0])
+                continue
+            # commande mal formée : acquittée quand même, sinon elle serait reprise indéfiniment
+            dispatch_guarded(r, transport, restos, order, policy, shadows, gate)
+            orders_in.ack(got[0])
+            print_transport_stats(transport)
+    finally:
+        gate.close()
 
 if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description="Manager Redis : annonces, candidatures, attribution.")
+    ap.add_argument("--batch", action="store_true", help="affectation globale par fenêtre (Hongrois) au lieu du tri par commande")
+    ap.add_argument("--batch-window", type=float, default=BATCH_WINDOW_S, help="durée de regroupement des commandes (s)")
+    ap.add_argument("--transport", choices=sorted(TRANSPORTS), default="pubsub",
+                    help="streams : groupe de consommateurs, plusieurs managers se partagent les commandes")
+    ap.add_argument("--codec", choices=CODECS, default=DEFAULT_CODEC,
+                    help="encodage des messages envoyés (la réception lit tous les codecs)")
+    ap.add_argument("--window-policy", choices=POLICIES, default=WINDOW_POLICY,
+                    help="adaptive : fermeture de la fenêtre de candidatures dès que possible (window.py)")
+    ap.add_argument("--graph", help="graphe de rues compilé (routing.py) : ETA par les rues")
+    ap.add_argument("--no-stack", action="store_true",
+                    help="n'annonce qu'aux coursiers libres (pas d'ajout aux tournées en cours)")
+    ap.add_argument("--metrics-port", type=int, help="expose /metrics (Prometheus) sur ce port local")
+    args = ap.parse_args()
+    set_codec(args.codec)
+    if args.metrics_port is not None:
+        serve(args.metrics_port)
+    STACKING = not args.no_stack
+    if args.graph:
+        ROUTER = open_router(args.graph, VITESSE_KMH)
+        PLANNER = Planner(router_s(ROUTER), pickup_s=DELAI_FIXE_MIN * 60)
     try:
-        main()
+        main(batch=args.batch, window_s=args.batch_window, transport_name=args.transport,
+             window_policy=args.window_policy)
     except KeyboardInterrupt:
         print("\n[MANAGER] Arrêt.")
         sys.exit(0)
@@ -0,0 +1,271 @@
+import asyncio, argparse, time, sys
+import redis.asyncio as aioredis
+
+import manager
+from codec import CODECS, DEFAULT_CODEC, encode, set_codec, try_decode
+from registry import CHAN_OFFERS_COURIER, nearest_idle_async
+from routing import open_router
+from manager import (
+    CSV_PATH, TIMEOUT_S, WINDOW_POLICY, CHAN_ORDERS, CHAN_OFFERS, CHAN_ASSIGN,
+    eta_minutes_batch, load_restos, rating_values, resolve_pickup,
+    build_offer, build_selection, prompt_select_or_auto,
+    M_ORDERS, M_ASSIGNED, M_UNASSIGNED, M_ORDER_LAG, M_CAND_LAG, M_RATING, observe_window,
+)
+from metrics import lag_since, serve, timer
+from ratings import LEADERBOARD_REFRESH_S, refresh_every
+from window import POLICIES, Window, WindowStats, make_policy
+
+MAX_WINDOWS = 500        # fenêtres de candidatures ouvertes en même temps
+STATS_EVERY = 50         # résumé des latences toutes les N affectations
+
+# Une seule souscription pour toutes les fenêtres (au lieu d'un pubsub par commande)
+PATTERN_CANDIDATES = "candidates:*"
+
+def arconn():
+    return aioredis.Redis(host="localhost", port=6379, db=0, decode_responses=True, encoding_errors="surrogateescape")
+
+async def get_ratings(r, couriers):
+    """Notes récentes (à cet instant) de plusieurs coursiers en un seul aller-retour (pipeline), sinon moyenne."""
+    pipe = r.pipeline(transaction=False)
+    for name in couriers:
+        pipe.hmget(f"ratings:{name}", "dsum", "dweight", "dts", "avg")
+    with timer(M_RATING):
+        raws = await pipe.execute()
+    return rating_values(couriers, raws)
+
+async def publish_offer(r, offer, pickup):
+    """Version asyncio de manager.publish_offer()."""
+    targets = await nearest_idle_async(r, pickup[0], pickup[1]) if manager.GEO_DISPATCH else []
+    payload = encode(offer)
+    if not targets:
+        await r.publish(CHAN_OFFERS, payload)
+        return []
+    pipe = r.pipeline(transaction=False)
+    for name in targets:
+        pipe.publish(CHAN_OFFERS_COURIER.format(name=name), payload)
+    await pipe.execute()
+    return targets
+
+class Bucket:
+    """Candidatures d'une fenêtre ; event réveille la tâche de la commande à chaque arrivée."""
+    __slots__ = ("cands", "event")
+
+    def __init__(self):
+        self.cands = []
+        self.event = asyncio.Event()
+
+def percentile(values, p):
+    if not values:
+        return 0.0
+    s = sorted(values)
+    k = min(len(s) - 1, max(0, int(round(p / 100.0 * (len(s) - 1)))))
+    return s[k]
+
+class Dispatcher:
+    """
+    Moteur d'attribution concurrent :
+      - un lecteur unique pour `orders` + `candidates:*`
+      - une tâche par commande qui garde sa fenêtre ouverte jusqu'à sa fermeture (window.py :
+        au plus timeout_s, plus tôt avec la politique adaptive)
+      - sélection auto (headless) ou via le prompt, sérialisé entre les fenêtres
+    Une fenêtre fermée tôt reste à l'écoute jusqu'à timeout_s pour mesurer la qualité perdue.
+    """
+
+    def __init__(self, r, restos, auto=True, timeout_s=TIMEOUT_S, max_windows=MAX_WINDOWS, verbose=True,
+                 window_policy=WINDOW_POLICY):
+        self.r = r
+        self.verbose = verbose
+        self.restos = restos
+        self.auto = auto
+        self.timeout_s = timeout_s
+        self.policy = make_policy(window_policy, timeout_s)
+        self.window_stats = WindowStats()
+        self.max_windows = max_windows
+        self.slots = asyncio.Semaphore(max_windows)
+        self.prompt_lock = asyncio.Lock()
+        self.windows = {}       # order_id -> Bucket (fenêtres ouvertes et fermées tôt)
+        self.tasks = set()
+        self.latencies = []     # secondes, réception ORDER -> publication SELECTION
+        self.started = time.monotonic()
+        self.assigned = 0
+        self.unassigned = 0
+
+    async def run(self):
+        ps = self.r.pubsub()
+        await ps.subscribe(CHAN_ORDERS)
+        await ps.psubscribe(PATTERN_CANDIDATES)
+        mode = "auto" if self.auto else "manuel"
+        print(f"[MANAGER] En attente de commandes sur {CHAN_ORDERS} (mode {mode}, {self.max_windows} fenêtres max, "
+              f"fenêtre {self.policy.name} ≤ {self.timeout_s} s)")
+        try:
+            async for msg in ps.listen():
+                kind = msg.get("type")
+                if kind == "message":
+                    self.on_order(msg["data"])
+                elif kind == "pmessage":
+                    self.on_candidate(msg["channel"], msg["data"])
+        finally:
+            await ps.aclose()
+
+    def on_order(self, raw):
+        order = try_decode(raw)
+        if order is None or order.get("type") != "ORDER":
+            return
+        M_ORDERS.inc()
+        lag_since(M_ORDER_LAG, order.get("sent_ts"))
+        self.spawn(self.dispatch(order, time.monotonic()))
+
+    def on_candidate(self, channel, raw):
+        order_id = channel.split(":", 1)[1]
+        bucket = self.windows.get(order_id)
+        if bucket is None:
+            return  # fenêtre déjà fermée ou commande inconnue
+        cand = try_decode(raw)
+        if cand is None or cand.get("type") != "CANDIDATURE" or cand.get("order_id") != order_id:
+            return
+        lag_since(M_CAND_LAG, cand.get("sent_ts"))
+        bucket.cands.append(cand)
+        bucket.event.set()
+
+    async def dispatch(self, order, received_at):
+        async with self.slots:
+            order_id = order["order_id"]
+            resto_name = order["restaurant"]["name"]
+            drop = (float(order["customer"]["lat"]), float(order["customer"]["lon"]))
+            pickup = resolve_pickup(self.restos, order)
+
+            # La fenêtre est ouverte AVANT l'annonce : aucune candidature perdue
+            bucket = self.windows[order_id] = Bucket()
+            targets = await publish_offer(self.r, build_offer(order_id, resto_name, pickup, drop), pickup)
+            w = Window(self.policy, expected=len(targets))
+            scored, done = {}, 0
+            while w.check() is None:
+                try:
+                    await asyncio.wait_for(bucket.event.wait(), w.wait_s())
+                except asyncio.TimeoutError:
+                    pass
+                bucket.event.clear()
+                new, done = bucket.cands[done:], len(bucket.cands)
+                for c in await self.score(new, pickup, drop):
+                    scored[c["courier"]] = c
+                    w.add(c["eta_min"], c["rating"])
+            self.window_stats.record(w)
+            observe_window(w)
+            if w.reason == "timeout":
+                self.windows.pop(order_id, None)
+            else:   # les retardataires sont comptés à l'échéance fixe
+                asyncio.get_running_loop().call_later(
+                    w.saved_s, lambda: self.spawn(self.settle(order_id, w, done, pickup, drop)))
+
+            cands = sorted(scored.values(), key=lambda c: (c["eta_min"], -c["rating"]))
+            if not cands:
+                self.unassigned += 1
+                M_UNASSIGNED.inc()
+                if self.verbose:
+                    print(f"[MANAGER] 😕 {order_id} : aucune candidature reçue.")
+                return
+
+            if self.auto:
+                chosen = cands[0]
+            else:
+                async with self.prompt_lock:
+                    print(f"\n[MANAGER] Commande {order_id} ({resto_name})")
+                    chosen = await asyncio.to_thread(prompt_select_or_auto, cands)
+
+            assign = build_selection(order_id, chosen, pickup, drop)
+            await self.r.publish(CHAN_ASSIGN.format(oid=order_id), encode(assign))
+            self.record(order_id, chosen, time.monotonic() - received_at)
+
+    def spawn(self, coro):
+        task = asyncio.create_task(coro)
+        self.tasks.add(task)
+        task.add_done_callback(self.tasks.discard)
+
+    async def settle(self, order_id, w, done, pickup, drop):
+        """Échéance fixe d'une fenêtre fermée tôt : candidatures qu'elle aurait encore vues."""
+        bucket = self.windows.pop(order_id, None)
+        if bucket is not None:
+            for c in await self.score(bucket.cands[done:], pickup, drop):
+                w.add(c["eta_min"], c["rating"])
+        self.window_stats.settle()
+
+    async def score(self, raw_cands, pickup, drop):
+        seen = {}
+        for cand in raw_cands:
+            try:
+                pos = (float(cand["position"]["lat"]), float(cand["position"]["lon"]))
+            except Exception:
+                continue
+            seen[cand["courier"]] = pos  # une seule candidature par coursier
+        if not seen:
+            return []
+        ratings = await get_ratings(self.r, list(seen))
+        etas = eta_minutes_batch(list(seen.values()), pickup, drop)
+        cands = [
+            {"courier": name, "eta_min": eta, "rating": ratings[name]}
+            for name, eta in zip(seen, etas)
+        ]
+        cands.sort(key=lambda c: (c["eta_min"], -c["rating"]))
+        return cands
+
+    def record(self, order_id, chosen, latency_s):
+        self.latencies.append(latency_s)
+        self.assigned += 1
+        M_ASSIGNED.inc()
+        if not self.verbose:
+            return
+        print(f"[MANAGER] ✅ {order_id} → {chosen['courier']} "
+              f"(ETA={chosen['eta_min']} min, Note={chosen['rating']:.2f}, latence={latency_s*1000:.0f} ms, "
+              f"fenêtres ouvertes={len(self.windows)})")
+        if self.assigned % STATS_EVERY == 0:
+            self.print_stats()
+
+    def print_stats(self):
+        elapsed = max(1e-6, time.monotonic() - self.started)
+        lat = self.latencies
+        print(f"[MANAGER] 📈 {self.assigned} affectées, {self.unassigned} sans candidat | "
+              f"{self.assigned / elapsed * 60:.1f} cmd/min | latence p50={percentile(lat, 50):.2f}s "
+              f"p95={percentile(lat, 95):.2f}s max={max(lat, default=0):.2f}s")
+        print(f"[MANAGER] ⏱️ fenêtres : {self.window_stats.line()}")
+        if manager.ROUTER is not None:
+            print(f"[MANAGER] 🛣️ {manager.ROUTER.describe()}")
+
+async def amain(args):
+    if args.broadcast:
+        manager.GEO_DISPATCH = False
+    if args.graph:
+        manager.ROUTER = open_router(args.graph, manager.VITESSE_KMH)
+    set_codec(args.codec)
+    if args.metrics_port is not None:
+        serve(args.metrics_port)
+    r = arconn()
+    refresh_every(manager.rconn(), LEADERBOARD_REFRESH_S)   # thread de fond, client synchrone
+    restos = load_restos(CSV_PATH)
+    dispatcher = Dispatcher(r, restos, auto=args.auto, timeout_s=args.timeout, max_windows=args.max_windows,
+                            window_policy=args.window_policy)
+    try:
+        await dispatcher.run()
+    finally:
+        dispatcher.print_stats()
+        await r.aclose()
+
+def parse_args(argv=None):
+    p = argparse.ArgumentParser(description="Manager asyncio : plusieurs fenêtres de candidatures en parallèle.")
+    p.add_argument("--auto", action="store_true", help="sélection automatique sans prompt (headless)")
+    p.add_argument("--timeout", type=float, default=TIMEOUT_S, help="durée max d'une fenêtre de candidatures (s)")
+    p.add_argument("--window-policy", choices=POLICIES, default=WINDOW_POLICY,
+                   help="adaptive : fermeture de la fenêtre dès que possible (window.py)")
+    p.add_argument("--max-windows", type=int, default=MAX_WINDOWS, help="fenêtres ouvertes simultanément")
+    p.add_argument("--broadcast", action="store_true", help="annonces à tous les coursiers (pas de ciblage géo)")
+    p.add_argument("--graph", help="graphe de rues compilé (routing.py) : ETA par les rues")
+    p.add_argument("--codec", choices=CODECS, default=DEFAULT_CODEC,
+                   help="encodage des messages envoyés (la réception lit tous les codecs)")
+    p.add_argument("--metrics-port", type=int, help="expose /metrics (Prometheus) sur ce port local")
+    return p.parse_args(argv)
+
+if __name__ == "__main__":
+    try:
+        asyncio.run(amain(parse_args()))
+    except KeyboardInterrupt:
+        print("\n[MANAGER] Arrêt.")
+        sys.exit(0)
@@ -0,0 +1,199 @@
+"""
+Métriques des chemins chauds (partagé par les rôles Redis et MongoDB), exposées au format Prometheus.
+
+- Counter.inc(n), Gauge.set(v) (ou Gauge(fn=...) lue au moment du scrape) ;
+- Histogram.observe(v) : buckets log-linéaires façon HDR (SUB_BUCKETS par puissance de 2 au-dessus
+  de `unit`, erreur relative ≤ 1/SUB_BUCKETS), un tableau d'entiers de taille fixe : un frexp et
+  une incrémentation, pas d'allocation. Quantiles calculés à la lecture (borne haute du bucket) ;
+- timer(h) : `with timer(h):` observe la durée du bloc en secondes (perf_counter) ;
+- serve(port) : GET /metrics (texte Prometheus 0.0.4) servi par un thread, même process.
+Les métriques sont créées une fois au niveau module et s'inscrivent dans REGISTRY : le chemin
+chaud ne fait aucune recherche par nom. Un verrou par métrique (sans contention, ~0,1 µs) :
+les threads de fond (heartbeat, change streams) ne perdent pas d'incréments.
+Coût mesuré par bench_metrics.py.
+
+    CANDS = Histogram("ubeer_manager_candidates_per_order", "Candidatures par commande", unit=1)
+    CANDS.observe(len(cands))
+    serve(9101)     # curl http://127.0.0.1:9101/metrics
+"""
+import math, threading, time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+SUB_BUCKETS = 8            # précision ~12 % (borne haute du bucket)
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+class Registry:
+    def __init__(self):
+        self.metrics = []
+        self.names = set()
+
+    def add(self, metric):
+        if metric.name in self.names:
+            raise ValueError(f"métrique déjà déclarée : {metric.name}")
+        self.names.add(metric.name)
+        self.metrics.append(metric)
+        return metric
+
+    def render(self):
+        lines = []
+        for m in self.metrics:
+            lines.append(f"# HELP {m.name} {m.help}")
+            lines.append(f"# TYPE {m.name} {m.kind}")
+            lines.extend(m.samples())
+        return "\n".join(lines) + "\n"
+
+REGISTRY = Registry()
+
+def _num(v):
+    if v == math.inf:
+        return "+Inf"
+    return repr(float(v)) if isinstance(v, float) else str(v)
+
+class Counter:
+    kind = "counter"
+
+    def __init__(self, name, help, registry=REGISTRY):
+        self.name, self.help = name, help
+        self.value = 0
+        self._lock = threading.Lock()
+        registry.add(self)
+
+    def inc(self, n=1):
+        with self._lock:
+            self.value += n
+
+    def samples(self):
+        return [f"{self.name} {_num(self.value)}"]
+
+class Gauge:
+    kind = "gauge"
+
+    def __init__(self, name, help, fn=None, registry=REGISTRY):
+        self.name, self.help = name, help
+        self.value = 0
+        self.fn = fn
+        registry.add(self)
+
+    def set(self, v):
+        self.value = v
+
+    def samples(self):
+        try:
+            v = self.fn() if self.fn is not None else self.value
+        except Exception:
+            v = math.nan
+        return [f"{self.name} {_num(v)}"]
+
+class Histogram:
+    """
+    Valeurs ≥ 0 ; unit = plus petite valeur distinguée (1 µs par défaut pour des secondes),
+    highest = au-delà, tout tombe dans le dernier bucket.
+    """
+    kind = "histogram"
+
+    def __init__(self, name, help, unit=1e-6, highest=100.0, registry=REGISTRY):
+        self.name, self.help = name, help
+        self.unit = unit
+        self.exps = max(1, math.ceil(math.log2(highest / unit)))
+        self.counts = [0] * (1 + self.exps * SUB_BUCKETS)
+        self.count = 0
+        self.sum = 0.0
+        self._inv = 1.0 / unit
+        self._last = len(self.counts) - 1
+        self._lock = threading.Lock()
+        registry.add(self)
+
+    def _index(self, v):
+        x = v * self._inv
+        if x < 1.0:
+            return 0
+        m, e = math.frexp(x)           # x = m · 2^e, m dans [0.5, 1)
+        i = 1 + (e - 1) * SUB_BUCKETS + int((m - 0.5) * 2 * SUB_BUCKETS)
+        return i if i < self._last else self._last
+
+    def upper(self, i):
+        """Borne haute du bucket i (dans l'unité des valeurs)."""
+        if i == 0:
+            return self.unit
+        e, s = divmod(i - 1, SUB_BUCKETS)
+        return self.unit * 2 ** e * (1 + (s + 1) / SUB_BUCKETS)
+
+    def observe(self, v):
+        i = self._index(v)
+        with self._lock:
+            self.counts[i] += 1
+            self.count += 1
+            self.sum += v
+
+    def quantile(self, q):
+        """Borne haute du bucket du quantile q (0..1) ; 0 sans observation."""
+        with self._lock:
+            counts, total = list(self.counts), self.count
+        if not total:
+            return 0.0
+        rank, seen = max(1, math.ceil(q * total)), 0
+        for i, c in enumerate(counts):
+            seen += c
+            if seen >= rank:
+                return self.upper(i)
+        return self.upper(len(counts) - 1)
+
+    def samples(self):
+        # buckets Prometheus cumulés aux puissances de 2 de l'unité (liste fixe d'un scrape à l'autre)
+        with self._lock:
+            counts, total, s = list(self.counts), self.count, self.sum
+        out, cum = [], counts[0]
+        out.append(f'{self.name}_bucket{{le="{_num(self.unit)}"}} {cum}')
+        for e in range(self.exps):
+            cum += sum(counts[1 + e * SUB_BUCKETS:1 + (e + 1) * SUB_BUCKETS])
+            out.append(f'{self.name}_bucket{{le="{_num(self.unit * 2 ** (e + 1))}"}} {cum}')
+        out.append(f'{self.name}_bucket{{le="+Inf"}} {total}')
+        out.append(f"{self.name}_sum {_num(s)}")
+        out.append(f"{self.name}_count {total}")
+        return out
+
+class timer:
+    """`with timer(h):` -> h.observe(durée du bloc en secondes)."""
+    __slots__ = ("h", "t0")
+
+    def __init__(self, h):
+        self.h = h
+
+    def __enter__(self):
+        self.t0 = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.h.observe(time.perf_counter() - self.t0)
+        return False
+
+def lag_since(h, sent_ts):
+    """Retard d'un message horodaté par l'émetteur (sent_ts, time.time()) ; ignoré s'il est absent."""
+    if isinstance(sent_ts, (int, float)):
+        h.observe(max(0.0, time.time() - sent_ts))
+
+class _Handler(BaseHTTPRequestHandler):
+    registry = REGISTRY
+
+    def do_GET(self):
+        if self.path.split("?")[0] != "/metrics":
+            self.send_error(404)
+            return
+        body = self.registry.render().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", CONTENT_TYPE)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+def serve(port, host="127.0.0.1", registry=REGISTRY):
+    """Endpoint /metrics dans un thread de fond ; port 0 = port libre choisi par le système."""
+    handler = type("Handler", (_Handler,), {"registry": registry})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True, name="metrics-http").start()
+    print(f"[METRICS] http://{host}:{server.server_address[1]}/metrics")
+    return server
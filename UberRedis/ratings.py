@@ -0,0 +1,290 @@
+"""
+Notation des coursiers en UNE opération atomique côté serveur (script Lua).
+
+Le script incrémente sum/count, recalcule avg et ajoute l'entrée à ratings_history:<coursier>
+dans le même appel : un aller-retour au lieu de cinq (HINCRBY ×2, HGETALL, HSET, LPUSH),
+et plus de moyenne écrasée par une notation concurrente.
+
+Note récente (celle qu'utilise le manager) : somme et poids des notes amortis de moitié tous les
+HALF_LIFE_DAYS, mis à jour en O(1) par note (dsum, dweight à la date dts : on multiplie par
+2^(-Δt / demi-vie) puis on ajoute la nouvelle note), tirés vers PRIOR comme si le coursier avait
+PRIOR_WEIGHT notes neutres de plus : une seule note 5 ne le place pas en tête.
+    recent = (dsum + PRIOR × PRIOR_WEIGHT) / (dweight + PRIOR_WEIGHT)
+Le même script la recopie dans le classement ratings_leaderboard (ZSET) : top K et rang d'un
+coursier en une commande (ZREVRANGE / ZREVRANK) au lieu d'un SCAN de tous les ratings:*.
+Sans nouvelle note, la note récente continue de glisser vers PRIOR : le manager la recalcule à
+l'instant de la lecture (current_rating), et refresh() rejoue l'amortissement dans le classement
+en parcourant ses membres (ZRANGE par lots, pas de SCAN de la base). Chaque manager lance
+refresh_every, mais un seul passe toutes les LEADERBOARD_REFRESH_S : celui qui obtient le bail
+lease:ratings_refresh (SET NX PX). Entre deux passages le classement a au plus
+LEADERBOARD_REFRESH_S de retard (0,02 % de l'écart à PRIOR pour 15 min et 30 jours de demi-vie).
+migrate() (`python ratings.py --refresh`, une fois) parcourt au contraire tous les ratings:* pour
+classer les coursiers notés avant la note récente, ou reconstruire un classement effacé.
+
+Historique borné : HISTORY_MAX dernières notes et rien de plus vieux que HISTORY_MAX_AGE_DAYS
+(entrées retirées en queue de liste par le même script, chacune une seule fois).
+
+    avg, count, recent = rate(r, "Léa", 5, order_id)
+    top(r, 10) ; rank(r, "Léa")
+
+    python ratings.py --top 10
+    python ratings.py --rank Léa
+    python ratings.py --near 48.8566 2.3522     # meilleurs coursiers libres autour d'un point
+    python ratings.py --refresh                 # migration : tous les ratings:* reclassés maintenant
+    python ratings.py --refresh --every 900     # ... puis classement rafraîchi toutes les 15 min
+"""
+import argparse, json, os, socket, threading, time
+from collections import namedtuple
+import redis
+
+from registry import GEO_IDLE_KEY, OFFER_RADIUS_KM
+
+RATINGS_KEY = "ratings:{courier}"               # hash : sum, count, avg, dsum, dweight, dts, recent
+HISTORY_KEY = "ratings_history:{courier}"       # liste JSON, plus récent en tête
+LEADERBOARD_KEY = "ratings_leaderboard"         # ZSET coursier -> note récente (hors de ratings:*)
+HISTORY_MAX = 500                               # N dernières notes gardées (0 = pas de limite)
+HISTORY_MAX_AGE_DAYS = 180                      # notes plus anciennes retirées (0 = pas de limite)
+HALF_LIFE_DAYS = 30.0                           # une note perd la moitié de son poids en 30 jours
+PRIOR = 3.0                                     # note neutre (celle du manager pour un coursier jamais noté)
+PRIOR_WEIGHT = 2.0                              # ... comptée comme 2 notes
+LEADERBOARD_REFRESH_S = 900                     # amortissement rejoué dans le classement (refresh_every)
+REFRESH_BATCH = 500                             # coursiers par pipeline de refresh()
+REFRESH_LEASE_KEY = "lease:ratings_refresh"     # bail : un seul refresh() par période, tous managers confondus
+REFRESH_CHECK_S = 30                            # chaque refresh_every tente de prendre le bail toutes les 30 s
+
+Rating = namedtuple("Rating", "avg count recent")
+
+# KEYS[1] = ratings:<c>, KEYS[2] = ratings_history:<c>, KEYS[3] = ratings_leaderboard
+# ARGV[1] = note, ARGV[2] = entrée JSON de l'historique, ARGV[3] = taille max (0 = illimitée),
+# ARGV[4] = date de la note (epoch), ARGV[5] = demi-vie (s), ARGV[6] = âge max (s, 0 = illimité),
+# ARGV[7] = note neutre, ARGV[8] = son poids, ARGV[9] = coursier
+RATE_LUA = """
+local score, now = tonumber(ARGV[1]), tonumber(ARGV[4])
+local d = redis.call('HMGET', KEYS[1], 'dsum', 'dweight', 'dts', 'sum', 'count')
+local dsum, dw, dts = tonumber(d[1]), tonumber(d[2]), tonumber(d[3])
+if not dsum then
+  -- coursier noté avant la note récente : ses anciennes notes comptent comme d'aujourd'hui
+  dsum, dw, dts = tonumber(d[4]) or 0, tonumber(d[5]) or 0, now
+end
+if now > dts then
+  local f = 2 ^ (-(now - dts) / tonumber(ARGV[5]))
+  dsum, dw, dts = dsum * f, dw * f, now
+end
+dsum, dw = dsum + score, dw + 1
+local pw = tonumber(ARGV[8])
+local recent = (dsum + tonumber(ARGV[7]) * pw) / (dw + pw)
+local s = redis.call('HINCRBY', KEYS[1], 'sum', ARGV[1])
+local c = redis.call('HINCRBY', KEYS[1], 'count', 1)
+local avg = tostring(s / c)
+redis.call('HSET', KEYS[1], 'avg', avg, 'dsum', tostring(dsum), 'dweight', tostring(dw),
+           'dts', tostring(dts), 'recent', tostring(recent))
+redis.call('ZADD', KEYS[3], recent, ARGV[9])
+redis.call('LPUSH', KEYS[2], ARGV[2])
+local maxlen = tonumber(ARGV[3])
+if maxlen > 0 then
+  redis.call('LTRIM', KEYS[2], 0, maxlen - 1)
+end
+local maxage = tonumber(ARGV[6])
+if maxage > 0 then
+  while true do
+    local last = redis.call('LINDEX', KEYS[2], -1)
+    local ts = last and tonumber(string.match(last, '"ts":%s*(%d+)'))
+    if not ts or ts >= now - maxage then break end
+    redis.call('RPOP', KEYS[2])
+  end
+end
+return {c, avg, tostring(recent)}
+"""
+
+# KEYS[1] = ratings:<c>, KEYS[2] = ratings_leaderboard
+# ARGV[1] = maintenant (epoch), ARGV[2] = demi-vie (s), ARGV[3] = note neutre, ARGV[4] = son poids,
+# ARGV[5] = coursier. Ne touche pas dsum/dweight/dts (sauf hash d'avant la note récente, initialisé
+# comme le ferait RATE_LUA) : une notation concurrente reste exacte.
+REFRESH_LUA = """
+local now = tonumber(ARGV[1])
+local d = redis.call('HMGET', KEYS[1], 'dsum', 'dweight', 'dts', 'sum', 'count')
+local dsum, dw, dts = tonumber(d[1]), tonumber(d[2]), tonumber(d[3])
+if not dsum then
+  if not tonumber(d[5]) then return false end
+  dsum, dw, dts = tonumber(d[4]) or 0, tonumber(d[5]), now
+  redis.call('HSET', KEYS[1], 'dsum', tostring(dsum), 'dweight', tostring(dw), 'dts', tostring(dts))
+end
+if now > dts then
+  local f = 2 ^ (-(now - dts) / tonumber(ARGV[2]))
+  dsum, dw = dsum * f, dw * f
+end
+local pw = tonumber(ARGV[4])
+local recent = (dsum + tonumber(ARGV[3]) * pw) / (dw + pw)
+redis.call('HSET', KEYS[1], 'recent', tostring(recent))
+redis.call('ZADD', KEYS[2], recent, ARGV[5])
+return tostring(recent)
+"""
+
+_script = None
+_refresh = None
+
+def rconn():
+    return redis.Redis(host="localhost", port=6379, db=0, decode_responses=True, encoding_errors="surrogateescape")
+
+def _rate_script(r):
+    # EVALSHA, rechargé automatiquement (EVAL) si le cache de scripts du serveur est vide
+    global _script
+    if _script is None:
+        _script = r.register_script(RATE_LUA)
+    return _script
+
+def _refresh_script(r):
+    global _refresh
+    if _refresh is None:
+        _refresh = r.register_script(REFRESH_LUA)
+    return _refresh
+
+def history_entry(order_id, score, ts=None):
+    return json.dumps({"order_id": order_id, "score": int(score), "ts": int(ts or time.time())})
+
+def recent_score(dsum, dweight):
+    return (dsum + PRIOR * PRIOR_WEIGHT) / (dweight + PRIOR_WEIGHT)
+
+def current_rating(dsum, dweight, dts, now=None, half_life_days=HALF_LIFE_DAYS):
+    """Note récente à l'instant now à partir des champs dsum, dweight, dts du hash."""
+    f = 2 ** (-max(0.0, (now or time.time()) - dts) / (half_life_days * 86400))
+    return recent_score(dsum * f, dweight * f)
+
+def rate(r, courier, score, order_id, history_max=HISTORY_MAX, max_age_days=HISTORY_MAX_AGE_DAYS,
+         half_life_days=HALF_LIFE_DAYS, ts=None):
+    """Enregistre la note -> Rating(moyenne, nombre d'avis, note récente)."""
+    ts = int(ts or time.time())
+    count, avg, recent = _rate_script(r)(
+        keys=[RATINGS_KEY.format(courier=courier), HISTORY_KEY.format(courier=courier), LEADERBOARD_KEY],
+        args=[int(score), history_entry(order_id, score, ts), int(history_max), ts,
+              half_life_days * 86400, int(max_age_days * 86400), PRIOR, PRIOR_WEIGHT, courier],
+        client=r,
+    )
+    return Rating(float(avg), int(count), float(recent))
+
+def top(r, k=10):
+    """Les k coursiers les mieux notés (note récente) -> [(nom, note)], un ZREVRANGE."""
+    return [(name, float(s)) for name, s in r.zrevrange(LEADERBOARD_KEY, 0, k - 1, withscores=True)]
+
+def rank(r, courier):
+    """Rang (1 = meilleur) d'un coursier dans le classement, ou None s'il n'a jamais été noté."""
+    rk = r.zrevrank(LEADERBOARD_KEY, courier)
+    return None if rk is None else rk + 1
+
+def top_near(r, lat, lon, k=10, radius_km=OFFER_RADIUS_KM):
+    """
+    Meilleurs coursiers libres autour d'un point -> [(nom, note)] : GEOSEARCH puis ZMSCORE, deux
+    commandes quel que soit le nombre de coursiers notés. Jamais notés : PRIOR.
+    """
+    names = r.geosearch(GEO_IDLE_KEY, longitude=lon, latitude=lat, radius=radius_km, unit="km")
+    if not names:
+        return []
+    scores = r.zmscore(LEADERBOARD_KEY, names)
+    ranked = sorted(((n, PRIOR if s is None else float(s)) for n, s in zip(names, scores)),
+                    key=lambda x: -x[1])
+    return ranked[:k]
+
+def _refresh_batch(r, names, now, half_life_days):
+    """Un script atomique par coursier, en un pipeline -> nombre de coursiers classés."""
+    script, pipe = _refresh_script(r), r.pipeline(transaction=False)
+    for name in names:
+        script(keys=[RATINGS_KEY.format(courier=name), LEADERBOARD_KEY],
+               args=[now, half_life_days * 86400, PRIOR, PRIOR_WEIGHT, name], client=pipe)
+    return sum(1 for x in pipe.execute() if x is not None)
+
+def refresh(r, now=None, half_life_days=HALF_LIFE_DAYS):
+    """
+    Note récente des coursiers du classement recalculée à l'instant now, dans leur hash (recent)
+    et dans ratings_leaderboard : ZRANGE par lots de REFRESH_BATCH, un pipeline par lot. Un
+    coursier qui change de lot pendant le parcours (note concurrente) est repris au passage
+    suivant. -> nombre de coursiers classés.
+    """
+    now, n, start = int(now or time.time()), 0, 0
+    while True:
+        names = r.zrange(LEADERBOARD_KEY, start, start + REFRESH_BATCH - 1)
+        if not names:
+            return n
+        n += _refresh_batch(r, names, now, half_life_days)
+        start += len(names)
+
+def migrate(r, now=None, half_life_days=HALF_LIFE_DAYS):
+    """
+    refresh() sur tous les ratings:* (SCAN de la base) : classe les coursiers notés avant la note
+    récente, reconstruit un classement effacé. Une fois, à la main. -> nombre de coursiers classés.
+    """
+    now, n, names = int(now or time.time()), 0, []
+    for key in r.scan_iter(match=RATINGS_KEY.format(courier="*"), count=REFRESH_BATCH):
+        names.append(key.split(":", 1)[1])
+        if len(names) >= REFRESH_BATCH:
+            n += _refresh_batch(r, names, now, half_life_days)
+            names = []
+    if names:
+        n += _refresh_batch(r, names, now, half_life_days)
+    return n
+
+def refresh_every(r, every_s=LEADERBOARD_REFRESH_S, owner=None):
+    """
+    refresh() au plus une fois toutes les every_s pour tous les processus qui l'appellent : chacun
+    tente toutes les REFRESH_CHECK_S de prendre le bail (SET NX PX every_s), seul le gagnant
+    rafraîchit. Thread de fond (managers).
+    """
+    owner = owner or f"ratings-{socket.gethostname()}-{os.getpid()}"
+
+    def loop():
+        while True:
+            try:
+                if r.set(REFRESH_LEASE_KEY, owner, nx=True, px=int(every_s * 1000)):
+                    t0 = time.perf_counter()
+                    n = refresh(r)
+                    print(f"[RATINGS] 🏆 classement rafraîchi : {n} coursiers en {(time.perf_counter() - t0) * 1000:.0f} ms")
+            except redis.RedisError as e:
+                print(f"[RATINGS] ⚠️ rafraîchissement du classement échoué : {e}")
+            time.sleep(min(every_s, REFRESH_CHECK_S))
+    th = threading.Thread(target=loop, daemon=True, name="ratings-refresh")
+    th.start()
+    return th
+
+def main():
+    ap = argparse.ArgumentParser(description="Classement des coursiers par note récente (ratings_leaderboard).")
+    ap.add_argument("--top", type=int, default=10, help="nombre de coursiers affichés")
+    ap.add_argument("--rank", metavar="COURSIER", help="rang et détail d'un coursier")
+    ap.add_argument("--near", type=float, nargs=2, metavar=("LAT", "LON"),
+                    help="meilleurs coursiers libres autour d'un point")
+    ap.add_argument("--radius", type=float, default=OFFER_RADIUS_KM)
+    ap.add_argument("--refresh", action="store_true",
+                    help="migration : recalculer maintenant la note récente de tous les ratings:* (et le classement)")
+    ap.add_argument("--every", type=float, metavar="S",
+                    help="avec --refresh : ensuite, rafraîchir le classement toutes les S secondes (bail partagé avec les managers)")
+    args = ap.parse_args()
+
+    r = rconn()
+    if args.refresh:
+        t0 = time.perf_counter()
+        n = migrate(r)
+        print(f"[RATINGS] 🏆 {n} coursiers classés en {(time.perf_counter() - t0) * 1000:.0f} ms")
+        if args.every:
+            refresh_every(r, args.every).join()
+    if args.rank:
+        rk = rank(r, args.rank)
+        if rk is None:
+            print(f"[RATINGS] {args.rank} n'a encore aucune note")
+            return
+        data = r.hgetall(RATINGS_KEY.format(courier=args.rank))
+        if "dsum" in data:
+            recent = current_rating(float(data["dsum"]), float(data["dweight"]), float(data["dts"]))
+        else:   # ajouté au classement avant sa première note récente
+            recent = recent_score(float(data.get("sum", 0)), float(data.get("count", 0)))
+        print(f"[RATINGS] {args.rank} : {rk}e sur {r.zcard(LEADERBOARD_KEY)} | note récente "
+              f"{recent:.2f} | moyenne {float(data.get('avg', 0)):.2f} ({data.get('count', 0)} avis)")
+        return
+    if args.near:
+        rows = top_near(r, *args.near, k=args.top, radius_km=args.radius)
+        print(f"[RATINGS] {len(rows)} coursiers libres à moins de {args.radius:g} km")
+    else:
+        rows = top(r, args.top)
+        print(f"[RATINGS] Top {args.top} sur {r.zcard(LEADERBOARD_KEY)} coursiers notés")
+    for i, (name, score) in enumerate(rows, 1):
+        print(f"  {i:>3}. {name:<20} ⭐ {score:.2f}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,97 @@
+"""
+Suivi à l'estime (dead reckoning), partagé par les coursiers et les clients Redis / MongoDB.
+
+Mode "quarters" (historique) : un TRACK à 0/25/50/75/100 % de chaque tronçon, le client voit
+la position sauter d'un quart à l'autre. Mode "reckoning" : chaque TRACK porte aussi la vitesse
+(vn, ve en m/s vers le nord / l'est) ; le coursier se tait tant que sa position réelle reste à
+moins de DRIFT_M de celle qu'un client extrapolerait depuis son dernier message, et au plus
+MAX_SILENCE_S. En ligne droite à vitesse constante : un message par tronçon (plus les rappels) ;
+par les rues : un message peu après chaque virage. Le client extrapole entre deux messages
+(Follower), sans dépasser la fin du tronçon annoncée par eta_s.
+
+    rk = Reckoner()
+    if rk.due(now, lat, lon, status):
+        publier(..., velocity=(vn, ve)); rk.sent(now, lat, lon, vn, ve, status)
+"""
+import math
+
+TRACKING_MODES = ("quarters", "reckoning")
+DRIFT_M = 25.0            # écart toléré entre position réelle et position extrapolée
+MAX_SILENCE_S = 60.0      # un message au moins toutes les N secondes (ETA, présence)
+M_PER_DEG = 111_320.0     # mètres par degré de latitude
+
+def velocity(a, b, dt_s):
+    """Vitesse moyenne (vn, ve) en m/s pour aller de a à b (lat, lon) en dt_s secondes."""
+    if dt_s <= 0:
+        return 0.0, 0.0
+    k = M_PER_DEG / dt_s
+    return (b[0] - a[0]) * k, (b[1] - a[1]) * k * math.cos(math.radians(a[0]))
+
+def extrapolate(lat, lon, vn, ve, dt_s):
+    """Position estimée dt_s secondes après (lat, lon) à la vitesse (vn, ve)."""
+    return (lat + vn * dt_s / M_PER_DEG,
+            lon + ve * dt_s / (M_PER_DEG * max(0.01, math.cos(math.radians(lat)))))
+
+def drift_m(a, b):
+    """Écart en mètres entre deux positions proches (projection équirectangulaire)."""
+    dy = (b[0] - a[0]) * M_PER_DEG
+    dx = (b[1] - a[1]) * M_PER_DEG * math.cos(math.radians((a[0] + b[0]) / 2))
+    return math.hypot(dx, dy)
+
+class Reckoner:
+    """Côté coursier : faut-il publier ce tick ?"""
+    __slots__ = ("drift_max", "silence_max", "last")
+
+    def __init__(self, drift_max=DRIFT_M, silence_max=MAX_SILENCE_S):
+        self.drift_max = drift_max
+        self.silence_max = silence_max
+        self.last = None   # (t, lat, lon, vn, ve, status) du dernier message
+
+    def due(self, t, lat, lon, status):
+        if self.last is None:
+            return True
+        t0, lat0, lon0, vn, ve, status0 = self.last
+        if status != status0 or t - t0 >= self.silence_max:
+            return True
+        return drift_m(extrapolate(lat0, lon0, vn, ve, t - t0), (lat, lon)) > self.drift_max
+
+    def sent(self, t, lat, lon, vn, ve, status):
+        self.last = (t, lat, lon, vn, ve, status)
+
+class Follower:
+    """
+    Côté client : dernier TRACK reçu -> position / progression / ETA estimées à tout instant.
+    Un TRACK sans vitesse (mode quarters, ancien coursier) reste immobile jusqu'au suivant.
+    """
+    __slots__ = ("msg", "t")
+
+    def __init__(self):
+        self.msg = None
+        self.t = 0.0
+
+    def update(self, msg, now):
+        # heure de réception (pas sent_ts) : pas d'écart d'horloge entre coursier et client
+        self.msg, self.t = msg, now
+
+    def _dt(self, now):
+        m = self.msg
+        return max(0.0, min(now - self.t, float(m.get("eta_s") or 0)))
+
+    def position(self, now):
+        m = self.msg
+        lat, lon = float(m["lat"]), float(m["lon"])
+        if "vn" not in m:
+            return lat, lon
+        return extrapolate(lat, lon, float(m["vn"]), float(m["ve"]), self._dt(now))
+
+    def progress(self, now):
+        """% du tronçon : le reste (100 - progress) est parcouru en eta_s secondes."""
+        m = self.msg
+        p, eta = float(m.get("progress", 0)), float(m.get("eta_s") or 0)
+        if "vn" not in m or eta <= 0:
+            return p
+        return p + (100 - p) * self._dt(now) / eta
+
+    def eta_s(self, now):
+        m = self.msg
+        return max(0.0, float(m.get("global_eta_s") or 0) - (self._dt(now) if "vn" in m else 0.0))
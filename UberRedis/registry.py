@@ -0,0 +1,123 @@
+import time
+
+# ----- Registre géographique des coursiers -----
+# couriers:geo:idle  (GEO)  : coursiers libres, indexés par position
+# courier:<prenom>   (Hash) : status idle|busy, lat, lon, ts — expire sans heartbeat
+#                               (+ route : arrêts restants d'un coursier en course, route_planner.py)
+# couriers:geo:stack (GEO)  : coursiers en course qui peuvent encore prendre une commande
+GEO_IDLE_KEY = "couriers:geo:idle"
+GEO_STACK_KEY = "couriers:geo:stack"
+STATE_KEY = "courier:{name}"
+CHAN_OFFERS_COURIER = "offers:{name}"   # manager -> un coursier précis
+
+HEARTBEAT_S = 2.0        # période des heartbeats côté coursier
+HEARTBEAT_TTL_S = 6      # sans heartbeat pendant ce délai, le coursier est considéré hors ligne
+OFFER_K = 8              # nombre de coursiers libres sollicités par commande
+OFFER_RADIUS_KM = 5.0    # rayon de recherche autour du restaurant
+
+def _heartbeat_cmds(pipe, name, lat, lon, busy, route=None):
+    key = STATE_KEY.format(name=name)
+    stackable = busy and route is not None
+    fields = {
+        "status": "busy" if busy else "idle",
+        "lat": lat, "lon": lon, "ts": time.time(),
+    }
+    if stackable:
+        fields["route"] = route
+    pipe.hset(key, mapping=fields)
+    pipe.expire(key, HEARTBEAT_TTL_S)
+    if busy:
+        pipe.zrem(GEO_IDLE_KEY, name)
+    else:
+        pipe.geoadd(GEO_IDLE_KEY, (lon, lat, name))
+    if stackable:
+        pipe.geoadd(GEO_STACK_KEY, (lon, lat, name))
+    else:
+        pipe.zrem(GEO_STACK_KEY, name)   # champ route laissé : ignoré hors de couriers:geo:stack
+
+def heartbeat(r, name, lat, lon, busy, route=None):
+    """
+    Publie position + statut ; un coursier occupé sort de l'index des coursiers libres.
+    route (route_planner.pack) : en course mais prêt à prendre une commande de plus.
+    """
+    pipe = r.pipeline(transaction=False)
+    _heartbeat_cmds(pipe, name, lat, lon, busy, route)
+    pipe.execute()
+
+async def heartbeat_many_async(r, states):
+    """Heartbeats de toute une flotte en un pipeline : states = [(name, lat, lon, busy), ...]."""
+    pipe = r.pipeline(transaction=False)
+    for name, lat, lon, busy in states:
+        _heartbeat_cmds(pipe, name, lat, lon, busy)
+    await pipe.execute()
+
+def go_offline(r, name):
+    pipe = r.pipeline(transaction=False)
+    pipe.zrem(GEO_IDLE_KEY, name)
+    pipe.zrem(GEO_STACK_KEY, name)
+    pipe.delete(STATE_KEY.format(name=name))
+    pipe.execute()
+
+async def go_offline_many_async(r, names):
+    pipe = r.pipeline(transaction=False)
+    pipe.zrem(GEO_IDLE_KEY, *names)
+    pipe.zrem(GEO_STACK_KEY, *names)
+    pipe.delete(*[STATE_KEY.format(name=n) for n in names])
+    await pipe.execute()
+
+def _geosearch_args(lat, lon, k, radius_km):
+    # on demande un peu plus que k : certains membres peuvent avoir expiré
+    return dict(longitude=lon, latitude=lat, radius=radius_km, unit="km",
+                sort="ASC", count=k * 2)
+
+def _split_alive(names, statuses, k):
+    alive = [n for n, st in zip(names, statuses) if st == "idle"]
+    dead = [n for n, st in zip(names, statuses) if st is None]
+    return alive[:k], dead
+
+def nearest_idle(r, lat, lon, k=OFFER_K, radius_km=OFFER_RADIUS_KM):
+    """Les k coursiers libres et vivants les plus proches (GEOSEARCH, tri distance ↑)."""
+    names = r.geosearch(GEO_IDLE_KEY, **_geosearch_args(lat, lon, k, radius_km))
+    if not names:
+        return []
+    pipe = r.pipeline(transaction=False)
+    for n in names:
+        pipe.hget(STATE_KEY.format(name=n), "status")
+    alive, dead = _split_alive(names, pipe.execute(), k)
+    if dead:
+        r.zrem(GEO_IDLE_KEY, *dead)  # nettoyage paresseux des coursiers disparus
+    return alive
+
+def nearest_stackable(r, lat, lon, k=OFFER_K, radius_km=OFFER_RADIUS_KM):
+    """
+    Coursiers en course proches qui acceptent encore une commande
+    -> [(nom, (lat, lon), route)] ; route : arrêts restants (route_planner.unpack).
+    """
+    names = r.geosearch(GEO_STACK_KEY, **_geosearch_args(lat, lon, k, radius_km))
+    if not names:
+        return []
+    pipe = r.pipeline(transaction=False)
+    for n in names:
+        pipe.hmget(STATE_KEY.format(name=n), "lat", "lon", "route")
+    out, dead = [], []
+    for n, (clat, clon, route) in zip(names, pipe.execute()):
+        if route is None:
+            dead.append(n)          # expiré, ou n'accepte plus de commande
+        elif len(out) < k:
+            out.append((n, (float(clat), float(clon)), route))
+    if dead:
+        r.zrem(GEO_STACK_KEY, *dead)
+    return out
+
+async def nearest_idle_async(r, lat, lon, k=OFFER_K, radius_km=OFFER_RADIUS_KM):
+    """Même chose que nearest_idle() pour un client redis.asyncio."""
+    names = await r.geosearch(GEO_IDLE_KEY, **_geosearch_args(lat, lon, k, radius_km))
+    if not names:
+        return []
+    pipe = r.pipeline(transaction=False)
+    for n in names:
+        pipe.hget(STATE_KEY.format(name=n), "status")
+    alive, dead = _split_alive(names, await pipe.execute(), k)
+    if dead:
+        await r.zrem(GEO_IDLE_KEY, *dead)
+    return alive
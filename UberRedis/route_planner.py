@@ -0,0 +1,144 @@
+"""
+Tournées à plusieurs commandes : insertion la moins chère d'un couple retrait -> dépôt dans la
+suite d'arrêts d'un coursier déjà en course (manager : faut-il lui proposer la commande ?
+coursier : où la placer une fois sélectionné).
+
+Une tournée = la position du coursier puis ses arrêts restants (Stop : commande, "pickup" ou
+"drop", lat, lon, heure promise du dépôt). Pour n arrêts, les (n+1)(n+2)/2 placements du retrait
+après le nœud i puis du dépôt après le nœud j ≥ i sont tous essayés, chacun en O(1) :
+  - heures d'arrivée et marge de chaque arrêt (retard encore permis avant de dépasser une heure
+    promise de plus de PROMISE_GRACE_S) calculées une fois par tournée, minimum sur la suite ;
+  - placer x entre k et k+1 décale tous les arrêts suivants de t(k, x) + service + t(x, k+1)
+    - t(k, k+1) : faisable si ce décalage tient dans leur marge.
+Limites : MAX_ORDERS commandes par coursier, allongement de la tournée ≤ MAX_DETOUR_S. Les
+`locked` premiers arrêts ne bougent pas (tronçon en cours). Temps de trajet : une fonction
+(a, b) -> secondes, à vol d'oiseau (straight_s) ou par les rues (router_s, routing.py).
+Coût mesuré par bench_route_planner.py.
+
+    planner = Planner(straight_s(20.0), pickup_s=30)
+    ins = planner.insert(pos, time.time(), stops, order_id, pickup, drop, locked=1)
+    if ins: ins.added_s, ins.drop_at, ins.stops
+"""
+import json, math
+from collections import namedtuple
+
+from geo import haversine_km
+
+MAX_ORDERS = 3             # commandes en cours par coursier (1 = une course à la fois)
+MAX_DETOUR_S = 600.0       # allongement de la tournée accepté pour une commande de plus
+PROMISE_GRACE_S = 180.0    # retard toléré sur l'heure promise d'une commande déjà affectée
+
+Stop = namedtuple("Stop", "order_id kind lat lon due")     # due : heure promise (epoch) du dépôt, ou None
+Insertion = namedtuple("Insertion", "i j added_s pickup_at drop_at stops")
+
+def straight_s(vitesse_kmh):
+    """Temps de trajet à vol d'oiseau à vitesse constante."""
+    k = 3600.0 / max(1e-6, vitesse_kmh)
+    def travel(a, b):
+        return haversine_km(a[0], a[1], b[0], b[1]) * k
+    return travel
+
+def router_s(router):
+    """
+    Temps par les rues : arbre inverse de la destination (routing.Router.to_s, un Dijkstra par
+    cellule gardé en LRU, puis une lecture de tableau), vol d'oiseau hors réseau.
+    """
+    fallback = straight_s(router.vitesse_kmh)
+    def travel(a, b):
+        t = router.to_s(a, b)
+        return fallback(a, b) if t is None else t
+    return travel
+
+def orders_of(stops):
+    return {s.order_id for s in stops}
+
+def pack(stops):
+    """Tournée -> texte compact (champ route du registre des coursiers)."""
+    return json.dumps([[s.order_id, s.kind, round(s.lat, 6), round(s.lon, 6), s.due] for s in stops],
+                      separators=(",", ":"))
+
+def unpack(raw):
+    return [Stop(*s) for s in json.loads(raw)] if raw else []
+
+class Planner:
+    def __init__(self, travel_s, pickup_s=0.0, max_orders=MAX_ORDERS, max_detour_s=MAX_DETOUR_S,
+                 grace_s=PROMISE_GRACE_S):
+        self.travel_s = travel_s
+        self.pickup_s = pickup_s          # service au restaurant (le dépôt est instantané)
+        self.max_orders = max_orders
+        self.max_detour_s = max_detour_s
+        self.grace_s = grace_s
+
+    def service(self, stop):
+        return self.pickup_s if stop.kind == "pickup" else 0.0
+
+    def schedule(self, pos, now, stops):
+        """Heure d'arrivée (epoch) à chaque arrêt, dans l'ordre de la tournée."""
+        out, t, prev = [], now, tuple(pos)
+        for s in stops:
+            t += self.travel_s(prev, (s.lat, s.lon))
+            out.append(t)
+            t += self.service(s)
+            prev = (s.lat, s.lon)
+        return out
+
+    def insert(self, pos, now, stops, order_id, pickup, drop, locked=0, max_eta_s=None):
+        """
+        Insertion la moins chère (allongement minimal, puis dépôt au plus tôt) du retrait et du
+        dépôt de order_id, ou None si aucune ne respecte les limites. Le Stop du nouveau dépôt a
+        due=None : l'heure promise est fixée par l'affectation (drop_at + marge éventuelle).
+        """
+        if len(orders_of(stops)) >= self.max_orders:
+            return None
+        travel, svc = self.travel_s, self.pickup_s
+        pickup, drop = tuple(pickup), tuple(drop)
+        n = len(stops)
+        nodes = [tuple(pos)] + [(s.lat, s.lon) for s in stops]
+        # nœud 0 = coursier ; leg[k] = t(k, k+1) ; dep = arrivée + service
+        leg, arr, dep = [], [now], [now]
+        for k, s in enumerate(stops):
+            leg.append(travel(nodes[k], nodes[k + 1]))
+            arr.append(dep[k] + leg[k])
+            dep.append(arr[-1] + self.service(s))
+        own = [math.inf] + [s.due + self.grace_s - arr[k + 1] if s.due is not None else math.inf
+                            for k, s in enumerate(stops)]
+        suffix = [math.inf] * (n + 2)       # marge de la suite k..n
+        for k in range(n, -1, -1):
+            suffix[k] = min(own[k], suffix[k + 1])
+        to_p = [travel(x, pickup) for x in nodes]
+        to_d = [travel(x, drop) for x in nodes]
+        from_p = [0.0] + [travel(pickup, x) for x in nodes[1:]]
+        from_d = [0.0] + [travel(drop, x) for x in nodes[1:]]
+        p_d = travel(pickup, drop)
+        limit = self.max_detour_s if stops else math.inf    # coursier libre : pas de détour
+        max_eta = math.inf if max_eta_s is None else max_eta_s
+
+        best = None   # (added, drop_at, i, j, pickup_at)
+        for i in range(min(locked, n), n + 1):
+            pickup_at = dep[i] + to_p[i]
+            # dépôt juste après le retrait
+            added = to_p[i] + svc + p_d + (from_d[i + 1] - leg[i] if i < n else 0.0)
+            drop_at = pickup_at + svc + p_d
+            if added <= limit and added <= suffix[i + 1] and drop_at - now <= max_eta:
+                if best is None or (added, drop_at) < best[:2]:
+                    best = (added, drop_at, i, i, pickup_at)
+            if i == n:
+                break
+            # dépôt plus loin : les nœuds i+1..j sont décalés de d1, la suite de d1 + d2
+            d1 = to_p[i] + svc + from_p[i + 1] - leg[i]
+            window = math.inf
+            for j in range(i + 1, n + 1):
+                window = min(window, own[j])
+                if d1 > window or d1 > limit:
+                    break
+                drop_at = dep[j] + d1 + to_d[j]
+                added = d1 + to_d[j] + (from_d[j + 1] - leg[j] if j < n else 0.0)
+                if added <= limit and added <= suffix[j + 1] and drop_at - now <= max_eta:
+                    if best is None or (added, drop_at) < best[:2]:
+                        best = (added, drop_at, i, j, pickup_at)
+        if best is None:
+            return None
+        added, drop_at, i, j, pickup_at = best
+        p = Stop(order_id, "pickup", pickup[0], pickup[1], None)
+        d = Stop(order_id, "drop", drop[0], drop[1], None)
+        return Insertion(i, j, added, pickup_at, drop_at, stops[:i] + [p] + stops[i:j] + [d] + stops[j:])
@@ -0,0 +1,57 @@
+"""
+Roue de temporisation (timer wheel) : des milliers de minuteries sur une seule tâche asyncio.
+
+La roue avance d'un cran toutes les tick_s secondes et exécute les rappels de la case
+courante. Planifier coûte O(1) quel que soit le nombre de coursiers simulés, au lieu d'un
+asyncio.sleep() (donc d'un timer du loop) par coursier et par tick.
+
+    wheel = TimerWheel(tick_s=1.0, on_tick=flush)
+    asyncio.create_task(wheel.run())
+    wheel.schedule(2.5, callback)      # appelé au 3e cran
+"""
+import asyncio, math
+
+class TimerWheel:
+    def __init__(self, tick_s=1.0, slots=256, on_tick=None):
+        """on_tick : coroutine optionnelle appelée après chaque cran (ex. envoi groupé des messages)."""
+        self.tick_s = tick_s
+        self.slots = [[] for _ in range(slots)]
+        self.turns = 0          # crans parcourus depuis le démarrage
+        self.fired = 0          # rappels exécutés
+        self.max_late_s = 0.0   # retard max d'un cran sur l'horloge (boucle saturée si > tick_s)
+        self.on_tick = on_tick
+
+    def schedule(self, delay_s, callback):
+        """callback() sera appelé dans ~delay_s secondes (arrondi au cran supérieur, 1 cran min)."""
+        due = self.turns + max(1, math.ceil(delay_s / self.tick_s - 1e-9))
+        self.slots[due % len(self.slots)].append((due, callback))
+
+    def pending(self):
+        return sum(len(s) for s in self.slots)
+
+    def advance(self):
+        self.turns += 1
+        i = self.turns % len(self.slots)
+        slot = self.slots[i]
+        if not slot:
+            return 0
+        # les rappels d'un tour ultérieur (délai > slots × tick_s) restent dans la case
+        self.slots[i] = [(due, cb) for due, cb in slot if due > self.turns]
+        fired = 0
+        for due, cb in slot:
+            if due <= self.turns:
+                cb()
+                fired += 1
+        self.fired += fired
+        return fired
+
+    async def run(self):
+        loop = asyncio.get_running_loop()
+        next_t = loop.time()
+        while True:
+            next_t += self.tick_s
+            await asyncio.sleep(max(0.0, next_t - loop.time()))
+            self.max_late_s = max(self.max_late_s, loop.time() - next_t)
+            self.advance()
+            if self.on_tick is not None:
+                await self.on_tick()
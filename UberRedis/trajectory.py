@@ -0,0 +1,254 @@
+"""
+Trajet de chaque commande, compact et rejouable : trajectory:<order_id> (chaîne binaire, un GET).
+
+Le coursier garde ses ticks (t, lat, lon) pendant la livraison (Recorder) et réécrit la clé à
+chaque TRACK publié : un client arrivé en cours de route récupère le trajet déjà parcouru.
+À la livraison, la version finale expire après TRAJ_TTL_S.
+
+Compression :
+  - Douglas–Peucker en distance synchronisée (SED) : un point est retiré si la position
+    interpolée *dans le temps* entre ses voisins conservés reste à moins de TOLERANCE_M ; le
+    rejeu garde donc les vitesses et les pauses, pas seulement la forme ;
+  - points conservés codés en deltas (dixièmes de seconde, 1e-5 degré ≈ 1 m) zigzag + varint :
+    quelques octets par point au lieu d'un TRACK JSON complet par tick ;
+  - repères (début de tronçon, arrivée…) gardés tels quels : index du point + code du statut.
+
+Format v1 : b"TJ", version, t0 (float64), ETA annoncée (uint32, s), lat0, lon0 (int32, 1e-5°),
+            varint nombre de points, varint nombre de repères, deltas (dt, dlat, dlon), repères.
+
+    python trajectory.py <order_id>                 # résumé + points
+    python trajectory.py <order_id> --replay 20     # rejeu 20× plus vite que la réalité
+"""
+import argparse, math, struct, sys, time
+import redis
+
+from codec import TRACK_STATUSES
+
+TRAJ_KEY = "trajectory:{oid}"
+TOLERANCE_M = 5.0           # écart max (SED) entre trajet simplifié et ticks réels
+TRAJ_TTL_S = 24 * 3600      # conservation après la livraison
+ACTIVE_TTL_S = 3 * 3600     # pendant la livraison (coursier disparu : la clé finit par expirer)
+COORD_SCALE = 100_000       # 1e-5 degré
+TIME_SCALE = 10             # dixièmes de seconde
+M_PER_DEG = 111_320.0
+
+MAGIC = b"TJ"
+VERSION = 1
+HEADER = struct.Struct("<2sBdIii")
+_STATUS_CODE = {s: i for i, s in enumerate(TRACK_STATUSES)}
+
+def rconn():
+    return redis.Redis(host="localhost", port=6379, db=0, decode_responses=True, encoding_errors="surrogateescape")
+
+# ---------------------------------------------------------------- simplification
+
+def _sed_m(p, a, b):
+    """Écart (m) entre p et la position interpolée au temps de p sur le segment a -> b."""
+    span = b[0] - a[0]
+    f = (p[0] - a[0]) / span if span > 0 else 0.0
+    lat, lon = a[1] + (b[1] - a[1]) * f, a[2] + (b[2] - a[2]) * f
+    dy = (p[1] - lat) * M_PER_DEG
+    dx = (p[2] - lon) * M_PER_DEG * math.cos(math.radians(lat))
+    return math.hypot(dx, dy)
+
+def simplify(points, tolerance_m=TOLERANCE_M, keep=()):
+    """
+    Douglas–Peucker (SED) itératif sur [(t, lat, lon)] -> indices conservés (triés).
+    keep : indices toujours conservés (repères).
+    """
+    n = len(points)
+    if n <= 2:
+        return list(range(n))
+    kept = {0, n - 1, *keep}
+    anchors = sorted(kept)
+    stack = list(zip(anchors, anchors[1:]))
+    while stack:
+        i, j = stack.pop()
+        worst, far = tolerance_m, -1
+        a, b = points[i], points[j]
+        for k in range(i + 1, j):
+            d = _sed_m(points[k], a, b)
+            if d > worst:
+                worst, far = d, k
+        if far >= 0:
+            kept.add(far)
+            stack.append((i, far))
+            stack.append((far, j))
+    return sorted(kept)
+
+# ---------------------------------------------------------------- varint
+
+def _put(out, v):
+    v = (v << 1) ^ (v >> 63)          # zigzag : petits négatifs -> petits positifs
+    while v >= 0x80:
+        out.append((v & 0x7F) | 0x80)
+        v >>= 7
+    out.append(v)
+
+def _get(data, pos):
+    shift = v = 0
+    while True:
+        byte = data[pos]
+        pos += 1
+        v |= (byte & 0x7F) << shift
+        if byte < 0x80:
+            return (v >> 1) ^ -(v & 1), pos
+        shift += 7
+
+def _put_u(out, v):
+    while v >= 0x80:
+        out.append((v & 0x7F) | 0x80)
+        v >>= 7
+    out.append(v)
+
+def _get_u(data, pos):
+    shift = v = 0
+    while True:
+        byte = data[pos]
+        pos += 1
+        v |= (byte & 0x7F) << shift
+        if byte < 0x80:
+            return v, pos
+        shift += 7
+
+# ---------------------------------------------------------------- format
+
+def encode(points, marks=(), eta_s=0):
+    """
+    points : [(t, lat, lon)] déjà simplifiés, t croissant (secondes epoch) ;
+    marks : [(index du point, statut TRACK)] ; eta_s : ETA annoncée à l'affectation.
+    """
+    if not points:
+        raise ValueError("trajet vide")
+    t0 = points[0][0]
+    q = [(round((t - t0) * TIME_SCALE), round(lat * COORD_SCALE), round(lon * COORD_SCALE))
+         for t, lat, lon in points]
+    out = bytearray(HEADER.pack(MAGIC, VERSION, t0, int(eta_s), q[0][1], q[0][2]))
+    _put_u(out, len(q))
+    _put_u(out, len(marks))
+    for prev, cur in zip(q, q[1:]):
+        _put(out, cur[0] - prev[0])
+        _put(out, cur[1] - prev[1])
+        _put(out, cur[2] - prev[2])
+    for idx, status in marks:
+        _put_u(out, idx)
+        out.append(_STATUS_CODE.get(status, 255))
+    return bytes(out)
+
+def decode(data):
+    """-> {"t0", "eta_s", "points": [(t, lat, lon)], "marks": [(index, statut)]}."""
+    if isinstance(data, str):
+        data = data.encode("utf-8", "surrogateescape")
+    magic, version, t0, eta_s, lat, lon = HEADER.unpack_from(data)
+    if magic != MAGIC or version != VERSION:
+        raise ValueError(f"trajet illisible ({magic!r} v{version})")
+    pos = HEADER.size
+    n, pos = _get_u(data, pos)
+    n_marks, pos = _get_u(data, pos)
+    dt = 0
+    points = [(t0, lat / COORD_SCALE, lon / COORD_SCALE)]
+    for _ in range(n - 1):
+        d, pos = _get(data, pos); dt += d
+        d, pos = _get(data, pos); lat += d
+        d, pos = _get(data, pos); lon += d
+        points.append((t0 + dt / TIME_SCALE, lat / COORD_SCALE, lon / COORD_SCALE))
+    marks = []
+    for _ in range(n_marks):
+        idx, pos = _get_u(data, pos)
+        code = data[pos]; pos += 1
+        marks.append((idx, TRACK_STATUSES[code] if code < len(TRACK_STATUSES) else "?"))
+    return {"t0": t0, "eta_s": eta_s, "points": points, "marks": marks}
+
+# ---------------------------------------------------------------- enregistrement / lecture
+
+class Recorder:
+    """Ticks d'une livraison côté coursier -> trajectory:<order_id>."""
+
+    def __init__(self, order_id, eta_s=0, tolerance_m=TOLERANCE_M):
+        self.order_id = order_id
+        self.eta_s = eta_s
+        self.tolerance_m = tolerance_m
+        self.points = []
+        self.marks = []
+
+    def add(self, t, lat, lon):
+        if self.points and t <= self.points[-1][0]:
+            return                        # même instant (fin de tronçon) : un seul point
+        self.points.append((t, lat, lon))
+
+    def mark(self, status):
+        """Repère sur le dernier point (ou le prochain s'il n'y en a pas encore)."""
+        self.marks.append((max(0, len(self.points) - 1), status))
+
+    def blob(self):
+        keep = simplify(self.points, self.tolerance_m, keep={i for i, _ in self.marks})
+        where = {old: new for new, old in enumerate(keep)}
+        return encode([self.points[i] for i in keep],
+                      [(where[i], s) for i, s in self.marks if i in where], self.eta_s)
+
+    def save(self, r, final=False):
+        """
+        SET (une commande, au moins un point enregistré) ; final : TTL de conservation après
+        livraison. Avec un client redis.asyncio, renvoie la coroutine à attendre.
+        """
+        return r.set(TRAJ_KEY.format(oid=self.order_id), self.blob(), ex=TRAJ_TTL_S if final else ACTIVE_TTL_S)
+
+def load(r, order_id):
+    """Trajet d'une commande (décodé), ou None."""
+    data = r.get(TRAJ_KEY.format(oid=order_id))
+    return decode(data) if data else None
+
+def position_at(points, t):
+    """Position interpolée au temps t (bornée aux extrémités du trajet)."""
+    if t <= points[0][0]:
+        return points[0][1:]
+    for a, b in zip(points, points[1:]):
+        if t <= b[0]:
+            f = (t - a[0]) / (b[0] - a[0]) if b[0] > a[0] else 1.0
+            return a[1] + (b[1] - a[1]) * f, a[2] + (b[2] - a[2]) * f
+    return points[-1][1:]
+
+def replay(traj, speed=1.0, step_s=1.0, sleep=time.sleep):
+    """Rejoue le trajet : (secondes depuis le départ, lat, lon) tous les step_s du trajet réel."""
+    points = traj["points"]
+    t0, end = points[0][0], points[-1][0]
+    t = t0
+    while True:
+        lat, lon = position_at(points, t)
+        yield t - t0, lat, lon
+        if t >= end:
+            return
+        sleep(step_s / speed)
+        t = min(end, t + step_s)
+
+def length_km(points):
+    return sum(math.hypot((b[1] - a[1]) * M_PER_DEG, (b[2] - a[2]) * M_PER_DEG * math.cos(math.radians(a[1])))
+               for a, b in zip(points, points[1:])) / 1000
+
+def main():
+    ap = argparse.ArgumentParser(description="Trajet enregistré d'une commande (trajectory:<order_id>).")
+    ap.add_argument("order_id")
+    ap.add_argument("--replay", type=float, metavar="VITESSE", help="rejouer, N fois plus vite que la réalité")
+    ap.add_argument("--step", type=float, default=5.0, help="pas du rejeu (secondes de trajet)")
+    args = ap.parse_args()
+
+    r = rconn()
+    data = r.get(TRAJ_KEY.format(oid=args.order_id))
+    if not data:
+        print(f"[TRAJET] Aucun trajet pour {args.order_id} (jamais livré, ou expiré)")
+        sys.exit(1)
+    traj = decode(data)
+    pts = traj["points"]
+    duration = pts[-1][0] - pts[0][0]
+    print(f"[TRAJET] {len(pts)} points, {length_km(pts):.2f} km en {duration / 60:.1f} min "
+          f"(ETA annoncée {traj['eta_s'] / 60:.0f} min) | {len(data.encode('utf-8', 'surrogateescape'))} octets, "
+          f"expire dans {r.ttl(TRAJ_KEY.format(oid=args.order_id))} s")
+    for idx, status in traj["marks"]:
+        t, lat, lon = pts[idx]
+        print(f"  +{t - pts[0][0]:6.0f} s  {status:<20} ({lat:.5f},{lon:.5f})")
+    if args.replay:
+        for dt, lat, lon in replay(traj, args.replay, args.step):
+            print(f"[REJEU] +{dt:6.0f} s  ({lat:.5f},{lon:.5f})")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,181 @@
+"""
+Transport des messages `orders`, `candidates:<oid>` et `assignments:<oid>`.
+
+- pubsub  : PUBLISH/SUBSCRIBE d'origine (fire-and-forget, chaque manager voit chaque commande) ;
+- streams : XADD + groupe de consommateurs sur `orders` (une commande = un seul manager,
+            XACK après attribution, reprise des commandes d'un manager tombé via XAUTOCLAIM),
+            flux courts par commande pour candidatures / sélections (lus depuis le début,
+            donc rien n'est perdu si l'on s'abonne après l'envoi).
+Les messages sont encodés par codec.py (JSON par défaut, msgpack / struct avec --codec),
+à l'identique dans les deux cas.
+"""
+import os, socket, time
+import redis
+
+from codec import encode, try_decode
+
+CHAN_ORDERS = "orders"
+ORDERS_GROUP = "managers"
+STREAM_MAXLEN = 100_000     # taille max (approx.) du flux orders
+PER_ORDER_TTL_S = 3600      # expiration des flux candidates:<oid> / assignments:<oid>
+RECLAIM_IDLE_MS = 60_000    # une commande non acquittée depuis 60 s est reprise par un autre manager
+RECLAIM_EVERY_S = 5.0
+
+def _decode(raw):
+    return try_decode(raw) if raw is not None else None
+
+def consumer_name():
+    return f"manager-{socket.gethostname()}-{os.getpid()}"
+
+# ---------------------------------------------------------------- Pub/Sub
+
+class _PubSubReader:
+    def __init__(self, r, chans):
+        self.ps = r.pubsub()
+        self.ps.subscribe(*chans)
+
+    def get(self, timeout):
+        """-> (id, message) ou None ; id vaut None en pub/sub."""
+        m = self.ps.get_message(timeout=timeout)
+        if not m or m.get("type") != "message":
+            return None
+        msg = _decode(m["data"])
+        return (None, msg) if msg is not None else None
+
+    def ack(self, msg_id):
+        pass
+
+    def close(self):
+        self.ps.close()
+
+class PubSubTransport:
+    name = "pubsub"
+
+    def __init__(self, r):
+        self.r = r
+
+    def publish(self, chan, msg):
+        self.r.publish(chan, encode(msg))
+
+    def subscribe(self, *chans):
+        return _PubSubReader(self.r, chans)
+
+    def consume_orders(self, consumer):
+        return _PubSubReader(self.r, [CHAN_ORDERS])
+
+    def stats(self):
+        return None
+
+# ---------------------------------------------------------------- Streams
+
+class _StreamReader:
+    """Lecture simple (XREAD) de flux par commande, depuis le premier message."""
+
+    def __init__(self, r, chans):
+        self.r = r
+        self.last = {c: "0-0" for c in chans}
+        self.buffer = []
+
+    def get(self, timeout):
+        if not self.buffer:
+            res = self.r.xread(self.last, count=100, block=max(1, int(timeout * 1000)))
+            for stream, entries in res or []:
+                for entry_id, fields in entries:
+                    self.last[stream] = entry_id
+                    msg = _decode((fields or {}).get("data"))
+                    if msg is not None:
+                        self.buffer.append((entry_id, msg))
+        return self.buffer.pop(0) if self.buffer else None
+
+    def ack(self, msg_id):
+        pass
+
+    def close(self):
+        pass
+
+class _GroupReader:
+    """Lecture de `orders` via le groupe de consommateurs, avec reprise des messages orphelins."""
+
+    def __init__(self, r, stream, group, consumer):
+        self.r, self.stream, self.group, self.consumer = r, stream, group, consumer
+        self.next_reclaim = 0.0
+        try:
+            r.xgroup_create(stream, group, id="$", mkstream=True)
+        except redis.ResponseError as e:
+            if "BUSYGROUP" not in str(e):
+                raise
+
+    def _reclaim(self):
+        res = self.r.xautoclaim(self.stream, self.group, self.consumer,
+                                min_idle_time=RECLAIM_IDLE_MS, start_id="0-0", count=1)
+        for entry_id, fields in (res[1] if res else []):
+            msg = _decode((fields or {}).get("data"))
+            if msg is None:  # entrée supprimée par MAXLEN entre-temps
+                self.ack(entry_id)
+                continue
+            print(f"[TRANSPORT] ♻️ Reprise de la commande {msg.get('order_id')} ({entry_id})")
+            return entry_id, msg
+        return None
+
+    def get(self, timeout):
+        now = time.monotonic()
+        if now >= self.next_reclaim:
+            self.next_reclaim = now + RECLAIM_EVERY_S
+            got = self._reclaim()
+            if got:
+                return got
+        res = self.r.xreadgroup(self.group, self.consumer, {self.stream: ">"},
+                                count=1, block=max(1, int(timeout * 1000)))
+        for _, entries in res or []:
+            for entry_id, fields in entries:
+                msg = _decode((fields or {}).get("data"))
+                if msg is None:
+                    self.ack(entry_id)
+                    continue
+                return entry_id, msg
+        return None
+
+    def ack(self, msg_id):
+        if msg_id is not None:
+            self.r.xack(self.stream, self.group, msg_id)
+
+    def close(self):
+        pass
+
+class StreamsTransport:
+    name = "streams"
+
+    def __init__(self, r):
+        self.r = r
+
+    def publish(self, chan, msg):
+        pipe = self.r.pipeline(transaction=False)
+        if chan == CHAN_ORDERS:
+            pipe.xadd(chan, {"data": encode(msg)}, maxlen=STREAM_MAXLEN, approximate=True)
+        else:
+            pipe.xadd(chan, {"data": encode(msg)})
+            pipe.expire(chan, PER_ORDER_TTL_S)
+        pipe.execute()
+
+    def subscribe(self, *chans):
+        return _StreamReader(self.r, chans)
+
+    def consume_orders(self, consumer):
+        return _GroupReader(self.r, CHAN_ORDERS, ORDERS_GROUP, consumer)
+
+    def stats(self):
+        """Longueur du flux, commandes en cours (pending) et retard (lag) du groupe."""
+        try:
+            groups = self.r.xinfo_groups(CHAN_ORDERS)
+        except redis.ResponseError:
+            return None
+        for g in groups:
+            if g.get("name") == ORDERS_GROUP:
+                return {"length": self.r.xlen(CHAN_ORDERS), "pending": g.get("pending"),
+                        "lag": g.get("lag"), "consumers": g.get("consumers")}
+        return None
+
+TRANSPORTS = {"pubsub": PubSubTransport, "streams": StreamsTransport}
+
+def make_transport(r, name="pubsub"):
+    return TRANSPORTS[name](r)